@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+Benchmark do DatabaseRoleMiddleware: pool por role vs fechar/reconectar.
+
+Simula requests autenticados (roles alternados) que executam uma query
+simples, em várias threads, e mede requests/segundo em cada modo.
+
+Requer PostgreSQL configurado (DB_ENGINE=django.db.backends.postgresql)
+e os utilizadores app_*_user criados (scripts/create_roles.sql).
+
+Uso:
+    python benchmarks/bench_db_role_middleware.py [--requests 2000] [--threads 8]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gestao_consultas.settings')
+
+import django
+django.setup()
+
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from core.db_role_middleware import DatabaseRoleMiddleware
+from core.db_pool import role_pools, obter_metricas_pools
+
+ROLES = ['paciente', 'medico', 'enfermeiro', 'admin']
+
+
+class FakeUser:
+    is_authenticated = True
+
+    def __init__(self, role):
+        self.role = role
+
+
+def view(request):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT current_user")
+        cursor.fetchone()
+    return HttpResponse("ok")
+
+
+def run(middleware, total, threads):
+    factory = RequestFactory()
+    per_thread = total // threads
+
+    def worker(offset):
+        for i in range(per_thread):
+            request = factory.get('/')
+            request.user = FakeUser(ROLES[(offset + i) % len(ROLES)])
+            middleware(request)
+        connection.close()
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return per_thread * threads / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    if connection.vendor != 'postgresql':
+        print("❌ Este benchmark requer PostgreSQL (DB_ENGINE)")
+        sys.exit(1)
+
+    print("=" * 60)
+    print("⏱️  BENCHMARK DatabaseRoleMiddleware")
+    print(f"   {args.requests} requests, {args.threads} threads")
+    print("=" * 60)
+
+    legacy = DatabaseRoleMiddleware(view)
+    legacy.use_pool = False
+    rps_legacy = run(legacy, args.requests, args.threads)
+    print(f"\n1. Fechar/reconectar: {rps_legacy:8.1f} req/s")
+
+    pooled = DatabaseRoleMiddleware(view)
+    pooled.use_pool = True
+    rps_pool = run(pooled, args.requests, args.threads)
+    print(f"2. Pool por role:     {rps_pool:8.1f} req/s")
+    print(f"\n   Ganho: {rps_pool / rps_legacy:.1f}x")
+
+    print("\n3. Métricas dos pools:")
+    for role, metricas in obter_metricas_pools().items():
+        print(f"   {role}: {metricas}")
+
+    role_pools.closeall()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Benchmark da importação em massa de unidades de saúde (core/importacao.py).
+
+Compara, para N unidades num CSV gerado:
+  1. uma chamada a admin_criar_unidade por linha (implementação antiga)
+  2. importar(): COPY para uma tabela temporária e um único INSERT ... SELECT
+
+Cada medição corre numa transação que é revertida no fim, por isso a base de
+dados não fica alterada. Requer PostgreSQL com pelo menos uma região.
+
+Uso:
+    python benchmarks/bench_importacao.py [--tamanhos 1000,10000,50000]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gestao_consultas.settings')
+
+import django
+django.setup()
+
+from django.db import connection, transaction
+
+from core.importacao import importar
+
+
+class Reverter(Exception):
+    pass
+
+
+def gerar_csv(n, id_regiao):
+    linhas = ['nome_unidade;morada_unidade;tipo_unidade;id_regiao']
+    linhas += [f'Unidade {i};Rua {i};USF;{id_regiao}' for i in range(n)]
+    return ('\n'.join(linhas) + '\n').encode('utf-8')
+
+
+def linha_a_linha(conteudo):
+    """Implementação antiga: uma CALL por linha"""
+    linhas = conteudo.decode('utf-8').splitlines()[1:]
+    with connection.cursor() as cursor:
+        for linha in linhas:
+            nome, morada, tipo, id_regiao = linha.split(';')
+            cursor.execute("CALL admin_criar_unidade(%s, %s, %s, %s)", [nome, morada, tipo, id_regiao])
+
+
+def em_massa(conteudo):
+    importar('unidades', 'csv', io.BytesIO(conteudo))
+
+
+def medir(funcao, conteudo):
+    inicio = time.perf_counter()
+    try:
+        with transaction.atomic():
+            funcao(conteudo)
+            decorrido = time.perf_counter() - inicio
+            raise Reverter()
+    except Reverter:
+        pass
+    return decorrido
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tamanhos', default='1000,10000,50000')
+    args = parser.parse_args()
+
+    if connection.vendor != 'postgresql':
+        print("❌ Este benchmark requer PostgreSQL (DB_ENGINE)")
+        sys.exit(1)
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT id_regiao FROM "REGIAO" ORDER BY id_regiao LIMIT 1')
+        row = cursor.fetchone()
+    if not row:
+        print("❌ Crie pelo menos uma região antes de correr o benchmark")
+        sys.exit(1)
+
+    print("=" * 60)
+    print("⏱️  BENCHMARK IMPORTAÇÃO DE UNIDADES")
+    print("=" * 60)
+    print(f"{'N linhas':>8} | {'linha a linha':>15} | {'importar()':>15}")
+
+    for n in [int(t) for t in args.tamanhos.split(',')]:
+        conteudo = gerar_csv(n, row[0])
+        t_antigo = medir(linha_a_linha, conteudo)
+        t_novo = medir(em_massa, conteudo)
+        print(f"{n:>8} | {t_antigo:>13.2f} s | {t_novo:>13.2f} s")
+
+
+if __name__ == '__main__':
+    main()
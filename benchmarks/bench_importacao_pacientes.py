@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+Benchmark do onboarding de pacientes em massa (core/importacao.py).
+
+Mede o débito (pacientes/s) para N pacientes num CSV gerado:
+  1. make_password + CALL admin_criar_utilizador por linha (implementação antiga)
+  2. importar('pacientes'): hash das senhas no pool de processos, COPY e um
+     único merge com números de utente reservados em bloco
+
+e, à parte, só o hash das senhas sem pool e com o pool (não precisa de base
+de dados, com --so-hash). As importações correm numa transação que é
+revertida no fim. Requer PostgreSQL.
+
+Uso:
+    python benchmarks/bench_importacao_pacientes.py [--tamanhos 100,1000] [--so-hash]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gestao_consultas.settings')
+
+import django
+django.setup()
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+
+from core.importacao import calcular_hashes, importar, pool_hash
+
+
+class Reverter(Exception):
+    pass
+
+
+def gerar_csv(n):
+    prefixo = f'bench{int(time.time())}'
+    linhas = ['nome;email;telefone;senha;data_nasc;genero;morada;alergias;observacoes']
+    linhas += [
+        f'Paciente {i};{prefixo}.{i}@exemplo.pt;9{i:08d};senha{i};1980-01-01;F;Rua {i};;'
+        for i in range(n)
+    ]
+    return ('\n'.join(linhas) + '\n').encode('utf-8')
+
+
+def linha_a_linha(conteudo):
+    """Implementação antiga: um hash e uma CALL por linha"""
+    linhas = conteudo.decode('utf-8').splitlines()[1:]
+    with connection.cursor() as cursor:
+        for linha in linhas:
+            nome, email, telefone, senha, data_nasc, genero, morada, _, _ = linha.split(';')
+            cursor.execute(
+                "CALL admin_criar_utilizador(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                [nome, email, telefone, 'paciente', make_password(senha), '', None, '',
+                 data_nasc, genero, morada]
+            )
+
+
+def em_massa(conteudo):
+    with pool_hash(settings.IMPORT_HASH_WORKERS) as pool:
+        importar('pacientes', 'csv', io.BytesIO(conteudo), pool=pool)
+
+
+def medir(funcao, *args):
+    inicio = time.perf_counter()
+    try:
+        with transaction.atomic():
+            funcao(*args)
+            decorrido = time.perf_counter() - inicio
+            raise Reverter()
+    except Reverter:
+        pass
+    return decorrido
+
+
+def medir_hash(n):
+    senhas = [f'senha{i}' for i in range(n)]
+
+    inicio = time.perf_counter()
+    calcular_hashes(senhas)
+    t_serie = time.perf_counter() - inicio
+
+    with pool_hash(settings.IMPORT_HASH_WORKERS) as pool:
+        calcular_hashes(senhas[:2], pool)  # arranque dos processos fora da medição
+        inicio = time.perf_counter()
+        calcular_hashes(senhas, pool)
+        t_pool = time.perf_counter() - inicio
+    return t_serie, t_pool
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tamanhos', default='100,1000')
+    parser.add_argument('--so-hash', action='store_true')
+    args = parser.parse_args()
+    tamanhos = [int(t) for t in args.tamanhos.split(',')]
+
+    print("=" * 60)
+    print("⏱️  BENCHMARK ONBOARDING DE PACIENTES")
+    print("=" * 60)
+    print(f"Hash das senhas ({settings.IMPORT_HASH_WORKERS} processos)")
+    print(f"{'N':>8} | {'sem pool':>18} | {'com pool':>18}")
+    for n in tamanhos:
+        t_serie, t_pool = medir_hash(n)
+        print(f"{n:>8} | {n / t_serie:>12.0f} /s    | {n / t_pool:>12.0f} /s")
+
+    if args.so_hash:
+        return
+    if connection.vendor != 'postgresql':
+        print("❌ A importação requer PostgreSQL (DB_ENGINE)")
+        sys.exit(1)
+
+    print()
+    print("Importação completa")
+    print(f"{'N':>8} | {'linha a linha':>18} | {'importar()':>18}")
+    for n in tamanhos:
+        t_antigo = medir(linha_a_linha, gerar_csv(n))
+        t_novo = medir(em_massa, gerar_csv(n))
+        print(f"{n:>8} | {n / t_antigo:>12.0f} /s    | {n / t_novo:>12.0f} /s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Benchmark do histórico de notas por paciente (get_notes_by_patient).
+
+Faz crescer uma coleção temporária de notas por patamares e mede, em cada
+patamar, a latência de ler a primeira página do histórico de um paciente:
+  1. view antiga: $sort por created_at sobre toda a coleção antes do filtro
+  2. get_notes_by_patient: filtro + ordenação pelo índice (paciente_id, created_at desc)
+
+Com o índice composto a latência deve manter-se estável com o crescimento.
+
+Requer MongoDB (MONGO_DB_URI). A coleção temporária é apagada no fim.
+
+Uso:
+    python benchmarks/bench_notas_historico.py [--patamares 10000,50000,100000,200000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gestao_consultas.settings')
+
+import django
+django.setup()
+
+from pymongo import ASCENDING, DESCENDING
+
+from core.mongo_client import MongoDBClient, NotasClinicasService
+
+COLECAO_BENCH = 'notas_clinicas_bench_historico'
+PACIENTES = 5000
+
+
+def inserir_notas(collection, inicio, fim):
+    rnd = random.Random(inicio)
+    base = datetime(2020, 1, 1)
+    lote = []
+    for i in range(inicio, fim):
+        lote.append({
+            'consulta_id': i + 1,
+            'medico_id': rnd.randint(1, 50),
+            'paciente_id': rnd.randint(1, PACIENTES),
+            'created_at': base + timedelta(minutes=5 * i),
+            'diagnostico': 'Diagnóstico sintético',
+            'sintomas': ['febre'],
+            'notas_clinicas': 'x' * 500,
+        })
+        if len(lote) == 10_000:
+            collection.insert_many(lote, ordered=False)
+            lote = []
+    if lote:
+        collection.insert_many(lote, ordered=False)
+
+
+def historico_view_antiga(collection, paciente_id):
+    """Equivalente a notas_por_paciente antiga: $sort antes do $match"""
+    return list(collection.aggregate([
+        {'$sort': {'created_at': -1}},
+        {'$project': {'notas_clinicas': 0}},
+        {'$match': {'paciente_id': paciente_id}},
+        {'$limit': 10},
+    ], allowDiskUse=True))
+
+
+def medir(funcao, pacientes):
+    tempos = []
+    for paciente_id in pacientes:
+        inicio = time.perf_counter()
+        funcao(paciente_id)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    return tempos[len(tempos) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--patamares', default='10000,50000,100000,200000')
+    parser.add_argument('--amostras', type=int, default=20)
+    args = parser.parse_args()
+
+    mongo = MongoDBClient()
+    if not mongo.connect():
+        print("❌ Este benchmark requer MongoDB (MONGO_DB_URI)")
+        sys.exit(1)
+
+    print("=" * 60)
+    print("⏱️  BENCHMARK HISTÓRICO DE NOTAS POR PACIENTE")
+    print("=" * 60)
+
+    collection = mongo.get_collection(COLECAO_BENCH)
+    collection.drop()
+    collection.create_index([('consulta_id', ASCENDING)], unique=True)
+    collection.create_index([('paciente_id', ASCENDING), ('created_at', DESCENDING)])
+
+    servico = NotasClinicasService()
+    servico.collection = collection
+    pacientes = random.Random(1).sample(range(1, PACIENTES + 1), args.amostras)
+
+    print(f"{'notas':>10} | {'view antiga p50':>16} | {'índice p50':>12}")
+    try:
+        total = 0
+        for patamar in [int(p) for p in args.patamares.split(',')]:
+            inserir_notas(collection, total, patamar)
+            total = patamar
+
+            antiga = medir(lambda p: historico_view_antiga(collection, p), pacientes)
+            nova = medir(lambda p: servico.get_notes_by_patient(p, limit=10), pacientes)
+            print(f"{total:>10} | {antiga:>13.1f} ms | {nova:>9.1f} ms")
+    finally:
+        collection.drop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+Benchmark da pesquisa de notas clínicas (core/notas_search.py).
+
+Gera N notas sintéticas (por omissão 100 000) e compara:
+  1. $regex case-insensitive sobre a projeção de notas_resumo (implementação antiga)
+  2. $text com o índice notas_texto e ranking por textScore
+  3. índice invertido local (usado quando o servidor não suporta $text)
+
+Os passos 1 e 2 requerem MongoDB (MONGO_DB_URI) e usam uma coleção
+temporária que é apagada no fim; o passo 3 corre sempre.
+
+Uso:
+    python benchmarks/bench_notas_search.py [--notas 100000] [--repeticoes 20]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gestao_consultas.settings')
+
+import django
+django.setup()
+
+from bson import ObjectId
+from pymongo import TEXT
+
+from core.mongo_client import MongoDBClient
+from core.notas_search import IndiceInvertido, PesquisaNotas, PESOS_TEXTO, INDICE_TEXTO
+
+COLECAO_BENCH = 'notas_clinicas_bench'
+
+DIAGNOSTICOS = ['Hipertensão arterial', 'Gripe', 'Diabetes tipo 2', 'Asma', 'Lombalgia',
+                'Enxaqueca', 'Gastrite', 'Sinusite', 'Dermatite', 'Ansiedade']
+SINTOMAS = ['febre', 'tosse', 'cefaleia', 'dor abdominal', 'náuseas', 'fadiga', 'tonturas', 'dispneia']
+MEDICAMENTOS = ['Paracetamol', 'Ibuprofeno', 'Lisinopril', 'Metformina', 'Salbutamol', 'Omeprazol']
+PALAVRAS = ('paciente refere queixas com evolução de vários dias sem melhoria exame '
+            'objetivo sem alterações relevantes recomendada vigilância e reavaliação').split()
+
+PESQUISAS = ['hipertensão', 'febre tosse', 'metformina', 'enxaqueca tonturas']
+
+
+def gerar_notas(n):
+    rnd = random.Random(42)
+    inicio = datetime(2022, 1, 1)
+    for i in range(n):
+        yield {
+            '_id': ObjectId(),
+            'consulta_id': i + 1,
+            'medico_id': rnd.randint(1, 50),
+            'paciente_id': rnd.randint(1, 5000),
+            'created_at': inicio + timedelta(minutes=15 * i),
+            'diagnostico': rnd.choice(DIAGNOSTICOS),
+            'sintomas': rnd.sample(SINTOMAS, 2),
+            'prescricoes': rnd.sample(MEDICAMENTOS, 1),
+            'notas_clinicas': ' '.join(rnd.choices(PALAVRAS, k=40)),
+        }
+
+
+def medir(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    return tempos[len(tempos) // 2], tempos[int(len(tempos) * 0.95) - 1]
+
+
+def pesquisa_regex(collection, texto):
+    """Equivalente à search_notes antiga: $regex sobre notas_resumo"""
+    return list(collection.aggregate([
+        {'$project': {
+            'consulta_id': 1, 'medico_id': 1, 'paciente_id': 1, 'diagnostico': 1, 'created_at': 1,
+            'resumo_notas': {'$substrCP': ['$notas_clinicas', 0, 200]},
+        }},
+        {'$sort': {'created_at': -1}},
+        {'$match': {'$or': [
+            {'resumo_notas': {'$regex': texto, '$options': 'i'}},
+            {'diagnostico': {'$regex': texto, '$options': 'i'}},
+        ]}},
+        {'$limit': 50},
+    ], allowDiskUse=True))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--notas', type=int, default=100_000)
+    parser.add_argument('--repeticoes', type=int, default=20)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("⏱️  BENCHMARK PESQUISA DE NOTAS CLÍNICAS")
+    print("=" * 60)
+    print(f"📦 {args.notas} notas sintéticas, {args.repeticoes} repetições por pesquisa")
+
+    notas = list(gerar_notas(args.notas))
+
+    inicio = time.perf_counter()
+    indice = IndiceInvertido()
+    for nota in notas:
+        indice.indexar(nota)
+    print(f"🔨 Índice invertido local construído em {(time.perf_counter() - inicio):.1f} s")
+
+    mongo = MongoDBClient()
+    collection = None
+    if mongo.connect():
+        collection = mongo.get_collection(COLECAO_BENCH)
+        collection.drop()
+        for i in range(0, len(notas), 10_000):
+            collection.insert_many(notas[i:i + 10_000], ordered=False)
+        collection.create_index(
+            [(campo, TEXT) for campo in PESOS_TEXTO],
+            weights=PESOS_TEXTO, default_language='portuguese', name=INDICE_TEXTO
+        )
+        pesquisa = PesquisaNotas(collection)
+    else:
+        print("⚠️  MongoDB indisponível: apenas o índice invertido local é medido")
+
+    print()
+    print(f"{'pesquisa':<22} | {'$regex p50/p95':>18} | {'$text p50/p95':>18} | {'local p50/p95':>18}")
+    try:
+        for texto in PESQUISAS:
+            regex = pesquisa_texto = '-'
+            if collection is not None:
+                regex = '{:.1f}/{:.1f} ms'.format(*medir(lambda: pesquisa_regex(collection, texto), args.repeticoes))
+                pesquisa_texto = '{:.1f}/{:.1f} ms'.format(*medir(lambda: pesquisa.pesquisar(texto), args.repeticoes))
+            local = '{:.1f}/{:.1f} ms'.format(*medir(lambda: indice.pesquisar(texto), args.repeticoes))
+            print(f"{texto:<22} | {regex:>18} | {pesquisa_texto:>18} | {local:>18}")
+    finally:
+        if collection is not None:
+            collection.drop()
+
+
+if __name__ == '__main__':
+    main()
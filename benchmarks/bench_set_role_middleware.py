@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+Teste de carga: SetPostgreSQLUserContextMiddleware (SET LOCAL ROLE numa
+conexão persistente) vs DatabaseRoleMiddleware (pool / reconectar).
+
+Cada request simulado executa 3 queries em autocommit. Para cada modo
+mostra requests/s, latência p50/p95 e o número de statements enviados
+ao servidor por request (incluindo SET ROLE / RESET / set_current_user).
+
+Requer PostgreSQL, os roles app_*_user e o GRANT da secção 7.1 de
+scripts/create_roles.sql.
+
+Uso:
+    python benchmarks/bench_set_role_middleware.py [--requests 2000] [--threads 8]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gestao_consultas.settings')
+
+import django
+django.setup()
+
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from core.db_pool import role_pools
+from core.db_role_middleware import DatabaseRoleMiddleware, SetPostgreSQLUserContextMiddleware
+
+ROLES = ['paciente', 'medico', 'enfermeiro', 'admin']
+QUERIES_POR_REQUEST = 3
+
+
+class FakeUser:
+    is_authenticated = True
+
+    def __init__(self, role, id_utilizador):
+        self.role = role
+        self.id_utilizador = id_utilizador
+
+
+def view(request):
+    for _ in range(QUERIES_POR_REQUEST):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT current_user, current_setting('app.current_user_id', true)")
+            cursor.fetchone()
+    return HttpResponse("ok")
+
+
+def run(middleware, total, threads, persistente):
+    factory = RequestFactory()
+    per_thread = total // threads
+    latencias = []
+    statements = []
+    lock = threading.Lock()
+    estado = threading.local()
+
+    def contar(execute, sql, params, many, context):
+        # O prefixo SET LOCAL vai no mesmo execute, logo não conta como ida extra
+        estado.idas += 1
+        return execute(sql, params, many, context)
+
+    def worker(offset):
+        minhas_latencias = []
+        for i in range(per_thread):
+            request = factory.get('/')
+            request.user = FakeUser(ROLES[(offset + i) % len(ROLES)], offset * per_thread + i + 1)
+            estado.idas = 0
+            inicio = time.perf_counter()
+            with connection.execute_wrapper(contar):
+                middleware(request)
+            minhas_latencias.append(time.perf_counter() - inicio)
+            with lock:
+                statements.append(estado.idas)
+            if not persistente:
+                connection.close()
+        with lock:
+            latencias.extend(minhas_latencias)
+        connection.close()
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencias.sort()
+    return {
+        'rps': per_thread * threads / elapsed,
+        'p50_ms': statistics.median(latencias) * 1000,
+        'p95_ms': latencias[int(len(latencias) * 0.95)] * 1000,
+        'idas_por_request': statistics.mean(statements),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    if connection.vendor != 'postgresql':
+        print("❌ Este teste requer PostgreSQL (DB_ENGINE)")
+        sys.exit(1)
+
+    print("=" * 60)
+    print("⏱️  TESTE DE CARGA - TROCA DE ROLE POR REQUEST")
+    print(f"   {args.requests} requests, {args.threads} threads, {QUERIES_POR_REQUEST} queries/request")
+    print("=" * 60)
+
+    legacy = DatabaseRoleMiddleware(view)
+    legacy.use_pool = False
+    pooled = DatabaseRoleMiddleware(view)
+    pooled.use_pool = True
+    set_role = SetPostgreSQLUserContextMiddleware(view)
+
+    modos = [
+        ("DatabaseRoleMiddleware (reconectar)", legacy, False),
+        ("DatabaseRoleMiddleware (pool)", pooled, False),
+        ("SetPostgreSQLUserContextMiddleware", set_role, True),
+    ]
+    for nome, middleware, persistente in modos:
+        r = run(middleware, args.requests, args.threads, persistente)
+        print(f"\n{nome}")
+        print(f"   {r['rps']:8.1f} req/s   p50 {r['p50_ms']:.2f} ms   p95 {r['p95_ms']:.2f} ms")
+        print(f"   {r['idas_por_request']:.1f} idas ao servidor por request (execute)")
+
+    role_pools.closeall()
+
+
+if __name__ == '__main__':
+    main()
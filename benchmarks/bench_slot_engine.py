@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Benchmark do motor de slots (core/slots.py).
+
+Compara, para N disponibilidades, o número de queries e o tempo de gerar a
+grelha de slots:
+  1. uma chamada a verificar_slot_disponivel por slot (implementação antiga)
+  2. obter_slots(): uma única query a obter_slots_disponibilidades
+
+Requer PostgreSQL com dados em "DISPONIBILIDADE".
+
+Uso:
+    python benchmarks/bench_slot_engine.py [--tamanhos 10,50,200]
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gestao_consultas.settings')
+
+import django
+django.setup()
+
+from django.db import connection
+
+from core.slots import obter_slots
+
+
+class ContadorQueries:
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+def slots_por_slot(disp_rows):
+    """Implementação antiga: uma query por slot"""
+    resultado = {}
+    with connection.cursor() as cursor:
+        for disp_id, hora_inicio, hora_fim, duracao in disp_rows:
+            slots = []
+            hora_atual = hora_inicio
+            while hora_atual < hora_fim:
+                hora_fim_slot = (datetime.combine(datetime.today(), hora_atual) + timedelta(minutes=duracao)).time()
+                if hora_fim_slot > hora_fim or hora_fim_slot <= hora_atual:
+                    break
+                cursor.execute("SELECT verificar_slot_disponivel(%s, %s)", [disp_id, hora_atual])
+                slots.append({'time': hora_atual.strftime("%H:%M"), 'available': cursor.fetchone()[0]})
+                hora_atual = hora_fim_slot
+            resultado[disp_id] = slots
+    return resultado
+
+
+def medir(funcao, *args):
+    contador = ContadorQueries()
+    inicio = time.perf_counter()
+    with connection.execute_wrapper(contador):
+        funcao(*args)
+    return contador.total, (time.perf_counter() - inicio) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tamanhos', default='10,50,200')
+    args = parser.parse_args()
+
+    if connection.vendor != 'postgresql':
+        print("❌ Este benchmark requer PostgreSQL (DB_ENGINE)")
+        sys.exit(1)
+
+    print("=" * 60)
+    print("⏱️  BENCHMARK MOTOR DE SLOTS")
+    print("=" * 60)
+    print(f"{'N disp.':>8} | {'por slot':>20} | {'obter_slots':>20}")
+
+    for n in [int(t) for t in args.tamanhos.split(',')]:
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT id_disponibilidade, hora_inicio, hora_fim, duracao_slot
+                FROM "DISPONIBILIDADE"
+                WHERE duracao_slot > 0
+                ORDER BY data DESC, hora_inicio
+                LIMIT %s
+            """, [n])
+            disp_rows = cursor.fetchall()
+
+        q_antigo, t_antigo = medir(slots_por_slot, disp_rows)
+        q_novo, t_novo = medir(obter_slots, [r[0] for r in disp_rows])
+        print(f"{len(disp_rows):>8} | {q_antigo:>6} q {t_antigo:>9.1f} ms | {q_novo:>6} q {t_novo:>9.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+Benchmark de vw_disponibilidades (EXPLAIN ANALYZE antes/depois).
+
+Compara a definição antiga da view (dois COUNT(*) correlacionados sobre
+"CONSULTAS" por disponibilidade) com a atual, que lê o contador
+"DISPONIBILIDADE".slots_ocupados mantido por trigger.
+
+Gera um dataset sintético (por omissão 50 000 disponibilidades e 1 000 000
+de consultas) dentro de uma transação que é revertida no fim. Os triggers
+são desligados durante a carga (session_replication_role = replica), por
+isso tem de correr com um utilizador superuser.
+
+Requer PostgreSQL com pelo menos um médico, uma unidade e um paciente.
+
+Uso:
+    python benchmarks/bench_vw_disponibilidades.py [--consultas 1000000] [--disponibilidades 50000]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gestao_consultas.settings')
+
+import django
+django.setup()
+
+from django.db import connection, transaction
+
+
+# Definição de vw_disponibilidades antes do contador slots_ocupados
+VIEW_ANTIGA = """
+    SELECT
+        d.id_disponibilidade, d.data, d.hora_inicio, d.hora_fim,
+        d.duracao_slot, d.status_slot,
+        m.id_medico, u.nome as medico_nome,
+        e.nome_especialidade, un.nome_unidade, r.nome as regiao_nome,
+        (SELECT COUNT(*)
+         FROM "CONSULTAS" c
+         WHERE c.id_disponibilidade = d.id_disponibilidade
+         AND c.estado NOT IN ('cancelada')) as slots_ocupados,
+        ((EXTRACT(EPOCH FROM (d.hora_fim - d.hora_inicio)) / 60) / d.duracao_slot)
+        - (SELECT COUNT(*)
+           FROM "CONSULTAS" c
+           WHERE c.id_disponibilidade = d.id_disponibilidade
+           AND c.estado NOT IN ('cancelada')) as slots_disponiveis
+    FROM "DISPONIBILIDADE" d
+    JOIN "MEDICOS" m ON d.id_medico = m.id_medico
+    JOIN "core_utilizador" u ON m.id_utilizador = u.id_utilizador
+    LEFT JOIN "ESPECIALIDADES" e ON m.id_especialidade = e.id_especialidade
+    JOIN "UNIDADE_DE_SAUDE" un ON d.id_unidade = un.id_unidade
+    JOIN "REGIAO" r ON un.id_regiao = r.id_regiao
+"""
+
+CONSULTA_TESTE = """
+    EXPLAIN (ANALYZE, BUFFERS)
+    SELECT id_disponibilidade, slots_ocupados, slots_disponiveis
+    FROM {origem} v
+    WHERE v.slots_disponiveis > 0
+"""
+
+
+def gerar_dataset(cursor, n_disp, n_consultas):
+    """Cria disponibilidades de 08:00-18:00 (20 slots de 30 min) e consultas nelas"""
+    cursor.execute('SELECT id_medico FROM "MEDICOS" ORDER BY id_medico LIMIT 1')
+    id_medico = cursor.fetchone()[0]
+    cursor.execute('SELECT id_unidade FROM "UNIDADE_DE_SAUDE" ORDER BY id_unidade LIMIT 1')
+    id_unidade = cursor.fetchone()[0]
+    cursor.execute('SELECT id_paciente FROM "PACIENTES" ORDER BY id_paciente LIMIT 1')
+    id_paciente = cursor.fetchone()[0]
+
+    cursor.execute("SET LOCAL session_replication_role = replica")
+    cursor.execute("""
+        INSERT INTO "DISPONIBILIDADE"
+            (id_medico, id_unidade, data, hora_inicio, hora_fim, duracao_slot, status_slot)
+        SELECT %s, %s, DATE '2100-01-01' + g, TIME '08:00', TIME '18:00', 30, 'available'
+        FROM generate_series(0, %s - 1) g
+        RETURNING id_disponibilidade
+    """, [id_medico, id_unidade, n_disp])
+    disp_ids = [r[0] for r in cursor.fetchall()]
+
+    # Uma consulta por slot, percorrendo as disponibilidades; ~10% canceladas
+    cursor.execute("""
+        INSERT INTO "CONSULTAS"
+            (id_paciente, id_medico, id_disponibilidade, data_consulta, hora_consulta, estado)
+        SELECT %s, %s, d.id_disponibilidade, d.data,
+               TIME '08:00' + ((g / %s) %% 20) * INTERVAL '30 minutes',
+               CASE WHEN g %% 10 = 0 THEN 'cancelada' ELSE 'agendada' END
+        FROM generate_series(0, %s - 1) g
+        JOIN "DISPONIBILIDADE" d
+          ON d.id_disponibilidade = (%s::int[])[(g %% %s) + 1]
+    """, [id_paciente, id_medico, len(disp_ids), n_consultas, disp_ids, len(disp_ids)])
+    cursor.execute("SET LOCAL session_replication_role = origin")
+
+    cursor.execute("SELECT recalcular_slots_ocupados()")
+    cursor.execute('ANALYZE "DISPONIBILIDADE"')
+    cursor.execute('ANALYZE "CONSULTAS"')
+
+
+def explain(cursor, origem):
+    cursor.execute(CONSULTA_TESTE.format(origem=origem))
+    return [r[0] for r in cursor.fetchall()]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--consultas', type=int, default=1_000_000)
+    parser.add_argument('--disponibilidades', type=int, default=50_000)
+    args = parser.parse_args()
+
+    if connection.vendor != 'postgresql':
+        print("❌ Este benchmark requer PostgreSQL (DB_ENGINE)")
+        sys.exit(1)
+
+    print("=" * 60)
+    print("⏱️  BENCHMARK vw_disponibilidades")
+    print("=" * 60)
+    print(f"📦 A gerar {args.disponibilidades} disponibilidades e {args.consultas} consultas...")
+
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                gerar_dataset(cursor, args.disponibilidades, args.consultas)
+
+                for titulo, origem in [
+                    ("ANTES (COUNT correlacionado)", f"({VIEW_ANTIGA})"),
+                    ("DEPOIS (contador slots_ocupados)", "vw_disponibilidades"),
+                ]:
+                    print()
+                    print(f"📊 {titulo}")
+                    print("-" * 60)
+                    for linha in explain(cursor, origem):
+                        print(linha)
+
+            # Nada do dataset sintético fica na base de dados
+            transaction.set_rollback(True)
+    except Exception as e:
+        print(f"❌ Erro: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
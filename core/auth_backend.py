@@ -2,6 +2,8 @@ from django.contrib.auth.backends import BaseBackend
 from django.contrib.auth.hashers import check_password
 from django.db import connection
 
+from .user_cache import obter_perfil
+
 
 class UtilizadorFromDB:
     """User object created from SQL query results"""
@@ -19,6 +21,10 @@ class UtilizadorFromDB:
         self.email_verified = row[9]
         self.last_login = row[10]
         self.is_superuser = row[11] if len(row) > 11 else False
+        # Ids do role (só presentes quando a linha vem de obter_perfil_utilizador)
+        self.id_paciente = row[12] if len(row) > 12 else None
+        self.id_medico = row[13] if len(row) > 13 else None
+        self.id_enfermeiro = row[14] if len(row) > 14 else None
         self.backend = 'core.auth_backend.UtilizadorBackend'
         
         # Django compatibility attributes
@@ -75,14 +81,12 @@ class UtilizadorBackend(BaseBackend):
         return None
 
     def get_user(self, user_id):
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "SELECT * FROM obter_utilizador_completo_por_pk(%s)",
-                [user_id]
-            )
-            row = cursor.fetchone()
-            
-            if row:
-                return UtilizadorFromDB(row)
+        # Perfil em cache (utilizador + ids do role), ver core/user_cache.py.
+        # Um utilizador desativado deixa de ter sessão
+        row = obter_perfil(user_id)
+        if row:
+            user = UtilizadorFromDB(row)
+            if user.ativo:
+                return user
         
         return None
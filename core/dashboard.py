@@ -0,0 +1,112 @@
+# core/dashboard.py
+"""
+Estatísticas do dashboard de administração.
+
+Os totais globais (pacientes, médicos, enfermeiros, unidades) vêm da tabela
+"CONTADORES", mantida por triggers, e os restantes indicadores são
+calculados numa única passagem com FILTER (obter_dashboard_admin_stats), por
+isso o custo não cresce com o histórico de consultas e faturas.
+
+O resultado completo (indicadores, evolução mensal, últimas consultas) fica
+em cache durante DASHBOARD_CACHE_TTL segundos: vários admins a abrir a
+página inicial partilham o mesmo cálculo.
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from .matviews import estado_matviews
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'dashboard_admin:{}'
+
+CAMPOS_STATS = (
+    'total_pacientes',
+    'total_medicos',
+    'total_enfermeiros',
+    'total_unidades',
+    'consultas_hoje',
+    'consultas_mes',
+    'consultas_pendentes',
+    'faturas_pendentes',
+    'receita_mes',
+)
+
+
+def calcular_dashboard_admin(hoje):
+    """Lê da base de dados todos os dados do dashboard (sem cache)"""
+    inicio_mes = hoje.replace(day=1)
+
+    # Estatísticas gerais via função SQL (uma só query)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT * FROM obter_dashboard_admin_stats(%s)",
+            [inicio_mes]
+        )
+        stats_row = cursor.fetchone()
+    dados = dict(zip(CAMPOS_STATS, stats_row or (0,) * len(CAMPOS_STATS)))
+
+    # Evolução dos últimos 12 meses: meses fechados da materialized view, mês atual em tempo real
+    evolucao_mensal = []
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT * FROM obter_estatisticas_mensais(%s)", [12])
+        for row in cursor.fetchall():
+            evolucao_mensal.append({
+                'mes': row[0],
+                'total_consultas': row[1],
+                'consultas_realizadas': row[2],
+                'consultas_canceladas': row[3],
+                'total_faturas': row[4],
+                'valor_total_pago': row[5] or 0,
+                'medicos_ativos': row[6],
+                'pacientes_atendidos': row[7],
+            })
+
+    # Últimas atividades (últimas 10 consultas) via view SQL
+    ultimas_consultas = []
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT id_consulta, paciente_nome, medico_nome, data_consulta, hora_consulta, estado
+            FROM vw_admin_ultimas_consultas
+            ORDER BY data_consulta DESC, hora_consulta DESC
+            LIMIT 10
+        """)
+        for row in cursor.fetchall():
+            ultimas_consultas.append({
+                'id_consulta': row[0],
+                'paciente_nome': row[1],
+                'medico_nome': row[2],
+                'data_consulta': row[3],
+                'hora_consulta': row[4],
+                'estado': row[5],
+            })
+
+    dados.update({
+        'ultimas_consultas': ultimas_consultas,
+        'evolucao_mensal': evolucao_mensal,
+        'matviews': estado_matviews(),
+    })
+    return dados
+
+
+def obter_dashboard_admin(hoje=None):
+    """
+    Dados do dashboard, lidos da cache quando possível. A chave inclui o
+    dia, por isso os indicadores "hoje"/"mês" mudam à meia-noite.
+    """
+    hoje = hoje or timezone.now().date()
+    key = CACHE_KEY.format(hoje.isoformat())
+    dados = cache.get(key)
+    if dados is not None:
+        return dados
+
+    dados = calcular_dashboard_admin(hoje)
+    ttl = getattr(settings, 'DASHBOARD_CACHE_TTL', 30)
+    if ttl:
+        cache.set(key, dados, ttl)
+    return dados
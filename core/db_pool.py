@@ -0,0 +1,268 @@
+# core/db_pool.py
+"""
+Pools de conexões PostgreSQL por role.
+
+Em vez de fechar e reabrir a conexão em cada request (um handshake TCP +
+autenticação por cada troca de credenciais), cada role da aplicação
+(app_paciente_user, app_medico_user, app_enfermeiro_user, app_admin_user)
+mantém um pool limitado de conexões já abertas. O middleware faz checkout
+de uma conexão no início do request e devolve-a no fim.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Nenhuma conexão ficou livre dentro do tempo de espera configurado"""
+
+
+class RolePool:
+    """
+    Pool limitado de conexões para um único utilizador PostgreSQL.
+
+    - ``min_size`` conexões são abertas no primeiro checkout (pool "quente")
+    - nunca existem mais de ``max_size`` conexões abertas em simultâneo
+    - quando o pool está esgotado, o checkout espera até ``timeout`` segundos
+    - conexões partidas são descartadas e substituídas (contam como reconnect)
+    """
+
+    def __init__(self, name, connect, min_size=2, max_size=10, timeout=5.0, max_idle=30.0):
+        self.name = name
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+
+        self._idle = deque()  # (conexão, instante em que ficou livre)
+        self._in_use = 0
+        self._opening = 0  # lugares reservados para conexões a abrir no aquecimento
+        self._warmed = False
+        self._cond = threading.Condition()
+
+        # Métricas
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.reconnects = 0
+
+    @property
+    def size(self):
+        return len(self._idle) + self._in_use + self._opening
+
+    def _open(self, reconnect=False):
+        """Abre uma conexão (chamado sem o lock: é I/O); só as métricas usam o lock"""
+        conn = self._connect()
+        with self._cond:
+            self.connects += 1
+            if reconnect:
+                self.reconnects += 1
+        return conn
+
+    def _warm_up(self):
+        """
+        Abre as conexões mínimas. Os lugares são reservados com o lock, mas as
+        conexões são abertas fora dele, para não bloquear os outros checkouts
+        (nem putconn) durante os handshakes.
+        """
+        with self._cond:
+            if self._warmed:
+                return
+            self._warmed = True
+            reservadas = max(0, self.min_size - self.size)
+            self._opening += reservadas
+
+        abertas = []
+        try:
+            for _ in range(reservadas):
+                abertas.append(self._open())
+        except Exception as e:
+            logger.warning(f"Pool {self.name}: falha ao pré-abrir conexão: {e}")
+        finally:
+            with self._cond:
+                self._opening -= reservadas
+                agora = time.monotonic()
+                self._idle.extend((conn, agora) for conn in abertas)
+                self._cond.notify_all()
+
+    @staticmethod
+    def _is_usable(conn):
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    def getconn(self):
+        """Faz checkout de uma conexão, esperando se o pool estiver esgotado"""
+        if not self._warmed:
+            self._warm_up()
+
+        with self._cond:
+            started = None
+            while not self._idle and self.size >= self.max_size:
+                if started is None:
+                    started = time.monotonic()
+                    self.waits += 1
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    self.wait_time += time.monotonic() - started
+                    raise PoolTimeout(
+                        f"Pool {self.name} esgotado ({self.max_size} conexões em uso)"
+                    )
+                self._cond.wait(remaining)
+
+            if started is not None:
+                self.wait_time += time.monotonic() - started
+
+            self.checkouts += 1
+            self._in_use += 1
+            if self._idle:
+                conn, idle_since = self._idle.pop()
+            else:
+                conn, idle_since = None, None
+
+        # I/O fora do lock: validar conexões paradas há muito tempo ou abrir uma nova
+        try:
+            if conn is not None and (
+                getattr(conn, 'closed', False)
+                or (time.monotonic() - idle_since > self.max_idle and not self._is_usable(conn))
+            ):
+                self._discard(conn)
+                conn = self._open(reconnect=True)
+            elif conn is None:
+                conn = self._open()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def putconn(self, conn):
+        """Devolve uma conexão ao pool, descartando-a se estiver partida"""
+        reusable = not getattr(conn, 'closed', False)
+        if reusable:
+            try:
+                # Nunca devolver uma conexão com transação pendente
+                if not conn.autocommit:
+                    conn.rollback()
+                    conn.autocommit = True
+            except Exception:
+                reusable = False
+
+        with self._cond:
+            self._in_use -= 1
+            if reusable and self.size < self.max_size:
+                self._idle.append((conn, time.monotonic()))
+                conn = None
+            self._cond.notify()
+
+        if conn is not None:
+            self._discard(conn)
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def closeall(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._warmed = False
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def metrics(self):
+        with self._cond:
+            return {
+                'role': self.name,
+                'size': self.size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'max_size': self.max_size,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_time_ms': round(self.wait_time * 1000, 2),
+                'timeouts': self.timeouts,
+                'connects': self.connects,
+                'reconnects': self.reconnects,
+            }
+
+
+class RolePoolRegistry:
+    """
+    Um pool por role da aplicação, criados a pedido com as credenciais
+    de DatabaseRoleMiddleware.ROLE_DB_MAPPING.
+    """
+
+    def __init__(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def get_pool(self, role, credentials, wrapper):
+        pool = self._pools.get(role)
+        if pool is not None:
+            return pool
+
+        with self._lock:
+            pool = self._pools.get(role)
+            if pool is None:
+                pool = RolePool(
+                    credentials['USER'],
+                    connect=lambda: _connect_as(wrapper, credentials),
+                    min_size=getattr(settings, 'DB_POOL_MIN_SIZE', 2),
+                    max_size=getattr(settings, 'DB_POOL_MAX_SIZE', 10),
+                    timeout=getattr(settings, 'DB_POOL_TIMEOUT', 5.0),
+                    max_idle=getattr(settings, 'DB_POOL_MAX_IDLE', 30.0),
+                )
+                self._pools[role] = pool
+        return pool
+
+    def metrics(self):
+        return {role: pool.metrics() for role, pool in self._pools.items()}
+
+    def closeall(self):
+        for pool in self._pools.values():
+            pool.closeall()
+
+
+def _connect_as(wrapper, credentials):
+    """
+    Abre uma conexão com os mesmos parâmetros do DatabaseWrapper do Django,
+    trocando apenas o utilizador/password, e deixa-a no mesmo estado que o
+    Django espera (autocommit + timezone).
+    """
+    params = wrapper.get_connection_params()
+    params['user'] = credentials['USER']
+    params['password'] = credentials['PASSWORD']
+    conn = wrapper.get_new_connection(params)
+    conn.autocommit = True
+    timezone_name = wrapper.timezone_name
+    if timezone_name:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT set_config('TimeZone', %s, false)", [timezone_name])
+    return conn
+
+
+# Instância global (uma por processo)
+role_pools = RolePoolRegistry()
+
+
+def obter_metricas_pools():
+    """Métricas de todos os pools (checkouts, esperas, reconexões, ...)"""
+    return role_pools.metrics()
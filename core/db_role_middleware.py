@@ -1,6 +1,68 @@
-import os
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
 from django.db import connection
 from django.contrib.auth import get_user_model
+from django.http import FileResponse, HttpResponse
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from .db_pool import PoolTimeout, role_pools
+from .db_router import ROLE_DB_CREDENTIALS
+
+logger = logging.getLogger(__name__)
+
+
+class _ConteudoComFecho:
+    """Conteúdo de uma StreamingHttpResponse que chama ``fechar`` no fecho da resposta"""
+    
+    def __init__(self, conteudo, fechar):
+        self.conteudo = conteudo
+        self.fechar = fechar
+    
+    def __iter__(self):
+        return iter(self.conteudo)
+    
+    def close(self):
+        self.fechar()
+
+
+def responder_com_contexto(get_response, request, sair):
+    """
+    Processa o request e chama ``sair`` (repor a conexão/role padrão) no fim.
+    
+    Numa StreamingHttpResponse (exportações, core/exportacao.py) as queries
+    correm enquanto o conteúdo é enviado, depois de o middleware devolver a
+    resposta: ``sair`` fica adiado para o fecho da resposta, que o servidor
+    WSGI chama no fim do envio (depois de fechar o gerador do conteúdo).
+    """
+    try:
+        response = get_response(request)
+    except BaseException:
+        sair()
+        raise
+    if response.streaming and not isinstance(response, FileResponse):
+        response.streaming_content = _ConteudoComFecho(response.streaming_content, sair)
+    else:
+        sair()
+    return response
+
+def _adotar_conexao(conn):
+    """
+    Coloca ``conn`` (do pool, já em autocommit e com a timezone) no
+    DatabaseWrapper com o estado que ``connect()`` lhe deixaria, sem abrir
+    a conexão padrão só para inicializar o wrapper.
+    """
+    connection.connection = conn
+    connection.autocommit = True
+    connection.in_atomic_block = False
+    connection.savepoint_ids = []
+    connection.atomic_blocks = []
+    connection.needs_rollback = False
+    connection.closed_in_transaction = False
+    connection.errors_occurred = False
+    connection.run_on_commit = []
+
 
 class DatabaseRoleMiddleware:
     """
@@ -9,81 +71,123 @@ class DatabaseRoleMiddleware:
     Fluxo:
     1. User faz login no Django (autenticação normal)
     2. Middleware detecta o role do user (paciente, medico, enfermeiro, admin)
-    3. Fecha a conexão atual do base de dados
-    4. Reconecta usando as credenciais do role apropriado
-    5. Todas as queries subsequentes usam as permissões daquele role
+    3. Faz checkout de uma conexão do pool desse role (ver core/db_pool.py)
+    4. Todas as queries subsequentes usam as permissões daquele role
+    5. No fim do request a conexão volta ao pool, sem fechar nada
+    
+    Os pools são opt-in (DB_POOL_ENABLED=True); por omissão usa o modo
+    antigo (fechar e reconectar com as credenciais do role).
     """
     
-    ROLE_DB_MAPPING = {
-        'paciente': {
-            'USER': 'app_paciente_user',
-            'PASSWORD': os.getenv('APP_PACIENTE_PASSWORD', 'w6b@AA5V#A4MhD!XtihLu!paER'),
-        },
-        'medico': {
-            'USER': 'app_medico_user',
-            'PASSWORD': os.getenv('APP_MEDICO_PASSWORD', 'D&VDBV4rae$L7R*wZ&ut72Jue&'),
-        },
-        'enfermeiro': {
-            'USER': 'app_enfermeiro_user',
-            'PASSWORD': os.getenv('APP_ENFERMEIRO_PASSWORD', '5Pb3Qb&MN*J8U&cLckHu5ozsSC'),
-        },
-        'admin': {
-            'USER': 'app_admin_user',
-            'PASSWORD': os.getenv('APP_ADMIN_PASSWORD', '7V4&RR^C9cRrg*Sk$ahk7kjGeC'),
-        },
-    }
+    ROLE_DB_MAPPING = ROLE_DB_CREDENTIALS
     
     def __init__(self, get_response):
         self.get_response = get_response
         # Armazenar credenciais padrão (admin) para restaurar depois
         self.default_user = None
         self.default_password = None
+        self.use_pool = getattr(settings, 'DB_POOL_ENABLED', False)
     
     def __call__(self, request):
         """
         Executado para cada request.
         """
+        user_role = None
+        if request.user.is_authenticated:
+            user_role = getattr(request.user, 'role', None)
+        
+        if user_role not in self.ROLE_DB_MAPPING:
+            return self.get_response(request)
+        
+        if self.use_pool and connection.vendor == 'postgresql':
+            return self._call_with_pool(request, user_role)
+        return self._call_with_reconnect(request, user_role)
+    
+    def _call_with_pool(self, request, user_role):
+        """
+        Faz checkout de uma conexão já aberta do pool do role e coloca-a
+        no DatabaseWrapper do Django durante o request. A conexão padrão
+        (admin), se já estiver aberta, fica guardada e é reposta no fim; se
+        não estiver, não é aberta. Pool esgotado -> 503.
+        
+        Durante o request o wrapper tem também as credenciais do role (numa
+        cópia do settings_dict, que é partilhado entre threads): se a view
+        fechar a conexão, o Django reconecta como o role e não como admin, e
+        essa conexão extra é fechada no fim.
+        """
+        db_credentials = self.ROLE_DB_MAPPING[user_role]
+        pool = role_pools.get_pool(user_role, db_credentials, connection)
+        
+        try:
+            pooled_conn = pool.getconn()
+        except PoolTimeout as e:
+            logger.warning(str(e))
+            response = HttpResponse(
+                "Serviço temporariamente sobrecarregado. Tente novamente.", status=503
+            )
+            response['Retry-After'] = '1'
+            return response
+        
+        default_conn, default_autocommit = connection.connection, connection.autocommit
+        default_settings = connection.settings_dict
+        connection.settings_dict = {
+            **default_settings,
+            'USER': db_credentials['USER'],
+            'PASSWORD': db_credentials['PASSWORD'],
+        }
+        _adotar_conexao(pooled_conn)
+        def devolver():
+            # A view pode ter fechado a conexão; o pool descarta-a nesse caso
+            if connection.connection not in (pooled_conn, None):
+                connection.close()
+            connection.settings_dict = default_settings
+            connection.connection = default_conn
+            connection.autocommit = default_autocommit
+            pool.putconn(pooled_conn)
+        
+        if hasattr(request, 'session'):
+            request.session['_db_role'] = user_role
+        return responder_com_contexto(self.get_response, request, devolver)
+    
+    def _call_with_reconnect(self, request, user_role):
+        """
+        Modo antigo: troca as credenciais do DatabaseWrapper e reconecta.
+        Usado quando DB_POOL_ENABLED=False ou fora de PostgreSQL.
+        """
         # Armazenar credenciais padrão na primeira execução
         if self.default_user is None:
             self.default_user = connection.settings_dict.get('USER')
             self.default_password = connection.settings_dict.get('PASSWORD')
         
-        # Verificar se o user está autenticado
-        if request.user.is_authenticated:
-            # Obter o role do user
-            user_role = getattr(request.user, 'role', None)
-            
-            if user_role and user_role in self.ROLE_DB_MAPPING:
-                # Obter as credenciais do role correspondente
-                db_credentials = self.ROLE_DB_MAPPING[user_role]
-                
-                # Verificar se precisa trocar a conexão
-                current_user = connection.settings_dict.get('USER')
-                target_user = db_credentials['USER']
-                
-                if current_user != target_user:
-                    # Fechar conexão atual
-                    connection.close()
-                    
-                    # Atualizar credenciais da conexão
-                    connection.settings_dict['USER'] = db_credentials['USER']
-                    connection.settings_dict['PASSWORD'] = db_credentials['PASSWORD']
-                    
-                    # Log para debug (opcional)
-                    if hasattr(request, 'session'):
-                        request.session['_db_role'] = user_role
+        # Obter as credenciais do role correspondente
+        db_credentials = self.ROLE_DB_MAPPING[user_role]
         
-        # Processar o request
-        response = self.get_response(request)
+        # Verificar se precisa trocar a conexão
+        current_user = connection.settings_dict.get('USER')
+        target_user = db_credentials['USER']
         
-        # Restaurar conexão admin após processar a resposta
-        # Isso garante que operações como salvar sessão usem credenciais corretas
-        if connection.settings_dict.get('USER') != self.default_user:
+        if current_user != target_user:
+            # Fechar conexão atual
             connection.close()
-            connection.settings_dict['USER'] = self.default_user
-            connection.settings_dict['PASSWORD'] = self.default_password
+            
+            # Atualizar credenciais da conexão
+            connection.settings_dict['USER'] = db_credentials['USER']
+            connection.settings_dict['PASSWORD'] = db_credentials['PASSWORD']
+            
+            # Log para debug (opcional)
+            if hasattr(request, 'session'):
+                request.session['_db_role'] = user_role
         
-        return response
+        def restaurar():
+            # Restaurar conexão admin após processar a resposta
+            # Isso garante que operações como salvar sessão usem credenciais corretas
+            if connection.settings_dict.get('USER') != self.default_user:
+                connection.close()
+                connection.settings_dict['USER'] = self.default_user
+                connection.settings_dict['PASSWORD'] = self.default_password
+        
+        # Processar o request
+        return responder_com_contexto(self.get_response, request, restaurar)
     
     def process_exception(self, request, exception):
         """
@@ -103,48 +207,76 @@ class DatabaseRoleMiddleware:
         return None
 
 
+class RoleContextExecuteWrapper:
+    """
+    Execute wrapper (ver ``connection.execute_wrapper``) que aplica o role
+    PostgreSQL e o id do utilizador (RLS) no início de cada transação.
+    
+    O contexto é enviado na mesma ida ao servidor que a primeira query da
+    transação, como prefixo:
+    
+        SELECT set_config('role', 'app_medico_user', true),
+               set_config('app.current_user_id', '42', true); <query>
+    
+    ``set_config(..., true)`` equivale a ``SET LOCAL``: o PostgreSQL repõe
+    os valores no fim da transação, por isso uma conexão persistente
+    (CONN_MAX_AGE) nunca fica com o role de um request anterior.
+    
+    - em autocommit cada query é a sua própria transação → leva prefixo
+    - dentro de ``transaction.atomic()`` só a primeira query leva prefixo
+    
+    Com ``pg_role=None`` (a conexão já é do role, p.ex. no modo router) só o
+    app.current_user_id é aplicado.
+    """
+    
+    def __init__(self, pg_role, user_id):
+        # pg_role vem de ROLE_DB_MAPPING e user_id é inteiro: seguro para literal
+        definicoes = [f"set_config('app.current_user_id', '{int(user_id)}', true)"]
+        if pg_role:
+            definicoes.insert(0, f"set_config('role', '{pg_role}', true)")
+        self.prefix = f"SELECT {', '.join(definicoes)}; "
+    
+    def __call__(self, execute, sql, params, many, context):
+        raw = context['connection'].connection
+        if raw is not None and raw.get_transaction_status() == TRANSACTION_STATUS_IDLE:
+            if getattr(context['cursor'].cursor, 'name', None):
+                # Cursor do lado do servidor: o psycopg2 envia DECLARE ... FOR <sql>,
+                # por isso o contexto vai antes, numa query própria da mesma transação
+                with raw.cursor() as cursor:
+                    cursor.execute(self.prefix)
+            else:
+                sql = self.prefix + sql
+        return execute(sql, params, many, context)
+
+
 class SetPostgreSQLUserContextMiddleware:
     """
-    Middleware alternativo/complementar que usa SET ROLE para alternar users.
+    Middleware alternativo ao DatabaseRoleMiddleware que mantém uma única
+    conexão (persistente, com CONN_MAX_AGE) e alterna o role com SET LOCAL.
     
-    Este approach mantém uma única conexão mas alterna o role usando o comando PostgreSQL SET ROLE.
-    Mais leve que fechar/abrir conexões, mas requer que o user padrão tenha permissão
-    para assumir os outros roles.
+    O role e o current_user_id para RLS são aplicados num único statement
+    no início de cada transação (ver RoleContextExecuteWrapper), sem idas
+    extra ao servidor e sem RESET no fim do request.
+    
+    Requer que o utilizador da conexão seja membro dos roles app_*_user
+    (scripts/create_roles.sql, secção 7.1).
     """
     
     def __init__(self, get_response):
         self.get_response = get_response
     
     def __call__(self, request):
+        user_role = None
         if request.user.is_authenticated:
             user_role = getattr(request.user, 'role', None)
-            
-            if user_role:
-                role_mapping = {
-                    'paciente': 'app_paciente_user',
-                    'medico': 'app_medico_user',
-                    'enfermeiro': 'app_enfermeiro_user',
-                    'admin': 'app_admin_user',
-                }
-                
-                pg_role = role_mapping.get(user_role)
-                
-                if pg_role:
-                    try:
-                        with connection.cursor() as cursor:
-                            # Alternar para o role apropriado
-                            cursor.execute(f"SET ROLE {pg_role}")
-                    except Exception as e:
-                        print(f"Erro ao definir role PostgreSQL: {e}")
-        
-        response = self.get_response(request)
         
-        # Reset role para padrão após o request (opcional)
-        if request.user.is_authenticated and hasattr(request.user, 'role'):
-            try:
-                with connection.cursor() as cursor:
-                    cursor.execute("RESET ROLE")
-            except:
-                pass
+        if user_role not in ROLE_DB_CREDENTIALS or connection.vendor != 'postgresql':
+            return self.get_response(request)
         
-        return response
+        wrapper = RoleContextExecuteWrapper(
+            ROLE_DB_CREDENTIALS[user_role]['USER'],
+            request.user.id_utilizador,
+        )
+        contexto = ExitStack()
+        contexto.enter_context(connection.execute_wrapper(wrapper))
+        return responder_com_contexto(self.get_response, request, contexto.close)
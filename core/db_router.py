@@ -3,74 +3,123 @@ Database Router para utilizar diferentes database users baseado no role do utili
 Coloca este ficheiro em: core/db_router.py
 """
 
-from django.conf import settings
+import os
+from contextvars import ContextVar
+
+
+# Credenciais PostgreSQL de cada role da aplicação (ver scripts/create_roles.sql)
+ROLE_DB_CREDENTIALS = {
+    'paciente': {
+        'USER': 'app_paciente_user',
+        'PASSWORD': os.getenv('APP_PACIENTE_PASSWORD', 'w6b@AA5V#A4MhD!XtihLu!paER'),
+    },
+    'medico': {
+        'USER': 'app_medico_user',
+        'PASSWORD': os.getenv('APP_MEDICO_PASSWORD', 'D&VDBV4rae$L7R*wZ&ut72Jue&'),
+    },
+    'enfermeiro': {
+        'USER': 'app_enfermeiro_user',
+        'PASSWORD': os.getenv('APP_ENFERMEIRO_PASSWORD', '5Pb3Qb&MN*J8U&cLckHu5ozsSC'),
+    },
+    'admin': {
+        'USER': 'app_admin_user',
+        'PASSWORD': os.getenv('APP_ADMIN_PASSWORD', '7V4&RR^C9cRrg*Sk$ahk7kjGeC'),
+    },
+}
+
+# Alias em settings.DATABASES de cada role
+ROLE_DB_ALIASES = {
+    'paciente': 'paciente_db',
+    'medico': 'medico_db',
+    'enfermeiro': 'enfermeiro_db',
+    'admin': 'admin_db',
+}
+
+# Role do request atual. Uma ContextVar (e não um dict por thread) fica
+# isolada por request tanto em WSGI como em ASGI e não deixa lixo quando
+# as threads são reutilizadas.
+_current_role = ContextVar('current_db_role', default=None)
+
+
+def build_role_databases(default, conn_max_age=60, health_checks=True):
+    """
+    Gera as entradas de settings.DATABASES para os aliases de cada role,
+    copiando a configuração de 'default' e trocando apenas as credenciais.
+
+    As conexões são persistentes (CONN_MAX_AGE) e verificadas antes de
+    serem reutilizadas (CONN_HEALTH_CHECKS), por isso trocar de role não
+    implica abrir uma nova conexão.
+    """
+    databases = {}
+    for role, alias in ROLE_DB_ALIASES.items():
+        db = dict(default)
+        db.update(ROLE_DB_CREDENTIALS[role])
+        db['CONN_MAX_AGE'] = conn_max_age
+        db['CONN_HEALTH_CHECKS'] = health_checks
+        # Nos testes todos os aliases usam a base de dados de teste de 'default'
+        db['TEST'] = {'MIRROR': 'default'}
+        databases[alias] = db
+    return databases
 
 
 class RoleBasedDatabaseRouter:
     """
     Router que seleciona a conexão de base de dados baseada no role do utilizador atual.
-    
+
     Cada role usa uma database user diferente com permissões específicas:
     - paciente → app_paciente_user
     - medico → app_medico_user
     - enfermeiro → app_enfermeiro_user
     - admin → app_admin_user
     """
-    
-    def __init__(self):
-        # Cache do utilizador atual por thread
-        self._current_user = {}
-    
+
     def _get_db_for_role(self, role):
         """Retorna o alias da base de dados para o role especificado"""
-        role_db_mapping = {
-            'paciente': 'paciente_db',
-            'medico': 'medico_db',
-            'enfermeiro': 'enfermeiro_db',
-            'admin': 'admin_db',
-        }
-        return role_db_mapping.get(role, 'default')
-    
+        return ROLE_DB_ALIASES.get(role, 'default')
+
     def _get_current_user_role(self):
-        """Obtém o role do utilizador atual da thread local"""
-        from threading import current_thread
-        thread_id = current_thread().ident
-        return self._current_user.get(thread_id)
-    
+        """Obtém o role do utilizador do request atual"""
+        return _current_role.get()
+
+    def get_current_alias(self):
+        """Alias da base de dados do request atual ('default' se não houver role)"""
+        role = self._get_current_user_role()
+        if role:
+            return self._get_db_for_role(role)
+        return 'default'
+
     def set_current_user(self, user):
-        """Define o utilizador atual para a thread (chamado pelo middleware)"""
-        from threading import current_thread
-        thread_id = current_thread().ident
+        """
+        Define o utilizador atual (chamado pelo middleware).
+        Devolve um token para repor o estado anterior com reset().
+        """
         if user and user.is_authenticated:
-            self._current_user[thread_id] = user.role
-        else:
-            self._current_user.pop(thread_id, None)
-    
+            return _current_role.set(getattr(user, 'role', None))
+        return _current_role.set(None)
+
+    def reset(self, token):
+        """Repõe o role que estava definido antes de set_current_user()"""
+        _current_role.reset(token)
+
     def db_for_read(self, model, **hints):
         """
         Seleciona a base de dados para operações de leitura baseado no role do user
         """
-        role = self._get_current_user_role()
-        if role:
-            return self._get_db_for_role(role)
-        return 'default'
-    
+        return self.get_current_alias()
+
     def db_for_write(self, model, **hints):
         """
         Seleciona a base de dados para operações de escrita baseado no role do user
         """
-        role = self._get_current_user_role()
-        if role:
-            return self._get_db_for_role(role)
-        return 'default'
-    
+        return self.get_current_alias()
+
     def allow_relation(self, obj1, obj2, **hints):
         """
         Permite relações entre objetos se estiverem na mesma base de dados
         """
         # Todas as databases apontam para o mesmo PostgreSQL, apenas users diferentes
         return True
-    
+
     def allow_migrate(self, db, app_label, model_name=None, **hints):
         """
         Apenas permite migrations na database 'default' com user admin
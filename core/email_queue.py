@@ -0,0 +1,280 @@
+# core/email_queue.py
+"""
+Envio de emails em background com uma fila limitada e um pool fixo de workers.
+
+Substitui a thread por email: os emails são postos numa queue.Queue com
+tamanho máximo (EMAIL_QUEUE_MAX) e enviados por EMAIL_WORKERS threads. Cada
+worker mantém uma conexão SMTP aberta (get_connection()) e envia os emails
+que já estão na fila em lotes, respeitando um limite de emails por segundo
+partilhado entre workers (EMAIL_RATE_LIMIT). Um email que falha é repetido
+(ele e os seguintes do lote, nunca os já enviados) com backoff exponencial
+até EMAIL_MAX_TENTATIVAS.
+
+Quem precisa de saber se o email foi mesmo entregue ao servidor SMTP (por
+exemplo, o registo de lembretes) passa ``ao_concluir`` a enfileirar(): é
+chamado uma vez, na thread do worker, com True se o envio correu bem ou False
+se falhou ou o email foi rejeitado. Emails que ficam na fila quando o pool é
+parado não chegam a ter resultado.
+
+O pool arranca no primeiro email e é drenado à saída do processo (atexit),
+por isso o número de threads é constante, seja qual for o volume de emails.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.utils.html import strip_tags
+
+logger = logging.getLogger(__name__)
+
+# Marca de paragem para os workers
+_PARAR = object()
+
+
+class LimiteTaxa:
+    """Limite de N envios por segundo partilhado entre threads (0 = sem limite)"""
+
+    def __init__(self, por_segundo):
+        self.por_segundo = por_segundo
+        self._proximo = 0.0
+        self._lock = threading.Lock()
+
+    def aguardar(self, n=1):
+        if not self.por_segundo:
+            return
+        with self._lock:
+            agora = time.monotonic()
+            inicio = max(agora, self._proximo)
+            self._proximo = inicio + n / self.por_segundo
+        if inicio > agora:
+            time.sleep(inicio - agora)
+
+
+class EmailDispatcher:
+    """Fila limitada de emails + pool fixo de workers com conexão SMTP persistente"""
+
+    def __init__(self, workers=2, max_fila=1000, tamanho_lote=20, por_segundo=0,
+                 max_tentativas=3, backoff=2.0, inatividade=30.0):
+        self.workers = workers
+        self.tamanho_lote = tamanho_lote
+        self.max_tentativas = max_tentativas
+        self.backoff = backoff
+        self.inatividade = inatividade
+        self.limite = LimiteTaxa(por_segundo)
+        self.fila = queue.Queue(maxsize=max_fila)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._a_parar = False
+        self.enviados = 0
+        self.falhados = 0
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            workers=getattr(settings, 'EMAIL_WORKERS', 2),
+            max_fila=getattr(settings, 'EMAIL_QUEUE_MAX', 1000),
+            tamanho_lote=getattr(settings, 'EMAIL_BATCH_SIZE', 20),
+            por_segundo=getattr(settings, 'EMAIL_RATE_LIMIT', 0),
+            max_tentativas=getattr(settings, 'EMAIL_MAX_TENTATIVAS', 3),
+            backoff=getattr(settings, 'EMAIL_BACKOFF_SEGUNDOS', 2.0),
+        )
+
+    def _iniciar(self):
+        with self._lock:
+            if self._threads or self._a_parar:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'email-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Pool de email iniciado com {self.workers} workers")
+
+    def enfileirar(self, mensagem, timeout=5, ao_concluir=None):
+        """
+        Põe um EmailMessage na fila. Bloqueia até ``timeout`` segundos se a
+        fila estiver cheia; devolve False se não conseguiu enfileirar.
+        ``ao_concluir(enviado)`` é chamado com o resultado do envio.
+        """
+        if self._a_parar:
+            logger.error(f"Email '{mensagem.subject}' rejeitado: pool de email a parar")
+            _concluir(ao_concluir, False)
+            return False
+        self._iniciar()
+        try:
+            self.fila.put((mensagem, ao_concluir), timeout=timeout)
+            return True
+        except queue.Full:
+            logger.error(f"Fila de email cheia, email '{mensagem.subject}' descartado")
+            _concluir(ao_concluir, False)
+            return False
+
+    def _lote(self, primeira):
+        """O primeiro email mais os que já estiverem na fila (até tamanho_lote)"""
+        lote = [primeira]
+        parar = False
+        while len(lote) < self.tamanho_lote:
+            try:
+                item = self.fila.get_nowait()
+            except queue.Empty:
+                break
+            if item is _PARAR:
+                parar = True
+                break
+            lote.append(item)
+        return lote, parar
+
+    def _enviar_lote(self, conexao, lote):
+        """
+        Envia o lote de pares (mensagem, ao_concluir) mensagem a mensagem na
+        conexão aberta. Uma falha só repete a mensagem que falhou e as
+        seguintes (as já enviadas não são enviadas outra vez); esgotadas as
+        tentativas, as que faltam contam como falhadas.
+        """
+        pendentes = list(lote)
+        tentativa = 1
+        while pendentes:
+            mensagem, ao_concluir = pendentes[0]
+            try:
+                self.limite.aguardar()
+                conexao.open()
+                enviado = conexao.send_messages([mensagem]) or 0
+            except Exception as e:
+                # Conexão possivelmente inválida: fechar para reabrir na próxima tentativa
+                try:
+                    conexao.close()
+                except Exception:
+                    pass
+                if tentativa == self.max_tentativas:
+                    with self._lock:
+                        self.falhados += len(pendentes)
+                    logger.error(f"Erro ao enviar {len(pendentes)} emails após {tentativa} tentativas: {e}")
+                    for _, callback in pendentes:
+                        _concluir(callback, False)
+                    return
+                espera = self.backoff * 2 ** (tentativa - 1)
+                logger.warning(f"Erro ao enviar emails (tentativa {tentativa}), nova tentativa em {espera}s: {e}")
+                time.sleep(espera)
+                tentativa += 1
+                continue
+
+            pendentes.pop(0)
+            tentativa = 1
+            with self._lock:
+                if enviado:
+                    self.enviados += 1
+                else:
+                    self.falhados += 1
+            if enviado:
+                logger.info(f"Email '{mensagem.subject}' enviado com sucesso para {mensagem.to}")
+            else:
+                logger.warning(f"Email '{mensagem.subject}' não enviado para {mensagem.to}")
+            _concluir(ao_concluir, bool(enviado))
+
+    def _worker(self):
+        conexao = get_connection(fail_silently=False)
+        aberta = False
+        try:
+            while True:
+                try:
+                    item = self.fila.get(timeout=self.inatividade)
+                except queue.Empty:
+                    # Sem emails há algum tempo: libertar a conexão SMTP
+                    if aberta:
+                        conexao.close()
+                        aberta = False
+                    continue
+
+                if item is _PARAR:
+                    self.fila.task_done()
+                    return
+
+                lote, parar = self._lote(item)
+                try:
+                    self._enviar_lote(conexao, lote)
+                    aberta = True
+                finally:
+                    for _ in range(len(lote) + (1 if parar else 0)):
+                        self.fila.task_done()
+                if parar:
+                    return
+        finally:
+            try:
+                conexao.close()
+            except Exception:
+                pass
+
+    def drenar(self, timeout=30):
+        """Deixa de aceitar emails, envia os que estão na fila e para os workers"""
+        with self._lock:
+            self._a_parar = True
+            threads = list(self._threads)
+        for _ in threads:
+            self.fila.put(_PARAR)
+        limite = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0, limite - time.monotonic()))
+        pendentes = self.fila.qsize()
+        if pendentes:
+            logger.warning(f"Pool de email parado com {pendentes} emails por enviar")
+        with self._lock:
+            self._threads = []
+
+
+def _concluir(ao_concluir, enviado):
+    """Chama o callback de resultado do email; um erro no callback não para o worker"""
+    if ao_concluir is None:
+        return
+    try:
+        ao_concluir(enviado)
+    except Exception as e:
+        logger.error(f"Erro no callback de envio de email: {e}")
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def obter_dispatcher():
+    """Dispatcher partilhado do processo (criado no primeiro uso)"""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = EmailDispatcher.from_settings()
+                atexit.register(_dispatcher.drenar)
+    return _dispatcher
+
+
+def construir_email(subject, html_message, recipient_list):
+    """Email com versão HTML e versão em texto simples"""
+    mensagem = EmailMultiAlternatives(
+        subject=subject,
+        body=strip_tags(html_message),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=recipient_list,
+    )
+    mensagem.attach_alternative(html_message, 'text/html')
+    return mensagem
+
+
+def enviar_email(subject, html_message, recipient_list):
+    """Constrói o email (HTML + texto) e põe-no na fila de envio"""
+    return obter_dispatcher().enfileirar(construir_email(subject, html_message, recipient_list))
+
+
+def enviar_emails(mensagens, ao_concluir=None):
+    """
+    Põe vários emails já construídos na fila. Devolve, para cada um, se foi
+    enfileirado. ``ao_concluir`` é uma lista de callbacks, um por mensagem.
+    """
+    dispatcher = obter_dispatcher()
+    callbacks = ao_concluir or [None] * len(mensagens)
+    return [
+        dispatcher.enfileirar(mensagem, ao_concluir=callback)
+        for mensagem, callback in zip(mensagens, callbacks)
+    ]
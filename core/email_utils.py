@@ -1,42 +1,20 @@
 # core/email_utils.py
 
-import threading
 import logging
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
-from django.conf import settings
+import threading
+from django.template.loader import get_template, render_to_string
 from django.utils import timezone
 from datetime import timedelta
 from django.db import connection
+from .email_queue import construir_email, enviar_email, enviar_emails
 
 logger = logging.getLogger(__name__)
 
 
-def _send_email_thread(subject, html_message, recipient_list):
-    """
-    Internal function to send email in a separate thread.
-    This prevents blocking the main request/response cycle.
-    """
-    try:
-        plain_message = strip_tags(html_message)
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=recipient_list,
-            html_message=html_message,
-            fail_silently=False,
-        )
-        logger.info(f"Email '{subject}' enviado com sucesso para {recipient_list}")
-    except Exception as e:
-        logger.error(f"Erro ao enviar email '{subject}': {str(e)}")
-
-
 def enviar_email_confirmacao(consulta_id):
     """
     Envia email de confirmação da consulta para o paciente de forma assíncrona.
-    Usa threading para não bloquear a resposta HTTP.
+    Usa a fila de email (core/email_queue.py) para não bloquear a resposta HTTP.
     
     Args:
         consulta_id: ID da consulta confirmada
@@ -71,15 +49,10 @@ def enviar_email_confirmacao(consulta_id):
         subject = 'Consulta Confirmada - MediPulse'
         recipient_list = [consulta_dict['paciente_email']]
         
-        # Enviar email em thread separada (non-blocking)
-        thread = threading.Thread(
-            target=_send_email_thread,
-            args=(subject, html_message, recipient_list)
-        )
-        thread.daemon = True
-        thread.start()
+        # Enviar email pela fila do pool de email (non-blocking)
+        enviar_email(subject, html_message, recipient_list)
         
-        logger.info(f"Thread de email de confirmação iniciada para consulta {consulta_id}")
+        logger.info(f"Email de confirmação enfileirado para consulta {consulta_id}")
         
     except Exception as e:
         logger.error(f"Erro ao preparar email de confirmação para consulta {consulta_id}: {str(e)}")
@@ -127,15 +100,10 @@ def enviar_email_cancelamento(consulta_id, motivo_cancelamento=''):
         subject = 'Consulta Cancelada - MediPulse'
         recipient_list = [consulta_dict['paciente_email']]
         
-        # Enviar email em thread separada (non-blocking)
-        thread = threading.Thread(
-            target=_send_email_thread,
-            args=(subject, html_message, recipient_list)
-        )
-        thread.daemon = True
-        thread.start()
+        # Enviar email pela fila do pool de email (non-blocking)
+        enviar_email(subject, html_message, recipient_list)
         
-        logger.info(f"Thread de email de cancelamento iniciada para consulta {consulta_id}")
+        logger.info(f"Email de cancelamento enfileirado para consulta {consulta_id}")
         
     except Exception as e:
         logger.error(f"Erro ao preparar email de cancelamento para consulta {consulta_id}: {str(e)}")
@@ -180,15 +148,10 @@ def enviar_lembrete(consulta_id, tempo_restante):
         subject = f'Lembrete: Consulta {tempo_restante} - MediPulse'
         recipient_list = [consulta_dict['paciente_email']]
         
-        # Enviar email em thread separada (non-blocking)
-        thread = threading.Thread(
-            target=_send_email_thread,
-            args=(subject, html_message, recipient_list)
-        )
-        thread.daemon = True
-        thread.start()
+        # Enviar email pela fila do pool de email (non-blocking)
+        enviar_email(subject, html_message, recipient_list)
         
-        logger.info(f"Thread de lembrete iniciada para consulta {consulta_id}")
+        logger.info(f"Lembrete enfileirado para consulta {consulta_id}")
         
     except Exception as e:
         logger.error(f"Erro ao preparar lembrete para consulta {consulta_id}: {str(e)}")
@@ -198,6 +161,98 @@ def enviar_lembrete(consulta_id, tempo_restante):
 # SCHEDULED TASKS - Called by APScheduler
 # ============================================================================
 
+def _hora_local(valor):
+    """Datetime aware -> naive em hora local (como data_consulta + hora_consulta)"""
+    return timezone.localtime(valor).replace(tzinfo=None)
+
+
+class ConfirmacaoLembretes:
+    """
+    Confirma no registo "LEMBRETES" só os lembretes cujo email foi entregue
+    ao servidor SMTP. O dispatcher chama o callback de cada email na thread
+    do worker quando o envio acaba; os entregues são confirmados com
+    marcar_lembretes_enviados em lotes de ``tamanho_lote`` (e o resto quando
+    o último email tiver resultado). Os que falham ficam pendentes e voltam
+    a ser reservados por reservar_lembretes depois de p_expirar.
+    """
+
+    def __init__(self, total, tamanho_lote=100):
+        self.tamanho_lote = tamanho_lote
+        self._por_concluir = total
+        self._entregues = []
+        self._lock = threading.Lock()
+
+    def callback(self, id_lembrete):
+        return lambda enviado: self.concluir(id_lembrete, enviado)
+
+    def concluir(self, id_lembrete, enviado):
+        with self._lock:
+            self._por_concluir -= 1
+            if enviado:
+                self._entregues.append(id_lembrete)
+            if len(self._entregues) < self.tamanho_lote and self._por_concluir > 0:
+                return
+            entregues, self._entregues = self._entregues, []
+        if not entregues:
+            return
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("CALL marcar_lembretes_enviados(%s::INTEGER[])", [entregues])
+        except Exception as e:
+            logger.error(f"Erro ao confirmar {len(entregues)} lembretes enviados: {str(e)}")
+        finally:
+            # Thread do worker de email: não deixar a conexão aberta
+            connection.close()
+
+
+def enviar_lembretes_janela(inicio_janela, fim_janela, tempo_restante, tipo_lembrete):
+    """
+    Envia lembretes do tipo ``tipo_lembrete`` ('24h', '2h') para as consultas
+    confirmadas entre inicio_janela e fim_janela.
+    
+    Os lembretes são reservados e os dados das consultas obtidos numa única
+    query (reservar_lembretes): uma consulta já lembrada nunca é devolvida de
+    novo, por isso janelas sobrepostas e vários workers em paralelo não
+    duplicam emails. Os emails são entregues à fila de email de uma vez e cada
+    lembrete só é confirmado (ConfirmacaoLembretes) depois de o servidor SMTP
+    aceitar o email; os que falham voltam a ser reservados mais tarde.
+    
+    Returns:
+        Número de lembretes enfileirados
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT * FROM reservar_lembretes(%s, %s, %s)",
+            [tipo_lembrete, _hora_local(inicio_janela), _hora_local(fim_janela)]
+        )
+        columns = [col[0] for col in cursor.description]
+        consultas = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    
+    if not consultas:
+        return 0
+    
+    template = get_template('emails/lembrete_consulta.html')
+    subject = f'Lembrete: Consulta {tempo_restante} - MediPulse'
+    lembretes, mensagens = [], []
+    for consulta_dict in consultas:
+        try:
+            html_message = template.render({
+                'consulta': consulta_dict,
+                'tempo_restante': tempo_restante,
+            })
+            mensagens.append(construir_email(subject, html_message, [consulta_dict['paciente_email']]))
+            lembretes.append(consulta_dict['id_lembrete'])
+        except Exception as e:
+            logger.error(f"Erro ao preparar lembrete para consulta {consulta_dict['id_consulta']}: {str(e)}")
+    
+    confirmacao = ConfirmacaoLembretes(len(lembretes))
+    enfileirados = enviar_emails(
+        mensagens,
+        ao_concluir=[confirmacao.callback(id_lembrete) for id_lembrete in lembretes],
+    )
+    return sum(enfileirados)
+
+
 def enviar_lembretes_24h():
     """
     Tarefa agendada: Envia lembretes para consultas que acontecerão em 24 horas.
@@ -206,43 +261,16 @@ def enviar_lembretes_24h():
     logger.info("Iniciando envio de lembretes de 24h...")
     agora = timezone.now()
     
-    # Buscar consultas confirmadas para daqui a 24h (±1h de margem)
-    inicio_janela = agora + timedelta(hours=23)
-    fim_janela = agora + timedelta(hours=25)
-    
-    # Use SQL to get consultas
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT id_consulta, data_consulta, hora_consulta
-            FROM "CONSULTAS"
-            WHERE estado = 'confirmada'
-            AND data_consulta BETWEEN %s AND %s
-        """, [inicio_janela.date(), fim_janela.date()])
-        
-        consultas = cursor.fetchall()
-    
-    emails_enviados = 0
+    # Consultas confirmadas para daqui a 24h (±1h de margem)
+    emails_enviados = enviar_lembretes_janela(
+        agora + timedelta(hours=23),
+        agora + timedelta(hours=25),
+        'amanhã',
+        '24h'
+    )
     
-    for consulta_row in consultas:
-        consulta_id = consulta_row[0]
-        data_consulta = consulta_row[1]
-        hora_consulta = consulta_row[2]
-        
-        # Combinar data e hora para comparação precisa
-        data_hora_consulta = timezone.make_aware(
-            timezone.datetime.combine(data_consulta, hora_consulta)
-        )
-        
-        # Verificar se está na janela de 24h
-        if inicio_janela <= data_hora_consulta <= fim_janela:
-            try:
-                enviar_lembrete(consulta_id, 'amanhã')
-                emails_enviados += 1
-            except Exception as e:
-                logger.error(f"Erro ao enviar lembrete 24h para consulta {consulta_id}: {str(e)}")
-    
-    logger.info(f"Tarefa enviar_lembretes_24h concluída. {emails_enviados} emails enviados.")
-    return f"{emails_enviados} lembretes de 24h enviados"
+    logger.info(f"Tarefa enviar_lembretes_24h concluída. {emails_enviados} emails enfileirados.")
+    return f"{emails_enviados} lembretes de 24h enfileirados"
 
 
 def enviar_lembretes_2h():
@@ -253,49 +281,22 @@ def enviar_lembretes_2h():
     logger.info("Iniciando envio de lembretes de 2h...")
     agora = timezone.now()
     
-    # Buscar consultas confirmadas para daqui a 2h (±30min de margem)
-    inicio_janela = agora + timedelta(hours=1.5)
-    fim_janela = agora + timedelta(hours=2.5)
-    
-    # Use SQL to get consultas
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT id_consulta, data_consulta, hora_consulta
-            FROM "CONSULTAS"
-            WHERE estado = 'confirmada'
-            AND data_consulta = %s
-        """, [agora.date()])
-        
-        consultas = cursor.fetchall()
-    
-    emails_enviados = 0
-    
-    for consulta_row in consultas:
-        consulta_id = consulta_row[0]
-        data_consulta = consulta_row[1]
-        hora_consulta = consulta_row[2]
-        
-        # Combinar data e hora para comparação precisa
-        data_hora_consulta = timezone.make_aware(
-            timezone.datetime.combine(data_consulta, hora_consulta)
-        )
-        
-        # Verificar se está na janela de 2h
-        if inicio_janela <= data_hora_consulta <= fim_janela:
-            try:
-                enviar_lembrete(consulta_id, 'daqui a 2 horas')
-                emails_enviados += 1
-            except Exception as e:
-                logger.error(f"Erro ao enviar lembrete 2h para consulta {consulta_id}: {str(e)}")
+    # Consultas confirmadas para daqui a 2h (±30min de margem)
+    emails_enviados = enviar_lembretes_janela(
+        agora + timedelta(hours=1.5),
+        agora + timedelta(hours=2.5),
+        'daqui a 2 horas',
+        '2h'
+    )
     
-    logger.info(f"Tarefa enviar_lembretes_2h concluída. {emails_enviados} emails enviados.")
-    return f"{emails_enviados} lembretes de 2h enviados"
+    logger.info(f"Tarefa enviar_lembretes_2h concluída. {emails_enviados} emails enfileirados.")
+    return f"{emails_enviados} lembretes de 2h enfileirados"
 
 
 def enviar_email_verificacao(user, request):
     """
     Envia email de verificação para o utilizador com link de ativação.
-    Gera um token único e envia email em thread separada.
+    Gera um token único e envia o email pela fila de email.
     
     Args:
         user: Objeto Utilizador que precisa verificar o email
@@ -323,13 +324,8 @@ def enviar_email_verificacao(user, request):
         subject = 'Verificar Email - MediPulse'
         recipient_list = [user.email]
         
-        # Enviar email em thread separada (non-blocking)
-        thread = threading.Thread(
-            target=_send_email_thread,
-            args=(subject, html_message, recipient_list)
-        )
-        thread.daemon = True
-        thread.start()
+        # Enviar email pela fila do pool de email (non-blocking)
+        enviar_email(subject, html_message, recipient_list)
         
         logger.info(f"Email de verificação enviado para {user.email}")
         return True
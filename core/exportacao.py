@@ -0,0 +1,248 @@
+# core/exportacao.py
+"""
+Exportação de relatórios em streaming (CSV e JSON).
+
+As linhas são lidas com um cursor do lado do servidor (named cursor do
+psycopg2, ``connection.chunked_cursor()``), EXPORT_ITERSIZE linhas por cada
+FETCH, e escritas à medida que chegam: o CSV linha a linha e o JSON como um
+array codificado item a item. A resposta é uma StreamingHttpResponse, por
+isso a memória usada não depende do número de linhas exportadas.
+
+Antes de devolver a resposta, a view valida os filtros e inicia a consulta
+(iniciar_linhas: executa a query e lê o primeiro lote): filtros inválidos e
+erros da base de dados dão o status HTTP certo (400/500) em vez de um 200
+com o corpo truncado.
+
+O conteúdo é gerado depois de a view devolver a resposta; os middlewares de
+role mantêm a conexão/role do utilizador até ao fecho da resposta (ver
+core/db_role_middleware.py, responder_com_contexto).
+"""
+
+import csv
+import itertools
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.http import StreamingHttpResponse
+
+
+class _Eco:
+    """Pseudo-ficheiro para o csv.writer: write devolve a linha em vez de a guardar"""
+
+    def write(self, valor):
+        return valor
+
+
+def linhas_servidor(sql, params, itersize=None):
+    """
+    Gera as linhas de ``sql`` com um cursor do lado do servidor.
+
+    O cursor só existe dentro de uma transação (sem WITH HOLD, que
+    materializaria o resultado inteiro no servidor antes do primeiro FETCH).
+    Com DISABLE_SERVER_SIDE_CURSORS (p.ex. atrás de um pgbouncer em modo
+    transaction) é um cursor normal.
+    """
+    itersize = itersize or getattr(settings, 'EXPORT_ITERSIZE', 2000)
+    with transaction.atomic():
+        with connection.chunked_cursor() as cursor:
+            if hasattr(cursor.cursor, 'itersize'):
+                cursor.cursor.itersize = itersize
+            cursor.execute(sql, params)
+            yield from cursor
+
+
+def iniciar_linhas(linhas):
+    """
+    Lê já a primeira linha de ``linhas`` (gerador de linhas_servidor), o que
+    abre a transação, executa a query e faz o primeiro FETCH, e devolve um
+    iterador com todas as linhas. Os erros saem aqui, ainda na view.
+    """
+    try:
+        primeira = next(linhas)
+    except StopIteration:
+        return iter(())
+    return itertools.chain((primeira,), linhas)
+
+
+def _agrupar(pedacos, tamanho):
+    """Junta pedaços de texto em blocos de ~``tamanho`` caracteres (menos writes no socket)"""
+    bloco, total = [], 0
+    for pedaco in pedacos:
+        bloco.append(pedaco)
+        total += len(pedaco)
+        if total >= tamanho:
+            yield ''.join(bloco)
+            bloco, total = [], 0
+    if bloco:
+        yield ''.join(bloco)
+
+
+def gerar_csv(cabecalho, linhas, delimiter=';', tamanho_bloco=None):
+    """CSV incremental: o cabeçalho sai logo, as linhas em blocos"""
+    tamanho_bloco = tamanho_bloco or getattr(settings, 'EXPORT_BLOCO_BYTES', 65536)
+    escritor = csv.writer(_Eco(), delimiter=delimiter)
+    yield escritor.writerow(cabecalho)
+    yield from _agrupar((escritor.writerow(linha) for linha in linhas), tamanho_bloco)
+
+
+def gerar_json(cabecalho, chave, itens, tamanho_bloco=None):
+    """
+    Objeto JSON com os campos de ``cabecalho`` (indentados) seguidos do array
+    ``chave`` codificado item a item, um item por linha.
+    """
+    tamanho_bloco = tamanho_bloco or getattr(settings, 'EXPORT_BLOCO_BYTES', 65536)
+    if cabecalho:
+        # Reabrir o objeto do cabeçalho: '{\n  ...\n}' -> '{\n  ...,\n'
+        inicio = json.dumps(cabecalho, cls=DjangoJSONEncoder, indent=2)[:-2] + ',\n'
+    else:
+        inicio = '{\n'
+    yield inicio + f'  {json.dumps(chave)}: ['
+
+    def codificar():
+        separador = '\n    '
+        for item in itens:
+            yield separador + json.dumps(item, cls=DjangoJSONEncoder)
+            separador = ',\n    '
+
+    yield from _agrupar(codificar(), tamanho_bloco)
+    yield '\n  ]\n}\n'
+
+
+def gerar_jsonl(itens, tamanho_bloco=None):
+    """JSON Lines: um objeto JSON por linha (exportações em ficheiro)"""
+    tamanho_bloco = tamanho_bloco or getattr(settings, 'EXPORT_BLOCO_BYTES', 65536)
+    yield from _agrupar(
+        (json.dumps(item, cls=DjangoJSONEncoder) + '\n' for item in itens), tamanho_bloco
+    )
+
+
+def resposta_csv(nome_ficheiro, conteudo):
+    response = StreamingHttpResponse(conteudo, content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{nome_ficheiro}"'
+    return response
+
+
+def resposta_json(conteudo):
+    return StreamingHttpResponse(conteudo, content_type='application/json')
+
+
+# ---- Faturas (relatorio_faturas_listar / relatorio_faturas_detalhes) ----
+
+CABECALHO_FATURAS_CSV = [
+    'ID Fatura',
+    'Data Emissão',
+    'Data Pagamento',
+    'Valor Total (€)',
+    'Estado',
+    'Método Pagamento',
+    'ID Consulta',
+    'Paciente',
+    'Médico',
+    'Especialidade',
+    'Data Consulta',
+    'Hora Consulta'
+]
+
+
+def linha_fatura_csv(row):
+    return [
+        row[0],
+        row[1].strftime('%d/%m/%Y') if row[1] else '',
+        row[1].strftime('%d/%m/%Y') if row[1] else 'Pendente',
+        f"{row[2]:.2f}".replace('.', ','),
+        row[3],
+        row[4] or 'N/A',
+        row[5],
+        row[6],
+        row[7],
+        row[8] or 'N/A',
+        row[9].strftime('%d/%m/%Y') if row[9] else '',
+        row[10].strftime('%H:%M') if row[10] else ''
+    ]
+
+
+def fatura_json(row):
+    return {
+        'id_fatura': row[0],
+        'data_pagamento': row[1].strftime('%Y-%m-%d') if row[1] else None,
+        'valor': float(row[2]),
+        'estado': row[3],
+        'metodo_pagamento': row[4],
+        'consulta': {
+            'id_consulta': row[5],
+            'data_consulta': row[6].strftime('%Y-%m-%d') if row[6] else None,
+            'hora_consulta': row[7].strftime('%H:%M') if row[7] else None,
+            'paciente': {
+                'id': row[8],
+                'nome': row[9],
+                'n_utente': row[10]
+            },
+            'medico': {
+                'id': row[11],
+                'nome': row[12],
+                'especialidade': row[13]
+            }
+        }
+    }
+
+
+# ---- Consultas (relatorio_consultas_listar / relatorio_consultas_detalhes) ----
+
+CABECALHO_CONSULTAS_CSV = [
+    'ID Consulta',
+    'Data',
+    'Hora',
+    'Paciente',
+    'Médico',
+    'Especialidade',
+    'Estado',
+    'Motivo',
+    'Valor (€)',
+    'Fatura ID',
+    'Data Criação'
+]
+
+
+def linha_consulta_csv(row):
+    return [
+        row[0],
+        row[1].strftime('%d/%m/%Y') if row[1] else '',
+        row[2].strftime('%H:%M') if row[2] else '',
+        row[3],
+        row[4],
+        row[5] or 'N/A',
+        row[6],
+        row[7] or '',
+        f"{row[8]:.2f}".replace('.', ','),
+        row[9] if row[9] else 'N/A',
+        row[10].strftime('%d/%m/%Y %H:%M') if row[10] else ''
+    ]
+
+
+def consulta_json(row):
+    fatura_info = None
+    if row[10]:
+        fatura_info = {
+            'id': row[10],
+            'valor': float(row[11]),
+            'estado': row[12]
+        }
+    return {
+        'id_consulta': row[0],
+        'data_consulta': row[1].strftime('%Y-%m-%d') if row[1] else None,
+        'hora_consulta': row[2].strftime('%H:%M') if row[2] else None,
+        'estado': row[3],
+        'motivo': row[4],
+        'paciente': {
+            'id': row[5],
+            'nome': row[6]
+        },
+        'medico': {
+            'id': row[7],
+            'nome': row[8],
+            'especialidade': row[9]
+        },
+        'fatura': fatura_info
+    }
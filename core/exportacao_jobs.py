@@ -0,0 +1,350 @@
+# core/exportacao_jobs.py
+"""
+Exportações de relatórios em background.
+
+O admin pede uma exportação (pedir_exportacao) e recebe logo o seu id; um
+worker do processo escreve o ficheiro comprimido (CSV ou JSON Lines em gzip)
+em MEDIA_ROOT/EXPORT_DIR e o admin consulta o estado até o poder
+descarregar. O estado de cada exportação fica num manifesto JSON ao lado do
+ficheiro: o sistema de ficheiros é o único store, partilhado por todos os
+processos web da máquina.
+
+O id é o hash de (relatório, formato, filtros, versões dos dados). As versões
+vêm da tabela "VERSOES_DADOS" (obter_versoes_dados), incrementada por trigger
+na mesma transação de cada alteração das tabelas do relatório: pedir outra
+vez a mesma exportação sem alterações nos dados devolve o ficheiro já gerado,
+sem tocar na base de dados além da leitura das versões. Como só as
+alterações confirmadas contam e o worker lê os dados depois de o pedido ter
+lido as versões, um ficheiro nunca tem dados mais antigos do que as versões
+do seu id.
+
+- Só um processo fica com cada exportação: o manifesto é criado com
+  os.link, que falha se já existir.
+- Uma exportação 'pendente'/'em_curso' sem atualização há mais de
+  EXPORT_TEMPO_MAX_SEGUNDOS (processo terminado a meio) volta a ser pedida.
+- Os ficheiros com mais de EXPORT_RETENCAO_HORAS são apagados pelo scheduler
+  (limpar_exportacoes).
+
+Os workers (EXPORT_WORKERS threads) usam a conexão padrão da base de dados,
+não a do role do request: as exportações são só de admin.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.utils import timezone
+
+from .exportacao import (
+    CABECALHO_CONSULTAS_CSV, CABECALHO_FATURAS_CSV, consulta_json, fatura_json, gerar_csv,
+    gerar_jsonl, linha_consulta_csv, linha_fatura_csv, linhas_servidor
+)
+
+logger = logging.getLogger(__name__)
+
+FORMATOS = {
+    'csv': 'csv.gz',
+    'jsonl': 'jsonl.gz',
+}
+
+
+def _objeto(*colunas):
+    return lambda row: dict(zip(colunas, row))
+
+
+# Por relatório: filtros aceites (pela ordem dos parâmetros da função SQL),
+# versões de dados de que depende e, por formato, a query e a conversão de
+# cada linha
+RELATORIOS = {
+    'financeiro': {
+        'nome': 'relatorio_financeiro',
+        'filtros': ('data_inicio', 'data_fim', 'estado'),
+        'versoes': ('faturas', 'consultas', 'utilizadores', 'medicos', 'especialidades'),
+        'csv': ("SELECT * FROM relatorio_faturas_listar(%s, %s, %s)",
+                CABECALHO_FATURAS_CSV, linha_fatura_csv),
+        'jsonl': ("SELECT * FROM relatorio_faturas_detalhes(%s, %s, %s, NULL)", fatura_json),
+    },
+    'consultas': {
+        'nome': 'relatorio_consultas',
+        'filtros': ('data_inicio', 'data_fim', 'estado', 'medico_id'),
+        'versoes': ('consultas', 'faturas', 'utilizadores', 'medicos', 'especialidades'),
+        'csv': ("SELECT * FROM relatorio_consultas_listar(%s, %s, %s, %s)",
+                CABECALHO_CONSULTAS_CSV, linha_consulta_csv),
+        'jsonl': ("SELECT * FROM relatorio_consultas_detalhes(%s, %s, %s, %s, NULL)", consulta_json),
+    },
+    'regioes': {
+        'nome': 'regioes',
+        'filtros': (),
+        'versoes': ('regioes',),
+        'csv': ("SELECT * FROM listar_regioes_admin()",
+                ['id_regiao', 'nome', 'tipo_regiao'], list),
+        'jsonl': ("SELECT * FROM listar_regioes_admin()",
+                  _objeto('id_regiao', 'nome', 'tipo_regiao')),
+    },
+    'unidades': {
+        'nome': 'unidades',
+        'filtros': (),
+        'versoes': ('unidades', 'regioes'),
+        'csv': ("SELECT * FROM listar_unidades_admin()",
+                ['id_unidade', 'nome_unidade', 'morada_unidade', 'tipo_unidade', 'id_regiao', 'nome_regiao'],
+                list),
+        'jsonl': ("SELECT * FROM listar_unidades_admin()",
+                  _objeto('id_unidade', 'nome_unidade', 'morada_unidade', 'tipo_unidade', 'id_regiao', 'nome_regiao')),
+    },
+    'especialidades': {
+        'nome': 'especialidades',
+        'filtros': (),
+        'versoes': ('especialidades',),
+        'csv': ("SELECT id_especialidade, nome_especialidade, descricao FROM listar_especialidades_admin()",
+                ['id_especialidade', 'nome_especialidade', 'descricao'], list),
+        'jsonl': ("SELECT id_especialidade, nome_especialidade, descricao FROM listar_especialidades_admin()",
+                  _objeto('id_especialidade', 'nome_especialidade', 'descricao')),
+    },
+}
+
+_ID_VALIDO = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _agora():
+    return timezone.now().isoformat()
+
+
+def _diretorio():
+    return os.path.join(settings.MEDIA_ROOT, getattr(settings, 'EXPORT_DIR', 'exportacoes'))
+
+
+def _caminho_manifesto(id_exportacao):
+    return os.path.join(_diretorio(), f'{id_exportacao}.json')
+
+
+def caminho_ficheiro(manifesto):
+    return os.path.join(_diretorio(), manifesto['ficheiro'])
+
+
+def normalizar_filtros(relatorio, filtros):
+    """
+    Filtros aceites pelo relatório, sem os vazios e já validados (datas
+    ISO, medico_id inteiro). Levanta ValueError se algum for inválido.
+    """
+    normalizados = {}
+    for nome in RELATORIOS[relatorio]['filtros']:
+        valor = (filtros.get(nome) or '').strip()
+        if not valor:
+            continue
+        if nome.startswith('data_'):
+            valor = date.fromisoformat(valor).isoformat()
+        elif nome == 'medico_id':
+            valor = str(int(valor))
+        normalizados[nome] = valor
+    return normalizados
+
+
+def obter_versoes(nomes):
+    """Versões atuais ("VERSOES_DADOS") das tabelas ``nomes``"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nome, versao FROM obter_versoes_dados()")
+        versoes = dict(cursor.fetchall())
+    return {nome: versoes.get(nome) for nome in nomes}
+
+
+def id_exportacao(relatorio, formato, filtros, versoes):
+    chave = json.dumps([relatorio, formato, filtros, versoes], sort_keys=True)
+    return hashlib.sha256(chave.encode()).hexdigest()[:32]
+
+
+# ---- Manifestos ----
+
+def _escrever_temporario(manifesto):
+    temporario = f'{_caminho_manifesto(manifesto["id"])}.{uuid.uuid4().hex}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, cls=DjangoJSONEncoder)
+    return temporario
+
+
+def _gravar_manifesto(manifesto):
+    """Substitui o manifesto de forma atómica (os leitores veem o antigo ou o novo)"""
+    os.replace(_escrever_temporario(manifesto), _caminho_manifesto(manifesto['id']))
+
+
+def _criar_manifesto(manifesto):
+    """Cria o manifesto só se ainda não existir; devolve False se outro pedido já o criou"""
+    temporario = _escrever_temporario(manifesto)
+    try:
+        os.link(temporario, _caminho_manifesto(manifesto['id']))
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(temporario)
+
+
+def obter_exportacao(id_exportacao):
+    """Manifesto da exportação, ou None se o id for inválido ou não existir"""
+    if not _ID_VALIDO.match(id_exportacao or ''):
+        return None
+    try:
+        with open(_caminho_manifesto(id_exportacao), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _deve_repetir(manifesto, agora=None):
+    """Exportação falhada, com o ficheiro apagado ou abandonada a meio"""
+    if manifesto['estado'] == 'erro':
+        return True
+    if manifesto['estado'] == 'concluida':
+        return not os.path.exists(caminho_ficheiro(manifesto))
+    agora = agora or timezone.now()
+    tempo_max = timedelta(seconds=getattr(settings, 'EXPORT_TEMPO_MAX_SEGUNDOS', 3600))
+    return agora - datetime.fromisoformat(manifesto['atualizado_em']) > tempo_max
+
+
+# ---- Pedido e execução ----
+
+def pedir_exportacao(relatorio, formato, filtros):
+    """
+    Pede a exportação de ``relatorio`` em ``formato`` ('csv' ou 'jsonl')
+    com os ``filtros`` do pedido. Devolve o manifesto: uma exportação
+    idêntica já concluída ou em curso é reutilizada, caso contrário é
+    criada e entregue aos workers. Levanta ValueError se o pedido for
+    inválido.
+    """
+    if relatorio not in RELATORIOS:
+        raise ValueError(f"Relatório desconhecido: {relatorio}")
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de exportação desconhecido: {formato}")
+    try:
+        filtros = normalizar_filtros(relatorio, filtros)
+    except ValueError:
+        raise ValueError("Filtros de exportação inválidos.")
+
+    versoes = obter_versoes(RELATORIOS[relatorio]['versoes'])
+    id_exp = id_exportacao(relatorio, formato, filtros, versoes)
+    agora = _agora()
+    manifesto = {
+        'id': id_exp,
+        'relatorio': relatorio,
+        'formato': formato,
+        'filtros': filtros,
+        'versoes': versoes,
+        'estado': 'pendente',
+        'criado_em': agora,
+        'atualizado_em': agora,
+        'concluida_em': None,
+        'linhas': 0,
+        'bytes': 0,
+        'erro': None,
+        'ficheiro': f'{id_exp}.{FORMATOS[formato]}',
+        'nome_download': f'{RELATORIOS[relatorio]["nome"]}.{FORMATOS[formato]}',
+    }
+
+    os.makedirs(_diretorio(), exist_ok=True)
+    if not _criar_manifesto(manifesto):
+        atual = obter_exportacao(id_exp)
+        if atual is not None and not _deve_repetir(atual):
+            return atual
+        _gravar_manifesto(manifesto)
+
+    obter_executor().submit(executar_exportacao, manifesto)
+    return manifesto
+
+
+def _contar(linhas, manifesto):
+    for linha in linhas:
+        manifesto['linhas'] += 1
+        yield linha
+
+
+def escrever_exportacao(manifesto, ficheiro):
+    """Escreve as linhas do relatório em ``ficheiro`` (texto) no formato do manifesto"""
+    definicao = RELATORIOS[manifesto['relatorio']]
+    params = [manifesto['filtros'].get(nome) for nome in definicao['filtros']]
+    if manifesto['formato'] == 'csv':
+        sql, cabecalho, converter = definicao['csv']
+        linhas = _contar(linhas_servidor(sql, params), manifesto)
+        ficheiro.writelines(gerar_csv(cabecalho, map(converter, linhas)))
+    else:
+        sql, converter = definicao['jsonl']
+        linhas = _contar(linhas_servidor(sql, params), manifesto)
+        ficheiro.writelines(gerar_jsonl(map(converter, linhas)))
+
+
+def executar_exportacao(manifesto):
+    """Gera o ficheiro da exportação (corre num worker)"""
+    manifesto = dict(manifesto, estado='em_curso', atualizado_em=_agora(), linhas=0)
+    _gravar_manifesto(manifesto)
+    destino = caminho_ficheiro(manifesto)
+    temporario = f'{destino}.{uuid.uuid4().hex}.tmp'
+    inicio = time.monotonic()
+    try:
+        with gzip.open(temporario, 'wt', encoding='utf-8', newline='') as ficheiro:
+            escrever_exportacao(manifesto, ficheiro)
+        os.replace(temporario, destino)
+        manifesto.update(
+            estado='concluida',
+            atualizado_em=_agora(),
+            concluida_em=_agora(),
+            bytes=os.path.getsize(destino),
+        )
+        logger.info(
+            f"Exportação {manifesto['relatorio']}/{manifesto['formato']} {manifesto['id']}: "
+            f"{manifesto['linhas']} linhas em {time.monotonic() - inicio:.1f}s"
+        )
+    except Exception as e:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        manifesto.update(estado='erro', atualizado_em=_agora(), erro=str(e))
+        logger.error(f"Erro na exportação {manifesto['relatorio']} {manifesto['id']}: {e}")
+    finally:
+        # Thread do worker: não deixar a conexão aberta entre exportações
+        connection.close()
+    _gravar_manifesto(manifesto)
+    return manifesto
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def obter_executor():
+    """Pool de workers de exportação do processo (criado no primeiro uso)"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'EXPORT_WORKERS', 2),
+                    thread_name_prefix='exportacao',
+                )
+    return _executor
+
+
+def limpar_exportacoes(agora=None):
+    """Apaga manifestos e ficheiros com mais de EXPORT_RETENCAO_HORAS. Devolve quantos apagou."""
+    diretorio = _diretorio()
+    if not os.path.isdir(diretorio):
+        return 0
+    limite = (agora or time.time()) - getattr(settings, 'EXPORT_RETENCAO_HORAS', 24) * 3600
+    apagados = 0
+    for entrada in os.scandir(diretorio):
+        if entrada.is_file() and entrada.stat().st_mtime < limite:
+            try:
+                os.remove(entrada.path)
+                apagados += 1
+            except FileNotFoundError:
+                pass
+    if apagados:
+        logger.info(f"Exportações: {apagados} ficheiros antigos apagados")
+    return apagados
@@ -0,0 +1,367 @@
+# core/importacao.py
+"""
+Importação em massa de regiões, especialidades e unidades de saúde.
+
+1. O ficheiro (CSV com ';' ou array JSON) é lido e validado numa única
+   passagem, em streaming, sem o carregar inteiro em memória. As linhas
+   válidas são escritas num buffer CSV (em disco a partir de
+   IMPORT_BUFFER_MEMORIA bytes); as inválidas ficam na lista de erros com o
+   número da linha.
+2. Nas unidades, os nomes de região são resolvidos com um mapa
+   nome -> id_regiao obtido com uma única query antes da passagem.
+3. Numa transação, o buffer é carregado com COPY numa tabela temporária e
+   juntado à tabela final com um único INSERT ... SELECT
+   (admin_importar_*, scripts/procedures_admin.sql), que devolve as linhas
+   rejeitadas (p.ex. nome já existente).
+
+Os pacientes (onboarding de uma região: comando importar_pacientes e, em
+background, admin_utilizadores_import_csv via core/importacao_jobs.py) passam
+pelo mesmo caminho, com dois passos a mais: as senhas são convertidas em hash
+num pool de processos (pool_hash), por lotes, antes de as linhas irem para o
+buffer (as senhas em claro nunca vão para disco), e o merge atribui os
+números de utente em bloco a partir da sequência n_utente_seq
+(gerar_n_utentes).
+"""
+
+import csv
+import io
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date
+
+import django
+from django.conf import settings
+from django.contrib.auth.base_user import BaseUserManager
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import connection, transaction
+
+# Linhas válidas processadas de cada vez pelo passo 'preparar' (hash das senhas)
+TAMANHO_LOTE = 1000
+
+
+def _texto(registo, *campos):
+    """Primeiro campo preenchido de ``registo`` (sem espaços nas pontas)"""
+    for campo in campos:
+        valor = registo.get(campo)
+        if valor is not None and str(valor).strip():
+            return str(valor).strip()
+    return ''
+
+
+def _limitar(valor, campo, tamanho):
+    if len(valor) > tamanho:
+        raise ValueError(f"{campo} com mais de {tamanho} caracteres")
+    return valor
+
+
+def _validar_regiao(registo, contexto):
+    nome = _texto(registo, 'nome')
+    tipo = _texto(registo, 'tipo_regiao')
+    if not nome or not tipo:
+        raise ValueError("nome e tipo_regiao são obrigatórios")
+    return nome, (_limitar(nome, 'nome', 50), _limitar(tipo, 'tipo_regiao', 50))
+
+
+def _validar_especialidade(registo, contexto):
+    nome = _texto(registo, 'nome_especialidade', 'nome')
+    descricao = _texto(registo, 'descricao')
+    if not nome:
+        raise ValueError("nome_especialidade é obrigatório")
+    return nome, (_limitar(nome, 'nome_especialidade', 255), _limitar(descricao, 'descricao', 255))
+
+
+def _validar_unidade(registo, contexto):
+    nome = _texto(registo, 'nome_unidade', 'nome')
+    morada = _texto(registo, 'morada_unidade')
+    tipo = _texto(registo, 'tipo_unidade')
+    if not nome or not morada or not tipo:
+        raise ValueError("nome_unidade, morada_unidade e tipo_unidade são obrigatórios")
+
+    id_regiao = _texto(registo, 'id_regiao')
+    nome_regiao = _texto(registo, 'nome_regiao')
+    if id_regiao:
+        if not id_regiao.isdigit() or int(id_regiao) not in contexto['ids']:
+            raise ValueError(f"região {id_regiao} não existe")
+        id_regiao = int(id_regiao)
+    elif nome_regiao:
+        if nome_regiao not in contexto['nomes']:
+            raise ValueError(f"região '{nome_regiao}' não existe")
+        id_regiao = contexto['nomes'][nome_regiao]
+    else:
+        raise ValueError("id_regiao ou nome_regiao é obrigatório")
+
+    # Unidades não têm chave natural: nomes repetidos no ficheiro são aceites
+    return None, (
+        _limitar(nome, 'nome_unidade', 255),
+        _limitar(morada, 'morada_unidade', 255),
+        _limitar(tipo, 'tipo_unidade', 255),
+        id_regiao,
+    )
+
+
+def _validar_paciente(registo, contexto):
+    nome = _texto(registo, 'nome')
+    email = BaseUserManager.normalize_email(_texto(registo, 'email'))
+    if not nome or not email:
+        raise ValueError("nome e email são obrigatórios")
+    try:
+        validate_email(email)
+    except ValidationError:
+        raise ValueError(f"email '{email}' inválido")
+
+    data_nasc = _texto(registo, 'data_nasc')
+    genero = _texto(registo, 'genero')
+    if not data_nasc or not genero:
+        raise ValueError("data_nasc e genero são obrigatórios")
+    try:
+        data_nasc = date.fromisoformat(data_nasc)
+    except ValueError:
+        raise ValueError(f"data_nasc '{data_nasc}' inválida (AAAA-MM-DD)")
+
+    # A senha é opcional: sem senha, o paciente define-a com a recuperação de senha
+    return email, (
+        _limitar(nome, 'nome', 255),
+        _limitar(email, 'email', 254),
+        _limitar(_texto(registo, 'telefone'), 'telefone', 20),
+        _texto(registo, 'senha'),
+        data_nasc.isoformat(),
+        _limitar(genero, 'genero', 50),
+        _limitar(_texto(registo, 'morada'), 'morada', 255),
+        _limitar(_texto(registo, 'alergias'), 'alergias', 255),
+        _limitar(_texto(registo, 'observacoes'), 'observacoes', 255),
+    )
+
+
+def _hash_senha(senha):
+    """make_password (num processo do pool); sem senha -> senha inutilizável"""
+    return make_password(senha or None)
+
+
+@contextmanager
+def pool_hash(workers):
+    """
+    Pool de processos para o hash das senhas, terminado à saída do bloco
+    (None se ``workers`` for 0: o hash é feito no próprio processo).
+
+    PBKDF2 ocupa o CPU e segura o GIL, por isso threads não ajudam. Os
+    processos são criados com 'spawn' (sem herdar conexões nem threads do
+    processo que os cria) e configuram o Django no arranque. O pool só vive
+    durante uma importação: nenhum processo fica pendurado no processo web.
+    """
+    if not workers:
+        yield None
+        return
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup,
+    )
+    try:
+        yield pool
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def calcular_hashes(senhas, pool=None):
+    """Hash de cada senha, em paralelo no ``pool`` (sem pool -> no próprio processo)"""
+    if pool is None or len(senhas) < 2:
+        return [_hash_senha(senha) for senha in senhas]
+    # Blocos pequenos o suficiente para repartir o lote por todos os processos
+    chunksize = max(1, len(senhas) // ((os.cpu_count() or 1) * 4))
+    return list(pool.map(_hash_senha, senhas, chunksize=chunksize))
+
+
+def _preparar_pacientes(lote, pool):
+    """Troca a senha em claro (coluna 4, depois da linha) pelo hash"""
+    hashes = calcular_hashes([valores[4] for valores in lote], pool)
+    return [valores[:4] + (senha,) + valores[5:] for valores, senha in zip(lote, hashes)]
+
+
+def _mapa_regioes():
+    """Regiões existentes, lidas uma única vez para validar o ficheiro inteiro"""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT id_regiao, nome FROM "REGIAO"')
+        rows = cursor.fetchall()
+    return {'ids': {row[0] for row in rows}, 'nomes': {row[1]: row[0] for row in rows}}
+
+
+# tipo -> tabela temporária, colunas (a primeira é sempre o número da linha),
+# validação, função de merge, contexto (lido antes da passagem) e preparação
+# de cada lote de linhas válidas antes de irem para o buffer
+IMPORTACOES = {
+    'regioes': {
+        'tabela': 'importacao_regioes',
+        'colunas': ('linha INTEGER', 'nome TEXT', 'tipo_regiao TEXT'),
+        'validar': _validar_regiao,
+        'funcao': 'admin_importar_regioes',
+        'contexto': None,
+        'preparar': None,
+        'rejeitada': "região já existe",
+    },
+    'especialidades': {
+        'tabela': 'importacao_especialidades',
+        'colunas': ('linha INTEGER', 'nome_especialidade TEXT', 'descricao TEXT'),
+        'validar': _validar_especialidade,
+        'funcao': 'admin_importar_especialidades',
+        'contexto': None,
+        'preparar': None,
+        'rejeitada': "especialidade já existe",
+    },
+    'unidades': {
+        'tabela': 'importacao_unidades',
+        'colunas': ('linha INTEGER', 'nome_unidade TEXT', 'morada_unidade TEXT',
+                    'tipo_unidade TEXT', 'id_regiao INTEGER'),
+        'validar': _validar_unidade,
+        'funcao': 'admin_importar_unidades',
+        'contexto': _mapa_regioes,
+        'preparar': None,
+        'rejeitada': "região eliminada durante a importação",
+    },
+    'pacientes': {
+        'tabela': 'importacao_pacientes',
+        'colunas': ('linha INTEGER', 'nome TEXT', 'email TEXT', 'telefone TEXT', 'password TEXT',
+                    'data_nasc DATE', 'genero TEXT', 'morada TEXT', 'alergias TEXT',
+                    'observacoes TEXT'),
+        'validar': _validar_paciente,
+        'funcao': 'admin_importar_pacientes',
+        'contexto': None,
+        'preparar': _preparar_pacientes,
+        'rejeitada': "já existe um utilizador com este email",
+    },
+}
+
+
+def registos_csv(ficheiro, delimiter=';'):
+    """(número da linha, dicionário) de cada linha do CSV, lidas à medida"""
+    texto = io.TextIOWrapper(ficheiro, encoding='utf-8-sig', newline='')
+    leitor = csv.DictReader(texto, delimiter=delimiter)
+    try:
+        for registo in leitor:
+            yield leitor.line_num, registo
+    except csv.Error as e:
+        raise ValueError(f"CSV inválido na linha {leitor.line_num}: {e}")
+
+
+_ESPACOS = re.compile(r'\s*')
+
+
+def registos_json(ficheiro, tamanho_bloco=65536):
+    """
+    (número do registo, item) de cada item de um array JSON, descodificados
+    à medida que o ficheiro é lido (json.JSONDecoder.raw_decode por blocos).
+    """
+    decoder = json.JSONDecoder()
+    texto = io.TextIOWrapper(ficheiro, encoding='utf-8-sig')
+    buffer = texto.read(tamanho_bloco)
+    pos = _ESPACOS.match(buffer).end()
+    if buffer[pos:pos + 1] != '[':
+        raise ValueError("O ficheiro JSON deve conter uma lista.")
+    pos += 1
+    numero = 0
+    separador = False
+
+    while True:
+        pos = _ESPACOS.match(buffer, pos).end()
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+        if pos < len(buffer) and separador:
+            if buffer[pos] != ',':
+                raise ValueError(f"JSON inválido depois do registo {numero}.")
+            pos += 1
+            separador = False
+            continue
+        if pos < len(buffer):
+            try:
+                item, fim = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                fim = None
+            # Um valor que acaba no fim do buffer pode estar truncado (p.ex. um número)
+            if fim is not None and fim < len(buffer):
+                numero += 1
+                yield numero, item
+                pos = fim
+                separador = True
+                continue
+
+        bloco = texto.read(tamanho_bloco)
+        if not bloco:
+            raise ValueError(f"JSON inválido ou incompleto depois do registo {numero}.")
+        buffer, pos = buffer[pos:] + bloco, 0
+
+
+def _carregar(config, buffer):
+    """COPY do buffer para a tabela temporária e merge; devolve as linhas rejeitadas"""
+    tabela = config['tabela']
+    nomes = ', '.join(coluna.split()[0] for coluna in config['colunas'])
+    buffer.seek(0)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMP TABLE {tabela} ({', '.join(config['colunas'])}) ON COMMIT DROP"
+            )
+            cursor.copy_expert(f"COPY {tabela} ({nomes}) FROM STDIN WITH (FORMAT csv)", buffer)
+            cursor.execute(f"SELECT linha FROM {config['funcao']}()")
+            return [row[0] for row in cursor.fetchall()]
+
+
+def importar(tipo, formato, ficheiro, pool=None):
+    """
+    Importa ``ficheiro`` ('csv' ou 'json') para ``tipo`` ('regioes',
+    'especialidades', 'unidades' ou 'pacientes'). Nos pacientes, ``pool``
+    (ver pool_hash) é usado para o hash das senhas.
+
+    Devolve {'criadas': n, 'erros': ['Linha 3: ...', ...]}. Erros no ficheiro
+    em si (JSON que não é uma lista, codificação inválida) levantam ValueError
+    e nada é importado.
+    """
+    config = IMPORTACOES[tipo]
+    registos = registos_csv(ficheiro) if formato == 'csv' else registos_json(ficheiro)
+    rotulo = 'Linha' if formato == 'csv' else 'Registo'
+    contexto = config['contexto']() if config['contexto'] else None
+
+    erros = {}
+    vistos = set()
+    validas = 0
+    lote = []
+    limite = getattr(settings, 'IMPORT_BUFFER_MEMORIA', 8 * 1024 * 1024)
+    with tempfile.SpooledTemporaryFile(max_size=limite, mode='w+', encoding='utf-8', newline='') as buffer:
+        escritor = csv.writer(buffer)
+
+        def escrever(lote):
+            escritor.writerows(config['preparar'](lote, pool) if config['preparar'] else lote)
+
+        for numero, registo in registos:
+            try:
+                if not isinstance(registo, dict):
+                    raise ValueError("registo não é um objeto")
+                chave, valores = config['validar'](registo, contexto)
+                if chave is not None:
+                    if chave in vistos:
+                        raise ValueError(f"'{chave}' repetido no ficheiro")
+                    vistos.add(chave)
+            except ValueError as e:
+                erros[numero] = str(e)
+                continue
+            lote.append((numero,) + valores)
+            validas += 1
+            if len(lote) >= TAMANHO_LOTE:
+                escrever(lote)
+                lote = []
+        if lote:
+            escrever(lote)
+
+        rejeitadas = _carregar(config, buffer) if validas else []
+
+    for numero in rejeitadas:
+        erros[numero] = config['rejeitada']
+    return {
+        'criadas': validas - len(rejeitadas),
+        'erros': [f"{rotulo} {numero}: {erros[numero]}" for numero in sorted(erros)],
+    }
@@ -0,0 +1,222 @@
+# core/importacao_jobs.py
+"""
+Onboarding de pacientes em background (admin_utilizadores_import_csv).
+
+O hash PBKDF2 de milhares de senhas demora minutos, mais do que o timeout do
+proxy, por isso o pedido só guarda o ficheiro e devolve o id da importação;
+um worker do processo corre importar('pacientes') e o admin consulta o
+estado. Como nas exportações (core/exportacao_jobs.py), o estado fica num
+manifesto JSON em MEDIA_ROOT/IMPORT_DIR, partilhado pelos processos web.
+
+- O ficheiro enviado (com as senhas em claro) vai para IMPORT_UPLOAD_DIR,
+  fora de MEDIA_ROOT (diretório 0700, ficheiro 0600), e é apagado no fim.
+- Cada processo tem um só worker (IMPORT_JOB_WORKERS): importações pedidas ao
+  mesmo tempo esperam pela vez em vez de multiplicarem os pools.
+- O pool de processos do hash (pool_hash) é criado para cada importação com
+  IMPORT_HASH_WORKERS_WEB processos e terminado quando ela acaba.
+- Uma importação pendente ou em curso sem atualizações há mais de
+  IMPORT_TEMPO_MAX_SEGUNDOS (processo terminado a meio) é mostrada como
+  'interrompida'; o scheduler (limpar_importacoes) apaga os ficheiros
+  enviados que ficaram para trás e os manifestos com mais de
+  IMPORT_RETENCAO_HORAS.
+
+Importações muito grandes devem usar o comando importar_pacientes.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .importacao import importar, pool_hash
+
+logger = logging.getLogger(__name__)
+
+_ID_VALIDO = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _agora():
+    return timezone.now().isoformat()
+
+
+def _diretorio():
+    return os.path.join(settings.MEDIA_ROOT, getattr(settings, 'IMPORT_DIR', 'importacoes'))
+
+
+def _diretorio_uploads():
+    """Diretório privado dos ficheiros enviados (criado com permissões 0700)"""
+    diretorio = settings.IMPORT_UPLOAD_DIR
+    os.makedirs(diretorio, mode=0o700, exist_ok=True)
+    return diretorio
+
+
+def _caminho_manifesto(id_importacao):
+    return os.path.join(_diretorio(), f'{id_importacao}.json')
+
+
+def _gravar_manifesto(manifesto):
+    """Substitui o manifesto de forma atómica (os leitores veem o antigo ou o novo)"""
+    temporario = f'{_caminho_manifesto(manifesto["id"])}.{uuid.uuid4().hex}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f)
+    os.replace(temporario, _caminho_manifesto(manifesto['id']))
+
+
+def _tempo_max():
+    return timedelta(seconds=getattr(settings, 'IMPORT_TEMPO_MAX_SEGUNDOS', 3600))
+
+
+def _interrompida(manifesto, agora=None):
+    """Importação pendente ou em curso abandonada (o processo terminou a meio)"""
+    if manifesto['estado'] not in ('pendente', 'em_curso'):
+        return False
+    agora = agora or timezone.now()
+    return agora - datetime.fromisoformat(manifesto['atualizado_em']) > _tempo_max()
+
+
+def obter_importacao(id_importacao, agora=None):
+    """Manifesto da importação, ou None se o id for inválido ou não existir"""
+    if not _ID_VALIDO.match(id_importacao or ''):
+        return None
+    try:
+        with open(_caminho_manifesto(id_importacao), encoding='utf-8') as f:
+            manifesto = json.load(f)
+    except FileNotFoundError:
+        return None
+    if _interrompida(manifesto, agora):
+        manifesto.update(
+            estado='interrompida',
+            erro='A importação foi interrompida (o servidor reiniciou?). Envie o ficheiro de novo.',
+        )
+    return manifesto
+
+
+def pedir_importacao(tipo, formato, ficheiro):
+    """
+    Guarda ``ficheiro`` (upload) em IMPORT_UPLOAD_DIR e entrega a importação
+    aos workers. Devolve o manifesto, no estado 'pendente'.
+    """
+    id_importacao = uuid.uuid4().hex
+    caminho = os.path.join(_diretorio_uploads(), f'{id_importacao}.{formato}')
+    descritor = os.open(caminho, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(descritor, 'wb') as destino:
+        for bloco in ficheiro.chunks():
+            destino.write(bloco)
+
+    agora = _agora()
+    manifesto = {
+        'id': id_importacao,
+        'tipo': tipo,
+        'formato': formato,
+        'nome_ficheiro': getattr(ficheiro, 'name', ''),
+        'estado': 'pendente',
+        'criado_em': agora,
+        'atualizado_em': agora,
+        'concluida_em': None,
+        'criadas': 0,
+        'erros': [],
+        'erro': None,
+    }
+    try:
+        os.makedirs(_diretorio(), exist_ok=True)
+        _gravar_manifesto(manifesto)
+        obter_executor().submit(executar_importacao, manifesto, caminho)
+    except Exception:
+        os.remove(caminho)
+        raise
+    return manifesto
+
+
+def executar_importacao(manifesto, caminho):
+    """Importa o ficheiro em ``caminho`` e apaga-o (corre num worker)"""
+    manifesto = dict(manifesto, estado='em_curso', atualizado_em=_agora())
+    _gravar_manifesto(manifesto)
+    inicio = time.monotonic()
+    try:
+        with pool_hash(getattr(settings, 'IMPORT_HASH_WORKERS_WEB', 2)) as pool:
+            with open(caminho, 'rb') as ficheiro:
+                resultado = importar(manifesto['tipo'], manifesto['formato'], ficheiro, pool=pool)
+        manifesto.update(
+            estado='concluida',
+            atualizado_em=_agora(),
+            concluida_em=_agora(),
+            criadas=resultado['criadas'],
+            erros=resultado['erros'],
+        )
+        logger.info(
+            f"Importação {manifesto['tipo']} {manifesto['id']}: {resultado['criadas']} criadas, "
+            f"{len(resultado['erros'])} com erro em {time.monotonic() - inicio:.1f}s"
+        )
+    except ValueError as e:
+        manifesto.update(estado='erro', atualizado_em=_agora(), erro=f"Ficheiro inválido: {e}")
+    except Exception as e:
+        manifesto.update(estado='erro', atualizado_em=_agora(), erro=str(e))
+        logger.error(f"Erro na importação {manifesto['tipo']} {manifesto['id']}: {e}")
+    finally:
+        # limpar_importacoes pode já ter apagado o ficheiro de uma importação muito longa
+        with suppress(FileNotFoundError):
+            os.remove(caminho)
+        # Thread do worker: não deixar a conexão aberta entre importações
+        connection.close()
+    _gravar_manifesto(manifesto)
+    return manifesto
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def obter_executor():
+    """Workers de importação do processo (criados no primeiro uso)"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'IMPORT_JOB_WORKERS', 1),
+                    thread_name_prefix='importacao',
+                )
+    return _executor
+
+
+def _apagar_antigos(diretorio, limite):
+    """Apaga os ficheiros de ``diretorio`` modificados antes de ``limite``"""
+    if not os.path.isdir(diretorio):
+        return 0
+    apagados = 0
+    for entrada in os.scandir(diretorio):
+        if entrada.is_file() and entrada.stat().st_mtime < limite:
+            try:
+                os.remove(entrada.path)
+                apagados += 1
+            except FileNotFoundError:
+                pass
+    return apagados
+
+
+def limpar_importacoes(agora=None):
+    """
+    Apaga os manifestos com mais de IMPORT_RETENCAO_HORAS e os ficheiros
+    enviados de importações interrompidas (mais de IMPORT_TEMPO_MAX_SEGUNDOS).
+    Devolve quantos ficheiros apagou.
+    """
+    agora = agora or time.time()
+    uploads = _apagar_antigos(settings.IMPORT_UPLOAD_DIR, agora - _tempo_max().total_seconds())
+    manifestos = _apagar_antigos(
+        _diretorio(), agora - getattr(settings, 'IMPORT_RETENCAO_HORAS', 24) * 3600
+    )
+    if uploads:
+        logger.warning(f"Importações: {uploads} ficheiros enviados de importações interrompidas apagados")
+    if manifestos:
+        logger.info(f"Importações: {manifestos} manifestos antigos apagados")
+    return uploads + manifestos
@@ -0,0 +1,112 @@
+# core/listas_admin.py
+"""
+Listagens paginadas do backoffice (consultas, faturas, utilizadores).
+
+Cada página é pedida às funções SQL listar_*_admin com paginação keyset: o
+cursor ``apos`` identifica a última linha da página anterior e a página
+seguinte é um range scan do índice a partir dela, por isso o custo de uma
+página não depende de quantas linhas vêm antes (ao contrário de OFFSET).
+
+As contagens totais (contar_*_admin) são aproximadas: estimativa do
+planeador sem filtros e contagem exata limitada a ADMIN_CONTAGEM_MAX com
+filtros. ADMIN_CONTAGEM_MAX = 0 desativa as contagens.
+"""
+
+from datetime import date, datetime, time
+
+from django.conf import settings
+from django.db import connection
+
+
+def _executar(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [col[0] for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def _pagina(linhas, limite, codificar):
+    proximo = codificar(linhas[-1]) if len(linhas) == limite else None
+    return linhas, proximo
+
+
+# ---- Consultas: cursor (data_consulta, hora_consulta, id_consulta) ----
+
+def codificar_cursor_consulta(consulta):
+    return f"{consulta['data_consulta'].isoformat()}_{consulta['hora_consulta'].isoformat()}_{consulta['id_consulta']}"
+
+
+def descodificar_cursor_consulta(cursor_str):
+    """Inverso de codificar_cursor_consulta; levanta ValueError se o cursor for inválido"""
+    data_str, hora_str, id_consulta = cursor_str.split('_')
+    return date.fromisoformat(data_str), time.fromisoformat(hora_str), int(id_consulta)
+
+
+def listar_consultas(estado=None, data=None, limite=50, apos=None):
+    """Devolve (consultas, proximo_cursor) da página seguinte a ``apos``"""
+    apos_data, apos_hora, apos_id = descodificar_cursor_consulta(apos) if apos else (None, None, None)
+    linhas = _executar(
+        "SELECT * FROM listar_consultas_admin(%s, %s, %s, %s, %s, %s)",
+        [estado or None, data or None, limite, apos_data, apos_hora, apos_id]
+    )
+    return _pagina(linhas, limite, codificar_cursor_consulta)
+
+
+# ---- Faturas: cursor id_fatura ----
+
+def codificar_cursor_fatura(fatura):
+    return str(fatura['id_fatura'])
+
+
+def listar_faturas(estado=None, limite=50, apos=None):
+    """Devolve (faturas, proximo_cursor) da página seguinte a ``apos``"""
+    apos_id = int(apos) if apos else None
+    linhas = _executar(
+        "SELECT * FROM listar_faturas_admin(%s, %s, %s)",
+        [estado or None, limite, apos_id]
+    )
+    return _pagina(linhas, limite, codificar_cursor_fatura)
+
+
+# ---- Utilizadores: cursor (data_registo, id_utilizador) ----
+
+def codificar_cursor_utilizador(utilizador):
+    return f"{utilizador['data_registo'].isoformat()}_{utilizador['id_utilizador']}"
+
+
+def descodificar_cursor_utilizador(cursor_str):
+    """Inverso de codificar_cursor_utilizador; levanta ValueError se o cursor for inválido"""
+    data_str, id_utilizador = cursor_str.split('_')
+    return datetime.fromisoformat(data_str), int(id_utilizador)
+
+
+def listar_utilizadores(role=None, limite=50, apos=None):
+    """Devolve (utilizadores, proximo_cursor) da página seguinte a ``apos``"""
+    apos_data, apos_id = descodificar_cursor_utilizador(apos) if apos else (None, None)
+    linhas = _executar(
+        "SELECT * FROM listar_utilizadores_admin(%s, %s, %s, %s)",
+        [role or None, limite, apos_data, apos_id]
+    )
+    return _pagina(linhas, limite, codificar_cursor_utilizador)
+
+
+# ---- Contagens ----
+
+def contar(funcao, params):
+    """
+    Contagem total de uma listagem: {'total', 'estimado', 'limitado'} ou
+    None se as contagens estiverem desativadas. ``estimado``: estimativa do
+    planeador; ``limitado``: há mais de ``total`` linhas. ``funcao`` é um
+    dos contar_*_admin e ``params`` os filtros da listagem.
+    """
+    maximo = getattr(settings, 'ADMIN_CONTAGEM_MAX', 10000)
+    if not maximo:
+        return None
+    if funcao not in ('contar_consultas_admin', 'contar_faturas_admin', 'contar_utilizadores_admin'):
+        raise ValueError(f"Função de contagem desconhecida: {funcao}")
+
+    marcadores = ', '.join(['%s'] * (len(params) + 1))
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT * FROM {funcao}({marcadores})", list(params) + [maximo])
+        total, estimado, limitado = cursor.fetchone()
+    return {'total': total, 'estimado': estimado, 'limitado': limitado}
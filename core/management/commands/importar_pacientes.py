@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importacao import importar, pool_hash
+
+
+class Command(BaseCommand):
+    help = 'Cria pacientes em massa a partir de um CSV (onboarding de uma região)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'ficheiro',
+            help='CSV com ";" e colunas nome;email;telefone;senha;data_nasc;genero;morada;alergias;observacoes'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Processos para o hash das senhas (por omissão IMPORT_HASH_WORKERS; 0 = sem pool)'
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if workers is None:
+            workers = settings.IMPORT_HASH_WORKERS
+
+        inicio = time.perf_counter()
+        try:
+            with pool_hash(workers) as pool, open(options['ficheiro'], 'rb') as ficheiro:
+                resultado = importar('pacientes', 'csv', ficheiro, pool=pool)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        decorrido = time.perf_counter() - inicio
+
+        for erro in resultado['erros']:
+            self.stderr.write(erro)
+        self.stdout.write(
+            f"✓ {resultado['criadas']} pacientes criados, {len(resultado['erros'])} com erro "
+            f"({decorrido:.1f} s, {resultado['criadas'] / decorrido if decorrido else 0:.0f} pacientes/s)"
+        )
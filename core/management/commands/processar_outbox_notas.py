@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.outbox import drenar_outbox
+
+
+class Command(BaseCommand):
+    help = 'Envia as notas clínicas pendentes do outbox (PostgreSQL) para o MongoDB'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Continuar a processar periodicamente (worker dedicado)'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=int,
+            default=getattr(settings, 'OUTBOX_INTERVALO_SEGUNDOS', 5),
+            help='Segundos entre execuções com --loop'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            total = drenar_outbox()
+            self.stdout.write(f"✓ {total} notas enviadas para o MongoDB")
+            if not options['loop']:
+                break
+            time.sleep(options['intervalo'])
@@ -0,0 +1,68 @@
+import logging
+import signal
+import sys
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.scheduler import (
+    conexao_lider_ativa,
+    criar_scheduler,
+    libertar_lock_lider,
+    obter_lock_lider,
+    registar_tarefas,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Corre as tarefas agendadas (lembretes, outbox de notas) num processo dedicado'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo',
+            type=int,
+            default=getattr(settings, 'SCHEDULER_LEADER_CHECK_SEGUNDOS', 15),
+            help='Segundos entre tentativas de obter o lock de líder e verificações da conexão'
+        )
+
+    def handle(self, *args, **options):
+        intervalo = options['intervalo']
+        parar = threading.Event()
+        for sinal in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sinal, lambda *_: parar.set())
+
+        # Esperar pelo lock de líder: só um processo corre as tarefas
+        pid = obter_lock_lider()
+        if pid is None:
+            self.stdout.write("⏳ Outro processo é líder do scheduler, a aguardar...")
+        while pid is None:
+            if parar.wait(intervalo):
+                return
+            pid = obter_lock_lider()
+
+        scheduler = criar_scheduler()
+        registar_tarefas(scheduler)
+        scheduler.start()
+        self.stdout.write(self.style.SUCCESS(
+            f"🚀 APScheduler iniciado (líder, {len(scheduler.get_jobs())} tarefas)"
+        ))
+
+        lock_perdido = False
+        try:
+            while not parar.wait(intervalo):
+                if not conexao_lider_ativa(pid):
+                    # Outro processo pode já ter assumido: parar imediatamente
+                    lock_perdido = True
+                    break
+        finally:
+            scheduler.shutdown(wait=not lock_perdido)
+            if not lock_perdido:
+                libertar_lock_lider()
+
+        if lock_perdido:
+            logger.error("Lock de líder do scheduler perdido, a terminar")
+            sys.exit(1)
+        self.stdout.write("✓ Scheduler parado")
@@ -0,0 +1,123 @@
+# core/matviews.py
+"""
+Materialized views de relatórios (scripts/matviews.sql).
+
+Os meses fechados de consultas, receita e evolução mensal são lidos das
+materialized views; só o mês atual (e os meses ainda não incluídos no
+último refresh) é calculado em tempo real pelas funções
+relatorio_consultas_agregado, relatorio_receitas_agregado e
+obter_estatisticas_mensais.
+
+atualizar_matviews() é chamada diariamente pelo scheduler
+(core/scheduler.py). Cada view é atualizada com REFRESH ... CONCURRENTLY
+(as páginas continuam a ler a versão anterior durante o refresh) e a
+duração, o resultado e a data do refresh ficam em "MATVIEW_REFRESH", que
+as páginas de admin mostram como indicador de atualização.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+MATVIEWS = (
+    'mv_estatisticas_mensais',
+    'mv_ranking_medicos',
+    'mv_consultas_mensais',
+    'mv_receitas_mensais',
+)
+
+
+def atualizar_matviews():
+    """
+    Atualiza todas as materialized views, uma por transação (o refresh de uma
+    view não prende as outras). Devolve uma lista de
+    {'matview', 'refresh_ms', 'sucesso', 'erro'}.
+
+    Tem de correr com o dono das views (o utilizador do scheduler), não com
+    os roles da aplicação.
+    """
+    resultados = []
+    for nome in MATVIEWS:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT * FROM atualizar_matview(%s)", [nome])
+            matview, refresh_ms, sucesso, erro = cursor.fetchone()
+        resultados.append({
+            'matview': matview,
+            'refresh_ms': float(refresh_ms),
+            'sucesso': sucesso,
+            'erro': erro,
+        })
+        if sucesso:
+            logger.info(f"Materialized view {matview} atualizada em {refresh_ms} ms")
+        else:
+            logger.error(f"Erro ao atualizar materialized view {matview} ({refresh_ms} ms): {erro}")
+    return resultados
+
+
+def estado_matviews(agora=None):
+    """
+    Metadados do último refresh de cada view, com a idade dos dados e um
+    indicador ``desatualizada`` (sem refresh há mais de
+    MATVIEWS_MAX_IDADE_HORAS ou último refresh falhado).
+    """
+    agora = agora or timezone.now()
+    max_idade = timedelta(hours=getattr(settings, 'MATVIEWS_MAX_IDADE_HORAS', 26))
+
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT nome, atualizado_em, dados_ate, ultima_tentativa, duracao_ms, erro
+            FROM "MATVIEW_REFRESH"
+        """)
+        linhas = {row[0]: row for row in cursor.fetchall()}
+
+    estado = []
+    for nome in MATVIEWS:
+        _, atualizado_em, dados_ate, ultima_tentativa, duracao_ms, erro = linhas.get(
+            nome, (nome, None, None, None, None, None)
+        )
+        idade = agora - atualizado_em if atualizado_em else None
+        estado.append({
+            'nome': nome,
+            'atualizado_em': atualizado_em,
+            'dados_ate': dados_ate,
+            'ultima_tentativa': ultima_tentativa,
+            'duracao_ms': duracao_ms,
+            'erro': erro,
+            'idade': idade,
+            'desatualizada': idade is None or idade > max_idade or erro is not None,
+        })
+    return estado
+
+
+def agregar_consultas(linhas, limite_medicos=10):
+    """
+    Agrega as linhas (estado, id_medico, medico_nome, especialidade_nome,
+    total) de relatorio_consultas_agregado nos três quadros do relatório.
+    Devolve (por_estado, por_medico, por_especialidade), por total desc.
+    """
+    por_estado, por_medico, por_especialidade = {}, {}, {}
+    for estado, id_medico, medico_nome, especialidade_nome, total in linhas:
+        por_estado[estado] = por_estado.get(estado, 0) + total
+        chave = (id_medico, medico_nome)
+        por_medico[chave] = por_medico.get(chave, 0) + total
+        por_especialidade[especialidade_nome] = por_especialidade.get(especialidade_nome, 0) + total
+
+    def ordenar(totais):
+        return sorted(totais.items(), key=lambda item: (-item[1], str(item[0])))
+
+    return (
+        [{'estado': estado, 'total': total} for estado, total in ordenar(por_estado)],
+        [
+            {'id_medico__id_utilizador__nome': nome, 'total': total}
+            for (_, nome), total in ordenar(por_medico)[:limite_medicos]
+        ],
+        [
+            {'id_medico__id_especialidade__nome_especialidade': nome, 'total': total}
+            for nome, total in ordenar(por_especialidade)
+        ],
+    )
@@ -3,7 +3,10 @@ Middleware para configurar o database user correto baseado no role do utilizador
 Coloca este ficheiro em: core/middleware.py (ou adiciona a um ficheiro middleware existente)
 """
 
-from django.db import connection
+from contextlib import ExitStack
+
+from django.db import connection, connections
+from .db_role_middleware import RoleContextExecuteWrapper, responder_com_contexto
 from .db_router import db_router
 
 
@@ -12,6 +15,16 @@ class RoleBasedDatabaseMiddleware:
     Middleware que:
     1. Define qual database user usar baseado no role do utilizador autenticado
     2. Configura o current_user_id no PostgreSQL para Row Level Security (RLS)
+    
+    O role fica numa ContextVar do router (válida só durante este request,
+    também em ASGI). Como as views usam ``connection.cursor()`` diretamente,
+    a conexão 'default' deste contexto aponta para o alias do role durante
+    o request e é reposta no fim. As conexões de cada alias são persistentes
+    (CONN_MAX_AGE), por isso a troca de role não abre novas conexões.
+    
+    O current_user_id para RLS vai na mesma ida ao servidor que a primeira
+    query de cada transação (RoleContextExecuteWrapper, com SET LOCAL), sem
+    uma query ``SELECT set_current_user(...)`` extra por request.
     """
     
     def __init__(self, get_response):
@@ -20,28 +33,34 @@ class RoleBasedDatabaseMiddleware:
     def __call__(self, request):
         # Configurar o router com o utilizador atual
         if hasattr(request, 'user') and request.user.is_authenticated:
-            # Define o role no router
-            db_router.set_current_user(request.user)
-            
-            # Define o current_user_id para Row Level Security
-            try:
-                with connection.cursor() as cursor:
-                    cursor.execute(
-                        "SELECT set_current_user(%s)", 
-                        [request.user.id_utilizador]
-                    )
-            except Exception as e:
-                # Log do erro mas não quebra o request
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f"Erro ao configurar current_user para RLS: {e}")
+            token = db_router.set_current_user(request.user)
         else:
-            # User não autenticado - limpar
-            db_router.set_current_user(None)
+            # User não autenticado - sem role
+            token = db_router.set_current_user(None)
         
-        response = self.get_response(request)
+        alias = db_router.get_current_alias()
+        if alias == 'default' or alias not in connections.settings:
+            return responder_com_contexto(
+                self.get_response, request, lambda: db_router.reset(token)
+            )
         
-        return response
+        default_connection = connections['default']
+        connections['default'] = connections[alias]
+        
+        # Define o current_user_id para Row Level Security (a conexão do
+        # alias já é do role, por isso só o utilizador é aplicado)
+        contexto = ExitStack()
+        contexto.enter_context(connections[alias].execute_wrapper(
+            RoleContextExecuteWrapper(None, request.user.id_utilizador)
+        ))
+        
+        def repor():
+            contexto.close()
+            connections['default'] = default_connection
+            db_router.reset(token)
+        
+        # Em respostas streaming o role mantém-se até ao fecho da resposta
+        return responder_com_contexto(self.get_response, request, repor)
 
 
 class DatabaseUserLoggingMiddleware:
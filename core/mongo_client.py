@@ -1,16 +1,71 @@
 # core/mongo_client.py
-from pymongo import MongoClient, ASCENDING, DESCENDING
-from pymongo.errors import ConnectionFailure
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import MongoClient, ASCENDING, DESCENDING, TEXT
+from pymongo.errors import OperationFailure
 from django.conf import settings
 from datetime import datetime
+import copy
 import logging
+import threading
+import time
+
+from .notas_search import PesquisaNotas, PESOS_TEXTO, INDICE_TEXTO
 
 logger = logging.getLogger(__name__)
 
 
+# Campos de conteúdo de uma nota clínica e respetivos valores por omissão
+CAMPOS_NOTA = {
+    'notas_clinicas': '',
+    'observacoes': '',
+    'diagnostico': '',
+    'tratamento': '',
+    'exame_fisico': {},
+    'sintomas': [],
+    'prescricoes': [],
+    'exames_solicitados': [],
+    'seguimento': '',
+}
+
+# Campos devolvidos nas listagens de histórico (get_notes_by_patient/medico)
+PROJECAO_HISTORICO = {
+    'consulta_id': 1,
+    'medico_id': 1,
+    'paciente_id': 1,
+    'diagnostico': 1,
+    'tratamento': 1,
+    'sintomas': 1,
+    'created_at': 1,
+}
+
+
+def update_upsert_nota(medico_id, paciente_id, notes_data, agora):
+    """
+    Documento de update para criar/atualizar uma nota com upsert: os campos
+    enviados vão em $set e o resto (created_at, ids, valores por omissão)
+    em $setOnInsert.
+    """
+    campos = {key: notes_data[key] for key in CAMPOS_NOTA if key in notes_data}
+    campos['updated_at'] = agora
+    
+    na_criacao = {key: copy.copy(valor) for key, valor in CAMPOS_NOTA.items() if key not in campos}
+    na_criacao.update({
+        'medico_id': medico_id,
+        'paciente_id': paciente_id,
+        'created_at': agora,
+    })
+    return {'$set': campos, '$setOnInsert': na_criacao}
+
+
 class MongoDBClient:
     """
-    Singleton MongoDB client for managing notas clínicas and medical records
+    Singleton MongoDB client for managing notas clínicas and medical records.
+
+    O MongoClient (e o seu pool de conexões) é criado uma única vez, no
+    arranque (CoreConfig.ready), e partilhado por todos os requests. Se o
+    MongoDB estiver em baixo, a ligação é tentada de novo de forma lazy, com
+    backoff exponencial, em vez de falhar em cada request.
     """
     _instance = None
     _client = None
@@ -19,48 +74,123 @@ class MongoDBClient:
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
+            cls._instance._lock = threading.Lock()
+            cls._instance._falhas = 0
+            cls._instance._proxima_tentativa = 0.0
         return cls._instance
     
-    def __init__(self):
-        if self._client is None:
+    def connect(self):
+        """
+        Cria o cliente, testa a ligação e garante os índices.
+        Devolve True se ficou ligado. Em caso de falha agenda a próxima
+        tentativa (backoff exponencial até MONGO_RECONNECT_BACKOFF_MAX).
+        """
+        with self._lock:
+            if self.is_connected:
+                return True
+            
+            mongo_uri = getattr(settings, 'MONGO_DB_URI', 'mongodb://localhost:27017/')
+            mongo_db_name = getattr(settings, 'MONGO_DB_NAME', 'gestao_consultas_notas_clinicas')
+            client = None
             try:
-                mongo_uri = getattr(settings, 'MONGO_DB_URI', 'mongodb://localhost:27017/')
-                mongo_db_name = getattr(settings, 'MONGO_DB_NAME', 'gestao_consultas_notas_clinicas')
-                
-                self._client = MongoClient(
+                client = MongoClient(
                     mongo_uri,
-                    serverSelectionTimeoutMS=5000,
+                    maxPoolSize=getattr(settings, 'MONGO_MAX_POOL_SIZE', 50),
+                    minPoolSize=getattr(settings, 'MONGO_MIN_POOL_SIZE', 5),
+                    maxIdleTimeMS=getattr(settings, 'MONGO_MAX_IDLE_TIME_MS', 300000),
+                    serverSelectionTimeoutMS=getattr(settings, 'MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000),
                     connectTimeoutMS=10000
                 )
                 # Test connection
-                self._client.admin.command('ping')
-                self._db = self._client[mongo_db_name]
+                client.admin.command('ping')
+                db = client[mongo_db_name]
+                
+                self._client = client
+                self._db = db
+                self._falhas = 0
                 
                 # Create indexes for better performance
                 self._create_indexes()
                 
                 logger.info(f"MongoDB connected successfully to {mongo_db_name}")
-            except ConnectionFailure as e:
-                logger.error(f"Failed to connect to MongoDB: {e}")
-                self._client = None
-                self._db = None
+                return True
             except Exception as e:
-                logger.error(f"Unexpected error connecting to MongoDB: {e}")
+                if client is not None:
+                    client.close()
                 self._client = None
                 self._db = None
+                self._falhas += 1
+                espera = min(
+                    getattr(settings, 'MONGO_RECONNECT_BACKOFF', 1) * 2 ** (self._falhas - 1),
+                    getattr(settings, 'MONGO_RECONNECT_BACKOFF_MAX', 60)
+                )
+                self._proxima_tentativa = time.monotonic() + espera
+                logger.error(f"Failed to connect to MongoDB: {e} (nova tentativa em {espera}s)")
+                return False
+    
+    def ensure_connected(self):
+        """
+        Garante a ligação sem bloquear o request enquanto o backoff não
+        expirar. Devolve True se o MongoDB está disponível.
+        """
+        if self.is_connected:
+            return True
+        if time.monotonic() < self._proxima_tentativa:
+            return False
+        return self.connect()
+    
+    def close(self):
+        """Fecha o cliente (e o pool de conexões)"""
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+            self._client = None
+            self._db = None
     
     def _create_indexes(self):
         """Create indexes for better query performance"""
         try:
             collection_name = getattr(settings, 'MONGO_COLLECTION_NAME', 'notas_clinicas')
             notas_clinicas = self._db[collection_name]
-            notas_clinicas.create_index([('consulta_id', ASCENDING)], unique=False)
-            notas_clinicas.create_index([('medico_id', ASCENDING)])
-            notas_clinicas.create_index([('paciente_id', ASCENDING)])
+            self._garantir_consulta_id_unico(notas_clinicas)
+            # Histórico por paciente/médico: filtro + ordenação (created_at, _id)
+            # da paginação por keyset servidos pelo índice
+            notas_clinicas.create_index(
+                [('paciente_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)]
+            )
+            notas_clinicas.create_index(
+                [('medico_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)]
+            )
             notas_clinicas.create_index([('created_at', DESCENDING)])
+            # Índices substituídos pelos compostos acima
+            existentes = notas_clinicas.index_information()
+            for nome in ('medico_id_1', 'paciente_id_1',
+                         'medico_id_1_created_at_-1', 'paciente_id_1_created_at_-1'):
+                if nome in existentes:
+                    notas_clinicas.drop_index(nome)
+            # Índice de texto para search_notes (ver core/notas_search.py)
+            notas_clinicas.create_index(
+                [(campo, TEXT) for campo in PESOS_TEXTO],
+                weights=PESOS_TEXTO,
+                default_language='portuguese',
+                name=INDICE_TEXTO
+            )
         except Exception as e:
             logger.warning(f"Failed to create indexes: {e}")
     
+    def _garantir_consulta_id_unico(self, notas_clinicas):
+        """Uma nota por consulta: troca o índice antigo (não único) por um único"""
+        indice = notas_clinicas.index_information().get('consulta_id_1')
+        if indice is not None and not indice.get('unique'):
+            notas_clinicas.drop_index('consulta_id_1')
+        try:
+            notas_clinicas.create_index([('consulta_id', ASCENDING)], unique=True)
+        except OperationFailure as e:
+            # Notas duplicadas antigas: manter um índice não único até serem
+            # limpas; o outbox (core/outbox.py) não envia notas até lá
+            logger.error(f"Não foi possível criar índice único em consulta_id (outbox parado): {e}")
+            notas_clinicas.create_index([('consulta_id', ASCENDING)])
+    
     @property
     def is_connected(self):
         """Check if MongoDB connection is active"""
@@ -68,41 +198,59 @@ class MongoDBClient:
     
     def get_collection(self, collection_name):
         """Get a MongoDB collection"""
-        if not self.is_connected:
+        if not self.ensure_connected():
             raise ConnectionError("MongoDB is not connected")
         return self._db[collection_name]
     
     def get_view(self, view_name):
         """Get a MongoDB view (read-only)"""
-        if not self.is_connected:
+        if not self.ensure_connected():
             raise ConnectionError("MongoDB is not connected")
         return self._db[view_name]
 
 
 class NotasClinicasService:
     """
-    Service for managing notas clínicas in MongoDB
+    Service for managing notas clínicas in MongoDB.
+
+    Usar a instância partilhada devolvida por get_notas_service(). As
+    coleções e views são obtidas uma vez, na primeira operação com o MongoDB
+    ligado; se o MongoDB estiver em baixo os métodos devolvem None/[]/False.
     """
     
     def __init__(self):
         self.mongo = MongoDBClient()
-        if self.mongo.is_connected:
-            collection_name = getattr(settings, 'MONGO_COLLECTION_NAME', 'notas_clinicas')
+        self.collection = None
+        self.view_por_consulta = None
+        self.view_por_paciente = None
+        self.view_por_medico = None
+        self.view_resumo = None
+        self.pesquisa = None
+        self._consulta_id_unico = False
+        self._ligar()
+    
+    def _ligar(self):
+        """Carrega a coleção e as views (uma vez). Devolve True se disponível."""
+        if self.collection is not None and self.mongo.is_connected:
+            return True
+        if not self.mongo.ensure_connected():
+            return False
+        
+        collection_name = getattr(settings, 'MONGO_COLLECTION_NAME', 'notas_clinicas')
+        try:
             self.collection = self.mongo.get_collection(collection_name)
-            
-            # Load MongoDB views (required for all read operations)
-            try:
-                self.view_por_consulta = self.mongo.get_view('notas_por_consulta')
-                self.view_por_paciente = self.mongo.get_view('notas_por_paciente')
-                self.view_por_medico = self.mongo.get_view('notas_por_medico')
-                self.view_resumo = self.mongo.get_view('notas_resumo')
-                logger.info("MongoDB views loaded successfully")
-            except Exception as e:
-                logger.error(f"CRITICAL: Failed to load MongoDB views.Error: {e}")
-                raise ConnectionError(f"MongoDB views not found.")
-        else:
+            # MongoDB views (required for all read operations)
+            self.view_por_consulta = self.mongo.get_view('notas_por_consulta')
+            self.view_por_paciente = self.mongo.get_view('notas_por_paciente')
+            self.view_por_medico = self.mongo.get_view('notas_por_medico')
+            self.view_resumo = self.mongo.get_view('notas_resumo')
+            self.pesquisa = PesquisaNotas(self.collection)
+            logger.info("MongoDB views loaded successfully")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to load MongoDB collection/views: {e}")
             self.collection = None
-            raise ConnectionError("MongoDB is not connected")
+            return False
     
     def create_note(self, consulta_id, medico_id, paciente_id, notes_data):
         """
@@ -117,7 +265,7 @@ class NotasClinicasService:
         Returns:
             The inserted document ID or None if failed
         """
-        if self.collection is None:
+        if not self._ligar():
             logger.error("Cannot create note: MongoDB not connected")
             return None
         
@@ -127,26 +275,54 @@ class NotasClinicasService:
             'paciente_id': paciente_id,
             'created_at': datetime.now(),
             'updated_at': datetime.now(),
-            'notas_clinicas': notes_data.get('notas_clinicas', ''),
-            'observacoes': notes_data.get('observacoes', ''),
-            'diagnostico': notes_data.get('diagnostico', ''),
-            'tratamento': notes_data.get('tratamento', ''),
-            'exame_fisico': notes_data.get('exame_fisico', {}),
-            'sintomas': notes_data.get('sintomas', []),
-            'prescricoes': notes_data.get('prescricoes', []),
-            'exames_solicitados': notes_data.get('exames_solicitados', []),
-            'seguimento': notes_data.get('seguimento', ''),
         }
+        for key, default in CAMPOS_NOTA.items():
+            document[key] = notes_data[key] if key in notes_data else copy.copy(default)
         
         try:
             result = self.collection.insert_one(document)
+            self.pesquisa.indexar(document)
             logger.info(f"Nota clínica created for consulta {consulta_id}")
             return str(result.inserted_id)
         except Exception as e:
             logger.error(f"Failed to create nota clínica: {e}")
             return None
     
+    def consulta_id_unico(self):
+        """
+        True se a coleção tem o índice único em consulta_id (de que depende a
+        idempotência do outbox), False se não tem e None se o MongoDB estiver
+        em baixo. Só o True fica guardado.
+        """
+        if self._consulta_id_unico:
+            return True
+        if not self._ligar():
+            return None
+        indice = self.collection.index_information().get('consulta_id_1')
+        self._consulta_id_unico = bool(indice and indice.get('unique'))
+        return self._consulta_id_unico
+    
+    def bulk_write(self, operacoes, consultas):
+        """
+        Aplica um lote de operações à coleção de notas (usado pelo outbox).
+        ``consultas`` são os consulta_id das operações, cujas notas são
+        reindexadas na pesquisa. Levanta ConnectionError se o MongoDB não
+        estiver disponível e deixa passar BulkWriteError para quem chama
+        tratar as falhas parciais.
+        """
+        if not self._ligar():
+            raise ConnectionError("MongoDB is not connected")
+        
+        try:
+            return self.collection.bulk_write(operacoes, ordered=False)
+        finally:
+            if self.pesquisa.indice is not None:
+                for document in self.collection.find({'consulta_id': {'$in': list(consultas)}}):
+                    self.pesquisa.indexar(document)
+    
     def get_note_by_consulta(self, consulta_id):
+        if not self._ligar():
+            return None
         try:
             note = self.view_por_consulta.find_one({'consulta_id': consulta_id})
             return note
@@ -154,25 +330,80 @@ class NotasClinicasService:
             logger.error(f"Failed to retrieve nota clínica from view: {e}")
             return None
     
-    def get_notes_by_patient(self, paciente_id, limit=50):
+    @staticmethod
+    def _ler_cursor(antes):
+        """
+        Cursor de página ('<created_at ISO>|<_id>') -> (created_at, ObjectId
+        ou None). Levanta ValueError se o cursor for inválido.
+        """
+        if not antes:
+            return None
+        created_at, _, id_nota = antes.partition('|')
+        try:
+            return datetime.fromisoformat(created_at), ObjectId(id_nota) if id_nota else None
+        except (ValueError, InvalidId):
+            raise ValueError(f"Cursor de página inválido: {antes!r}")
+    
+    def _pagina_notas(self, filtro, limit, cursor):
+        """
+        Página de notas mais recentes primeiro, ordenadas por (created_at, _id):
+        o _id desempata notas com o mesmo created_at, que de outro modo podiam
+        ser saltadas ou repetidas entre páginas. O filtro vem antes da
+        ordenação, por isso a query usa os índices (campo, created_at desc,
+        _id desc). ``cursor`` é o da página anterior, já lido por _ler_cursor.
+        """
+        if cursor:
+            created_at, id_nota = cursor
+            if id_nota:
+                filtro['$or'] = [
+                    {'created_at': {'$lt': created_at}},
+                    {'created_at': created_at, '_id': {'$lt': id_nota}},
+                ]
+            else:
+                filtro['created_at'] = {'$lt': created_at}
+        
+        notes = list(
+            self.collection.find(filtro, PROJECAO_HISTORICO)
+            .sort([('created_at', DESCENDING), ('_id', DESCENDING)])
+            .limit(limit)
+        )
+        proximo = None
+        if len(notes) == limit:
+            ultima = notes[-1]
+            proximo = f"{ultima['created_at'].isoformat()}|{ultima['_id']}"
+        return notes, proximo
+    
+    def get_notes_by_patient(self, paciente_id, limit=50, antes=None):
+        """
+        Histórico de notas do paciente. Devolve (notas, proximo_cursor);
+        levanta ValueError se o cursor ``antes`` for inválido.
+        """
+        cursor = self._ler_cursor(antes)
+        if not self._ligar():
+            return [], None
         try:
-            notes = self.view_por_paciente.find({'paciente_id': paciente_id}).limit(limit)
-            return list(notes)
+            return self._pagina_notas({'paciente_id': paciente_id}, limit, cursor)
         except Exception as e:
-            logger.error(f"Failed to retrieve patient notes from view: {e}")
-            return []
+            logger.error(f"Failed to retrieve patient notes: {e}")
+            return [], None
     
-    def get_notes_by_medico(self, medico_id, limit=50):
+    def get_notes_by_medico(self, medico_id, limit=50, antes=None):
+        """
+        Notas do médico. Devolve (notas, proximo_cursor); levanta ValueError
+        se o cursor ``antes`` for inválido.
+        """
+        cursor = self._ler_cursor(antes)
+        if not self._ligar():
+            return [], None
         try:
-            notes = self.view_por_medico.find({'medico_id': medico_id}).limit(limit)
-            return list(notes)
+            return self._pagina_notas({'medico_id': medico_id}, limit, cursor)
         except Exception as e:
-            logger.error(f"Failed to retrieve doctor notes from view: {e}")
-            return []
+            logger.error(f"Failed to retrieve doctor notes: {e}")
+            return [], None
     
     def update_note(self, consulta_id, notes_data):
         """Update an existing nota clínica"""
-        if self.collection is None:
+        if not self._ligar():
             return False
         
         update_data = {
@@ -180,8 +411,7 @@ class NotasClinicasService:
         }
         
         # Update only provided fields
-        for key in ['notas_clinicas', 'observacoes', 'diagnostico', 'tratamento', 
-                    'exame_fisico', 'sintomas', 'prescricoes', 'exames_solicitados', 'seguimento']:
+        for key in CAMPOS_NOTA:
             if key in notes_data:
                 update_data[key] = notes_data[key]
         
@@ -190,6 +420,10 @@ class NotasClinicasService:
                 {'consulta_id': consulta_id},
                 {'$set': update_data}
             )
+            if self.pesquisa.indice is not None:
+                document = self.collection.find_one({'consulta_id': consulta_id})
+                if document is not None:
+                    self.pesquisa.indexar(document)
             return result.modified_count > 0
         except Exception as e:
             logger.error(f"Failed to update nota clínica: {e}")
@@ -197,26 +431,72 @@ class NotasClinicasService:
     
     def delete_note(self, consulta_id):
         """Delete a nota clínica"""
-        if self.collection is None:
+        if not self._ligar():
             return False
         
         try:
-            result = self.collection.delete_one({'consulta_id': consulta_id})
-            return result.deleted_count > 0
+            document = self.collection.find_one_and_delete(
+                {'consulta_id': consulta_id},
+                projection={'_id': 1}
+            )
+            if document is None:
+                return False
+            self.pesquisa.remover(document['_id'])
+            return True
         except Exception as e:
             logger.error(f"Failed to delete nota clínica: {e}")
             return False
     
-    def search_notes(self, query_text, limit=50):
+    def search_notes(self, query_text, medico_id=None, paciente_id=None,
+                     data_inicio=None, data_fim=None, limit=50, cursor=None):
+        """
+        Pesquisa de texto (notas, diagnóstico, sintomas, prescrições) ordenada
+        por relevância. Devolve (notas, proximo_cursor); ver core/notas_search.py.
+        """
+        if not self._ligar():
+            return [], None
         try:
-            notes = self.view_resumo.find({
-                '$or': [
-                    {'resumo_notas': {'$regex': query_text, '$options': 'i'}},
-                    {'diagnostico': {'$regex': query_text, '$options': 'i'}}
-                ]
-            }).limit(limit)
-            
-            return list(notes)
+            return self.pesquisa.pesquisar(
+                query_text,
+                medico_id=medico_id,
+                paciente_id=paciente_id,
+                data_inicio=data_inicio,
+                data_fim=data_fim,
+                limite=limit,
+                cursor=cursor
+            )
+        except ValueError:
+            raise
         except Exception as e:
-            logger.error(f"Failed to search notes from view: {e}")
-            return []
+            logger.error(f"Failed to search notes: {e}")
+            return [], None
+
+
+_notas_service = None
+_notas_service_lock = threading.Lock()
+
+
+def get_notas_service():
+    """Instância partilhada de NotasClinicasService (uma por processo)"""
+    global _notas_service
+    if _notas_service is None:
+        with _notas_service_lock:
+            if _notas_service is None:
+                _notas_service = NotasClinicasService()
+    return _notas_service
+
+
+def ligar_mongo_no_arranque():
+    """
+    Liga o cliente MongoDB partilhado e cria os índices no arranque do
+    servidor web (wsgi.py/asgi.py), para o primeiro request não pagar a
+    ligação. Corre numa thread para não atrasar o arranque quando o MongoDB
+    não está disponível (os requests voltam a tentar com backoff).
+    """
+    if not getattr(settings, 'MONGO_CONNECT_ON_STARTUP', True):
+        return
+    threading.Thread(
+        target=MongoDBClient().connect,
+        name='mongo-connect',
+        daemon=True
+    ).start()
@@ -0,0 +1,261 @@
+# core/notas_search.py
+"""
+Pesquisa de texto nas notas clínicas.
+
+Com MongoDB usa o índice de texto ``notas_texto`` (criado em
+MongoDBClient._create_indexes) sobre notas_clinicas, diagnostico, sintomas e
+prescricoes, com ranking por ``textScore``. Só quando o servidor não suporta
+``$text`` de todo (mongomock nos testes, ou MONGO_PESQUISA_INDICE_LOCAL)
+usa um índice invertido local construído a partir da coleção, com os mesmos
+pesos. Esse índice só vê as escritas feitas neste processo, por isso não é
+usado como recurso quando o ``$text`` falha num MongoDB real (p.ex. o índice
+ainda está a ser criado): o erro é registado e a pesquisa seguinte volta a
+tentar o ``$text``.
+
+Os resultados vêm ordenados por relevância (score desc, _id) e são
+paginados por cursor keyset ("<score>_<_id>").
+"""
+
+import logging
+import math
+import re
+import threading
+import unicodedata
+
+from bson import ObjectId
+from django.conf import settings
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Campos do índice de texto e respetivos pesos
+PESOS_TEXTO = {
+    'diagnostico': 10,
+    'sintomas': 5,
+    'prescricoes': 3,
+    'notas_clinicas': 1,
+}
+
+INDICE_TEXTO = 'notas_texto'
+
+# Campos devolvidos em cada resultado
+PROJECAO = {
+    'consulta_id': 1,
+    'medico_id': 1,
+    'paciente_id': 1,
+    'diagnostico': 1,
+    'created_at': 1,
+    'resumo_notas': {'$substrCP': [{'$ifNull': ['$notas_clinicas', '']}, 0, 200]},
+}
+
+STOPWORDS = {
+    'a', 'o', 'as', 'os', 'de', 'da', 'do', 'das', 'dos', 'e', 'em', 'no', 'na',
+    'nos', 'nas', 'um', 'uma', 'com', 'sem', 'por', 'para', 'que', 'se', 'ao',
+}
+
+
+def tokenizar(texto):
+    """Minúsculas, sem acentos, palavras com 2+ caracteres e sem stopwords"""
+    if not texto:
+        return []
+    if isinstance(texto, (list, tuple)):
+        texto = ' '.join(str(t) for t in texto)
+    texto = unicodedata.normalize('NFKD', str(texto).lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return [t for t in re.findall(r'\w+', texto) if len(t) > 1 and t not in STOPWORDS]
+
+
+def codificar_cursor(nota):
+    """Cursor keyset (score, _id) do último resultado de uma página"""
+    return f"{nota['score']!r}_{nota['_id']}"
+
+
+def descodificar_cursor(cursor_str):
+    """Inverso de codificar_cursor; levanta ValueError se o cursor for inválido"""
+    score, _id = cursor_str.split('_', 1)
+    try:
+        _id = ObjectId(_id)
+    except Exception:
+        _id = int(_id)
+    return float(score), _id
+
+
+def _filtro(medico_id=None, paciente_id=None, data_inicio=None, data_fim=None):
+    filtro = {}
+    if medico_id is not None:
+        filtro['medico_id'] = medico_id
+    if paciente_id is not None:
+        filtro['paciente_id'] = paciente_id
+    if data_inicio is not None or data_fim is not None:
+        filtro['created_at'] = {}
+        if data_inicio is not None:
+            filtro['created_at']['$gte'] = data_inicio
+        if data_fim is not None:
+            filtro['created_at']['$lt'] = data_fim
+    return filtro
+
+
+class IndiceInvertido:
+    """
+    Índice invertido em memória: termo -> {_id: peso}. O peso de um termo
+    num documento é a soma, por campo, de PESOS_TEXTO[campo] * ocorrências.
+    O score de uma pesquisa é a soma de peso * idf dos termos pesquisados.
+    """
+
+    def __init__(self):
+        self._postings = {}
+        self._docs = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def indexar(self, doc):
+        termos = {}
+        for campo, peso in PESOS_TEXTO.items():
+            for termo in tokenizar(doc.get(campo)):
+                termos[termo] = termos.get(termo, 0) + peso
+
+        with self._lock:
+            self._remover(doc['_id'])
+            self._docs[doc['_id']] = (
+                {k: doc.get(k) for k in ('consulta_id', 'medico_id', 'paciente_id', 'diagnostico', 'created_at')}
+                | {'resumo_notas': (doc.get('notas_clinicas') or '')[:200]},
+                list(termos),
+            )
+            for termo, peso in termos.items():
+                self._postings.setdefault(termo, {})[doc['_id']] = peso
+
+    def remover(self, _id):
+        with self._lock:
+            self._remover(_id)
+
+    def _remover(self, _id):
+        entrada = self._docs.pop(_id, None)
+        if entrada is None:
+            return
+        for termo in entrada[1]:
+            docs = self._postings.get(termo)
+            if docs is not None:
+                docs.pop(_id, None)
+                if not docs:
+                    del self._postings[termo]
+
+    def pesquisar(self, query_text, medico_id=None, paciente_id=None,
+                  data_inicio=None, data_fim=None, limite=50, apos=None):
+        scores = {}
+        with self._lock:
+            total = len(self._docs) or 1
+            for termo in set(tokenizar(query_text)):
+                docs = self._postings.get(termo, {})
+                if not docs:
+                    continue
+                idf = math.log(1 + total / len(docs))
+                for _id, peso in docs.items():
+                    scores[_id] = scores.get(_id, 0.0) + peso * idf
+
+            resultados = []
+            for _id, score in scores.items():
+                dados = self._docs[_id][0]
+                if medico_id is not None and dados['medico_id'] != medico_id:
+                    continue
+                if paciente_id is not None and dados['paciente_id'] != paciente_id:
+                    continue
+                if data_inicio is not None and (dados['created_at'] is None or dados['created_at'] < data_inicio):
+                    continue
+                if data_fim is not None and (dados['created_at'] is None or dados['created_at'] >= data_fim):
+                    continue
+                resultados.append(dict(dados, _id=_id, score=score))
+
+        resultados.sort(key=lambda n: (-n['score'], str(n['_id'])))
+        if apos is not None:
+            apos_score, apos_id = apos
+            resultados = [
+                n for n in resultados
+                if n['score'] < apos_score or (n['score'] == apos_score and str(n['_id']) > str(apos_id))
+            ]
+        return resultados[:limite]
+
+
+def _sem_pesquisa_texto(collection):
+    """True para coleções que não suportam $text (mongomock) ou com o índice local forçado"""
+    if getattr(settings, 'MONGO_PESQUISA_INDICE_LOCAL', False):
+        return True
+    return type(collection).__module__.split('.')[0] == 'mongomock'
+
+
+class PesquisaNotas:
+    """Pesquisa numa coleção de notas: $text, ou índice invertido local sem suporte para $text"""
+
+    def __init__(self, collection, indice_local=None):
+        self.collection = collection
+        self.indice = None
+        self._usar_texto = not (_sem_pesquisa_texto(collection) if indice_local is None else indice_local)
+        self._lock = threading.Lock()
+
+    def _indice_local(self):
+        if self.indice is None:
+            with self._lock:
+                if self.indice is None:
+                    indice = IndiceInvertido()
+                    campos = dict.fromkeys(list(PESOS_TEXTO) + ['consulta_id', 'medico_id', 'paciente_id', 'created_at'], 1)
+                    for doc in self.collection.find({}, campos):
+                        indice.indexar(doc)
+                    logger.info(f"Índice invertido local construído com {len(indice)} notas")
+                    self.indice = indice
+        return self.indice
+
+    def indexar(self, doc):
+        """Atualiza o índice local (se estiver em uso) depois de criar/alterar uma nota"""
+        if self.indice is not None:
+            self.indice.indexar(doc)
+
+    def remover(self, _id):
+        if self.indice is not None:
+            self.indice.remover(_id)
+
+    def _pesquisar_texto(self, query_text, filtro, limite, apos):
+        pipeline = [
+            {'$match': dict(filtro, **{'$text': {'$search': query_text}})},
+            {'$addFields': {'score': {'$meta': 'textScore'}}},
+        ]
+        if apos is not None:
+            apos_score, apos_id = apos
+            pipeline.append({'$match': {'$or': [
+                {'score': {'$lt': apos_score}},
+                {'score': apos_score, '_id': {'$gt': apos_id}},
+            ]}})
+        pipeline += [
+            {'$sort': {'score': -1, '_id': 1}},
+            {'$limit': limite},
+            {'$project': dict(PROJECAO, score=1)},
+        ]
+        return list(self.collection.aggregate(pipeline))
+
+    def pesquisar(self, query_text, medico_id=None, paciente_id=None,
+                  data_inicio=None, data_fim=None, limite=50, cursor=None):
+        """
+        Devolve (notas, proximo_cursor) ordenadas por relevância. ``cursor`` é
+        o valor devolvido pela página anterior (None para a primeira página).
+        """
+        apos = descodificar_cursor(cursor) if cursor else None
+        if not tokenizar(query_text):
+            return [], None
+
+        if self._usar_texto:
+            try:
+                notas = self._pesquisar_texto(
+                    query_text, _filtro(medico_id, paciente_id, data_inicio, data_fim), limite, apos
+                )
+            except OperationFailure as e:
+                # Sem recurso ao índice local (incompleto noutros processos):
+                # a próxima pesquisa volta a tentar o $text
+                logger.error(f"Pesquisa $text falhou (índice '{INDICE_TEXTO}' em falta?): {e}")
+                raise
+        else:
+            notas = self._indice_local().pesquisar(
+                query_text, medico_id, paciente_id, data_inicio, data_fim, limite, apos
+            )
+
+        proximo = codificar_cursor(notas[-1]) if len(notas) == limite else None
+        return notas, proximo
@@ -0,0 +1,184 @@
+# core/outbox.py
+"""
+Outbox de notas clínicas (PostgreSQL -> MongoDB).
+
+O request grava a nota na tabela "OUTBOX_NOTAS" na mesma transação em que
+atualiza a consulta (enfileirar_nota), por isso os dois estados nunca
+divergem e a latência do request não depende do MongoDB.
+
+processar_outbox() reserva um lote de eventos pendentes
+(reservar_eventos_outbox_notas, FOR UPDATE SKIP LOCKED) e confirma a reserva;
+só depois, sem transação nem bloqueios abertos no PostgreSQL, envia-os com um
+único bulk_write e marca-os como processados; os que falham são reagendados
+com backoff exponencial. Uma reserva de um worker que morreu a meio expira ao
+fim de OUTBOX_RESERVA_SEGUNDOS. É chamado periodicamente pelo APScheduler e
+pelo comando ``python manage.py processar_outbox_notas``.
+
+Cada nota é um upsert por consulta_id com o id do evento (outbox_id): um
+evento repetido ou mais antigo do que o que já está no MongoDB não altera a
+nota, por isso reprocessar é idempotente. Isto depende do índice único em
+consulta_id (o upsert de um evento antigo falha com chave duplicada em vez de
+criar uma segunda nota): sem ele o outbox não envia nada e levanta
+IndiceConsultaEmFalta.
+"""
+
+import json
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .mongo_client import get_notas_service, update_upsert_nota
+
+logger = logging.getLogger(__name__)
+
+# Código de erro do MongoDB para chave duplicada
+DUPLICATE_KEY = 11000
+
+
+class IndiceConsultaEmFalta(RuntimeError):
+    """A coleção de notas não tem o índice único em consulta_id"""
+
+
+def enfileirar_nota(id_consulta, medico_id, paciente_id, notes_data):
+    """
+    Regista a nota clínica no outbox. Deve ser chamada dentro da transação
+    que altera a consulta. Devolve o id do evento.
+    """
+    payload = {
+        'medico_id': medico_id,
+        'paciente_id': paciente_id,
+        'notes': notes_data,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT enfileirar_nota_outbox(%s, %s::JSONB)",
+            [id_consulta, json.dumps(payload)]
+        )
+        return cursor.fetchone()[0]
+
+
+def _data_mongo(valor):
+    """As notas guardam datas naive em hora local (como datetime.now())"""
+    if timezone.is_aware(valor):
+        return timezone.make_naive(valor)
+    return valor
+
+
+def preparar_operacoes(eventos):
+    """
+    Converte eventos (id_evento, id_consulta, payload, criado_em, tentativas)
+    em operações UpdateOne, uma por consulta (fica o evento mais recente).
+
+    Devolve (operacoes, ids_por_operacao): ids_por_operacao[i] são todos os
+    eventos resolvidos pela operação i.
+    """
+    por_consulta = {}
+    for evento in sorted(eventos, key=lambda e: e[0]):
+        id_evento, id_consulta = evento[0], evento[1]
+        _, ids = por_consulta.get(id_consulta, (None, []))
+        por_consulta[id_consulta] = (evento, ids + [id_evento])
+
+    operacoes, ids_por_operacao = [], []
+    for id_consulta, (evento, ids) in por_consulta.items():
+        id_evento, _, payload, criado_em, _ = evento
+        update = update_upsert_nota(
+            payload.get('medico_id'),
+            payload.get('paciente_id'),
+            payload.get('notes', {}),
+            _data_mongo(criado_em)
+        )
+        update['$set']['outbox_id'] = id_evento
+        operacoes.append(UpdateOne(
+            {
+                'consulta_id': id_consulta,
+                '$or': [
+                    {'outbox_id': {'$exists': False}},
+                    {'outbox_id': {'$lt': id_evento}},
+                ],
+            },
+            update,
+            upsert=True
+        ))
+        ids_por_operacao.append(ids)
+    return operacoes, ids_por_operacao
+
+
+def classificar_resultado(ids_por_operacao, erros):
+    """
+    Separa os eventos em (processados, falhados) a partir dos writeErrors de
+    um BulkWriteError. Uma chave duplicada significa que a nota já tem uma
+    versão mais recente: o evento conta como processado.
+    """
+    falhadas = {e['index'] for e in erros if e.get('code') != DUPLICATE_KEY}
+    processados, falhados = [], []
+    for indice, ids in enumerate(ids_por_operacao):
+        (falhados if indice in falhadas else processados).extend(ids)
+    return processados, falhados
+
+
+def processar_outbox(limite=None):
+    """
+    Processa um lote de eventos pendentes. Devolve (processados, falhados).
+    """
+    limite = limite or getattr(settings, 'OUTBOX_BATCH_SIZE', 200)
+    max_tentativas = getattr(settings, 'OUTBOX_MAX_TENTATIVAS', 10)
+    backoff = getattr(settings, 'OUTBOX_BACKOFF_SEGUNDOS', 5)
+    reserva = getattr(settings, 'OUTBOX_RESERVA_SEGUNDOS', 300)
+
+    notas = get_notas_service()
+    if notas.consulta_id_unico() is False:
+        logger.error("Outbox de notas parado: a coleção de notas não tem índice único em consulta_id")
+        raise IndiceConsultaEmFalta(
+            "Índice único em consulta_id em falta: remova as notas duplicadas e reinicie a aplicação"
+        )
+
+    # Reserva confirmada já aqui: nenhum bloqueio fica aberto durante o bulk_write
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT * FROM reservar_eventos_outbox_notas(%s, %s, %s)",
+                [limite, max_tentativas, reserva]
+            )
+            eventos = cursor.fetchall()
+    if not eventos:
+        return 0, 0
+
+    operacoes, ids_por_operacao = preparar_operacoes(eventos)
+    erro = None
+    try:
+        notas.bulk_write(operacoes, sorted({evento[1] for evento in eventos}))
+        processados, falhados = [e[0] for e in eventos], []
+    except BulkWriteError as e:
+        erros = e.details.get('writeErrors', [])
+        processados, falhados = classificar_resultado(ids_por_operacao, erros)
+        erro = '; '.join(err.get('errmsg', '') for err in erros if err.get('code') != DUPLICATE_KEY)
+    except Exception as e:
+        processados, falhados = [], [ev[0] for ev in eventos]
+        erro = str(e)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CALL concluir_eventos_outbox_notas(%s::BIGINT[], %s::BIGINT[], %s, %s)",
+            [processados, falhados, erro, backoff]
+        )
+
+    if falhados:
+        logger.warning(f"Outbox de notas: {len(falhados)} eventos reagendados ({erro})")
+    if processados:
+        logger.info(f"Outbox de notas: {len(processados)} eventos enviados para o MongoDB")
+    return len(processados), len(falhados)
+
+
+def drenar_outbox(max_lotes=50):
+    """Processa lotes até o outbox ficar vazio (ou só com falhas). Usado pelo scheduler."""
+    total = 0
+    for _ in range(max_lotes):
+        processados, _ = processar_outbox()
+        total += processados
+        if not processados:
+            break
+    return total
@@ -0,0 +1,43 @@
+# core/receitas.py
+"""
+Registo de receitas em lote.
+
+Todas as linhas de prescrição de uma consulta (e, opcionalmente, a mudança
+de estado da consulta) são gravadas com uma única chamada ao procedimento
+``inserir_receitas_lote``, numa só transação e num só round-trip, em vez de
+um ``CALL inserir_receita`` por linha.
+"""
+
+from django.db import connection
+
+
+def _colunas(linhas):
+    """Converte [(medicamento, dosagem, instrucoes), ...] em três listas (arrays SQL)"""
+    medicamentos, dosagens, instrucoes = [], [], []
+    for medicamento, dosagem, instrucao in linhas:
+        if not medicamento or not medicamento.strip():
+            continue
+        medicamentos.append(medicamento.strip())
+        dosagens.append(dosagem)
+        instrucoes.append(instrucao)
+    return medicamentos, dosagens, instrucoes
+
+
+def registar_receitas(id_consulta, linhas, data_prescricao, novo_estado=None):
+    """
+    Insere as receitas da consulta e, se ``novo_estado`` for indicado,
+    atualiza o estado da consulta na mesma transação.
+
+    ``linhas`` é um iterável de (medicamento, dosagem, instrucoes); linhas
+    sem medicamento são ignoradas. Devolve o número de receitas inseridas.
+    """
+    medicamentos, dosagens, instrucoes = _colunas(linhas)
+    if not medicamentos and novo_estado is None:
+        return 0
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CALL inserir_receitas_lote(%s, %s::TEXT[], %s::TEXT[], %s::TEXT[], %s, %s, NULL)",
+            [id_consulta, medicamentos, dosagens, instrucoes, data_prescricao, novo_estado]
+        )
+        return cursor.fetchone()[0]
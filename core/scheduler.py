@@ -0,0 +1,212 @@
+# core/scheduler.py
+"""
+Tarefas agendadas (APScheduler) corridas fora dos processos web.
+
+O scheduler corre num processo dedicado (``python manage.py run_scheduler``)
+em vez de arrancar em CoreConfig.ready: com vários workers gunicorn as
+tarefas corriam em todos os workers (ou em nenhum, fora do runserver).
+
+- As tarefas ficam guardadas no DjangoJobStore (tabelas do django_apscheduler,
+  criadas com ``python manage.py migrate django_apscheduler``) e cada execução
+  fica registada em DjangoJobExecution (histórico visível no admin).
+- Só um processo é líder: o que obtém o advisory lock SCHEDULER_LOCK_ID do
+  PostgreSQL. Os restantes ficam em espera e assumem se o líder cair (o lock
+  é libertado quando a sessão do líder termina).
+- As tarefas correm num ThreadPoolExecutor com SCHEDULER_WORKERS threads.
+"""
+
+import logging
+
+from django.conf import settings
+from django.db import connection
+from django_apscheduler import util
+
+logger = logging.getLogger(__name__)
+
+
+@util.close_old_connections
+def tarefa_lembretes_24h():
+    from .email_utils import enviar_lembretes_24h
+    return enviar_lembretes_24h()
+
+
+@util.close_old_connections
+def tarefa_lembretes_2h():
+    from .email_utils import enviar_lembretes_2h
+    return enviar_lembretes_2h()
+
+
+@util.close_old_connections
+def tarefa_outbox_notas():
+    from .outbox import drenar_outbox
+    return drenar_outbox()
+
+
+@util.close_old_connections
+def tarefa_atualizar_matviews():
+    from .matviews import atualizar_matviews
+    return atualizar_matviews()
+
+
+def tarefa_limpar_exportacoes():
+    from .exportacao_jobs import limpar_exportacoes
+    return limpar_exportacoes()
+
+
+def tarefa_limpar_importacoes():
+    from .importacao_jobs import limpar_importacoes
+    return limpar_importacoes()
+
+
+@util.close_old_connections
+def tarefa_limpar_historico():
+    """Apaga execuções antigas do histórico do django_apscheduler"""
+    from django_apscheduler.models import DjangoJobExecution
+
+    dias = getattr(settings, 'SCHEDULER_HISTORICO_DIAS', 7)
+    DjangoJobExecution.objects.delete_old_job_executions(dias * 24 * 3600)
+
+
+def registar_tarefas(scheduler):
+    """Adiciona (ou substitui no job store) todas as tarefas agendadas"""
+    # Tarefa 1: Lembrete 24h - Diariamente às 9:00
+    scheduler.add_job(
+        tarefa_lembretes_24h,
+        'cron',
+        hour=9,
+        minute=0,
+        id='lembrete_24h',
+        replace_existing=True,
+        name='Enviar lembretes de 24h'
+    )
+    logger.info("✓ Tarefa agendada: Lembretes 24h (diário às 9:00)")
+
+    # Tarefa 2: Lembrete 2h - A cada 30 minutos
+    scheduler.add_job(
+        tarefa_lembretes_2h,
+        'interval',
+        minutes=30,
+        id='lembrete_2h',
+        replace_existing=True,
+        name='Enviar lembretes de 2h'
+    )
+    logger.info("✓ Tarefa agendada: Lembretes 2h (a cada 30 minutos)")
+
+    # Tarefa 3: Outbox de notas clínicas -> MongoDB
+    scheduler.add_job(
+        tarefa_outbox_notas,
+        'interval',
+        seconds=getattr(settings, 'OUTBOX_INTERVALO_SEGUNDOS', 5),
+        id='outbox_notas',
+        replace_existing=True,
+        name='Sincronizar notas clínicas com o MongoDB'
+    )
+    logger.info("✓ Tarefa agendada: Outbox de notas clínicas")
+
+    # Tarefa 4: Refresh das materialized views de relatórios - Diariamente
+    scheduler.add_job(
+        tarefa_atualizar_matviews,
+        'cron',
+        hour=getattr(settings, 'MATVIEWS_REFRESH_HORA', 2),
+        minute=0,
+        id='atualizar_matviews',
+        replace_existing=True,
+        name='Atualizar materialized views de relatórios'
+    )
+    logger.info("✓ Tarefa agendada: Refresh das materialized views (diário)")
+
+    # Tarefa 5: Ficheiros de exportações em background expirados - De hora a hora
+    scheduler.add_job(
+        tarefa_limpar_exportacoes,
+        'interval',
+        hours=1,
+        id='limpar_exportacoes',
+        replace_existing=True,
+        name='Apagar exportações expiradas'
+    )
+    logger.info("✓ Tarefa agendada: Limpeza de exportações (a cada hora)")
+
+    # Tarefa 6: Manifestos de importações em background antigos - De hora a hora
+    scheduler.add_job(
+        tarefa_limpar_importacoes,
+        'interval',
+        hours=1,
+        id='limpar_importacoes',
+        replace_existing=True,
+        name='Apagar manifestos de importações antigos'
+    )
+    logger.info("✓ Tarefa agendada: Limpeza de importações (a cada hora)")
+
+    # Tarefa 7: Limpeza do histórico de execuções - Semanalmente
+    scheduler.add_job(
+        tarefa_limpar_historico,
+        'cron',
+        day_of_week='mon',
+        hour=3,
+        minute=0,
+        id='limpar_historico_tarefas',
+        replace_existing=True,
+        name='Limpar histórico de execuções'
+    )
+    logger.info("✓ Tarefa agendada: Limpeza do histórico (semanal)")
+
+
+def criar_scheduler(jobstore=None):
+    """
+    BackgroundScheduler com DjangoJobStore e ThreadPoolExecutor.
+    ``jobstore`` permite usar outro job store (p.ex. em memória nos testes).
+    """
+    from apscheduler.executors.pool import ThreadPoolExecutor
+    from apscheduler.schedulers.background import BackgroundScheduler
+
+    if jobstore is None:
+        from django_apscheduler.jobstores import DjangoJobStore
+        jobstore = DjangoJobStore()
+
+    return BackgroundScheduler(
+        timezone=getattr(settings, 'SCHEDULER_TIMEZONE', 'Europe/Lisbon'),
+        jobstores={'default': jobstore},
+        executors={'default': ThreadPoolExecutor(getattr(settings, 'SCHEDULER_WORKERS', 4))},
+        job_defaults={
+            # Execuções perdidas (p.ex. durante uma troca de líder) correm uma só vez
+            'coalesce': True,
+            'max_instances': 1,
+            'misfire_grace_time': getattr(settings, 'SCHEDULER_MISFIRE_GRACE_SEGUNDOS', 300),
+        },
+    )
+
+
+def obter_lock_lider():
+    """
+    Tenta obter o advisory lock de líder na conexão deste thread. O lock é
+    de sessão: mantém-se enquanto a conexão estiver aberta.
+
+    Devolve o pid do backend que detém o lock, ou None se outro processo já
+    é líder.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_try_advisory_lock(%s), pg_backend_pid()",
+            [settings.SCHEDULER_LOCK_ID]
+        )
+        obtido, pid = cursor.fetchone()
+    return pid if obtido else None
+
+
+def libertar_lock_lider():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", [settings.SCHEDULER_LOCK_ID])
+
+
+def conexao_lider_ativa(pid):
+    """
+    Verifica se a sessão que detém o lock continua viva. Uma conexão nova
+    (pid diferente) significa que o lock se perdeu com a sessão anterior.
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_backend_pid()")
+            return cursor.fetchone()[0] == pid
+    except Exception as e:
+        logger.error(f"Conexão do líder do scheduler perdida: {e}")
+        return False
@@ -0,0 +1,83 @@
+# core/slots.py
+"""
+Motor de slots das disponibilidades.
+
+A grelha de slots (hora + livre/ocupado) de qualquer número de linhas de
+"DISPONIBILIDADE" é obtida com uma única query à função SQL
+``obter_slots_disponibilidades`` (tabela materializada "SLOTS", mantida por
+triggers), em vez de uma chamada a ``verificar_slot_disponivel`` por slot.
+
+``procurar_primeiros_slots`` devolve os primeiros slots livres de todos os
+médicos, com paginação keyset.
+"""
+
+from datetime import datetime
+
+from django.db import connection
+
+
+def _agrupar_slots(rows):
+    """Agrupa as linhas (id_disp, data, hora_inicio, hora_fim, disponivel, id_consulta) por disponibilidade"""
+    slots = {}
+    for id_disponibilidade, _data, hora_inicio, hora_fim, disponivel, id_consulta in rows:
+        slots.setdefault(id_disponibilidade, []).append({
+            'time': hora_inicio.strftime('%H:%M'),
+            'hora_inicio': hora_inicio,
+            'hora_fim': hora_fim,
+            'available': disponivel,
+            'id_consulta': id_consulta,
+        })
+    return slots
+
+
+def obter_slots(disp_ids):
+    """
+    Devolve {id_disponibilidade: [slot, ...]} para todas as disponibilidades
+    pedidas, com uma única query. Disponibilidades sem slots (duração
+    inválida) não aparecem no dicionário.
+    """
+    disp_ids = [int(d) for d in disp_ids]
+    if not disp_ids:
+        return {}
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT * FROM obter_slots_disponibilidades(%s)",
+            [disp_ids]
+        )
+        return _agrupar_slots(cursor.fetchall())
+
+
+def codificar_cursor(slot):
+    """Cursor keyset (data, hora_inicio, id_slot) do último slot de uma página"""
+    return f"{slot['data'].isoformat()}_{slot['hora_inicio'].strftime('%H:%M')}_{slot['id_slot']}"
+
+
+def descodificar_cursor(cursor_str):
+    """Inverso de codificar_cursor; levanta ValueError se o cursor for inválido"""
+    data_str, hora_str, id_slot = cursor_str.split('_')
+    return (
+        datetime.strptime(data_str, '%Y-%m-%d').date(),
+        datetime.strptime(hora_str, '%H:%M').time(),
+        int(id_slot),
+    )
+
+
+def procurar_primeiros_slots(especialidade=None, unidade=None, regiao=None, limite=20, apos=None):
+    """
+    Devolve (slots, proximo_cursor) com os primeiros ``limite`` slots livres
+    de todos os médicos que respeitam os filtros. ``apos`` é o cursor
+    devolvido pela página anterior (None para a primeira página).
+    """
+    apos_data, apos_hora, apos_id = descodificar_cursor(apos) if apos else (None, None, None)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT * FROM obter_primeiros_slots_livres(%s, %s, %s, %s, %s, %s, %s)",
+            [especialidade, unidade, regiao, limite, apos_data, apos_hora, apos_id]
+        )
+        columns = [col[0] for col in cursor.description]
+        slots = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    proximo = codificar_cursor(slots[-1]) if len(slots) == limite else None
+    return slots, proximo
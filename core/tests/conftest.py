@@ -0,0 +1,115 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+
+class FakeCursor:
+    """
+    Cursor de FakeConnection: regista cada query em ``conn.chamadas`` e
+    devolve as linhas programadas na conexão para essa query.
+    """
+
+    def __init__(self, conn, nome=None):
+        self.conn = conn
+        # Cursor psycopg2 por baixo do wrapper do Django (chunked_cursor)
+        self.cursor = SimpleNamespace(name=nome, itersize=2000)
+        self.linhas = []
+        self.fechado = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.fechado = True
+        return False
+
+    @property
+    def description(self):
+        return [(coluna,) for coluna in self.conn.colunas]
+
+    def execute(self, sql, params=None):
+        self.conn.chamadas.append((sql, params))
+        self.linhas = self.conn.resultado(sql, params)
+
+    def copy_expert(self, sql, ficheiro):
+        self.conn.chamadas.append((sql, None))
+        self.conn.copiado = ficheiro.read()
+
+    def fetchone(self):
+        return self.linhas[0] if self.linhas else None
+
+    def fetchall(self):
+        return list(self.linhas)
+
+    def __iter__(self):
+        for linha in self.linhas:
+            self.conn.lidas += 1
+            yield linha
+
+
+class FakeConnection:
+    """
+    Substituto de ``django.db.connection`` para testes sem base de dados.
+
+    ``respostas`` associa um excerto do SQL às linhas devolvidas (ou a uma
+    função ``params -> linhas``); as outras queries devolvem ``linhas``.
+    """
+
+    def __init__(self, linhas=(), colunas=(), respostas=None):
+        self.linhas = list(linhas)
+        self.colunas = list(colunas)
+        self.respostas = dict(respostas or {})
+        self.chamadas = []
+        self.cursores = []
+        self.copiado = None
+        self.lidas = 0
+        self.fechada = False
+        self.em_transacao = False
+
+    @property
+    def queries(self):
+        return [sql for sql, _ in self.chamadas]
+
+    def resultado(self, sql, params):
+        for excerto, linhas in self.respostas.items():
+            if excerto in sql:
+                return linhas(params) if callable(linhas) else linhas
+        return self.linhas
+
+    def cursor(self):
+        self.cursores.append(FakeCursor(self))
+        return self.cursores[-1]
+
+    def chunked_cursor(self):
+        self.cursores.append(FakeCursor(self, nome='_django_curs_1'))
+        return self.cursores[-1]
+
+    def close(self):
+        self.fechada = True
+
+    @contextmanager
+    def atomic(self):
+        self.em_transacao = True
+        try:
+            yield
+        finally:
+            self.em_transacao = False
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """
+    Troca ``connection`` (e ``transaction``, se o módulo a usar) dos módulos
+    indicados por uma FakeConnection e devolve-a:
+
+        conn = fake_db(receitas, linhas=[(2,)])
+    """
+    def criar(*modulos, **kwargs):
+        conn = FakeConnection(**kwargs)
+        for modulo in modulos:
+            monkeypatch.setattr(modulo, 'connection', conn)
+            if hasattr(modulo, 'transaction'):
+                monkeypatch.setattr(modulo, 'transaction', conn)
+        return conn
+    return criar
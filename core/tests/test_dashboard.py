@@ -0,0 +1,41 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from django.core.cache import cache
+
+from core import dashboard
+
+
+@pytest.fixture
+def conn(monkeypatch, settings, fake_db):
+    settings.DASHBOARD_CACHE_TTL = 30
+    cache.clear()
+    conn = fake_db(dashboard, respostas={
+        'obter_dashboard_admin_stats': [(120, 8, 5, 3, 4, 37, 12, 6, Decimal('1520.50'))],
+    })
+    monkeypatch.setattr(dashboard, 'estado_matviews', lambda: [])
+    yield conn
+    cache.clear()
+
+
+def test_dashboard_calculado_uma_vez_por_ttl(conn):
+    dados = dashboard.obter_dashboard_admin(date(2025, 3, 10))
+
+    assert dados['total_pacientes'] == 120
+    assert dados['consultas_mes'] == 37
+    assert dados['receita_mes'] == Decimal('1520.50')
+    assert sum('obter_dashboard_admin_stats' in q for q in conn.queries) == 1
+
+    n = len(conn.queries)
+    assert dashboard.obter_dashboard_admin(date(2025, 3, 10)) == dados
+    assert len(conn.queries) == n
+
+
+def test_dashboard_recalculado_noutro_dia(conn):
+    dashboard.obter_dashboard_admin(date(2025, 3, 10))
+    n = len(conn.queries)
+
+    dashboard.obter_dashboard_admin(date(2025, 3, 11))
+
+    assert len(conn.queries) == 2 * n
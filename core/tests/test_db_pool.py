@@ -0,0 +1,204 @@
+import threading
+
+import pytest
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from core import db_role_middleware
+from core.db_pool import RolePool, PoolTimeout
+
+
+class FakeConn:
+    def __init__(self):
+        self.closed = False
+        self.autocommit = True
+        self.rolled_back = False
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(**kwargs):
+    return RolePool('app_teste_user', connect=FakeConn, **kwargs)
+
+
+def test_pool_aquece_e_reutiliza_conexoes():
+    pool = make_pool(min_size=2, max_size=4)
+
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+
+    metricas = pool.metrics()
+    assert metricas['connects'] == 2
+    assert metricas['checkouts'] == 2
+    assert metricas['in_use'] == 1
+
+
+def test_pool_limitado_espera_e_timeout():
+    pool = make_pool(min_size=1, max_size=1, timeout=0.05)
+    conn = pool.getconn()
+
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+
+    libertar = threading.Timer(0.01, pool.putconn, args=[conn])
+    pool.timeout = 1.0
+    libertar.start()
+    assert pool.getconn() is conn
+
+    metricas = pool.metrics()
+    assert metricas['waits'] == 2
+    assert metricas['timeouts'] == 1
+    assert metricas['size'] == 1
+
+
+def test_pool_descarta_conexoes_partidas():
+    pool = make_pool(min_size=1, max_size=2)
+    conn = pool.getconn()
+    conn.closed = True
+    pool.putconn(conn)
+    assert pool.metrics()['size'] == 0
+
+    nova = pool.getconn()
+    assert nova is not conn
+    assert not nova.closed
+
+
+def test_pool_reconecta_conexao_fechada_no_idle():
+    pool = make_pool(min_size=1, max_size=1)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.closed = True
+
+    nova = pool.getconn()
+    assert nova is not conn
+    assert pool.metrics()['reconnects'] == 1
+
+
+def test_pool_faz_rollback_de_transacao_pendente():
+    pool = make_pool(min_size=0, max_size=1)
+    conn = pool.getconn()
+    conn.autocommit = False
+    pool.putconn(conn)
+
+    assert conn.rolled_back
+    assert conn.autocommit
+
+
+def test_aquecimento_abre_conexoes_fora_do_lock():
+    metricas_durante_connect = []
+
+    def connect():
+        # Outra thread consegue usar o pool enquanto a conexão está a abrir
+        thread = threading.Thread(target=lambda: metricas_durante_connect.append(pool.metrics()))
+        thread.start()
+        thread.join(timeout=1)
+        return FakeConn()
+
+    pool = RolePool('app_teste_user', connect=connect, min_size=2, max_size=2)
+    pool.getconn()
+
+    assert len(metricas_durante_connect) == 2
+    assert metricas_durante_connect[0]['size'] == 2  # lugares já reservados
+    assert pool.metrics()['connects'] == 2
+    assert pool.metrics()['size'] == 2
+
+
+class FakeUser:
+    is_authenticated = True
+    role = 'paciente'
+
+
+class FakeDatabaseWrapper:
+    vendor = 'postgresql'
+
+    def __init__(self):
+        self.connection = None
+        self.autocommit = False
+        self.settings_dict = {'USER': 'admin', 'PASSWORD': 'segredo'}
+
+    def ensure_connection(self):
+        raise AssertionError("o middleware não deve abrir a conexão padrão")
+
+    def close(self):
+        self.connection.close()
+        self.connection = None
+
+
+class FakeRegistry:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def get_pool(self, role, credentials, wrapper):
+        return self.pool
+
+
+@pytest.fixture
+def middleware(monkeypatch, settings):
+    settings.DB_POOL_ENABLED = True
+    wrapper = FakeDatabaseWrapper()
+    pool = make_pool(min_size=0, max_size=1, timeout=0.01)
+    monkeypatch.setattr(db_role_middleware, 'connection', wrapper)
+    monkeypatch.setattr(db_role_middleware, 'role_pools', FakeRegistry(pool))
+    vistas = []
+
+    def view(request):
+        vistas.append((wrapper.connection, wrapper.autocommit))
+        if request.GET.get('reconectar'):
+            # A view fecha a conexão e o Django abre outra com o settings_dict atual
+            wrapper.connection.close()
+            wrapper.connection = FakeConn()
+            vistas.append(dict(wrapper.settings_dict))
+        return HttpResponse('ok')
+
+    return db_role_middleware.DatabaseRoleMiddleware(view), wrapper, pool, vistas
+
+
+def pedido(**params):
+    request = RequestFactory().get('/', params)
+    request.user = FakeUser()
+    return request
+
+
+def test_middleware_usa_conexao_do_pool_sem_abrir_a_padrao(middleware):
+    mw, wrapper, pool, vistas = middleware
+
+    response = mw(pedido())
+
+    assert response.status_code == 200
+    [(conn, autocommit)] = vistas
+    assert isinstance(conn, FakeConn) and autocommit
+    assert wrapper.connection is None
+    assert not wrapper.autocommit
+    assert pool.metrics()['in_use'] == 0
+
+
+def test_middleware_reconecta_com_o_role_se_a_conexao_fechar(middleware):
+    mw, wrapper, pool, vistas = middleware
+    credenciais_admin = wrapper.settings_dict
+
+    response = mw(pedido(reconectar='1'))
+
+    assert response.status_code == 200
+    [(conn, _), settings_durante] = vistas
+    assert settings_durante['USER'] == db_role_middleware.ROLE_DB_CREDENTIALS['paciente']['USER']
+    assert wrapper.settings_dict is credenciais_admin
+    assert credenciais_admin == {'USER': 'admin', 'PASSWORD': 'segredo'}
+    assert wrapper.connection is None
+    assert pool.metrics()['in_use'] == 0
+
+
+def test_middleware_devolve_503_com_pool_esgotado(middleware):
+    mw, wrapper, pool, vistas = middleware
+    pool.getconn()
+
+    response = mw(pedido())
+
+    assert response.status_code == 503
+    assert response['Retry-After'] == '1'
+    assert vistas == []
+    assert pool.metrics()['timeouts'] == 1
@@ -0,0 +1,107 @@
+import contextvars
+from contextlib import contextmanager
+
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from core import middleware
+from core.db_router import RoleBasedDatabaseRouter, build_role_databases
+
+
+class FakeUser:
+    is_authenticated = True
+    id_utilizador = 42
+
+    def __init__(self, role):
+        self.role = role
+
+
+def test_build_role_databases_copia_default_com_credenciais_do_role():
+    default = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': 'gestao',
+        'USER': 'postgres',
+        'PASSWORD': 'x',
+        'HOST': 'db',
+        'PORT': '5432',
+    }
+    databases = build_role_databases(default, conn_max_age=120)
+
+    assert set(databases) == {'paciente_db', 'medico_db', 'enfermeiro_db', 'admin_db'}
+    medico = databases['medico_db']
+    assert medico['USER'] == 'app_medico_user'
+    assert medico['HOST'] == 'db'
+    assert medico['CONN_MAX_AGE'] == 120
+    assert medico['CONN_HEALTH_CHECKS'] is True
+    assert medico['TEST'] == {'MIRROR': 'default'}
+    assert default['USER'] == 'postgres'
+
+
+def test_router_usa_role_do_contexto_e_repoe_no_fim():
+    router = RoleBasedDatabaseRouter()
+    assert router.db_for_read(None) == 'default'
+
+    token = router.set_current_user(FakeUser('paciente'))
+    assert router.db_for_read(None) == 'paciente_db'
+    assert router.db_for_write(None) == 'paciente_db'
+
+    router.reset(token)
+    assert router.db_for_read(None) == 'default'
+
+
+def test_router_isola_role_entre_contextos():
+    router = RoleBasedDatabaseRouter()
+    token = router.set_current_user(FakeUser('medico'))
+    try:
+        def outro_request():
+            router.set_current_user(FakeUser('admin'))
+            return router.get_current_alias()
+
+        assert contextvars.Context().run(outro_request) == 'admin_db'
+        assert router.get_current_alias() == 'medico_db'
+    finally:
+        router.reset(token)
+
+
+class FakeAliasConnection:
+    def __init__(self):
+        self.execute_wrappers = []
+        self.queries = []
+
+    @contextmanager
+    def execute_wrapper(self, wrapper):
+        self.execute_wrappers.append(wrapper)
+        try:
+            yield
+        finally:
+            self.execute_wrappers.pop()
+
+    def cursor(self):
+        raise AssertionError("o middleware não deve fazer queries")
+
+
+class FakeConnections(dict):
+    @property
+    def settings(self):
+        return self
+
+
+def test_middleware_aplica_rls_pelo_execute_wrapper_sem_query_extra(monkeypatch):
+    default, medico = FakeAliasConnection(), FakeAliasConnection()
+    connections = FakeConnections(default=default, medico_db=medico)
+    monkeypatch.setattr(middleware, 'connections', connections)
+    vistas = []
+
+    def view(request):
+        vistas.append((connections['default'], list(medico.execute_wrappers)))
+        return HttpResponse('ok')
+
+    request = RequestFactory().get('/')
+    request.user = FakeUser('medico')
+    middleware.RoleBasedDatabaseMiddleware(view)(request)
+
+    [(conexao, [wrapper])] = vistas
+    assert conexao is medico
+    assert wrapper.prefix == "SELECT set_config('app.current_user_id', '42', true); "
+    assert connections['default'] is default
+    assert medico.execute_wrappers == []
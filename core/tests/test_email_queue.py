@@ -0,0 +1,115 @@
+import threading
+
+from django.core import mail
+from django.core.mail import EmailMessage, get_connection
+from django.core.mail.backends.locmem import EmailBackend as LocmemBackend
+
+from core.email_queue import EmailDispatcher
+
+
+class FalhaUmaVezBackend(LocmemBackend):
+    """Backend locmem cujo primeiro envio falha (para testar retry)"""
+    falhou = False
+    aberturas = 0
+
+    def open(self):
+        FalhaUmaVezBackend.aberturas += 1
+
+    def send_messages(self, messages):
+        if not FalhaUmaVezBackend.falhou:
+            FalhaUmaVezBackend.falhou = True
+            raise ConnectionError('SMTP em baixo')
+        return super().send_messages(messages)
+
+
+def mensagem(i):
+    return EmailMessage(f'Assunto {i}', 'corpo', 'noreply@example.com', [f'p{i}@example.com'])
+
+
+def test_pool_envia_todos_com_numero_fixo_de_threads(settings):
+    settings.EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+    mail.outbox = []
+    antes = threading.active_count()
+    dispatcher = EmailDispatcher(workers=3, max_fila=500, tamanho_lote=10)
+
+    for i in range(300):
+        assert dispatcher.enfileirar(mensagem(i))
+    assert threading.active_count() - antes == 3
+
+    dispatcher.drenar(timeout=10)
+
+    assert len(mail.outbox) == 300
+    assert dispatcher.enviados == 300
+    assert threading.active_count() == antes
+    assert not dispatcher.enfileirar(mensagem(301))
+
+
+def test_pool_repete_lote_com_backoff(settings):
+    settings.EMAIL_BACKEND = 'core.tests.test_email_queue.FalhaUmaVezBackend'
+    FalhaUmaVezBackend.falhou = False
+    FalhaUmaVezBackend.aberturas = 0
+    mail.outbox = []
+    dispatcher = EmailDispatcher(workers=1, backoff=0.01)
+
+    dispatcher.enfileirar(mensagem(1))
+    dispatcher.drenar(timeout=5)
+
+    assert len(mail.outbox) == 1
+    assert dispatcher.falhados == 0
+    assert FalhaUmaVezBackend.aberturas == 2
+
+
+class FalhaAoTerceiroBackend(LocmemBackend):
+    """Backend locmem em que o terceiro envio falha uma vez"""
+    envios = 0
+
+    def open(self):
+        pass
+
+    def send_messages(self, messages):
+        FalhaAoTerceiroBackend.envios += 1
+        if FalhaAoTerceiroBackend.envios == 3:
+            raise ConnectionError('ligação perdida')
+        if any(m.to == ['sem-destino'] for m in messages):
+            return 0
+        return super().send_messages(messages)
+
+
+def test_falha_a_meio_do_lote_nao_repete_emails_ja_enviados(settings):
+    settings.EMAIL_BACKEND = 'core.tests.test_email_queue.FalhaAoTerceiroBackend'
+    FalhaAoTerceiroBackend.envios = 0
+    mail.outbox = []
+    dispatcher = EmailDispatcher(workers=1, backoff=0.01)
+    resultados = {}
+    lote = [(mensagem(i), lambda enviado, i=i: resultados.__setitem__(i, enviado)) for i in range(4)]
+    lote.append((
+        EmailMessage('Assunto x', 'corpo', 'noreply@example.com', ['sem-destino']),
+        lambda enviado: resultados.__setitem__('x', enviado),
+    ))
+
+    dispatcher._enviar_lote(get_connection(), lote)
+
+    assert [m.subject for m in mail.outbox] == [f'Assunto {i}' for i in range(4)]
+    assert dispatcher.enviados == 4
+    assert dispatcher.falhados == 1
+    assert resultados == {0: True, 1: True, 2: True, 3: True, 'x': False}
+
+
+class FalhaSempreBackend(LocmemBackend):
+    def open(self):
+        pass
+
+    def send_messages(self, messages):
+        raise ConnectionError('SMTP em baixo')
+
+
+def test_callback_de_envio_recebe_false_quando_o_envio_falha(settings):
+    settings.EMAIL_BACKEND = 'core.tests.test_email_queue.FalhaSempreBackend'
+    resultados = []
+    dispatcher = EmailDispatcher(workers=1, max_tentativas=2, backoff=0.01)
+
+    assert dispatcher.enfileirar(mensagem(1), ao_concluir=resultados.append)
+    dispatcher.drenar(timeout=5)
+    assert not dispatcher.enfileirar(mensagem(2), ao_concluir=resultados.append)
+
+    assert resultados == [False, False]
@@ -0,0 +1,135 @@
+import json
+from datetime import date, time
+from decimal import Decimal
+
+import pytest
+from django.core.signals import request_finished
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory
+
+from core import exportacao, views_admin
+from core.db_role_middleware import responder_com_contexto
+
+
+def test_linhas_servidor_usa_cursor_do_servidor_com_itersize(fake_db):
+    conn = fake_db(exportacao, linhas=[(1,), (2,), (3,)])
+
+    linhas = exportacao.linhas_servidor("SELECT * FROM f(%s)", [1], itersize=500)
+    assert conn.chamadas == []  # nada é executado antes de a resposta começar a ser enviada
+
+    assert next(linhas) == (1,)
+    [cursor] = conn.cursores
+    assert cursor.cursor.name and cursor.cursor.itersize == 500
+    assert conn.chamadas == [("SELECT * FROM f(%s)", [1])]
+    assert conn.lidas == 1 and conn.em_transacao
+
+    assert list(linhas) == [(2,), (3,)]
+    assert cursor.fechado and not conn.em_transacao
+
+
+def test_iniciar_linhas_executa_a_query_antes_da_resposta(fake_db):
+    conn = fake_db(exportacao, linhas=[(1,), (2,)])
+
+    linhas = exportacao.iniciar_linhas(exportacao.linhas_servidor("SELECT * FROM f()", []))
+    assert len(conn.chamadas) == 1 and conn.lidas == 1
+
+    assert list(linhas) == [(1,), (2,)]
+    assert list(exportacao.iniciar_linhas(iter(()))) == []
+
+
+def test_iniciar_linhas_propaga_erros_da_query():
+    def linhas():
+        raise RuntimeError('invalid input syntax for type date')
+        yield
+
+    with pytest.raises(RuntimeError):
+        exportacao.iniciar_linhas(linhas())
+
+
+@pytest.mark.parametrize('view, query', [
+    (views_admin.relatorio_financeiro_csv, 'data_inicio=abc'),
+    (views_admin.relatorio_financeiro_json, 'data_fim=2025-13-01'),
+    (views_admin.relatorio_consultas_csv, 'medico_id=x'),
+    (views_admin.relatorio_consultas_json, 'data_inicio=01/02/2025'),
+])
+def test_relatorios_com_filtros_invalidos_dao_400_sem_tocar_na_base_de_dados(monkeypatch, view, query):
+    monkeypatch.setattr(views_admin, 'connection', None)
+    monkeypatch.setattr(views_admin, 'linhas_servidor', None)
+    request = RequestFactory().get(f'/admin-panel/relatorios/?{query}')
+    request.user = type('User', (), {'is_authenticated': True, 'role': 'admin'})()
+
+    response = view(request)
+
+    assert response.status_code == 400
+    assert not response.streaming
+
+
+def test_gerar_csv_envia_cabecalho_e_agrupa_linhas():
+    linhas = ([i, f'nome {i}'] for i in range(10))
+    pedacos = list(exportacao.gerar_csv(['ID', 'Nome'], linhas, tamanho_bloco=40))
+
+    assert pedacos[0] == 'ID;Nome\r\n'
+    assert all(len(p) >= 40 for p in pedacos[1:-1])
+    assert ''.join(pedacos[1:]) == ''.join(f'{i};nome {i}\r\n' for i in range(10))
+
+
+def test_gerar_json_codifica_array_incrementalmente():
+    consumidos = []
+
+    def itens():
+        for i in range(3):
+            consumidos.append(i)
+            yield {'id': i, 'valor': Decimal('1.50'), 'data': date(2025, 1, i + 1)}
+
+    gerador = exportacao.gerar_json({'total': 3}, 'faturas', itens(), tamanho_bloco=1)
+    primeiro = next(gerador)
+    assert consumidos == []
+    assert primeiro.startswith('{\n  "total": 3,\n  "faturas": [')
+
+    resposta = json.loads(primeiro + ''.join(gerador))
+    assert resposta == {
+        'total': 3,
+        'faturas': [
+            {'id': i, 'valor': '1.50', 'data': f'2025-01-0{i + 1}'} for i in range(3)
+        ],
+    }
+
+
+def test_gerar_json_sem_cabecalho_nem_itens():
+    assert json.loads(''.join(exportacao.gerar_json({}, 'consultas', []))) == {'consultas': []}
+
+
+def test_linha_fatura_csv():
+    row = (7, date(2025, 3, 4), Decimal('45.5'), 'paga', None, 3, 'Ana', 'Rui', None,
+           date(2025, 3, 1), time(9, 15))
+    assert exportacao.linha_fatura_csv(row) == [
+        7, '04/03/2025', '04/03/2025', '45,50', 'paga', 'N/A', 3, 'Ana', 'Rui', 'N/A',
+        '01/03/2025', '09:15'
+    ]
+
+
+def test_responder_com_contexto_adia_saida_ate_ao_fecho_do_streaming(monkeypatch):
+    # close() envia request_finished (close_old_connections): sem base de dados no teste
+    monkeypatch.setattr(request_finished, 'send', lambda sender, **kwargs: [])
+    eventos = []
+
+    def conteudo():
+        eventos.append('query')
+        yield b'a'
+
+    resposta = responder_com_contexto(
+        lambda request: StreamingHttpResponse(conteudo()), None, lambda: eventos.append('sair')
+    )
+    assert eventos == []
+
+    assert b''.join(resposta) == b'a'
+    resposta.close()
+    assert eventos == ['query', 'sair']
+
+
+def test_responder_com_contexto_sai_logo_sem_streaming():
+    eventos = []
+
+    responder_com_contexto(lambda request: HttpResponse('ok'), None, lambda: eventos.append('sair'))
+
+    assert eventos == ['sair']
@@ -0,0 +1,132 @@
+import gzip
+import json
+import os
+import time
+from datetime import date, time as dt_time, timedelta
+from decimal import Decimal
+
+import pytest
+from django.utils import timezone
+
+from core import exportacao_jobs
+
+
+class FakeExecutor:
+    def __init__(self):
+        self.submetidos = []
+
+    def submit(self, funcao, manifesto):
+        self.submetidos.append(manifesto['id'])
+        return funcao(manifesto)
+
+
+@pytest.fixture
+def ambiente(settings, tmp_path, monkeypatch, fake_db):
+    settings.MEDIA_ROOT = str(tmp_path)
+    executor = FakeExecutor()
+    estado = {
+        'versoes': {'faturas': 10, 'consultas': 20, 'utilizadores': 1, 'medicos': 1, 'especialidades': 1},
+        'linhas': [
+            (7, date(2025, 3, 4), Decimal('45.5'), 'paga', 'mbway', 3, 'Ana', 'Rui', 'Cardiologia',
+             date(2025, 3, 1), dt_time(9, 15)),
+        ],
+        'queries': [],
+    }
+
+    def linhas_servidor(sql, params):
+        estado['queries'].append((sql, params))
+        if estado.get('erro'):
+            raise RuntimeError(estado['erro'])
+        return iter(estado['linhas'])
+
+    monkeypatch.setattr(exportacao_jobs, 'obter_executor', lambda: executor)
+    fake_db(exportacao_jobs)
+    monkeypatch.setattr(exportacao_jobs, 'linhas_servidor', linhas_servidor)
+    monkeypatch.setattr(exportacao_jobs, 'obter_versoes', lambda nomes: {n: estado['versoes'].get(n, 1) for n in nomes})
+    estado['executor'] = executor
+    return estado
+
+
+def test_exportacao_csv_gera_gzip_e_reutiliza_resultado(ambiente):
+    filtros = {'data_inicio': '2025-03-01', 'estado': '', 'outro': 'x'}
+    pedido = exportacao_jobs.pedir_exportacao('financeiro', 'csv', filtros)
+    assert pedido['estado'] == 'pendente'
+
+    manifesto = exportacao_jobs.obter_exportacao(pedido['id'])
+    assert manifesto['estado'] == 'concluida'
+    assert manifesto['linhas'] == 1
+    assert ambiente['queries'] == [
+        ("SELECT * FROM relatorio_faturas_listar(%s, %s, %s)", ['2025-03-01', None, None])
+    ]
+    with gzip.open(exportacao_jobs.caminho_ficheiro(manifesto), 'rt', encoding='utf-8') as f:
+        linhas = f.read().splitlines()
+    assert linhas[0].startswith('ID Fatura;')
+    assert linhas[1] == '7;04/03/2025;04/03/2025;45,50;paga;mbway;3;Ana;Rui;Cardiologia;01/03/2025;09:15'
+
+    # Mesmo pedido e mesmos dados: o ficheiro já gerado é reutilizado
+    repetido = exportacao_jobs.pedir_exportacao('financeiro', 'csv', {'data_inicio': '2025-03-01'})
+    assert repetido['id'] == manifesto['id']
+    assert ambiente['executor'].submetidos == [manifesto['id']]
+
+    # Dados alterados: nova versão, nova exportação
+    ambiente['versoes']['faturas'] = 11
+    novo = exportacao_jobs.pedir_exportacao('financeiro', 'csv', {'data_inicio': '2025-03-01'})
+    assert novo['id'] != manifesto['id']
+    assert len(ambiente['executor'].submetidos) == 2
+
+
+def test_exportacao_jsonl(ambiente):
+    ambiente['linhas'] = [(1, 'Norte', 'continente'), (2, 'Açores', 'ilhas')]
+    manifesto = exportacao_jobs.pedir_exportacao('regioes', 'jsonl', {})
+
+    with gzip.open(exportacao_jobs.caminho_ficheiro(manifesto), 'rt', encoding='utf-8') as f:
+        objetos = [json.loads(linha) for linha in f]
+    assert objetos == [
+        {'id_regiao': 1, 'nome': 'Norte', 'tipo_regiao': 'continente'},
+        {'id_regiao': 2, 'nome': 'Açores', 'tipo_regiao': 'ilhas'},
+    ]
+    assert manifesto['nome_download'] == 'regioes.jsonl.gz'
+
+
+def test_exportacao_com_erro_e_repetida_no_pedido_seguinte(ambiente):
+    ambiente['erro'] = 'ligação perdida'
+    pedido = exportacao_jobs.pedir_exportacao('consultas', 'csv', {})
+    manifesto = exportacao_jobs.obter_exportacao(pedido['id'])
+    assert manifesto['estado'] == 'erro'
+    assert manifesto['erro'] == 'ligação perdida'
+    assert os.listdir(os.path.dirname(exportacao_jobs.caminho_ficheiro(manifesto))) == [f"{manifesto['id']}.json"]
+
+    ambiente['erro'] = None
+    ambiente['linhas'] = []
+    exportacao_jobs.pedir_exportacao('consultas', 'csv', {})
+    assert exportacao_jobs.obter_exportacao(pedido['id'])['estado'] == 'concluida'
+    assert len(ambiente['executor'].submetidos) == 2
+
+
+def test_exportacao_em_curso_so_e_repetida_se_abandonada(ambiente, monkeypatch):
+    monkeypatch.setattr(exportacao_jobs, 'obter_executor', lambda: type('E', (), {'submit': lambda *a: None})())
+    pendente = exportacao_jobs.pedir_exportacao('unidades', 'csv', {})
+    assert exportacao_jobs.obter_exportacao(pendente['id'])['estado'] == 'pendente'
+    assert not exportacao_jobs._deve_repetir(pendente)
+
+    depois = timezone.now() + timedelta(seconds=3601)
+    assert exportacao_jobs._deve_repetir(pendente, agora=depois)
+
+
+def test_pedidos_invalidos(ambiente):
+    with pytest.raises(ValueError):
+        exportacao_jobs.pedir_exportacao('pacientes', 'csv', {})
+    with pytest.raises(ValueError):
+        exportacao_jobs.pedir_exportacao('financeiro', 'xlsx', {})
+    with pytest.raises(ValueError):
+        exportacao_jobs.pedir_exportacao('consultas', 'csv', {'medico_id': '1 OR 1=1'})
+    assert exportacao_jobs.obter_exportacao('../../settings') is None
+
+
+def test_limpar_exportacoes_apaga_ficheiros_expirados(ambiente):
+    manifesto = exportacao_jobs.pedir_exportacao('especialidades', 'csv', {})
+    diretorio = os.path.dirname(exportacao_jobs.caminho_ficheiro(manifesto))
+
+    assert exportacao_jobs.limpar_exportacoes() == 0
+    assert exportacao_jobs.limpar_exportacoes(agora=time.time() + 25 * 3600) == 2
+    assert os.listdir(diretorio) == []
@@ -0,0 +1,149 @@
+import csv
+import io
+import json
+
+import pytest
+from django.contrib.auth.hashers import check_password
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from core import importacao
+
+
+@pytest.fixture
+def conn(fake_db):
+    return fake_db(importacao)
+
+
+def copiadas(conn):
+    return list(csv.reader(io.StringIO(conn.copiado)))
+
+
+def rejeitar(conn, *linhas):
+    conn.respostas['SELECT linha FROM'] = [(linha,) for linha in linhas]
+
+
+def ficheiro(conteudo):
+    return SimpleUploadedFile('dados', conteudo.encode('utf-8'))
+
+
+def test_importar_regioes_csv_valida_copia_e_junta_num_so_insert(conn):
+    rejeitar(conn, 5)
+    conteudo = (
+        '\ufeffnome;tipo_regiao\n'
+        'Norte;continente\n'
+        ';continente\n'
+        'Norte;ilhas\n'
+        'Centro;continente\n'
+        f"{'x' * 51};continente\n"
+    )
+    resultado = importacao.importar('regioes', 'csv', ficheiro(conteudo))
+
+    assert conn.queries == [
+        'CREATE TEMP TABLE importacao_regioes (linha INTEGER, nome TEXT, tipo_regiao TEXT) ON COMMIT DROP',
+        'COPY importacao_regioes (linha, nome, tipo_regiao) FROM STDIN WITH (FORMAT csv)',
+        'SELECT linha FROM admin_importar_regioes()',
+    ]
+    assert copiadas(conn) == [['2', 'Norte', 'continente'], ['5', 'Centro', 'continente']]
+    assert resultado == {
+        'criadas': 1,
+        'erros': [
+            'Linha 3: nome e tipo_regiao são obrigatórios',
+            "Linha 4: 'Norte' repetido no ficheiro",
+            'Linha 5: região já existe',
+            'Linha 6: nome com mais de 50 caracteres',
+        ],
+    }
+
+
+def test_importar_unidades_resolve_regioes_com_uma_query(conn):
+    conn.respostas['SELECT id_regiao, nome FROM'] = [(1, 'Norte'), (2, 'Centro')]
+    itens = [
+        {'nome_unidade': 'USF A', 'morada_unidade': 'Rua 1', 'tipo_unidade': 'USF', 'nome_regiao': 'Centro'},
+        {'nome': 'USF A', 'morada_unidade': 'Rua 2', 'tipo_unidade': 'USF', 'id_regiao': 1},
+        {'nome_unidade': 'USF B', 'morada_unidade': 'Rua 3', 'tipo_unidade': 'USF', 'nome_regiao': 'Sul'},
+        {'nome_unidade': 'USF C', 'morada_unidade': 'Rua 4', 'tipo_unidade': 'USF', 'id_regiao': '9'},
+        'texto',
+    ]
+    resultado = importacao.importar('unidades', 'json', ficheiro(json.dumps(itens)))
+
+    assert conn.queries.count('SELECT id_regiao, nome FROM "REGIAO"') == 1
+    assert copiadas(conn) == [['1', 'USF A', 'Rua 1', 'USF', '2'], ['2', 'USF A', 'Rua 2', 'USF', '1']]
+    assert resultado == {
+        'criadas': 2,
+        'erros': [
+            "Registo 3: região 'Sul' não existe",
+            'Registo 4: região 9 não existe',
+            'Registo 5: registo não é um objeto',
+        ],
+    }
+
+
+def test_importar_sem_linhas_validas_nao_abre_transacao(conn):
+    resultado = importacao.importar('especialidades', 'csv', ficheiro('nome;descricao\n;x\n'))
+
+    assert conn.queries == []
+    assert resultado == {'criadas': 0, 'erros': ['Linha 2: nome_especialidade é obrigatório']}
+
+
+def test_registos_json_em_blocos_pequenos():
+    itens = [{'nome': f'Região {i}', 'valor': 12345, 'lista': [1, 2]} for i in range(20)] + [7, 'a', None]
+    conteudo = json.dumps(itens, indent=2, ensure_ascii=False)
+
+    lidos = list(importacao.registos_json(io.BytesIO(conteudo.encode('utf-8')), tamanho_bloco=7))
+
+    assert lidos == list(enumerate(itens, start=1))
+
+
+@pytest.mark.parametrize('conteudo', ['{"nome": "Norte"}', '[{"nome": "Norte"} {"nome": "Sul"}]', '[{"nome": '])
+def test_registos_json_invalido(conteudo):
+    with pytest.raises(ValueError):
+        list(importacao.registos_json(io.BytesIO(conteudo.encode('utf-8')), tamanho_bloco=4))
+
+
+def test_importar_pacientes_faz_hash_das_senhas_antes_do_copy(conn, settings):
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    rejeitar(conn, 3)
+    conteudo = (
+        'nome;email;telefone;senha;data_nasc;genero;morada;alergias;observacoes\n'
+        'Ana;ana@Exemplo.PT;912345678;segredo;1990-05-01;F;Rua 1;;\n'
+        'Rui;rui@exemplo.pt;;;1985-01-31;M;;;\n'
+        'Eva;ana@exemplo.pt;;x;1970-01-01;F;;;\n'
+        'Rita;rita@exemplo.pt;;x;31/12/1999;F;;;\n'
+        'Sem email;;;x;1999-01-01;F;;;\n'
+    )
+    resultado = importacao.importar('pacientes', 'csv', ficheiro(conteudo))
+
+    assert conn.queries[-1] == 'SELECT linha FROM admin_importar_pacientes()'
+    linhas = {int(linha[0]): linha for linha in copiadas(conn)}
+    assert sorted(linhas) == [2, 3]
+    assert linhas[2][1:4] == ['Ana', 'ana@exemplo.pt', '912345678']
+    assert linhas[2][5:] == ['1990-05-01', 'F', 'Rua 1', '', '']
+    assert check_password('segredo', linhas[2][4])
+    assert linhas[3][4].startswith('!')  # sem senha: senha inutilizável
+    assert 'segredo' not in ''.join(linhas[2])
+    assert resultado == {
+        'criadas': 1,
+        'erros': [
+            'Linha 3: já existe um utilizador com este email',
+            "Linha 4: 'ana@exemplo.pt' repetido no ficheiro",
+            "Linha 5: data_nasc '31/12/1999' inválida (AAAA-MM-DD)",
+            'Linha 6: nome e email são obrigatórios',
+        ],
+    }
+
+
+def test_calcular_hashes_usa_o_pool_de_processos():
+    chamadas = []
+
+    class FakePool:
+        def map(self, funcao, senhas, chunksize):
+            chamadas.append(list(senhas))
+            return [f'hash:{senha}' for senha in senhas]
+
+    assert importacao.calcular_hashes(['a', 'b'], FakePool()) == ['hash:a', 'hash:b']
+    assert chamadas == [['a', 'b']]
+
+
+def test_pool_hash_sem_workers_nao_cria_processos():
+    with importacao.pool_hash(0) as pool:
+        assert pool is None
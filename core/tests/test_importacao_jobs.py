@@ -0,0 +1,107 @@
+import os
+import stat
+import time
+from datetime import timedelta
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from core import importacao_jobs
+
+
+class FakeExecutor:
+    def submit(self, funcao, *args):
+        return funcao(*args)
+
+
+class ExecutorParado:
+    """Executor de um processo que terminou antes de correr a importação"""
+
+    def submit(self, funcao, *args):
+        return None
+
+
+@pytest.fixture
+def ambiente(settings, tmp_path, monkeypatch, fake_db):
+    settings.MEDIA_ROOT = str(tmp_path / 'media')
+    settings.IMPORT_UPLOAD_DIR = str(tmp_path / 'uploads')
+    settings.IMPORT_HASH_WORKERS_WEB = 0
+    estado = {'importados': []}
+
+    def importar(tipo, formato, ficheiro, pool=None):
+        conteudo = ficheiro.read().decode('utf-8')
+        estado['modo'] = stat.S_IMODE(os.stat(ficheiro.name).st_mode)
+        estado['importados'].append((tipo, formato, conteudo, pool, ficheiro.name))
+        if estado.get('erro'):
+            raise estado['erro']
+        return {'criadas': 2, 'erros': ['Linha 4: nome e email são obrigatórios']}
+
+    monkeypatch.setattr(importacao_jobs, 'obter_executor', lambda: FakeExecutor())
+    fake_db(importacao_jobs)
+    monkeypatch.setattr(importacao_jobs, 'importar', importar)
+    return estado
+
+
+def test_importacao_em_background_guarda_resultado_e_apaga_o_ficheiro(ambiente):
+    pedido = importacao_jobs.pedir_importacao(
+        'pacientes', 'csv', SimpleUploadedFile('pacientes.csv', b'nome;email\nAna;ana@exemplo.pt\n')
+    )
+
+    assert pedido['estado'] == 'pendente'
+    [(tipo, formato, conteudo, pool, caminho)] = ambiente['importados']
+    assert (tipo, formato, conteudo, pool) == ('pacientes', 'csv', 'nome;email\nAna;ana@exemplo.pt\n', None)
+    assert os.path.dirname(caminho) == importacao_jobs.settings.IMPORT_UPLOAD_DIR
+    assert ambiente['modo'] == 0o600
+    assert not os.path.exists(caminho)  # senhas em claro não ficam em disco
+
+    importacao = importacao_jobs.obter_importacao(pedido['id'])
+    assert importacao['estado'] == 'concluida'
+    assert importacao['nome_ficheiro'] == 'pacientes.csv'
+    assert importacao['criadas'] == 2
+    assert importacao['erros'] == ['Linha 4: nome e email são obrigatórios']
+
+
+def test_importacao_com_ficheiro_invalido_fica_com_erro(ambiente):
+    ambiente['erro'] = ValueError('codificação inválida')
+
+    pedido = importacao_jobs.pedir_importacao('pacientes', 'csv', SimpleUploadedFile('p.csv', b'nome;email\n'))
+
+    importacao = importacao_jobs.obter_importacao(pedido['id'])
+    assert importacao['estado'] == 'erro'
+    assert importacao['erro'] == 'Ficheiro inválido: codificação inválida'
+    assert not os.path.exists(ambiente['importados'][0][4])
+
+
+def test_obter_importacao_rejeita_ids_invalidos(ambiente):
+    assert importacao_jobs.obter_importacao('../settings') is None
+    assert importacao_jobs.obter_importacao('0' * 32) is None
+
+
+def test_limpar_importacoes_apaga_manifestos_antigos(ambiente):
+    pedido = importacao_jobs.pedir_importacao('pacientes', 'csv', SimpleUploadedFile('p.csv', b'x'))
+
+    assert importacao_jobs.limpar_importacoes() == 0
+    assert importacao_jobs.limpar_importacoes(agora=time.time() + 25 * 3600) == 1
+    assert importacao_jobs.obter_importacao(pedido['id']) is None
+
+
+def test_importacao_parada_sem_atualizacoes_fica_interrompida(ambiente, monkeypatch):
+    monkeypatch.setattr(importacao_jobs, 'obter_executor', lambda: ExecutorParado())
+
+    pedido = importacao_jobs.pedir_importacao('pacientes', 'csv', SimpleUploadedFile('p.csv', b'x'))
+
+    assert importacao_jobs.obter_importacao(pedido['id'])['estado'] == 'pendente'
+    depois = importacao_jobs.timezone.now() + timedelta(hours=2)
+    importacao = importacao_jobs.obter_importacao(pedido['id'], agora=depois)
+    assert importacao['estado'] == 'interrompida'
+    assert importacao['erro']
+
+
+def test_limpar_importacoes_apaga_ficheiros_enviados_abandonados(ambiente, monkeypatch, settings):
+    monkeypatch.setattr(importacao_jobs, 'obter_executor', lambda: ExecutorParado())
+    importacao_jobs.pedir_importacao('pacientes', 'csv', SimpleUploadedFile('p.csv', b'senha'))
+    [upload] = os.listdir(settings.IMPORT_UPLOAD_DIR)
+
+    assert importacao_jobs.limpar_importacoes() == 0
+    assert importacao_jobs.limpar_importacoes(agora=time.time() + 2 * 3600) == 1
+    assert os.listdir(settings.IMPORT_UPLOAD_DIR) == []
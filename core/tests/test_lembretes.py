@@ -0,0 +1,73 @@
+from datetime import date, datetime, time, timezone as dt_timezone
+
+from core import email_utils
+
+
+COLUNAS_LEMBRETE = [
+    'id_lembrete', 'id_consulta', 'data_consulta', 'hora_consulta', 'motivo', 'paciente_nome',
+    'paciente_email', 'medico_nome', 'especialidade_nome', 'nome_unidade',
+]
+
+
+def lembretes(n):
+    return [
+        (100 + i, i, date(2025, 3, 4), time(10, 0), 'Rotina', f'Paciente {i}', f'p{i}@example.com',
+         'Dr. Silva', 'Cardiologia', 'USF Centro')
+        for i in range(n)
+    ]
+
+
+JANELA = (
+    datetime(2025, 3, 4, 9, 0, tzinfo=dt_timezone.utc),
+    datetime(2025, 3, 4, 11, 0, tzinfo=dt_timezone.utc),
+)
+
+
+def test_lembretes_confirmados_em_lotes_so_depois_de_entregues(monkeypatch, fake_db):
+    conn = fake_db(email_utils, colunas=COLUNAS_LEMBRETE, linhas=lembretes(250))
+    lotes = []
+
+    def fake_enviar_emails(mensagens, ao_concluir):
+        lotes.append((mensagens, ao_concluir))
+        # A fila recusa o último email
+        return [True] * (len(mensagens) - 1) + [False]
+
+    monkeypatch.setattr(email_utils, 'enviar_emails', fake_enviar_emails)
+
+    total = email_utils.enviar_lembretes_janela(*JANELA, 'amanhã', '24h')
+
+    assert total == 249
+    [(sql_reserva, params)] = conn.chamadas
+    assert 'reservar_lembretes' in sql_reserva
+    assert params[0] == '24h'
+    assert all(p.tzinfo is None for p in params[1:])
+
+    [(mensagens, callbacks)] = lotes
+    assert mensagens[0].to == ['p0@example.com']
+    assert mensagens[0].subject == 'Lembrete: Consulta amanhã - MediPulse'
+
+    # Nada é confirmado enquanto o servidor SMTP não aceitar os emails;
+    # o email 5 falha e fica pendente
+    for i, callback in enumerate(callbacks):
+        callback(i not in (5, 249))
+
+    confirmacoes = [ids for sql, [ids] in conn.chamadas[1:]]
+    assert all('marcar_lembretes_enviados' in sql for sql in conn.queries[1:])
+    assert [len(ids) for ids in confirmacoes] == [100, 100, 48]
+    assert sum(confirmacoes, []) == [100 + i for i in range(249) if i != 5]
+    assert conn.fechada
+
+
+def test_lembretes_sem_resultado_ficam_por_confirmar(monkeypatch, fake_db):
+    conn = fake_db(email_utils, colunas=COLUNAS_LEMBRETE, linhas=lembretes(3))
+    monkeypatch.setattr(email_utils, 'enviar_emails', lambda mensagens, ao_concluir: [True] * len(mensagens))
+
+    assert email_utils.enviar_lembretes_janela(*JANELA, 'amanhã', '24h') == 3
+    assert len(conn.chamadas) == 1
+
+
+def test_sem_lembretes_por_reservar_nao_envia_nada(fake_db):
+    conn = fake_db(email_utils, colunas=COLUNAS_LEMBRETE)
+
+    assert email_utils.enviar_lembretes_janela(*JANELA, 'daqui a 2 horas', '2h') == 0
+    assert len(conn.chamadas) == 1
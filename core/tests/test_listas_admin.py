@@ -0,0 +1,59 @@
+from datetime import date, datetime, time, timezone as dt_timezone
+
+import pytest
+
+from core import listas_admin
+
+
+def consulta(i):
+    return (i, date(2025, 3, 4), time(10, 30), 'agendada', 'Paciente', 'Médico')
+
+
+COLUNAS_CONSULTA = ['id_consulta', 'data_consulta', 'hora_consulta', 'estado', 'paciente_nome', 'medico_nome']
+
+
+def test_listar_consultas_pagina_cheia_devolve_cursor_da_ultima_linha(fake_db):
+    conn = fake_db(listas_admin, colunas=COLUNAS_CONSULTA, linhas=[consulta(9), consulta(8)])
+
+    consultas, proximo = listas_admin.listar_consultas('agendada', None, limite=2)
+
+    assert [c['id_consulta'] for c in consultas] == [9, 8]
+    assert proximo == '2025-03-04_10:30:00_8'
+
+    listas_admin.listar_consultas('agendada', None, limite=2, apos=proximo)
+    _, params = conn.chamadas[-1]
+    assert params == ['agendada', None, 2, date(2025, 3, 4), time(10, 30), 8]
+
+
+def test_listar_consultas_ultima_pagina_sem_cursor(fake_db):
+    fake_db(listas_admin, colunas=COLUNAS_CONSULTA, linhas=[consulta(1)])
+
+    _, proximo = listas_admin.listar_consultas(limite=2)
+
+    assert proximo is None
+
+
+def test_cursor_utilizador_ida_e_volta():
+    registo = datetime(2025, 3, 4, 10, 30, 15, 123456, tzinfo=dt_timezone.utc)
+    cursor = listas_admin.codificar_cursor_utilizador({'data_registo': registo, 'id_utilizador': 42})
+
+    assert listas_admin.descodificar_cursor_utilizador(cursor) == (registo, 42)
+
+
+@pytest.mark.parametrize('cursor', ['lixo', '2025-03-04_10:30_x', '2025-13-01_10:30:00_1'])
+def test_cursor_consulta_invalido(cursor):
+    with pytest.raises(ValueError):
+        listas_admin.descodificar_cursor_consulta(cursor)
+
+
+def test_contar_passa_o_maximo_e_pode_ser_desativado(fake_db, settings):
+    conn = fake_db(listas_admin, linhas=[(10000, False, True)])
+    settings.ADMIN_CONTAGEM_MAX = 10000
+
+    total = listas_admin.contar('contar_faturas_admin', ['pendente'])
+
+    assert total == {'total': 10000, 'estimado': False, 'limitado': True}
+    assert conn.chamadas == [("SELECT * FROM contar_faturas_admin(%s, %s)", ['pendente', 10000])]
+
+    settings.ADMIN_CONTAGEM_MAX = 0
+    assert listas_admin.contar('contar_faturas_admin', ['pendente']) is None
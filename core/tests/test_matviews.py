@@ -0,0 +1,48 @@
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from core import matviews
+
+
+def test_agregar_consultas_junta_meses_fechados_e_mes_atual():
+    # A mesma combinação pode vir da materialized view e do cálculo em tempo real
+    linhas = [
+        ('realizada', 1, 'Dr. Silva', 'Cardiologia', 40),
+        ('realizada', 1, 'Dr. Silva', 'Cardiologia', 2),
+        ('cancelada', 1, 'Dr. Silva', 'Cardiologia', 5),
+        ('realizada', 2, 'Dra. Costa', 'Pediatria', 30),
+        ('agendada', 3, 'Dr. Silva', 'Sem especialidade', 1),
+    ]
+
+    por_estado, por_medico, por_especialidade = matviews.agregar_consultas(linhas, limite_medicos=2)
+
+    assert por_estado == [
+        {'estado': 'realizada', 'total': 72},
+        {'estado': 'cancelada', 'total': 5},
+        {'estado': 'agendada', 'total': 1},
+    ]
+    # Médicos homónimos não são somados
+    assert por_medico == [
+        {'id_medico__id_utilizador__nome': 'Dr. Silva', 'total': 47},
+        {'id_medico__id_utilizador__nome': 'Dra. Costa', 'total': 30},
+    ]
+    assert por_especialidade[0] == {'id_medico__id_especialidade__nome_especialidade': 'Cardiologia', 'total': 47}
+
+
+def test_estado_matviews_assinala_views_desatualizadas(fake_db, settings):
+    settings.MATVIEWS_MAX_IDADE_HORAS = 26
+    agora = datetime(2025, 3, 10, 12, 0, tzinfo=dt_timezone.utc)
+    fake_db(matviews, linhas=[
+        ('mv_estatisticas_mensais', agora - timedelta(hours=3), date(2025, 3, 1), agora, 120.5, None),
+        ('mv_ranking_medicos', agora - timedelta(days=3), date(2025, 3, 1), agora, 80.0, None),
+        ('mv_consultas_mensais', agora - timedelta(hours=3), date(2025, 3, 1), agora, 10.0, 'lock timeout'),
+    ])
+
+    estado = {mv['nome']: mv for mv in matviews.estado_matviews(agora)}
+
+    assert not estado['mv_estatisticas_mensais']['desatualizada']
+    assert estado['mv_estatisticas_mensais']['idade'] == timedelta(hours=3)
+    assert estado['mv_ranking_medicos']['desatualizada']
+    assert estado['mv_consultas_mensais']['desatualizada']
+    # Nunca atualizada
+    assert estado['mv_receitas_mensais']['atualizado_em'] is None
+    assert estado['mv_receitas_mensais']['desatualizada']
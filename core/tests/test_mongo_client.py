@@ -0,0 +1,253 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from core import mongo_client
+from core.mongo_client import MongoDBClient, NotasClinicasService
+
+
+class FakeAdmin:
+    def command(self, nome):
+        if FakeMongoClient.em_baixo:
+            raise ConnectionError("servidor em baixo")
+        return {'ok': 1}
+
+
+class FakeCursor(list):
+    def sort(self, campos):
+        # Todas as chaves na mesma direção (como nas queries de histórico)
+        reverso = campos[0][1] < 0
+        return FakeCursor(sorted(self, key=lambda d: [d[campo] for campo, _ in campos], reverse=reverso))
+
+    def limit(self, n):
+        return FakeCursor(self[:n])
+
+
+class FakeCollection:
+    def __init__(self, nome):
+        self.nome = nome
+        self.indices = []
+        self.existentes = {}
+        self.docs = []
+        self.updates = []
+
+    def create_index(self, keys, **kwargs):
+        self.indices.append(keys)
+
+    def index_information(self):
+        return self.existentes
+
+    def drop_index(self, nome):
+        del self.existentes[nome]
+
+    def find_one(self, filtro):
+        return {'consulta_id': filtro['consulta_id'], 'origem': self.nome}
+
+    def update_one(self, filtro, update, upsert=False):
+        self.updates.append((filtro, update, upsert))
+        return type('Resultado', (), {'upserted_id': None})()
+
+    def find(self, filtro, projecao):
+        def corresponde(doc, filtro=filtro):
+            for campo, valor in filtro.items():
+                if campo == '$or':
+                    if not any(corresponde(doc, alternativa) for alternativa in valor):
+                        return False
+                elif isinstance(valor, dict):
+                    if not doc[campo] < valor['$lt']:
+                        return False
+                elif doc[campo] != valor:
+                    return False
+            return True
+        return FakeCursor(
+            {k: v for k, v in d.items() if k in projecao or k == '_id'} for d in self.docs if corresponde(d)
+        )
+
+
+class FakeDatabase(dict):
+    def __missing__(self, nome):
+        self[nome] = FakeCollection(nome)
+        return self[nome]
+
+
+class FakeMongoClient:
+    em_baixo = False
+    criados = []
+
+    def __init__(self, uri, **kwargs):
+        self.kwargs = kwargs
+        self.admin = FakeAdmin()
+        self.db = FakeDatabase()
+        self.fechado = False
+        FakeMongoClient.criados.append(self)
+
+    def __getitem__(self, nome):
+        return self.db
+
+    def close(self):
+        self.fechado = True
+
+
+@pytest.fixture
+def mongo(monkeypatch, settings):
+    settings.MONGO_MAX_POOL_SIZE = 20
+    settings.MONGO_MIN_POOL_SIZE = 2
+    settings.MONGO_RECONNECT_BACKOFF = 10
+    FakeMongoClient.em_baixo = False
+    FakeMongoClient.criados = []
+
+    monkeypatch.setattr(mongo_client, 'MongoClient', FakeMongoClient)
+    monkeypatch.setattr(MongoDBClient, '_instance', None)
+    relogio = [1000.0]
+    monkeypatch.setattr(mongo_client.time, 'monotonic', lambda: relogio[0])
+    return relogio
+
+
+def test_connect_usa_pool_configurado_e_cria_indices_uma_vez(mongo):
+    cliente = MongoDBClient()
+    assert cliente.connect()
+    assert cliente.connect()
+
+    assert len(FakeMongoClient.criados) == 1
+    fake = FakeMongoClient.criados[0]
+    assert fake.kwargs['maxPoolSize'] == 20
+    assert fake.kwargs['minPoolSize'] == 2
+    assert len(fake.db['notas_clinicas'].indices) == 5
+
+
+def test_servico_nao_levanta_com_mongo_em_baixo_e_religa_apos_backoff(mongo):
+    FakeMongoClient.em_baixo = True
+    servico = NotasClinicasService()
+    assert servico.get_note_by_consulta(1) is None
+    assert servico.get_notes_by_patient(1) == ([], None)
+    assert len(FakeMongoClient.criados) == 1
+
+    # Dentro do backoff não volta a tentar ligar
+    FakeMongoClient.em_baixo = False
+    assert servico.get_note_by_consulta(1) is None
+    assert len(FakeMongoClient.criados) == 1
+
+    mongo[0] += 10
+    nota = servico.get_note_by_consulta(1)
+    assert nota == {'consulta_id': 1, 'origem': 'notas_por_consulta'}
+    assert len(FakeMongoClient.criados) == 2
+    assert FakeMongoClient.criados[0].fechado
+
+
+def test_get_notas_service_partilha_instancia(mongo, monkeypatch):
+    monkeypatch.setattr(mongo_client, '_notas_service', None)
+    assert mongo_client.get_notas_service() is mongo_client.get_notas_service()
+
+
+def test_indices_compostos_e_consulta_id_unico(mongo):
+    cliente = MongoDBClient()
+    assert cliente.connect()
+    colecao = FakeMongoClient.criados[0].db['notas_clinicas']
+    colecao.indices.clear()
+    colecao.existentes.update({
+        'consulta_id_1': {'key': [('consulta_id', 1)]},
+        'paciente_id_1': {'key': [('paciente_id', 1)]},
+    })
+
+    cliente._create_indexes()
+
+    assert 'consulta_id_1' not in colecao.existentes
+    assert 'paciente_id_1' not in colecao.existentes
+    assert [('paciente_id', 1), ('created_at', -1), ('_id', -1)] in colecao.indices
+    assert [('medico_id', 1), ('created_at', -1), ('_id', -1)] in colecao.indices
+
+
+def test_consulta_id_unico_so_guarda_o_resultado_positivo(mongo):
+    servico = NotasClinicasService()
+    servico.collection.existentes['consulta_id_1'] = {'key': [('consulta_id', 1)]}
+    assert servico.consulta_id_unico() is False
+
+    servico.collection.existentes['consulta_id_1']['unique'] = True
+    assert servico.consulta_id_unico() is True
+    servico.collection.existentes.clear()
+    assert servico.consulta_id_unico() is True
+
+
+def test_historico_paciente_paginado_por_created_at(mongo):
+    servico = NotasClinicasService()
+    inicio = datetime(2024, 1, 1)
+    servico.collection.docs = [
+        {'_id': ObjectId(), 'consulta_id': i, 'paciente_id': 1 if i % 2 else 2, 'medico_id': 1,
+         'created_at': inicio + timedelta(days=i), 'notas_clinicas': 'texto longo'}
+        for i in range(1, 8)
+    ]
+
+    pagina1, cursor = servico.get_notes_by_patient(1, limit=2)
+    assert [n['consulta_id'] for n in pagina1] == [7, 5]
+    assert 'notas_clinicas' not in pagina1[0]
+
+    pagina2, cursor = servico.get_notes_by_patient(1, limit=2, antes=cursor)
+    assert [n['consulta_id'] for n in pagina2] == [3, 1]
+    pagina3, cursor = servico.get_notes_by_patient(1, limit=2, antes=cursor)
+    assert pagina3 == [] and cursor is None
+
+
+def test_historico_desempata_notas_com_o_mesmo_created_at_pelo_id(mongo):
+    servico = NotasClinicasService()
+    mesmo_instante = datetime(2024, 1, 1, 10, 0)
+    servico.collection.docs = [
+        {'_id': ObjectId(), 'consulta_id': i, 'paciente_id': 1, 'medico_id': 1,
+         'created_at': mesmo_instante if i < 4 else mesmo_instante - timedelta(days=1)}
+        for i in range(1, 6)
+    ]
+
+    vistas, cursor = [], None
+    while True:
+        pagina, cursor = servico.get_notes_by_patient(1, limit=2, antes=cursor)
+        vistas += [n['consulta_id'] for n in pagina]
+        if cursor is None:
+            break
+
+    assert vistas == [3, 2, 1, 5, 4]
+
+
+@pytest.mark.parametrize('cursor', ['ontem', '2024-01-01T10:00:00|nao-e-um-id', '|'])
+def test_cursor_de_historico_invalido_levanta_value_error(mongo, cursor):
+    servico = NotasClinicasService()
+
+    with pytest.raises(ValueError):
+        servico.get_notes_by_patient(1, limit=2, antes=cursor)
+    with pytest.raises(ValueError):
+        servico.get_notes_by_medico(1, limit=2, antes=cursor)
+
+
+def test_detalhes_consulta_com_cursor_de_notas_invalido_da_400(mongo, monkeypatch, fake_db):
+    from django.test import RequestFactory
+    from core import views_medico
+
+    linha = (3, 1, 9, datetime(2025, 3, 4).date(), None, 'confirmada', 'Rotina',
+             'Ana', 'ana@exemplo.pt', '910000000', 'Dr. Silva', 'Cardiologia', 'USF Centro')
+    fake_db(views_medico, respostas={'obter_consulta_com_relacoes': [linha]})
+    monkeypatch.setattr(views_medico, 'get_notas_service', NotasClinicasService)
+    request = RequestFactory().get('/medico/consulta/3/', {'notas_antes': 'lixo'})
+    request.user = type('User', (), {'is_authenticated': True, 'role': 'medico', 'id_medico': 9})()
+
+    assert views_medico.medico_detalhes_consulta(request, 3).status_code == 400
+
+
+def test_update_upsert_nota_separa_set_e_set_on_insert():
+    update = mongo_client.update_upsert_nota(2, 9, {'diagnostico': 'Gripe', 'sintomas': ['febre']}, datetime(2025, 3, 4))
+
+    assert update['$set']['diagnostico'] == 'Gripe'
+    assert 'updated_at' in update['$set']
+    assert update['$setOnInsert']['created_at'] == update['$set']['updated_at']
+    assert update['$setOnInsert']['medico_id'] == 2
+    assert update['$setOnInsert']['notas_clinicas'] == ''
+    # Nenhum campo pode estar em $set e $setOnInsert ao mesmo tempo
+    assert not set(update['$set']) & set(update['$setOnInsert'])
+
+
+def test_ready_nao_liga_o_mongo_fora_do_servidor_web(monkeypatch):
+    from django.apps import apps
+
+    monkeypatch.setattr(MongoDBClient, 'connect', lambda self: pytest.fail('ligou no ready()'))
+    apps.get_app_config('core').ready()
+
+    assert not any(t.name == 'mongo-connect' for t in threading.enumerate())
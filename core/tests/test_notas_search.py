@@ -0,0 +1,95 @@
+from datetime import datetime
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from core.notas_search import IndiceInvertido, PesquisaNotas, tokenizar
+
+
+NOTAS = [
+    {'_id': 1, 'consulta_id': 1, 'medico_id': 1, 'paciente_id': 10, 'created_at': datetime(2024, 1, 1),
+     'diagnostico': 'Hipertensão arterial', 'notas_clinicas': 'Tensão elevada', 'sintomas': ['cefaleia'], 'prescricoes': []},
+    {'_id': 2, 'consulta_id': 2, 'medico_id': 1, 'paciente_id': 11, 'created_at': datetime(2024, 2, 1),
+     'diagnostico': 'Gripe', 'notas_clinicas': 'Sem sinais de hipertensão', 'sintomas': ['febre'], 'prescricoes': ['Paracetamol']},
+    {'_id': 3, 'consulta_id': 3, 'medico_id': 2, 'paciente_id': 10, 'created_at': datetime(2024, 3, 1),
+     'diagnostico': 'Hipertensao', 'notas_clinicas': '', 'sintomas': [], 'prescricoes': ['Lisinopril']},
+]
+
+
+class FakeCollection:
+    """Coleção sem suporte para $text (como o mongomock)"""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, filtro, projecao=None):
+        return iter(self.docs)
+
+    def aggregate(self, pipeline):
+        raise NotImplementedError('$text')
+
+
+def test_tokenizar_ignora_acentos_maiusculas_e_stopwords():
+    assert tokenizar('Hipertensão da Tensão') == ['hipertensao', 'tensao']
+    assert tokenizar(['Febre', 'tosse']) == ['febre', 'tosse']
+
+
+def test_indice_ordena_por_relevancia_e_filtra():
+    indice = IndiceInvertido()
+    for nota in NOTAS:
+        indice.indexar(nota)
+
+    resultados = indice.pesquisar('hipertensão')
+    # Diagnóstico pesa mais do que o texto das notas
+    assert [n['consulta_id'] for n in resultados][-1] == 2
+    assert {n['consulta_id'] for n in resultados} == {1, 2, 3}
+
+    assert [n['consulta_id'] for n in indice.pesquisar('hipertensao', paciente_id=10, medico_id=2)] == [3]
+    assert [n['consulta_id'] for n in indice.pesquisar('hipertensao', data_inicio=datetime(2024, 2, 15))] == [3]
+
+    indice.remover(3)
+    assert {n['consulta_id'] for n in indice.pesquisar('hipertensao')} == {1, 2}
+
+
+def test_pesquisa_usa_indice_local_e_pagina_com_cursor():
+    pesquisa = PesquisaNotas(FakeCollection(NOTAS), indice_local=True)
+
+    pagina1, cursor = pesquisa.pesquisar('hipertensao', limite=2)
+    assert len(pagina1) == 2 and cursor
+    pagina2, fim = pesquisa.pesquisar('hipertensao', limite=2, cursor=cursor)
+    assert fim is None
+    assert {n['consulta_id'] for n in pagina1 + pagina2} == {1, 2, 3}
+
+    pesquisa.indexar(dict(NOTAS[1], _id=4, consulta_id=4, diagnostico='Hipertensão'))
+    assert 4 in {n['consulta_id'] for n in pesquisa.pesquisar('hipertensao')[0]}
+
+
+def test_pesquisa_cursor_invalido():
+    with pytest.raises(ValueError):
+        PesquisaNotas(FakeCollection(NOTAS), indice_local=True).pesquisar('gripe', cursor='x')
+
+
+def test_pesquisa_texto_falhada_nao_muda_para_indice_local():
+    class ColecaoSemIndice(FakeCollection):
+        falhar = True
+        pedidos = 0
+
+        def find(self, filtro, projecao=None):
+            raise AssertionError('a coleção não deve ser carregada para memória')
+
+        def aggregate(self, pipeline):
+            self.pedidos += 1
+            if self.falhar:
+                raise OperationFailure('text index required for $text query')
+            return iter([dict(NOTAS[0], score=1.5)])
+
+    colecao = ColecaoSemIndice(NOTAS)
+    pesquisa = PesquisaNotas(colecao)
+    with pytest.raises(OperationFailure):
+        pesquisa.pesquisar('hipertensao')
+
+    # Índice criado entretanto: a pesquisa seguinte volta a usar o $text
+    colecao.falhar = False
+    notas, _ = pesquisa.pesquisar('hipertensao')
+    assert [n['consulta_id'] for n in notas] == [1]
+    assert colecao.pedidos == 2 and pesquisa.indice is None
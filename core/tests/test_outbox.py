@@ -0,0 +1,82 @@
+from datetime import datetime, timezone as dt_timezone
+
+import pytest
+
+from core import outbox
+from core.outbox import DUPLICATE_KEY, classificar_resultado, preparar_operacoes
+
+
+def evento(id_evento, id_consulta, diagnostico):
+    payload = {'medico_id': 2, 'paciente_id': 9, 'notes': {'diagnostico': diagnostico}}
+    return (id_evento, id_consulta, payload, datetime(2025, 3, 3, 10, 0, tzinfo=dt_timezone.utc), 0)
+
+
+def test_preparar_operacoes_uma_por_consulta_com_evento_mais_recente():
+    operacoes, ids = preparar_operacoes([
+        evento(12, 7, 'Gripe'),
+        evento(10, 7, 'Constipação'),
+        evento(11, 8, 'Asma'),
+    ])
+
+    assert ids == [[10, 12], [11]]
+    op = operacoes[0]
+    assert op._filter['consulta_id'] == 7
+    assert {'outbox_id': {'$lt': 12}} in op._filter['$or']
+    assert op._doc['$set']['diagnostico'] == 'Gripe'
+    assert op._doc['$set']['outbox_id'] == 12
+    assert op._doc['$setOnInsert']['created_at'].tzinfo is None
+    assert op._upsert
+
+
+def test_classificar_resultado_chave_duplicada_conta_como_processado():
+    ids = [[10, 12], [11], [13]]
+    erros = [
+        {'index': 0, 'code': DUPLICATE_KEY, 'errmsg': 'dup'},
+        {'index': 2, 'code': 2, 'errmsg': 'falhou'},
+    ]
+
+    assert classificar_resultado(ids, erros) == ([10, 12, 11], [13])
+
+
+class FakeNotas:
+    def __init__(self, conn, unico=True):
+        self.conn = conn
+        self.unico = unico
+
+    def consulta_id_unico(self):
+        return self.unico
+
+    def bulk_write(self, operacoes, consultas):
+        self.conn.chamadas.append(('bulk_write', self.conn.em_transacao))
+        self.consultas = consultas
+
+
+@pytest.fixture
+def conn(fake_db):
+    def reservar(params):
+        conn.chamadas.append(('reserva', conn.em_transacao))
+        return [evento(10, 7, 'Gripe'), evento(11, 8, 'Asma')]
+
+    conn = fake_db(outbox, respostas={'reservar_eventos_outbox_notas': reservar})
+    return conn
+
+
+def test_processar_outbox_confirma_a_reserva_antes_de_escrever_no_mongo(conn, monkeypatch):
+    notas = FakeNotas(conn)
+    monkeypatch.setattr(outbox, 'get_notas_service', lambda: notas)
+
+    assert outbox.processar_outbox() == (2, 0)
+    assert notas.consultas == [7, 8]
+    reserva, em_transacao, bulk_write, conclusao = conn.chamadas
+    assert 'reservar_eventos_outbox_notas' in reserva[0] and em_transacao == ('reserva', True)
+    assert bulk_write == ('bulk_write', False)
+    assert conclusao[0].startswith('CALL concluir_eventos_outbox_notas')
+    assert conclusao[1][:2] == [[10, 11], []]
+
+
+def test_processar_outbox_sem_indice_unico_falha_sem_reservar(conn, monkeypatch):
+    monkeypatch.setattr(outbox, 'get_notas_service', lambda: FakeNotas(conn, unico=False))
+
+    with pytest.raises(outbox.IndiceConsultaEmFalta):
+        outbox.processar_outbox()
+    assert conn.chamadas == []
@@ -0,0 +1,27 @@
+from datetime import date
+
+from core import receitas
+
+
+def test_registar_receitas_numa_unica_chamada(fake_db):
+    conn = fake_db(receitas, respostas={'inserir_receitas_lote': lambda params: [(len(params[1]),)]})
+
+    total = receitas.registar_receitas(
+        9,
+        [(' Ibuprofeno ', '200mg', 'Dieta'), ('  ', 'x', 'y'), ('Paracetamol', None, 'Dieta')],
+        date(2025, 3, 3),
+        novo_estado='realizada'
+    )
+
+    assert total == 2
+    [(sql, params)] = conn.chamadas
+    assert sql.startswith('CALL inserir_receitas_lote(')
+    assert params == [9, ['Ibuprofeno', 'Paracetamol'], ['200mg', None], ['Dieta', 'Dieta'],
+                      date(2025, 3, 3), 'realizada']
+
+
+def test_registar_receitas_sem_linhas_nem_estado_nao_faz_query(fake_db):
+    conn = fake_db(receitas)
+
+    assert receitas.registar_receitas(9, [], date(2025, 3, 3)) == 0
+    assert conn.chamadas == []
@@ -0,0 +1,91 @@
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+
+from core.db_role_middleware import RoleContextExecuteWrapper
+
+
+class FakeRawCursor:
+    def __init__(self, raw, name=None):
+        self.raw = raw
+        self.name = name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, sql):
+        self.raw.executadas.append(sql)
+
+
+class FakeRawConnection:
+    def __init__(self, status):
+        self.status = status
+        self.executadas = []
+
+    def get_transaction_status(self):
+        return self.status
+
+    def cursor(self):
+        return FakeRawCursor(self)
+
+
+class FakeCursorWrapper:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+
+class FakeWrapper:
+    def __init__(self, status):
+        self.connection = FakeRawConnection(status)
+
+
+def executar(wrapper, status, sql):
+    executed = []
+
+    def execute(sql, params, many, context):
+        executed.append(sql)
+
+    conn = FakeWrapper(status)
+    cursor = FakeCursorWrapper(FakeRawCursor(conn.connection))
+    wrapper(execute, sql, [1], False, {'connection': conn, 'cursor': cursor})
+    return executed[0]
+
+
+def test_prefixo_no_inicio_da_transacao():
+    wrapper = RoleContextExecuteWrapper('app_medico_user', 42)
+    sql = executar(wrapper, TRANSACTION_STATUS_IDLE, "SELECT * FROM x WHERE id = %s")
+
+    assert sql == (
+        "SELECT set_config('role', 'app_medico_user', true), "
+        "set_config('app.current_user_id', '42', true); "
+        "SELECT * FROM x WHERE id = %s"
+    )
+
+
+def test_sem_role_aplica_so_o_utilizador():
+    wrapper = RoleContextExecuteWrapper(None, 7)
+
+    assert executar(wrapper, TRANSACTION_STATUS_IDLE, "SELECT 1") == (
+        "SELECT set_config('app.current_user_id', '7', true); SELECT 1"
+    )
+
+
+def test_sem_prefixo_dentro_de_transacao_aberta():
+    wrapper = RoleContextExecuteWrapper('app_medico_user', 42)
+    sql = executar(wrapper, TRANSACTION_STATUS_INTRANS, "SELECT 1")
+
+    assert sql == "SELECT 1"
+
+
+def test_cursor_do_servidor_recebe_contexto_numa_query_separada():
+    wrapper = RoleContextExecuteWrapper('app_admin_user', 1)
+    conn = FakeWrapper(TRANSACTION_STATUS_IDLE)
+    cursor = FakeCursorWrapper(FakeRawCursor(conn.connection, '_django_curs_1'))
+    executed = []
+
+    wrapper(lambda sql, *args: executed.append(sql), "SELECT * FROM f()", [], False,
+            {'connection': conn, 'cursor': cursor})
+
+    assert executed == ["SELECT * FROM f()"]
+    assert conn.connection.executadas == [wrapper.prefix]
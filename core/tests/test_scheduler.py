@@ -0,0 +1,39 @@
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.util import obj_to_ref, ref_to_obj
+
+from core import scheduler
+
+
+def test_tarefas_registadas_com_referencias_serializaveis():
+    sched = scheduler.criar_scheduler(jobstore=MemoryJobStore())
+    scheduler.registar_tarefas(sched)
+    sched.start(paused=True)
+    try:
+        jobs = {job.id: job for job in sched.get_jobs()}
+    finally:
+        sched.shutdown(wait=False)
+
+    assert set(jobs) == {
+        'lembrete_24h', 'lembrete_2h', 'outbox_notas', 'atualizar_matviews', 'limpar_exportacoes',
+        'limpar_importacoes',
+        'limpar_historico_tarefas',
+    }
+    for job in jobs.values():
+        # O DjangoJobStore guarda a tarefa por referência textual
+        assert ref_to_obj(obj_to_ref(job.func)) is job.func
+        assert job.max_instances == 1
+        assert job.coalesce
+
+
+def test_lock_lider(fake_db):
+    fake_db(scheduler, linhas=[(True, 321)])
+    assert scheduler.obter_lock_lider() == 321
+
+    fake_db(scheduler, linhas=[(False, 322)])
+    assert scheduler.obter_lock_lider() is None
+
+
+def test_conexao_lider_nova_sessao_perdeu_o_lock(fake_db):
+    fake_db(scheduler, linhas=[(321,)])
+    assert scheduler.conexao_lider_ativa(321)
+    assert not scheduler.conexao_lider_ativa(100)
@@ -0,0 +1,58 @@
+from datetime import date, time
+
+import pytest
+from django.test import RequestFactory
+
+from core import views
+from core.slots import _agrupar_slots, codificar_cursor, descodificar_cursor, obter_slots
+
+
+def test_agrupar_slots_por_disponibilidade():
+    rows = [
+        (1, date(2025, 3, 3), time(9, 0), time(9, 30), True, None),
+        (1, date(2025, 3, 3), time(9, 30), time(10, 0), False, 17),
+        (2, date(2025, 3, 4), time(14, 0), time(14, 20), True, None),
+    ]
+    slots = _agrupar_slots(rows)
+
+    assert [s['time'] for s in slots[1]] == ['09:00', '09:30']
+    assert slots[1][1]['available'] is False
+    assert slots[1][1]['id_consulta'] == 17
+    assert slots[2][0]['hora_fim'] == time(14, 20)
+
+
+def test_obter_slots_sem_ids_nao_faz_query():
+    assert obter_slots([]) == {}
+
+
+def test_cursor_keyset_ida_e_volta():
+    slot = {'data': date(2025, 3, 3), 'hora_inicio': time(9, 30), 'id_slot': 42}
+    cursor = codificar_cursor(slot)
+
+    assert cursor == '2025-03-03_09:30_42'
+    assert descodificar_cursor(cursor) == (date(2025, 3, 3), time(9, 30), 42)
+
+
+def test_cursor_invalido():
+    with pytest.raises(ValueError):
+        descodificar_cursor('lixo')
+
+
+@pytest.mark.parametrize('query', ['unidade=abc', 'especialidade=1.5', 'regiao=x', 'limite=dez'])
+def test_api_primeiros_slots_filtros_invalidos_dao_400(monkeypatch, query):
+    monkeypatch.setattr(views, 'procurar_primeiros_slots', lambda **kwargs: pytest.fail('sem query'))
+    request = RequestFactory().get(f'/api/primeiros-slots/?{query}')
+    request.user = type('User', (), {'is_authenticated': True})()
+
+    assert views.api_primeiros_slots(request).status_code == 400
+
+
+def test_api_primeiros_slots_converte_filtros(monkeypatch):
+    chamadas = []
+    monkeypatch.setattr(views, 'procurar_primeiros_slots', lambda **kwargs: chamadas.append(kwargs) or ([], None))
+    request = RequestFactory().get('/api/primeiros-slots/?unidade=3&especialidade=')
+    request.user = type('User', (), {'is_authenticated': True})()
+
+    assert views.api_primeiros_slots(request).status_code == 200
+    assert chamadas[0]['unidade'] == 3
+    assert chamadas[0]['especialidade'] is None
@@ -0,0 +1,73 @@
+from datetime import datetime
+
+import pytest
+from django.core.cache import cache
+
+from core import user_cache
+from core.auth_backend import UtilizadorBackend
+
+
+PERFIL = (
+    7, 'Ana Médica', 'ana@example.com', 'hash', '912345678', None, 'medico',
+    datetime(2024, 1, 1), True, True, None, False,
+    None, 3, None,
+)
+
+@pytest.fixture
+def fetches(monkeypatch):
+    cache.clear()
+    chamadas = []
+
+    def fake_fetch(id_utilizador):
+        chamadas.append(id_utilizador)
+        return PERFIL if id_utilizador == 7 else None
+
+    monkeypatch.setattr(user_cache, '_fetch_perfil', fake_fetch)
+    yield chamadas
+    cache.clear()
+
+
+def test_get_user_usa_cache_apos_primeira_query(fetches):
+    backend = UtilizadorBackend()
+
+    user = backend.get_user(7)
+    assert user.id_utilizador == 7
+    assert user.id_medico == 3
+    assert user.id_paciente is None
+
+    assert backend.get_user(7).id_medico == 3
+    assert fetches == [7]
+
+
+def test_invalidar_perfil_obriga_nova_query(fetches):
+    user_cache.obter_perfil(7)
+    user_cache.invalidar_perfil(7)
+    user_cache.obter_perfil(7)
+
+    assert fetches == [7, 7]
+
+
+def test_utilizador_inexistente_nao_fica_em_cache(fetches):
+    assert UtilizadorBackend().get_user(99) is None
+    assert UtilizadorBackend().get_user(99) is None
+    assert fetches == [99, 99]
+
+
+def test_hash_da_senha_nao_fica_em_cache(fetches):
+    assert user_cache.obter_perfil(7)[3] == ''
+    assert 'hash' not in cache.get(user_cache._cache_key(7))
+
+
+def test_hit_nao_faz_queries_e_desativacao_invalida(fetches, fake_db):
+    conn = fake_db(user_cache)
+    backend = UtilizadorBackend()
+    assert backend.get_user(7).ativo
+
+    assert backend.get_user(7).ativo
+    assert conn.chamadas == []
+    assert fetches == [7]
+
+    # admin_toggle_utilizador_ativo invalida o perfil depois de o alterar
+    user_cache.invalidar_perfil(7)
+    backend.get_user(7)
+    assert fetches == [7, 7]
@@ -14,6 +14,7 @@ urlpatterns = [
     path("paciente/agendar/", views.agendar_consulta, name="marcar_consulta"),
     path("paciente/agenda/", views.agenda_medica, name="patient_agenda"),
     path("api/disponibilidades/", views.api_disponibilidades, name="api_disponibilidades"),
+    path("api/slots/primeiros/", views.api_primeiros_slots, name="api_primeiros_slots"),
     path("paciente/consultas/", views.listar_consultas, name="listar_consultas"),
     path("paciente/consultas/<int:consulta_id>/confirmar/", views.paciente_confirmar_consulta, name="paciente_confirmar_consulta"),
     path("paciente/consultas/<int:consulta_id>/recusar/", views.paciente_recusar_consulta, name="paciente_recusar_consulta"),
@@ -45,6 +46,7 @@ urlpatterns = [
     
     # URLs do Admin
     path('admin-panel/', views_admin.admin_dashboard, name='admin_dashboard'),
+    path('admin-panel/db-pool/metricas/', views_admin.admin_db_pool_metrics, name='admin_db_pool_metrics'),
     
     # Gestão de Regiões
     path('admin-panel/regioes/', views_admin.admin_regioes, name='admin_regioes'),
@@ -79,6 +81,8 @@ urlpatterns = [
     # Gestão de Utilizadores
     path('admin-panel/utilizadores/', views_admin.admin_utilizadores, name='admin_utilizadores'),
     path('admin-panel/utilizadores/criar/', views_admin.admin_utilizador_criar, name='admin_utilizador_criar'),
+    path('admin-panel/utilizadores/import/csv/', views_admin.admin_utilizadores_import_csv, name='admin_utilizadores_import_csv'),
+    path('admin-panel/importacoes/<str:id_importacao>/', views_admin.admin_importacao_estado, name='admin_importacao_estado'),
     path('admin-panel/utilizadores/<int:utilizador_id>/editar/', views_admin.admin_utilizador_editar, name='admin_utilizador_editar'),
     path('admin-panel/utilizadores/<int:utilizador_id>/desativar/', views_admin.admin_utilizador_desativar, name='admin_utilizador_desativar'),
     
@@ -101,4 +105,7 @@ urlpatterns = [
     path('admin-panel/relatorios/financeiro/json/', views_admin.relatorio_financeiro_json, name='relatorio_financeiro_json'),
     path('admin-panel/relatorios/consultas/csv/', views_admin.relatorio_consultas_csv, name='relatorio_consultas_csv'),
     path('admin-panel/relatorios/consultas/json/', views_admin.relatorio_consultas_json, name='relatorio_consultas_json'),
+    path('admin-panel/exportacoes/', views_admin.admin_exportacao_pedir, name='admin_exportacao_pedir'),
+    path('admin-panel/exportacoes/<str:id_exportacao>/', views_admin.admin_exportacao_estado, name='admin_exportacao_estado'),
+    path('admin-panel/exportacoes/<str:id_exportacao>/download/', views_admin.admin_exportacao_download, name='admin_exportacao_download'),
 ]
@@ -0,0 +1,72 @@
+# core/user_cache.py
+"""
+Cache de perfis de utilizador, indexada por id_utilizador.
+
+Cada entrada guarda a linha devolvida por ``obter_perfil_utilizador`` (dados
+do utilizador + id_paciente/id_medico/id_enfermeiro). Com a cache quente, o
+UtilizadorBackend.get_user e as views deixam de fazer queries de identidade.
+
+As entradas expiram ao fim de USER_PROFILE_CACHE_TTL segundos e são
+invalidadas explicitamente sempre que o perfil muda
+(atualizar_perfil_utilizador, admin_editar_utilizador,
+admin_toggle_utilizador_ativo).
+
+O hash da senha nunca vai para a cache (só o authenticate o usa, e lê-o da
+base de dados). Um hit não faz nenhuma query, nem para o ``ativo``: a
+desativação passa pela invalidação de admin_toggle_utilizador_ativo. Com uma
+cache local a cada processo (LocMemCache, a predefinição) essa invalidação
+só chega ao processo que a fez e os outros workers mantêm a sessão até a
+entrada expirar (USER_PROFILE_CACHE_TTL); em produção usar uma cache
+partilhada (Redis, memcached, base de dados).
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'perfil_utilizador:{}'
+
+# Posições na linha de obter_perfil_utilizador
+_PASSWORD = 3
+
+
+def _cache_key(id_utilizador):
+    return CACHE_KEY.format(int(id_utilizador))
+
+
+def _fetch_perfil(id_utilizador):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT * FROM obter_perfil_utilizador(%s)",
+            [id_utilizador]
+        )
+        row = cursor.fetchone()
+    return tuple(row) if row else None
+
+
+def obter_perfil(id_utilizador):
+    """
+    Devolve a linha do perfil (tuplo, sem o hash da senha) do utilizador, ou
+    None se não existir. Lê da cache e só vai à base de dados em caso de miss.
+    """
+    key = _cache_key(id_utilizador)
+    row = cache.get(key)
+    if row is None:
+        row = _fetch_perfil(id_utilizador)
+        if row is not None:
+            # Sem o hash da senha
+            row = row[:_PASSWORD] + ('',) + row[_PASSWORD + 1:]
+            cache.set(key, row, getattr(settings, 'USER_PROFILE_CACHE_TTL', 300))
+    return row
+
+
+def invalidar_perfil(id_utilizador):
+    """Remove o perfil da cache (chamar depois de alterar o utilizador)"""
+    try:
+        cache.delete(_cache_key(id_utilizador))
+    except Exception as e:
+        logger.warning(f"Erro ao invalidar perfil {id_utilizador} da cache: {e}")
@@ -11,6 +11,8 @@ from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.utils.dateparse import parse_time
 from .decorators import role_required
+from .user_cache import invalidar_perfil
+from .slots import obter_slots, procurar_primeiros_slots
 
 
 @csrf_exempt
@@ -306,16 +308,12 @@ def agendar_consulta(request):
     if not request.user.is_authenticated:
         return redirect("login")
 
-    # Obter ID do paciente
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT obter_paciente_por_utilizador_id(%s)", [request.user.id_utilizador])
-        result = cursor.fetchone()
+    # Obter ID do paciente (perfil em cache, ver core/user_cache.py)
+    paciente_id = getattr(request.user, 'id_paciente', None)
     
-    if not result or not result[0]:
+    if not paciente_id:
         messages.error(request, "Não foi possível encontrar o registo de paciente.")
         return redirect("patient_home")
-    
-    paciente_id = result[0]
 
     if request.method == "POST":
         disp_id = request.POST.get("disponibilidade_id")
@@ -440,37 +438,11 @@ def agendar_consulta(request):
             cursor.execute(query, params)
             disp_rows = cursor.fetchall()
 
-            # Pré-carregar consultas ocupadas por disponibilidade
-            disp_ids = [r[0] for r in disp_rows]
-            ocupados = {}
-            if disp_ids:
-                cursor.execute("""
-                    SELECT id_disponibilidade, hora_consulta
-                    FROM "CONSULTAS"
-                    WHERE id_disponibilidade = ANY(%s)
-                    AND estado NOT IN ('cancelada')
-                """, [disp_ids])
-                for d_id, hora in cursor.fetchall():
-                    ocupados.setdefault(d_id, set()).add(hora)
+            # Grelha de slots de todas as disponibilidades numa só query
+            slots_por_disp = obter_slots([r[0] for r in disp_rows])
 
             for row in disp_rows:
-                disp_id = row[0]
-                hora_inicio = row[2]
-                hora_fim = row[3]
-                duracao = row[4]
-
-                # Gerar slots
-                slots = []
-                current_time = datetime.combine(row[1], hora_inicio)
-                end_time = datetime.combine(row[1], hora_fim)
-                ocupados_disp = ocupados.get(disp_id, set())
-                while current_time < end_time:
-                    slot_time = current_time.time()
-                    slots.append({
-                        'time': slot_time.strftime('%H:%M'),
-                        'available': slot_time not in ocupados_disp
-                    })
-                    current_time += timedelta(minutes=duracao)
+                slots = slots_por_disp.get(row[0], [])
 
                 disponibilidades.append({
                     'id_disponibilidade': row[0],
@@ -509,6 +481,51 @@ def agenda_medica(request):
     return render(request, "core/agenda_medica.html", {})
 
 
+@login_required
+def api_primeiros_slots(request):
+    """Primeiros slots livres de todos os médicos (JSON, paginação keyset).
+
+    Query params:
+    - especialidade / unidade / regiao: filtros opcionais
+    - limite: número de slots por página (máx. 100, por omissão 20)
+    - apos: cursor devolvido em ``proximo`` pela página anterior
+    """
+    def _id(nome):
+        valor = request.GET.get(nome)
+        return int(valor) if valor else None
+
+    try:
+        limite = min(max(int(request.GET.get("limite", 20)), 1), 100)
+        slots, proximo = procurar_primeiros_slots(
+            especialidade=_id("especialidade"),
+            unidade=_id("unidade"),
+            regiao=_id("regiao"),
+            limite=limite,
+            apos=request.GET.get("apos") or None,
+        )
+    except ValueError:
+        return JsonResponse({"error": "Parâmetros inválidos"}, status=400)
+
+    return JsonResponse({
+        "slots": [
+            {
+                "id_slot": s["id_slot"],
+                "id_disponibilidade": s["id_disponibilidade"],
+                "id_medico": s["id_medico"],
+                "medico_nome": s["medico_nome"],
+                "especialidade": s["especialidade_nome"],
+                "id_unidade": s["id_unidade"],
+                "unidade": s["nome_unidade"],
+                "data": s["data"].isoformat(),
+                "hora_inicio": s["hora_inicio"].strftime("%H:%M"),
+                "hora_fim": s["hora_fim"].strftime("%H:%M"),
+            }
+            for s in slots
+        ],
+        "proximo": proximo,
+    })
+
+
 def api_disponibilidades(request):
     """API simples que retorna disponibilidades como eventos JSON.
 
@@ -579,13 +596,8 @@ def listar_consultas(request):
     if not request.user.is_authenticated:
         return redirect("login")
 
-    # Obter paciente usando função
-    paciente_id = None
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT obter_paciente_por_utilizador_id(%s)", [request.user.id_utilizador])
-        result = cursor.fetchone()
-        if result:
-            paciente_id = result[0]
+    # Obter paciente (perfil em cache, ver core/user_cache.py)
+    paciente_id = getattr(request.user, 'id_paciente', None)
     
     if not paciente_id:
         messages.error(request, "Não foi possível encontrar o registo de paciente.")
@@ -817,16 +829,11 @@ def listar_faturas(request):
     if not request.user.is_authenticated:
         return redirect("login")
 
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT id_paciente FROM "PACIENTES"
-            WHERE id_utilizador = %s
-        """, [request.user.id_utilizador])
-        paciente_row = cursor.fetchone()
-        if not paciente_row:
-            messages.error(request, "Não foi possível encontrar o registo de paciente associado ao utilizador.")
-            return redirect("patient_home")
-        paciente_id = paciente_row[0]
+    # Perfil em cache (ver core/user_cache.py)
+    paciente_id = getattr(request.user, 'id_paciente', None)
+    if not paciente_id:
+        messages.error(request, "Não foi possível encontrar o registo de paciente associado ao utilizador.")
+        return redirect("patient_home")
 
     if request.method == "POST":
         action = request.POST.get("action")
@@ -927,6 +934,7 @@ def patient_perfil_editar(request):
                         "CALL atualizar_perfil_utilizador(%s, %s, %s, %s)",
                         [request.user.id_utilizador, nome, telefone, password]
                     )
+                    invalidar_perfil(request.user.id_utilizador)
                     messages.success(request, "Perfil atualizado com sucesso! Faça login novamente.")
                     logout(request)
                     return redirect('login')
@@ -935,6 +943,7 @@ def patient_perfil_editar(request):
                         "CALL atualizar_perfil_utilizador(%s, %s, %s, NULL)",
                         [request.user.id_utilizador, nome, telefone]
                     )
+                    invalidar_perfil(request.user.id_utilizador)
                     messages.success(request, "Perfil atualizado com sucesso!")
                     return redirect('patient_perfil_editar')
                     
@@ -952,16 +961,11 @@ def reagendar_consulta(request, consulta_id):
         messages.error(request, "Acesso negado.")
         return redirect('home')
     
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT id_paciente FROM "PACIENTES"
-            WHERE id_utilizador = %s
-        """, [request.user.id_utilizador])
-        paciente_row = cursor.fetchone()
-        if not paciente_row:
-            messages.error(request, "Não foi possível encontrar o registo de paciente associado ao utilizador.")
-            return redirect("patient_home")
-        paciente_id = paciente_row[0]
+    # Perfil em cache (ver core/user_cache.py)
+    paciente_id = getattr(request.user, 'id_paciente', None)
+    if not paciente_id:
+        messages.error(request, "Não foi possível encontrar o registo de paciente associado ao utilizador.")
+        return redirect("patient_home")
     
     # Buscar consulta original
     with connection.cursor() as cursor:
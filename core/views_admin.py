@@ -2,6 +2,7 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.conf import settings
 from django.db import transaction, connection
 from django.db.models import Count, Q, Sum
 from django.utils import timezone
@@ -11,77 +12,64 @@ from .models import (
     Enfermeiro, Paciente, Consulta, Fatura, Disponibilidade
 )
 from .decorators import role_required
-from django.http import HttpResponse, JsonResponse
+from .user_cache import invalidar_perfil
+from .dashboard import obter_dashboard_admin
+from .listas_admin import contar, listar_consultas, listar_faturas, listar_utilizadores
+from .matviews import agregar_consultas, estado_matviews
+from .exportacao import (
+    CABECALHO_CONSULTAS_CSV, CABECALHO_FATURAS_CSV, consulta_json, fatura_json, gerar_csv,
+    gerar_json, iniciar_linhas, linha_consulta_csv, linha_fatura_csv, linhas_servidor, resposta_csv,
+    resposta_json
+)
+from .exportacao_jobs import caminho_ficheiro, normalizar_filtros, obter_exportacao, pedir_exportacao
+from .importacao import importar
+from .importacao_jobs import obter_importacao, pedir_importacao
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 import csv
-import json
-import io
+
+def _limite_lista():
+    return getattr(settings, 'ADMIN_LISTA_LIMITE', 50)
+
+
+def _url_pagina(request, apos):
+    """Query string da listagem atual com o cursor ``apos`` (None = primeira página)"""
+    params = request.GET.copy()
+    params.pop('apos', None)
+    if apos:
+        params['apos'] = apos
+    return '?' + params.urlencode()
+
+
+def _importar_ficheiro(request, tipo, formato, redirecionar):
+    """Importação em massa de um ficheiro CSV/JSON (core/importacao.py)"""
+    if request.method != 'POST' or 'file' not in request.FILES:
+        messages.error(request, f"Selecione um ficheiro {formato.upper()}.")
+        return redirect(redirecionar)
+
+    try:
+        resultado = importar(tipo, formato, request.FILES['file'])
+    except ValueError as e:
+        messages.error(request, f"Ficheiro inválido: {e}")
+        return redirect(redirecionar)
+    except Exception as e:
+        messages.error(request, f"Erro na importação: {str(e)}")
+        return redirect(redirecionar)
+
+    erros = resultado['erros']
+    messages.success(request, f"Importação concluída: {resultado['criadas']} criadas, {len(erros)} com erro.")
+    max_erros = getattr(settings, 'IMPORT_MAX_ERROS_MOSTRADOS', 20)
+    for erro in erros[:max_erros]:
+        messages.warning(request, erro)
+    if len(erros) > max_erros:
+        messages.warning(request, f"... e mais {len(erros) - max_erros} linhas com erro.")
+    return redirect(redirecionar)
+
 
 @login_required
 @role_required('admin')
 def admin_dashboard(request):
     """Dashboard principal do administrador com estatísticas gerais"""
-    hoje = timezone.now().date()
-    inicio_mes = hoje.replace(day=1)
-    
-    # Estatísticas gerais via função SQL
-    with connection.cursor() as cursor:
-        cursor.execute(
-            "SELECT * FROM obter_dashboard_admin_stats(%s)",
-            [inicio_mes]
-        )
-        stats_row = cursor.fetchone()
-    
-    if stats_row:
-        (
-            total_pacientes,
-            total_medicos,
-            total_enfermeiros,
-            total_unidades,
-            consultas_hoje,
-            consultas_mes,
-            consultas_pendentes,
-            faturas_pendentes,
-            receita_mes,
-        ) = stats_row
-    else:
-        total_pacientes = total_medicos = total_enfermeiros = total_unidades = 0
-        consultas_hoje = consultas_mes = consultas_pendentes = 0
-        faturas_pendentes = 0
-        receita_mes = 0
-
-    # Últimas atividades (últimas 10 consultas) via view SQL
-    ultimas_consultas = []
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT id_consulta, paciente_nome, medico_nome, data_consulta, hora_consulta, estado
-            FROM vw_admin_ultimas_consultas
-            ORDER BY data_consulta DESC, hora_consulta DESC
-            LIMIT 10
-        """)
-        for row in cursor.fetchall():
-            ultimas_consultas.append({
-                'id_consulta': row[0],
-                'paciente_nome': row[1],
-                'medico_nome': row[2],
-                'data_consulta': row[3],
-                'hora_consulta': row[4],
-                'estado': row[5],
-            })
-    
-    context = {
-        'total_pacientes': total_pacientes,
-        'total_medicos': total_medicos,
-        'total_enfermeiros': total_enfermeiros,
-        'total_unidades': total_unidades,
-        'consultas_hoje': consultas_hoje,
-        'consultas_mes': consultas_mes,
-        'consultas_pendentes': consultas_pendentes,
-        'faturas_pendentes': faturas_pendentes,
-        'receita_mes': receita_mes,
-        'ultimas_consultas': ultimas_consultas,
-    }
-    
-    return render(request, 'admin/dashboard.html', context)
+    return render(request, 'admin/dashboard.html', obter_dashboard_admin())
 
 
 # ==================== GESTÃO DE REGIÕES ====================
@@ -134,60 +122,13 @@ def admin_regioes_export_json(request):
 @login_required
 @role_required('admin')
 def admin_regioes_import_csv(request):
-    if request.method != 'POST' or 'file' not in request.FILES:
-        messages.error(request, "Selecione um ficheiro CSV.")
-        return redirect('admin_regioes')
-
-    file_obj = request.FILES['file']
-    content = file_obj.read().decode('utf-8-sig')
-    reader = csv.DictReader(io.StringIO(content), delimiter=';')
-    created = 0
-    errors = 0
-
-    for row in reader:
-        nome = (row.get('nome') or '').strip()
-        tipo = (row.get('tipo_regiao') or '').strip()
-        if not nome or not tipo:
-            errors += 1
-            continue
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute("CALL admin_criar_regiao(%s, %s)", [nome, tipo])
-            created += 1
-        except Exception:
-            errors += 1
-
-    messages.success(request, f"Importação concluída: {created} criadas, {errors} com erro.")
-    return redirect('admin_regioes')
+    return _importar_ficheiro(request, 'regioes', 'csv', 'admin_regioes')
 
 
 @login_required
 @role_required('admin')
 def admin_regioes_import_json(request):
-    if request.method != 'POST' or 'file' not in request.FILES:
-        messages.error(request, "Selecione um ficheiro JSON.")
-        return redirect('admin_regioes')
-
-    file_obj = request.FILES['file']
-    data = json.loads(file_obj.read().decode('utf-8-sig'))
-    created = 0
-    errors = 0
-
-    for item in data if isinstance(data, list) else []:
-        nome = (item.get('nome') or '').strip()
-        tipo = (item.get('tipo_regiao') or '').strip()
-        if not nome or not tipo:
-            errors += 1
-            continue
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute("CALL admin_criar_regiao(%s, %s)", [nome, tipo])
-            created += 1
-        except Exception:
-            errors += 1
-
-    messages.success(request, f"Importação concluída: {created} criadas, {errors} com erro.")
-    return redirect('admin_regioes')
+    return _importar_ficheiro(request, 'regioes', 'json', 'admin_regioes')
 
 
 @login_required
@@ -330,60 +271,13 @@ def admin_especialidades_export_json(request):
 @login_required
 @role_required('admin')
 def admin_especialidades_import_csv(request):
-    if request.method != 'POST' or 'file' not in request.FILES:
-        messages.error(request, "Selecione um ficheiro CSV.")
-        return redirect('admin_especialidades')
-
-    file_obj = request.FILES['file']
-    content = file_obj.read().decode('utf-8-sig')
-    reader = csv.DictReader(io.StringIO(content), delimiter=';')
-    created = 0
-    errors = 0
-
-    for row in reader:
-        nome = (row.get('nome_especialidade') or row.get('nome') or '').strip()
-        descricao = (row.get('descricao') or '').strip()
-        if not nome:
-            errors += 1
-            continue
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute("CALL admin_criar_especialidade(%s, %s)", [nome, descricao])
-            created += 1
-        except Exception:
-            errors += 1
-
-    messages.success(request, f"Importação concluída: {created} criadas, {errors} com erro.")
-    return redirect('admin_especialidades')
+    return _importar_ficheiro(request, 'especialidades', 'csv', 'admin_especialidades')
 
 
 @login_required
 @role_required('admin')
 def admin_especialidades_import_json(request):
-    if request.method != 'POST' or 'file' not in request.FILES:
-        messages.error(request, "Selecione um ficheiro JSON.")
-        return redirect('admin_especialidades')
-
-    file_obj = request.FILES['file']
-    data = json.loads(file_obj.read().decode('utf-8-sig'))
-    created = 0
-    errors = 0
-
-    for item in data if isinstance(data, list) else []:
-        nome = (item.get('nome_especialidade') or item.get('nome') or '').strip()
-        descricao = (item.get('descricao') or '').strip()
-        if not nome:
-            errors += 1
-            continue
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute("CALL admin_criar_especialidade(%s, %s)", [nome, descricao])
-            created += 1
-        except Exception:
-            errors += 1
-
-    messages.success(request, f"Importação concluída: {created} criadas, {errors} com erro.")
-    return redirect('admin_especialidades')
+    return _importar_ficheiro(request, 'especialidades', 'json', 'admin_especialidades')
 
 
 @login_required
@@ -538,98 +432,13 @@ def admin_unidades_export_json(request):
 @login_required
 @role_required('admin')
 def admin_unidades_import_csv(request):
-    if request.method != 'POST' or 'file' not in request.FILES:
-        messages.error(request, "Selecione um ficheiro CSV.")
-        return redirect('admin_unidades')
-
-    file_obj = request.FILES['file']
-    content = file_obj.read().decode('utf-8-sig')
-    reader = csv.DictReader(io.StringIO(content), delimiter=';')
-    created = 0
-    errors = 0
-
-    for row in reader:
-        nome = (row.get('nome_unidade') or row.get('nome') or '').strip()
-        morada = (row.get('morada_unidade') or '').strip()
-        tipo = (row.get('tipo_unidade') or '').strip()
-        id_regiao = (row.get('id_regiao') or '').strip()
-        nome_regiao = (row.get('nome_regiao') or '').strip()
-
-        if not nome or not morada or not tipo:
-            errors += 1
-            continue
-
-        if not id_regiao and nome_regiao:
-            with connection.cursor() as cursor:
-                cursor.execute("SELECT id_regiao FROM \"REGIAO\" WHERE nome = %s", [nome_regiao])
-                reg_row = cursor.fetchone()
-                if reg_row:
-                    id_regiao = str(reg_row[0])
-
-        if not id_regiao:
-            errors += 1
-            continue
-
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute(
-                    "CALL admin_criar_unidade(%s, %s, %s, %s)",
-                    [nome, morada, tipo, id_regiao]
-                )
-            created += 1
-        except Exception:
-            errors += 1
-
-    messages.success(request, f"Importação concluída: {created} criadas, {errors} com erro.")
-    return redirect('admin_unidades')
+    return _importar_ficheiro(request, 'unidades', 'csv', 'admin_unidades')
 
 
 @login_required
 @role_required('admin')
 def admin_unidades_import_json(request):
-    if request.method != 'POST' or 'file' not in request.FILES:
-        messages.error(request, "Selecione um ficheiro JSON.")
-        return redirect('admin_unidades')
-
-    file_obj = request.FILES['file']
-    data = json.loads(file_obj.read().decode('utf-8-sig'))
-    created = 0
-    errors = 0
-
-    for item in data if isinstance(data, list) else []:
-        nome = (item.get('nome_unidade') or item.get('nome') or '').strip()
-        morada = (item.get('morada_unidade') or '').strip()
-        tipo = (item.get('tipo_unidade') or '').strip()
-        id_regiao = str(item.get('id_regiao') or '').strip()
-        nome_regiao = (item.get('nome_regiao') or '').strip()
-
-        if not nome or not morada or not tipo:
-            errors += 1
-            continue
-
-        if not id_regiao and nome_regiao:
-            with connection.cursor() as cursor:
-                cursor.execute("SELECT id_regiao FROM \"REGIAO\" WHERE nome = %s", [nome_regiao])
-                reg_row = cursor.fetchone()
-                if reg_row:
-                    id_regiao = str(reg_row[0])
-
-        if not id_regiao:
-            errors += 1
-            continue
-
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute(
-                    "CALL admin_criar_unidade(%s, %s, %s, %s)",
-                    [nome, morada, tipo, id_regiao]
-                )
-            created += 1
-        except Exception:
-            errors += 1
-
-    messages.success(request, f"Importação concluída: {created} criadas, {errors} com erro.")
-    return redirect('admin_unidades')
+    return _importar_ficheiro(request, 'unidades', 'json', 'admin_unidades')
 
 
 @login_required
@@ -758,13 +567,13 @@ def admin_unidade_eliminar(request, unidade_id):
 def admin_utilizadores(request):
     """Listar todos os utilizadores"""
     role_filter = request.GET.get('role', '')
+    apos = request.GET.get('apos') or None
     
-    utilizadores = []
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT * FROM listar_utilizadores_admin(%s)", [role_filter or None])
-        columns = [col[0] for col in cursor.description]
-        for row in cursor.fetchall():
-            utilizadores.append(dict(zip(columns, row)))
+    try:
+        utilizadores, proximo = listar_utilizadores(role_filter, _limite_lista(), apos)
+    except ValueError:
+        messages.error(request, "Página inválida.")
+        return redirect('admin_utilizadores')
     
     roles = [
         ('paciente', 'Paciente'),
@@ -776,11 +585,46 @@ def admin_utilizadores(request):
     context = {
         'utilizadores': utilizadores,
         'role_filter': role_filter,
-        'roles': roles
+        'roles': roles,
+        'total': contar('contar_utilizadores_admin', [role_filter or None]),
+        'proximo_url': _url_pagina(request, proximo) if proximo else None,
+        'primeira_url': _url_pagina(request, None) if apos else None,
     }
     return render(request, 'admin/utilizadores.html', context)
 
 
+@login_required
+@role_required('admin')
+def admin_utilizadores_import_csv(request):
+    """Onboarding de pacientes em massa a partir de um CSV (em background)"""
+    if request.method != 'POST' or 'file' not in request.FILES:
+        messages.error(request, "Selecione um ficheiro CSV.")
+        return redirect('admin_utilizadores')
+    try:
+        importacao = pedir_importacao('pacientes', 'csv', request.FILES['file'])
+    except Exception as e:
+        messages.error(request, f"Erro na importação: {str(e)}")
+        return redirect('admin_utilizadores')
+    return redirect('admin_importacao_estado', id_importacao=importacao['id'])
+
+
+@login_required
+@role_required('admin')
+def admin_importacao_estado(request, id_importacao):
+    """Estado de uma importação em background (HTML com refresh automático, ou JSON)"""
+    importacao = obter_importacao(id_importacao)
+    if importacao is None:
+        raise Http404("Importação não encontrada")
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse(importacao)
+    max_erros = getattr(settings, 'IMPORT_MAX_ERROS_MOSTRADOS', 20)
+    return render(request, 'admin/importacao.html', {
+        'importacao': importacao,
+        'erros': importacao['erros'][:max_erros],
+        'erros_omitidos': max(0, len(importacao['erros']) - max_erros),
+    })
+
+
 @login_required
 @role_required('admin')
 def admin_utilizador_criar(request):
@@ -895,6 +739,7 @@ def admin_utilizador_editar(request, utilizador_id):
                     "CALL admin_editar_utilizador(%s, %s, %s, %s, %s, %s)",
                     [utilizador_id, nome, email, telefone, ativo, password_hash]
                 )
+            invalidar_perfil(utilizador_id)
             messages.success(request, f"Utilizador '{nome}' atualizado!")
             return redirect('admin_utilizadores')
         except Exception as e:
@@ -932,6 +777,7 @@ def admin_utilizador_desativar(request, utilizador_id):
         try:
             with connection.cursor() as cursor:
                 cursor.execute("CALL admin_toggle_utilizador_ativo(%s)", [utilizador_id])
+            invalidar_perfil(utilizador_id)
             with connection.cursor() as cursor:
                 cursor.execute("SELECT * FROM obter_utilizador_admin_por_id(%s)", [utilizador_id])
                 row = cursor.fetchone()
@@ -956,20 +802,21 @@ def admin_consultas(request):
     estado_filter = request.GET.get('estado', '')
     data_filter = request.GET.get('data', '')
     
-    consultas = []
-    with connection.cursor() as cursor:
-        cursor.execute(
-            "SELECT * FROM listar_consultas_admin(%s, %s, %s)",
-            [estado_filter or None, data_filter or None, 100]
-        )
-        columns = [col[0] for col in cursor.description]
-        for row in cursor.fetchall():
-            consultas.append(dict(zip(columns, row)))
+    apos = request.GET.get('apos') or None
+    
+    try:
+        consultas, proximo = listar_consultas(estado_filter, data_filter, _limite_lista(), apos)
+    except ValueError:
+        messages.error(request, "Página inválida.")
+        return redirect('admin_consultas')
     
     context = {
         'consultas': consultas,
         'estado_filter': estado_filter,
-        'data_filter': data_filter
+        'data_filter': data_filter,
+        'total': contar('contar_consultas_admin', [estado_filter or None, data_filter or None]),
+        'proximo_url': _url_pagina(request, proximo) if proximo else None,
+        'primeira_url': _url_pagina(request, None) if apos else None,
     }
     return render(request, 'admin/consultas.html', context)
 
@@ -1010,6 +857,14 @@ def admin_disponibilidades_list(request):
         return JsonResponse({'disponibilidades': [], 'error': str(e)})
 
 
+@login_required
+@role_required('admin')
+def admin_db_pool_metrics(request):
+    """Métricas dos pools de conexões por role (checkouts, esperas, reconexões)"""
+    from .db_pool import obter_metricas_pools
+    return JsonResponse({'pools': obter_metricas_pools()}, json_dumps_params={'indent': 2})
+
+
 @login_required
 @role_required('admin')
 def admin_consulta_cancelar(request, consulta_id):
@@ -1162,15 +1017,13 @@ def admin_faturas(request):
     """Listar e gerir todas as faturas"""
     estado_filter = request.GET.get('estado', '')
     
-    faturas = []
-    with connection.cursor() as cursor:
-        cursor.execute(
-            "SELECT * FROM listar_faturas_admin(%s, %s)",
-            [estado_filter or None, 100]
-        )
-        columns = [col[0] for col in cursor.description]
-        for row in cursor.fetchall():
-            faturas.append(dict(zip(columns, row)))
+    apos = request.GET.get('apos') or None
+    
+    try:
+        faturas, proximo = listar_faturas(estado_filter, _limite_lista(), apos)
+    except ValueError:
+        messages.error(request, "Página inválida.")
+        return redirect('admin_faturas')
     
     total_faturado = 0
     total_pendente = 0
@@ -1185,7 +1038,10 @@ def admin_faturas(request):
         'faturas': faturas,
         'estado_filter': estado_filter,
         'total_faturado': total_faturado,
-        'total_pendente': total_pendente
+        'total_pendente': total_pendente,
+        'total': contar('contar_faturas_admin', [estado_filter or None]),
+        'proximo_url': _url_pagina(request, proximo) if proximo else None,
+        'primeira_url': _url_pagina(request, None) if apos else None,
     }
     return render(request, 'admin/faturas.html', context)
 
@@ -1294,46 +1150,20 @@ def admin_relatorios(request):
         data_inicio = inicio_mes
         data_fim = hoje
     
-    consultas_por_estado = []
+    # Meses fechados vêm das materialized views; só o resto do período é calculado em tempo real
     with connection.cursor() as cursor:
         cursor.execute(
-            "SELECT * FROM relatorio_consultas_por_estado(%s, %s, %s, %s)",
-            [data_inicio, data_fim, estado_filter, None]
-        )
-        for row in cursor.fetchall():
-            consultas_por_estado.append({
-                'estado': row[0],
-                'total': row[1]
-            })
-    
-    consultas_por_medico = []
-    with connection.cursor() as cursor:
-        cursor.execute(
-            "SELECT * FROM relatorio_consultas_por_medico(%s, %s, %s, %s, %s)",
-            [data_inicio, data_fim, estado_filter, None, 10]
+            "SELECT * FROM relatorio_consultas_agregado(%s, %s, %s)",
+            [data_inicio, data_fim, estado_filter]
         )
-        for row in cursor.fetchall():
-            consultas_por_medico.append({
-                'id_medico__id_utilizador__nome': row[0],
-                'total': row[1]
-            })
-    
-    consultas_por_especialidade = []
-    with connection.cursor() as cursor:
-        cursor.execute(
-            "SELECT * FROM relatorio_consultas_por_especialidade(%s, %s, %s, %s)",
-            [data_inicio, data_fim, estado_filter, None]
+        consultas_por_estado, consultas_por_medico, consultas_por_especialidade = agregar_consultas(
+            cursor.fetchall()
         )
-        for row in cursor.fetchall():
-            consultas_por_especialidade.append({
-                'id_medico__id_especialidade__nome_especialidade': row[0],
-                'total': row[1]
-            })
 
     receitas = {'total': 0, 'count': 0}
     with connection.cursor() as cursor:
         cursor.execute(
-            "SELECT * FROM relatorio_receitas_periodo(%s, %s)",
+            "SELECT * FROM relatorio_receitas_agregado(%s, %s)",
             [data_inicio, data_fim]
         )
         row = cursor.fetchone()
@@ -1347,74 +1177,55 @@ def admin_relatorios(request):
         'consultas_por_medico': list(consultas_por_medico),
         'consultas_por_especialidade': list(consultas_por_especialidade),
         'receitas': receitas,
+        'matviews': estado_matviews(),
+        'exportacoes_background': [('financeiro', 'Financeiro'), ('consultas', 'Consultas')],
     }
     
     return render(request, 'admin/relatorios.html', context)
 
+# Filtros dos relatórios validados antes de a exportação começar (400 em vez
+# de um 200 com o corpo truncado quando a query falha já a meio do envio)
+FILTROS_INVALIDOS = "Filtros inválidos: datas no formato AAAA-MM-DD e medico_id numérico."
+
 @login_required
 @role_required('admin')
 def relatorio_financeiro_csv(request):
-    """Relatório financeiro em CSV"""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="relatorio_financeiro.csv"'
-    
-    writer = csv.writer(response, delimiter=';') 
-    writer.writerow([
-        'ID Fatura', 
-        'Data Emissão', 
-        'Data Pagamento', 
-        'Valor Total (€)', 
-        'Estado', 
-        'Método Pagamento', 
-        'ID Consulta',
-        'Paciente', 
-        'Médico', 
-        'Especialidade',
-        'Data Consulta',
-        'Hora Consulta'
-    ])
-
-    data_inicio = request.GET.get('data_inicio')
-    data_fim = request.GET.get('data_fim')
-    estado = request.GET.get('estado')
-    
-    with connection.cursor() as cursor:
-        cursor.execute(
-            "SELECT * FROM relatorio_faturas_listar(%s, %s, %s)",
-            [data_inicio or None, data_fim or None, estado or None]
-        )
-        for row in cursor.fetchall():
-            writer.writerow([
-                row[0],
-                row[1].strftime('%d/%m/%Y') if row[1] else '',
-                row[1].strftime('%d/%m/%Y') if row[1] else 'Pendente',
-                f"{row[2]:.2f}".replace('.', ','),
-                row[3],
-                row[4] or 'N/A',
-                row[5],
-                row[6],
-                row[7],
-                row[8] or 'N/A',
-                row[9].strftime('%d/%m/%Y') if row[9] else '',
-                row[10].strftime('%H:%M') if row[10] else ''
-            ])
-    
-    return response
+    """Relatório financeiro em CSV (streaming)"""
+    try:
+        filtros = normalizar_filtros('financeiro', request.GET)
+    except ValueError:
+        return HttpResponse(FILTROS_INVALIDOS, status=400)
+    data_inicio = filtros.get('data_inicio')
+    data_fim = filtros.get('data_fim')
+    estado = filtros.get('estado')
+    
+    linhas = iniciar_linhas(linhas_servidor(
+        "SELECT * FROM relatorio_faturas_listar(%s, %s, %s)",
+        [data_inicio, data_fim, estado]
+    ))
+    return resposta_csv(
+        'relatorio_financeiro.csv',
+        gerar_csv(CABECALHO_FATURAS_CSV, map(linha_fatura_csv, linhas))
+    )
 
 @login_required
 @role_required('admin')
 def relatorio_financeiro_json(request):
-    """Relatório financeiro em JSON com estatísticas"""
-    data_inicio = request.GET.get('data_inicio')
-    data_fim = request.GET.get('data_fim')
-    estado = request.GET.get('estado')
+    """Relatório financeiro em JSON com estatísticas (faturas em streaming)"""
+    try:
+        filtros = normalizar_filtros('financeiro', request.GET)
+    except ValueError:
+        return HttpResponse(FILTROS_INVALIDOS, status=400)
+    data_inicio = filtros.get('data_inicio')
+    data_fim = filtros.get('data_fim')
+    estado = filtros.get('estado')
     
     total_faturas = 0
     valor_total = 0
     with connection.cursor() as cursor:
         cursor.execute(
             "SELECT * FROM relatorio_faturas_stats(%s, %s, %s)",
-            [data_inicio or None, data_fim or None, estado or None]
+            [data_inicio, data_fim, estado]
         )
         row = cursor.fetchone()
         if row:
@@ -1425,7 +1236,7 @@ def relatorio_financeiro_json(request):
     with connection.cursor() as cursor:
         cursor.execute(
             "SELECT * FROM relatorio_faturas_por_estado(%s, %s, %s)",
-            [data_inicio or None, data_fim or None, estado or None]
+            [data_inicio, data_fim, estado]
         )
         for row in cursor.fetchall():
             faturas_por_estado.append({
@@ -1434,37 +1245,7 @@ def relatorio_financeiro_json(request):
                 'total': row[2]
             })
     
-    faturas_detalhes = []
-    with connection.cursor() as cursor:
-        cursor.execute(
-            "SELECT * FROM relatorio_faturas_detalhes(%s, %s, %s, %s)",
-            [data_inicio or None, data_fim or None, estado or None, 100]
-        )
-        for row in cursor.fetchall():
-            faturas_detalhes.append({
-                'id_fatura': row[0],
-                'data_pagamento': row[1].strftime('%Y-%m-%d') if row[1] else None,
-                'valor': float(row[2]),
-                'estado': row[3],
-                'metodo_pagamento': row[4],
-                'consulta': {
-                    'id_consulta': row[5],
-                    'data_consulta': row[6].strftime('%Y-%m-%d') if row[6] else None,
-                    'hora_consulta': row[7].strftime('%H:%M') if row[7] else None,
-                    'paciente': {
-                        'id': row[8],
-                        'nome': row[9],
-                        'n_utente': row[10]
-                    },
-                    'medico': {
-                        'id': row[11],
-                        'nome': row[12],
-                        'especialidade': row[13]
-                    }
-                }
-            })
-    
-    resposta = {
+    cabecalho = {
         'periodo': {
             'data_inicio': data_inicio,
             'data_fim': data_fim
@@ -1482,75 +1263,55 @@ def relatorio_financeiro_json(request):
             }
             for item in faturas_por_estado
         ],
-        'faturas': faturas_detalhes
     }
     
-    return JsonResponse(resposta, safe=False, json_dumps_params={'indent': 2})
+    # Todas as faturas do período (LIMIT NULL), lidas em lotes do cursor do servidor
+    linhas = iniciar_linhas(linhas_servidor(
+        "SELECT * FROM relatorio_faturas_detalhes(%s, %s, %s, %s)",
+        [data_inicio, data_fim, estado, None]
+    ))
+    return resposta_json(gerar_json(cabecalho, 'faturas', map(fatura_json, linhas)))
 
 @login_required
 @role_required('admin')
 def relatorio_consultas_csv(request):
-    """Relatório de consultas em CSV"""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="relatorio_consultas.csv"'
-    
-    writer = csv.writer(response, delimiter=';')
-    writer.writerow([
-        'ID Consulta',
-        'Data',
-        'Hora',
-        'Paciente',
-        'Médico',
-        'Especialidade',
-        'Estado',
-        'Motivo',
-        'Valor (€)',
-        'Fatura ID',
-        'Data Criação'
-    ])
-    
-    data_inicio = request.GET.get('data_inicio')
-    data_fim = request.GET.get('data_fim')
-    estado = request.GET.get('estado')
-    medico_id = request.GET.get('medico_id')
-    
-    with connection.cursor() as cursor:
-        cursor.execute(
-            "SELECT * FROM relatorio_consultas_listar(%s, %s, %s, %s)",
-            [data_inicio or None, data_fim or None, estado or None, medico_id or None]
-        )
-        for row in cursor.fetchall():
-            writer.writerow([
-                row[0],
-                row[1].strftime('%d/%m/%Y') if row[1] else '',
-                row[2].strftime('%H:%M') if row[2] else '',
-                row[3],
-                row[4],
-                row[5] or 'N/A',
-                row[6],
-                row[7] or '',
-                f"{row[8]:.2f}".replace('.', ','),
-                row[9] if row[9] else 'N/A',
-                row[10].strftime('%d/%m/%Y %H:%M') if row[10] else ''
-            ])
-    
-    return response
+    """Relatório de consultas em CSV (streaming)"""
+    try:
+        filtros = normalizar_filtros('consultas', request.GET)
+    except ValueError:
+        return HttpResponse(FILTROS_INVALIDOS, status=400)
+    data_inicio = filtros.get('data_inicio')
+    data_fim = filtros.get('data_fim')
+    estado = filtros.get('estado')
+    medico_id = filtros.get('medico_id')
+    
+    linhas = iniciar_linhas(linhas_servidor(
+        "SELECT * FROM relatorio_consultas_listar(%s, %s, %s, %s)",
+        [data_inicio, data_fim, estado, medico_id]
+    ))
+    return resposta_csv(
+        'relatorio_consultas.csv',
+        gerar_csv(CABECALHO_CONSULTAS_CSV, map(linha_consulta_csv, linhas))
+    )
 
 @login_required
 @role_required('admin')
 def relatorio_consultas_json(request):
-    """Relatório de consultas em JSON"""
-    # Filtros
-    data_inicio = request.GET.get('data_inicio')
-    data_fim = request.GET.get('data_fim')
-    estado = request.GET.get('estado')
-    medico_id = request.GET.get('medico_id')
+    """Relatório de consultas em JSON (consultas em streaming)"""
+    try:
+        filtros = normalizar_filtros('consultas', request.GET)
+    except ValueError:
+        return HttpResponse(FILTROS_INVALIDOS, status=400)
+    data_inicio = filtros.get('data_inicio')
+    data_fim = filtros.get('data_fim')
+    estado = filtros.get('estado')
+    medico_id = filtros.get('medico_id')
     
     total_consultas = 0
     with connection.cursor() as cursor:
         cursor.execute(
             "SELECT relatorio_consultas_total(%s, %s, %s, %s)",
-            [data_inicio or None, data_fim or None, estado or None, medico_id or None]
+            [data_inicio, data_fim, estado, medico_id]
         )
         row = cursor.fetchone()
         if row:
@@ -1560,7 +1321,7 @@ def relatorio_consultas_json(request):
     with connection.cursor() as cursor:
         cursor.execute(
             "SELECT * FROM relatorio_consultas_por_estado(%s, %s, %s, %s)",
-            [data_inicio or None, data_fim or None, estado or None, medico_id or None]
+            [data_inicio, data_fim, estado, medico_id]
         )
         for row in cursor.fetchall():
             consultas_por_estado.append({
@@ -1572,7 +1333,7 @@ def relatorio_consultas_json(request):
     with connection.cursor() as cursor:
         cursor.execute(
             "SELECT * FROM relatorio_consultas_por_medico(%s, %s, %s, %s, %s)",
-            [data_inicio or None, data_fim or None, estado or None, medico_id or None, 10]
+            [data_inicio, data_fim, estado, medico_id, 10]
         )
         for row in cursor.fetchall():
             consultas_por_medico.append({
@@ -1580,39 +1341,7 @@ def relatorio_consultas_json(request):
                 'count': row[1]
             })
     
-    consultas_detalhes = []
-    with connection.cursor() as cursor:
-        cursor.execute(
-            "SELECT * FROM relatorio_consultas_detalhes(%s, %s, %s, %s, %s)",
-            [data_inicio or None, data_fim or None, estado or None, medico_id or None, 100]
-        )
-        for row in cursor.fetchall():
-            fatura_info = None
-            if row[10]:
-                fatura_info = {
-                    'id': row[10],
-                    'valor': float(row[11]),
-                    'estado': row[12]
-                }
-            consultas_detalhes.append({
-                'id_consulta': row[0],
-                'data_consulta': row[1].strftime('%Y-%m-%d') if row[1] else None,
-                'hora_consulta': row[2].strftime('%H:%M') if row[2] else None,
-                'estado': row[3],
-                'motivo': row[4],
-                'paciente': {
-                    'id': row[5],
-                    'nome': row[6]
-                },
-                'medico': {
-                    'id': row[7],
-                    'nome': row[8],
-                    'especialidade': row[9]
-                },
-                'fatura': fatura_info
-            })
-    
-    resposta = {
+    cabecalho = {
         'periodo': {
             'data_inicio': data_inicio,
             'data_fim': data_fim
@@ -1622,7 +1351,62 @@ def relatorio_consultas_json(request):
             'por_estado': list(consultas_por_estado),
             'top_medicos': list(consultas_por_medico)
         },
-        'consultas': consultas_detalhes
     }
     
-    return JsonResponse(resposta, safe=False, json_dumps_params={'indent': 2})
\ No newline at end of file
+    # Todas as consultas do período (LIMIT NULL), lidas em lotes do cursor do servidor
+    linhas = iniciar_linhas(linhas_servidor(
+        "SELECT * FROM relatorio_consultas_detalhes(%s, %s, %s, %s, %s)",
+        [data_inicio, data_fim, estado, medico_id, None]
+    ))
+    return resposta_json(gerar_json(cabecalho, 'consultas', map(consulta_json, linhas)))
+
+
+# ==================== EXPORTAÇÕES EM BACKGROUND ====================
+
+@login_required
+@role_required('admin')
+def admin_exportacao_pedir(request):
+    """Pede uma exportação em background (POST com relatorio, formato e filtros)"""
+    if request.method != 'POST':
+        return redirect('admin_relatorios')
+    try:
+        exportacao = pedir_exportacao(
+            request.POST.get('relatorio'),
+            request.POST.get('formato', 'csv'),
+            request.POST
+        )
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect('admin_relatorios')
+    return redirect('admin_exportacao_estado', id_exportacao=exportacao['id'])
+
+
+@login_required
+@role_required('admin')
+def admin_exportacao_estado(request, id_exportacao):
+    """Estado de uma exportação (HTML com refresh automático, ou JSON para polling)"""
+    exportacao = obter_exportacao(id_exportacao)
+    if exportacao is None:
+        raise Http404("Exportação não encontrada")
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse(exportacao)
+    return render(request, 'admin/exportacao.html', {'exportacao': exportacao})
+
+
+@login_required
+@role_required('admin')
+def admin_exportacao_download(request, id_exportacao):
+    """Download do ficheiro (gzip) de uma exportação concluída"""
+    exportacao = obter_exportacao(id_exportacao)
+    if exportacao is None or exportacao['estado'] != 'concluida':
+        raise Http404("Exportação não disponível")
+    try:
+        ficheiro = open(caminho_ficheiro(exportacao), 'rb')
+    except FileNotFoundError:
+        raise Http404("Exportação expirada")
+    return FileResponse(
+        ficheiro,
+        as_attachment=True,
+        filename=exportacao['nome_download'],
+        content_type='application/gzip'
+    )
@@ -1,11 +1,15 @@
+from django.http import HttpResponse
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
-from django.db import connection
+from django.db import connection, transaction
 from datetime import datetime, timedelta
 from .decorators import role_required
-from .mongo_client import NotasClinicasService
+from .mongo_client import get_notas_service
+from .outbox import enfileirar_nota
+from .receitas import registar_receitas
+from .slots import obter_slots
 import logging
 import json
 
@@ -15,17 +19,13 @@ logger = logging.getLogger(__name__)
 @role_required('medico')
 def medico_dashboard(request):
     """Dashboard principal do médico usando funções e procedimentos PostgreSQL"""
-    # Obter médico usando SQL
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT * FROM obter_medico_por_id_utilizador(%s)", [request.user.id_utilizador])
-        medico_row = cursor.fetchone()
+    # Obter médico (perfil em cache, ver core/user_cache.py)
+    medico_id = getattr(request.user, 'id_medico', None)
     
-    if not medico_row:
+    if not medico_id:
         messages.error(request, "Perfil de médico não encontrado.")
         return redirect('index')
     
-    medico_id = medico_row[0]
-    
     hoje = timezone.now().date()
     
     try:
@@ -432,17 +432,13 @@ def medico_excluir_disponibilidade(request, disponibilidade_id):
     """Excluir uma disponibilidade que não está ocupada usando procedimento SQL"""
     from django.db import connection
     
-    # Obter médico usando SQL
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT * FROM obter_medico_por_id_utilizador(%s)", [request.user.id_utilizador])
-        medico_row = cursor.fetchone()
+    # Obter médico (perfil em cache, ver core/user_cache.py)
+    medico_id = getattr(request.user, 'id_medico', None)
     
-    if not medico_row:
+    if not medico_id:
         messages.error(request, "Perfil de médico não encontrado.")
         return redirect('index')
     
-    medico_id = medico_row[0]
-    
     try:
         with connection.cursor() as cursor:
             cursor.execute("""
@@ -648,17 +644,13 @@ def medico_cancelar_consulta(request, consulta_id):
 @role_required('medico')
 def medico_detalhes_consulta(request, consulta_id):
     """Ver detalhes da consulta e informações do paciente"""
-    # Obter médico usando SQL
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT * FROM obter_medico_por_id_utilizador(%s)", [request.user.id_utilizador])
-        medico_row = cursor.fetchone()
+    # Obter médico (perfil em cache, ver core/user_cache.py)
+    medico_id = getattr(request.user, 'id_medico', None)
     
-    if not medico_row:
+    if not medico_id:
         messages.error(request, "Perfil de médico não encontrado.")
         return redirect('index')
     
-    medico_id = medico_row[0]
-    
     # Obter consulta com relações
     with connection.cursor() as cursor:
         cursor.execute("SELECT * FROM obter_consulta_com_relacoes(%s)", [consulta_id])
@@ -703,11 +695,17 @@ def medico_detalhes_consulta(request, consulta_id):
             })
     
     # Get notas clínicas from MongoDB if available
-    notas_clinicas_service = NotasClinicasService()
+    notas_clinicas_service = get_notas_service()
     mongo_notes = notas_clinicas_service.get_note_by_consulta(consulta_id)
     
-    # Get all patient notes from MongoDB
-    patient_history_notes = notas_clinicas_service.get_notes_by_patient(paciente_id, limit=10)
+    # Get all patient notes from MongoDB (página seguinte com ?notas_antes=<cursor>)
+    notas_antes = request.GET.get('notas_antes') or None
+    try:
+        patient_history_notes, notas_proximo = notas_clinicas_service.get_notes_by_patient(
+            paciente_id, limit=10, antes=notas_antes
+        )
+    except ValueError:
+        return HttpResponse("Página de notas inválida.", status=400)
     
     # Build paciente dict
     paciente_dict = {
@@ -723,6 +721,7 @@ def medico_detalhes_consulta(request, consulta_id):
         'historico': historico,
         'mongo_notes': mongo_notes,
         'patient_history_notes': patient_history_notes,
+        'notas_proximo': notas_proximo,
     }
     
     return render(request, 'medico/detalhes_consulta.html', context)
@@ -732,17 +731,13 @@ def medico_detalhes_consulta(request, consulta_id):
 @role_required('medico')
 def medico_registar_consulta(request, consulta_id):
     """Registar notas médicas e receitas após a consulta - salva no MongoDB"""
-    # Obter médico usando SQL
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT * FROM obter_medico_por_id_utilizador(%s)", [request.user.id_utilizador])
-        medico_row = cursor.fetchone()
+    # Obter médico (perfil em cache, ver core/user_cache.py)
+    medico_id = getattr(request.user, 'id_medico', None)
     
-    if not medico_row:
+    if not medico_id:
         messages.error(request, "Perfil de médico não encontrado.")
         return redirect('index')
     
-    medico_id = medico_row[0]
-    
     # Obter consulta
     with connection.cursor() as cursor:
         cursor.execute("SELECT * FROM obter_consulta_com_relacoes(%s)", [consulta_id])
@@ -792,56 +787,33 @@ def medico_registar_consulta(request, consulta_id):
             }
         }
         
-        # Save to MongoDB - update if exists, create if not
-        notas_clinicas_service = NotasClinicasService()
-        existing_note = notas_clinicas_service.get_note_by_consulta(consulta_dict['id_consulta'])
-        
-        if existing_note is not None:
-            # Update existing note
-            success = notas_clinicas_service.update_note(consulta_dict['id_consulta'], notes_data)
-            if success:
-                logger.info(f"Updated nota clínica for consulta {consulta_dict['id_consulta']}")
-            note_id = existing_note.get('_id')
-        else:
-            # Create new note
-            note_id = notas_clinicas_service.create_note(
-                consulta_id=consulta_dict['id_consulta'],
-                medico_id=medico_id,
-                paciente_id=consulta_dict['id_paciente'],
-                notes_data=notes_data
+        # Estado da consulta, receitas e nota clínica (outbox) numa só
+        # transação; o worker do outbox envia a nota para o MongoDB
+        # (ver core/outbox.py), por isso o request não depende do MongoDB.
+        with transaction.atomic():
+            registar_receitas(
+                consulta_dict['id_consulta'],
+                [
+                    (prescricao, 'Conforme prescrição', notes_data['diagnostico'][:255])
+                    for prescricao in notes_data['prescricoes']
+                ],
+                timezone.now().date(),
+                novo_estado='realizada'
+            )
+            enfileirar_nota(
+                consulta_dict['id_consulta'],
+                medico_id,
+                consulta_dict['id_paciente'],
+                notes_data
             )
-
-        
-        # Update consulta status in PostgreSQL using stored procedure
-        with connection.cursor() as cursor:
-            cursor.execute("CALL atualizar_estado_consulta(%s, %s)", [consulta_dict['id_consulta'], 'realizada'])
-        
-        # Create receita if prescriptions exist (using stored procedure)
-        if notes_data['prescricoes']:
-            for prescricao in notes_data['prescricoes']:
-                if prescricao.strip():
-                    with connection.cursor() as cursor:
-                        cursor.execute(
-                            "CALL inserir_receita(%s, %s, %s, %s, %s)",
-                            [
-                                consulta_dict['id_consulta'],
-                                prescricao,
-                                'Conforme prescrição',
-                                notes_data['diagnostico'][:255],
-                                timezone.now().date()
-                            ]
-                        )
         
-        if note_id or success:
-            messages.success(request, "Consulta registada com sucesso! Notas clínicas salvas no MongoDB.")
-        else:
-            messages.warning(request, "Consulta registada, mas houve um problema ao salvar as notas clínicas detalhadas.")
+        messages.success(request, "Consulta registada com sucesso! As notas clínicas serão sincronizadas com o MongoDB.")
         
         return redirect('medico_dashboard')
     
     # GET request - show form
     # Load existing notes from MongoDB
-    notas_clinicas_service = NotasClinicasService()
+    notas_clinicas_service = get_notas_service()
     mongo_notes = notas_clinicas_service.get_note_by_consulta(consulta_id)
     
     context = {
@@ -949,39 +921,6 @@ def agendar_consulta(request):
 
     disponibilidades = []
     
-    def gerar_slots(disponibilidade_row, disp_id):
-        slots = []
-        hora_inicio = disponibilidade_row[2]
-        hora_fim = disponibilidade_row[3]
-        duracao = disponibilidade_row[4]
-        
-        if not hora_inicio or not hora_fim or not duracao:
-            return slots
-        
-        hora_atual = hora_inicio
-        with connection.cursor() as cursor_slots:
-            while hora_atual < hora_fim:
-                hora_atual_dt = datetime.combine(datetime.today(), hora_atual)
-                hora_fim_slot = (hora_atual_dt + timedelta(minutes=duracao)).time()
-                
-                if hora_fim_slot > hora_fim:
-                    break
-                
-                try:
-                    cursor_slots.execute("SELECT verificar_slot_disponivel(%s, %s)", [disp_id, hora_atual])
-                    disponivel = cursor_slots.fetchone()[0]
-                except:
-                    disponivel = True
-                
-                slots.append({
-                    'time': hora_atual.strftime("%H:%M"),
-                    'available': disponivel
-                })
-                
-                hora_atual = hora_fim_slot
-        
-        return slots
-    
     # Filtrar disponibilidades 
     try:
         query_params = [medico_id]
@@ -1006,10 +945,14 @@ def agendar_consulta(request):
                 LIMIT 50
             """
             cursor.execute(query, query_params)
+            disp_rows = cursor.fetchall()
             
-            for row in cursor.fetchall():
+            # Grelha de slots de todas as disponibilidades numa só query
+            slots_por_disp = obter_slots([r[0] for r in disp_rows])
+            
+            for row in disp_rows:
                 disp_id = row[0]
-                slots = gerar_slots(row, disp_id)
+                slots = slots_por_disp.get(disp_id, [])
                 
                 disponibilidades.append({
                     'id_disponibilidade': disp_id,
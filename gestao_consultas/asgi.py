@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gestao_consultas.settings')
 
 application = get_asgi_application()
+
+# Só o servidor web liga o MongoDB no arranque (os comandos ligam no primeiro uso)
+from core.mongo_client import ligar_mongo_no_arranque
+
+ligar_mongo_no_arranque()
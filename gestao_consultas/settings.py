@@ -1,8 +1,10 @@
 # gestao_consultas/settings.py
 
 import os
+import tempfile
 from pathlib import Path
 from decouple import config, Csv
+from django.core.exceptions import ImproperlyConfigured
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -75,6 +77,103 @@ else:
         }
     }
 
+# Modo router: um alias de DATABASES por role (core/db_router.py), com
+# conexões persistentes; substitui o DatabaseRoleMiddleware
+DB_ROUTER_ENABLED = config('DB_ROUTER_ENABLED', default=False, cast=bool)
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=60, cast=int)
+
+if DB_ROUTER_ENABLED and DB_ENGINE != 'django.db.backends.sqlite3':
+    from core.db_router import build_role_databases
+
+    DATABASES.update(build_role_databases(DATABASES['default'], conn_max_age=DB_CONN_MAX_AGE))
+    DATABASE_ROUTERS = ['core.db_router.RoleBasedDatabaseRouter']
+    MIDDLEWARE[-1] = 'core.middleware.RoleBasedDatabaseMiddleware'
+
+# Modo SET LOCAL ROLE: uma conexão persistente por thread e o role/RLS
+# aplicados no início de cada transação (SetPostgreSQLUserContextMiddleware)
+DB_SET_ROLE_ENABLED = config('DB_SET_ROLE_ENABLED', default=False, cast=bool)
+
+# Os dois modos substituem o último middleware: só um pode estar ativo
+if DB_ROUTER_ENABLED and DB_SET_ROLE_ENABLED:
+    raise ImproperlyConfigured(
+        "DB_ROUTER_ENABLED e DB_SET_ROLE_ENABLED não podem estar ativos ao mesmo tempo"
+    )
+
+if DB_SET_ROLE_ENABLED and DB_ENGINE != 'django.db.backends.sqlite3':
+    DATABASES['default']['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+    MIDDLEWARE[-1] = 'core.db_role_middleware.SetPostgreSQLUserContextMiddleware'
+
+# Pools de conexões por role (core/db_pool.py), opt-in: cada processo web
+# mantém até DB_POOL_MAX_SIZE conexões abertas por role; pool esgotado
+# durante DB_POOL_TIMEOUT segundos -> 503.
+# Em produção com PostgreSQL (DatabaseRoleMiddleware) deve estar ativo: sem
+# pool cada request autenticado fecha e reabre a conexão duas vezes (role e
+# de volta a admin). O valor por omissão False serve o SQLite/desenvolvimento.
+DB_POOL_ENABLED = config('DB_POOL_ENABLED', default=False, cast=bool)
+DB_POOL_MIN_SIZE = config('DB_POOL_MIN_SIZE', default=2, cast=int)
+DB_POOL_MAX_SIZE = config('DB_POOL_MAX_SIZE', default=10, cast=int)
+DB_POOL_TIMEOUT = config('DB_POOL_TIMEOUT', default=5.0, cast=float)
+DB_POOL_MAX_IDLE = config('DB_POOL_MAX_IDLE', default=30.0, cast=float)
+
+# Cache (LocMem por processo; usar um backend partilhado, p.ex. Redis,
+# para que as invalidações cheguem a todos os workers)
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='gestao-consultas'),
+    }
+}
+
+# Tempo de vida (segundos) dos perfis de utilizador em cache (core/user_cache.py).
+# Com a LocMemCache (local a cada processo) um utilizador desativado mantém a
+# sessão nos outros workers até a entrada expirar; com uma cache partilhada
+# (p.ex. Redis) a invalidação chega a todos
+USER_PROFILE_CACHE_TTL = config('USER_PROFILE_CACHE_TTL', default=300, cast=int)
+
+# Tempo de vida (segundos) das estatísticas do dashboard admin em cache (core/dashboard.py)
+DASHBOARD_CACHE_TTL = config('DASHBOARD_CACHE_TTL', default=30, cast=int)
+
+# Listagens do backoffice (core/listas_admin.py): linhas por página e limite
+# das contagens exatas com filtros (0 desativa as contagens)
+ADMIN_LISTA_LIMITE = config('ADMIN_LISTA_LIMITE', default=50, cast=int)
+ADMIN_CONTAGEM_MAX = config('ADMIN_CONTAGEM_MAX', default=10000, cast=int)
+
+# Exportações de relatórios em streaming (core/exportacao.py): linhas pedidas
+# ao cursor do servidor por cada FETCH e tamanho (bytes) de cada bloco enviado
+EXPORT_ITERSIZE = config('EXPORT_ITERSIZE', default=2000, cast=int)
+EXPORT_BLOCO_BYTES = config('EXPORT_BLOCO_BYTES', default=65536, cast=int)
+
+# Exportações em background (core/exportacao_jobs.py): ficheiros gzip em
+# MEDIA_ROOT/EXPORT_DIR, threads de trabalho por processo, tempo após o qual
+# uma exportação sem progresso é repetida e retenção dos ficheiros
+EXPORT_DIR = config('EXPORT_DIR', default='exportacoes')
+EXPORT_WORKERS = config('EXPORT_WORKERS', default=2, cast=int)
+EXPORT_TEMPO_MAX_SEGUNDOS = config('EXPORT_TEMPO_MAX_SEGUNDOS', default=3600, cast=int)
+EXPORT_RETENCAO_HORAS = config('EXPORT_RETENCAO_HORAS', default=24, cast=int)
+
+# Importação em massa (core/importacao.py): bytes do buffer de linhas válidas
+# mantidos em memória antes de passar para disco e erros por linha mostrados
+IMPORT_BUFFER_MEMORIA = config('IMPORT_BUFFER_MEMORIA', default=8 * 1024 * 1024, cast=int)
+IMPORT_MAX_ERROS_MOSTRADOS = config('IMPORT_MAX_ERROS_MOSTRADOS', default=20, cast=int)
+# Processos para o hash das senhas na importação de pacientes (0 = no próprio
+# processo): no comando importar_pacientes (por omissão, um por CPU) e em cada
+# importação em background pedida no admin (pool criado só para essa importação)
+IMPORT_HASH_WORKERS = config('IMPORT_HASH_WORKERS', default=os.cpu_count() or 1, cast=int)
+IMPORT_HASH_WORKERS_WEB = config('IMPORT_HASH_WORKERS_WEB', default=2, cast=int)
+
+# Importações em background (core/importacao_jobs.py): manifestos em
+# MEDIA_ROOT/IMPORT_DIR, ficheiros enviados (senhas em claro) num diretório
+# privado fora de MEDIA_ROOT, threads de trabalho por processo, tempo sem
+# atualizações até a importação ser dada como interrompida e retenção
+IMPORT_DIR = config('IMPORT_DIR', default='importacoes')
+IMPORT_UPLOAD_DIR = config(
+    'IMPORT_UPLOAD_DIR', default=os.path.join(tempfile.gettempdir(), 'gestao_consultas_importacoes')
+)
+IMPORT_JOB_WORKERS = config('IMPORT_JOB_WORKERS', default=1, cast=int)
+IMPORT_TEMPO_MAX_SEGUNDOS = config('IMPORT_TEMPO_MAX_SEGUNDOS', default=3600, cast=int)
+IMPORT_RETENCAO_HORAS = config('IMPORT_RETENCAO_HORAS', default=24, cast=int)
+
 # Static files
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
@@ -92,6 +191,15 @@ EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@gestao-consultas.com')
 
+# Fila de envio de emails (core/email_queue.py): pool fixo de workers, cada um
+# com uma conexão SMTP persistente
+EMAIL_WORKERS = config('EMAIL_WORKERS', default=2, cast=int)
+EMAIL_QUEUE_MAX = config('EMAIL_QUEUE_MAX', default=1000, cast=int)
+EMAIL_BATCH_SIZE = config('EMAIL_BATCH_SIZE', default=20, cast=int)
+EMAIL_RATE_LIMIT = config('EMAIL_RATE_LIMIT', default=10, cast=float)  # emails/segundo (0 = sem limite)
+EMAIL_MAX_TENTATIVAS = config('EMAIL_MAX_TENTATIVAS', default=3, cast=int)
+EMAIL_BACKOFF_SEGUNDOS = config('EMAIL_BACKOFF_SEGUNDOS', default=2, cast=float)
+
 # Password Validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -130,6 +238,43 @@ MONGO_DB_URI = config('MONGO_DB_URI', default='mongodb://localhost:27017/')
 MONGO_DB_NAME = config('MONGO_DB_NAME', default='gestao_consultas_notas_clinicas')
 MONGO_COLLECTION_NAME = config('MONGO_COLLECTION_NAME', default='notas_clinicas')
 
+# Pool do cliente MongoDB partilhado (core/mongo_client.py), criado no arranque
+MONGO_MAX_POOL_SIZE = config('MONGO_MAX_POOL_SIZE', default=50, cast=int)
+MONGO_MIN_POOL_SIZE = config('MONGO_MIN_POOL_SIZE', default=5, cast=int)
+MONGO_MAX_IDLE_TIME_MS = config('MONGO_MAX_IDLE_TIME_MS', default=300000, cast=int)
+MONGO_SERVER_SELECTION_TIMEOUT_MS = config('MONGO_SERVER_SELECTION_TIMEOUT_MS', default=5000, cast=int)
+# Backoff (segundos) entre tentativas de religação quando o MongoDB está em baixo
+MONGO_RECONNECT_BACKOFF = config('MONGO_RECONNECT_BACKOFF', default=1, cast=float)
+MONGO_RECONNECT_BACKOFF_MAX = config('MONGO_RECONNECT_BACKOFF_MAX', default=60, cast=float)
+# Ligar o MongoDB no arranque do servidor web (wsgi.py/asgi.py); os outros
+# processos (scheduler, comandos) ligam sempre no primeiro uso
+MONGO_CONNECT_ON_STARTUP = config('MONGO_CONNECT_ON_STARTUP', default=True, cast=bool)
+# Pesquisa de notas com o índice invertido local em vez de $text (só para
+# servidores sem suporte para $text; o mongomock é detetado automaticamente)
+MONGO_PESQUISA_INDICE_LOCAL = config('MONGO_PESQUISA_INDICE_LOCAL', default=False, cast=bool)
+
+# Outbox de notas clínicas PostgreSQL -> MongoDB (core/outbox.py); a reserva
+# de um lote expira ao fim de OUTBOX_RESERVA_SEGUNDOS (worker morto a meio)
+OUTBOX_INTERVALO_SEGUNDOS = config('OUTBOX_INTERVALO_SEGUNDOS', default=5, cast=int)
+OUTBOX_BATCH_SIZE = config('OUTBOX_BATCH_SIZE', default=200, cast=int)
+OUTBOX_MAX_TENTATIVAS = config('OUTBOX_MAX_TENTATIVAS', default=10, cast=int)
+OUTBOX_BACKOFF_SEGUNDOS = config('OUTBOX_BACKOFF_SEGUNDOS', default=5, cast=int)
+OUTBOX_RESERVA_SEGUNDOS = config('OUTBOX_RESERVA_SEGUNDOS', default=300, cast=int)
+
+# Scheduler de tarefas (python manage.py run_scheduler, core/scheduler.py)
+SCHEDULER_TIMEZONE = config('SCHEDULER_TIMEZONE', default='Europe/Lisbon')
+SCHEDULER_WORKERS = config('SCHEDULER_WORKERS', default=4, cast=int)
+SCHEDULER_MISFIRE_GRACE_SEGUNDOS = config('SCHEDULER_MISFIRE_GRACE_SEGUNDOS', default=300, cast=int)
+# Advisory lock do PostgreSQL que elege o processo líder
+SCHEDULER_LOCK_ID = config('SCHEDULER_LOCK_ID', default=742001, cast=int)
+SCHEDULER_LEADER_CHECK_SEGUNDOS = config('SCHEDULER_LEADER_CHECK_SEGUNDOS', default=15, cast=int)
+SCHEDULER_HISTORICO_DIAS = config('SCHEDULER_HISTORICO_DIAS', default=7, cast=int)
+
+# Materialized views de relatórios (core/matviews.py): hora do refresh diário
+# e idade a partir da qual as páginas de admin as assinalam como desatualizadas
+MATVIEWS_REFRESH_HORA = config('MATVIEWS_REFRESH_HORA', default=2, cast=int)
+MATVIEWS_MAX_IDADE_HORAS = config('MATVIEWS_MAX_IDADE_HORAS', default=26, cast=int)
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -153,6 +153,29 @@ GRANT UPDATE ON "PACIENTES" TO app_enfermeiro_user;
 GRANT UPDATE ON "core_utilizador" TO app_enfermeiro_user;
 GRANT UPDATE ON "ENFERMEIRO" TO app_enfermeiro_user;
 
+-- ============================================================================
+-- 4.1 SLOTS MATERIALIZADOS (mantidos por triggers em nome de quem marca)
+-- ============================================================================
+
+GRANT SELECT, UPDATE ON "SLOTS" TO app_paciente_user;
+GRANT SELECT, INSERT, UPDATE, DELETE ON "SLOTS" TO app_medico_user;
+GRANT USAGE ON SEQUENCE "SLOTS_id_slot_seq" TO app_medico_user;
+GRANT SELECT, UPDATE ON "SLOTS" TO app_enfermeiro_user;
+
+-- Outbox de notas clínicas (escrito pelo médico ao registar a consulta)
+GRANT SELECT, INSERT ON "OUTBOX_NOTAS" TO app_medico_user;
+GRANT USAGE ON SEQUENCE "OUTBOX_NOTAS_id_evento_seq" TO app_medico_user;
+GRANT EXECUTE ON FUNCTION enfileirar_nota_outbox(INTEGER, JSONB) TO app_medico_user;
+
+-- Contador slots_ocupados (trg_slots_ocupados corre com o role de quem marca/cancela)
+GRANT UPDATE (slots_ocupados) ON "DISPONIBILIDADE" TO app_paciente_user;
+GRANT UPDATE (slots_ocupados) ON "DISPONIBILIDADE" TO app_enfermeiro_user;
+
+-- Versões de dados das exportações (os triggers trg_versao_* correm com o
+-- role de quem altera as tabelas e incrementam "VERSOES_DADOS")
+GRANT SELECT, INSERT, UPDATE ON "VERSOES_DADOS"
+    TO app_paciente_user, app_medico_user, app_enfermeiro_user;
+
 -- ============================================================================
 -- 5. PERMISSÕES PARA ADMINISTRADORES (Manutenção da BD)
 -- ============================================================================
@@ -226,6 +249,8 @@ GRANT SELECT ON vw_dashboard_admin TO app_admin_user;
 GRANT SELECT ON vw_disponibilidades_com_slots TO app_admin_user;
 GRANT SELECT ON vw_admin_ultimas_consultas TO app_admin_user;
 GRANT SELECT ON vw_consultas_com_fatura TO app_admin_user;
+GRANT SELECT ON mv_estatisticas_mensais, mv_ranking_medicos, mv_consultas_mensais, mv_receitas_mensais TO app_admin_user;
+GRANT SELECT ON "MATVIEW_REFRESH" TO app_admin_user;
 
 -- ============================================================================
 -- 7. PERMISSÕES PARA FUNÇÕES E PROCEDIMENTOS
@@ -249,6 +274,7 @@ GRANT EXECUTE ON FUNCTION obter_utilizador_por_email(VARCHAR) TO app_medico_user
 GRANT EXECUTE ON FUNCTION obter_utilizador_por_id(INTEGER) TO app_medico_user;
 GRANT EXECUTE ON FUNCTION validar_horario_disponibilidade(INTEGER, DATE, TIME) TO app_medico_user;
 GRANT EXECUTE ON PROCEDURE inserir_receita(INTEGER, INTEGER, TEXT, TEXT) TO app_medico_user;
+GRANT EXECUTE ON PROCEDURE inserir_receitas_lote(INTEGER, TEXT[], TEXT[], TEXT[], DATE, VARCHAR, INTEGER) TO app_medico_user;
 
 -- Enfermeiro: funções relacionadas a consultas e disponibilidade
 GRANT EXECUTE ON FUNCTION obter_paciente_por_utilizador(INTEGER) TO app_enfermeiro_user;
@@ -279,6 +305,18 @@ BEGIN
     END LOOP;
 END $$;
 
+-- ============================================================================
+-- 7.1 SET ROLE A PARTIR DO UTILIZADOR DA APLICAÇÃO
+-- ============================================================================
+-- Necessário para o SetPostgreSQLUserContextMiddleware: o utilizador com que
+-- o Django se liga (DB_USER) assume o role de cada request com
+-- set_config('role', ..., true). Executar este script com esse utilizador.
+
+GRANT app_paciente_user TO CURRENT_USER;
+GRANT app_medico_user TO CURRENT_USER;
+GRANT app_enfermeiro_user TO CURRENT_USER;
+GRANT app_admin_user TO CURRENT_USER;
+
 -- ============================================================================
 -- 8. VERIFICAÇÃO
 -- ============================================================================
@@ -177,4 +177,148 @@ CREATE TABLE IF NOT EXISTS "RECEITAS" (
 -- Índices úteis
 CREATE INDEX IF NOT EXISTS idx_consultas_data_estado ON "CONSULTAS"(data_consulta, estado);
 CREATE INDEX IF NOT EXISTS idx_disponibilidade_data ON "DISPONIBILIDADE"(data);
-CREATE INDEX IF NOT EXISTS idx_faturas_estado ON "FATURAS"(estado);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_faturas_estado ON "FATURAS"(estado);
+-- Slots materializados: uma linha por slot marcável de cada disponibilidade.
+-- Mantida pelos triggers de "DISPONIBILIDADE" e "CONSULTAS" (triggers.sql);
+-- reconstruir com SELECT reconstruir_slots();
+CREATE TABLE IF NOT EXISTS "SLOTS" (
+    id_slot SERIAL PRIMARY KEY,
+    id_disponibilidade INTEGER NOT NULL,
+    id_medico INTEGER NOT NULL,
+    id_unidade INTEGER NOT NULL,
+    data DATE NOT NULL,
+    hora_inicio TIME NOT NULL,
+    hora_fim TIME NOT NULL,
+    ocupado BOOLEAN NOT NULL DEFAULT FALSE,
+    id_consulta INTEGER NULL,
+    CONSTRAINT fk_slot_disponibilidade
+        FOREIGN KEY (id_disponibilidade) REFERENCES "DISPONIBILIDADE"(id_disponibilidade)
+        ON UPDATE CASCADE ON DELETE CASCADE,
+    CONSTRAINT fk_slot_consulta
+        FOREIGN KEY (id_consulta) REFERENCES "CONSULTAS"(id_consulta)
+        ON UPDATE CASCADE ON DELETE SET NULL,
+    CONSTRAINT uq_slot_disponibilidade_hora UNIQUE (id_disponibilidade, hora_inicio),
+    CONSTRAINT uq_slot_consulta UNIQUE (id_consulta)
+);
+
+-- Procura de slots livres por médico/dia
+CREATE INDEX IF NOT EXISTS idx_slots_medico_data_livres
+    ON "SLOTS"(id_medico, data, hora_inicio)
+    WHERE NOT ocupado;
+
+-- Sem marcações duplas: no máximo uma consulta ativa por slot e por médico/hora
+DROP INDEX IF EXISTS idx_consultas_disp_hora_ativas;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_consultas_disp_hora_ativas
+    ON "CONSULTAS"(id_disponibilidade, hora_consulta)
+    WHERE estado <> 'cancelada';
+CREATE UNIQUE INDEX IF NOT EXISTS uq_consultas_medico_horario_ativas
+    ON "CONSULTAS"(id_medico, data_consulta, hora_consulta)
+    WHERE estado <> 'cancelada';
+
+-- Pesquisa dos primeiros slots livres (keyset por data/hora/id_slot)
+CREATE INDEX IF NOT EXISTS idx_slots_livres_data_hora
+    ON "SLOTS"(data, hora_inicio, id_slot)
+    WHERE NOT ocupado;
+CREATE INDEX IF NOT EXISTS idx_disponibilidade_status_data_medico
+    ON "DISPONIBILIDADE"(status_slot, data, id_medico);
+
+-- Contador de consultas ativas por disponibilidade (mantido por trigger,
+-- substitui os COUNT(*) correlacionados de vw_disponibilidades)
+ALTER TABLE "DISPONIBILIDADE"
+    ADD COLUMN IF NOT EXISTS slots_ocupados INTEGER NOT NULL DEFAULT 0;
+
+-- Outbox de notas clínicas: cada registo de consulta grava aqui a nota, na
+-- mesma transação que o estado da consulta; o worker (core/outbox.py) envia
+-- os eventos pendentes para o MongoDB em lote.
+CREATE TABLE IF NOT EXISTS "OUTBOX_NOTAS" (
+    id_evento BIGSERIAL PRIMARY KEY,
+    id_consulta INTEGER NOT NULL,
+    payload JSONB NOT NULL,
+    criado_em TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    proxima_tentativa TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    ultimo_erro TEXT NULL,
+    processado_em TIMESTAMPTZ NULL,
+    CONSTRAINT fk_outbox_consulta
+        FOREIGN KEY (id_consulta) REFERENCES "CONSULTAS"(id_consulta)
+        ON UPDATE CASCADE ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_outbox_notas_pendentes
+    ON "OUTBOX_NOTAS"(proxima_tentativa, id_evento)
+    WHERE processado_em IS NULL;
+
+-- Lembretes: janela por data + hora da consulta (reservar_lembretes)
+CREATE INDEX IF NOT EXISTS idx_consultas_estado_data_hora
+    ON "CONSULTAS"(estado, (data_consulta + hora_consulta));
+
+-- Registo de lembretes: um por consulta e tipo ('24h', '2h'). A linha é
+-- criada quando o lembrete é reservado (reservar_lembretes) e enviado_em é
+-- preenchido quando o email é entregue à fila de envio.
+CREATE TABLE IF NOT EXISTS "LEMBRETES" (
+    id_lembrete SERIAL PRIMARY KEY,
+    id_consulta INTEGER NOT NULL,
+    tipo_lembrete VARCHAR(10) NOT NULL,
+    reservado_em TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    enviado_em TIMESTAMPTZ NULL,
+    tentativas INTEGER NOT NULL DEFAULT 1,
+    CONSTRAINT uq_lembretes_consulta_tipo UNIQUE (id_consulta, tipo_lembrete),
+    CONSTRAINT fk_lembrete_consulta
+        FOREIGN KEY (id_consulta) REFERENCES "CONSULTAS"(id_consulta)
+        ON UPDATE CASCADE ON DELETE CASCADE
+);
+
+-- Lembretes reservados mas ainda não enviados
+CREATE INDEX IF NOT EXISTS idx_lembretes_pendentes
+    ON "LEMBRETES"(tipo_lembrete, reservado_em)
+    WHERE enviado_em IS NULL;
+
+-- Contadores globais do dashboard admin (pacientes, medicos, enfermeiros,
+-- unidades). Mantidos pelos triggers trg_contador_* (triggers.sql);
+-- reconstruir com SELECT recalcular_contadores();
+CREATE TABLE IF NOT EXISTS "CONTADORES" (
+    nome VARCHAR(50) PRIMARY KEY,
+    valor BIGINT NOT NULL DEFAULT 0
+);
+
+-- Dashboard admin: faturas pendentes e receita do mês num único range scan
+DROP INDEX IF EXISTS idx_faturas_estado;
+CREATE INDEX IF NOT EXISTS idx_faturas_estado_pagamento
+    ON "FATURAS"(estado, data_pagamento);
+
+-- Listagens admin com paginação keyset (listar_consultas_admin,
+-- listar_faturas_admin, listar_utilizadores_admin) e últimas consultas do
+-- dashboard: cada página é um range scan do índice na ordem da listagem
+CREATE INDEX IF NOT EXISTS idx_consultas_data_hora_id
+    ON "CONSULTAS"(data_consulta, hora_consulta, id_consulta);
+CREATE INDEX IF NOT EXISTS idx_consultas_estado_data_hora_id
+    ON "CONSULTAS"(estado, data_consulta, hora_consulta, id_consulta);
+CREATE INDEX IF NOT EXISTS idx_faturas_estado_id
+    ON "FATURAS"(estado, id_fatura);
+CREATE INDEX IF NOT EXISTS idx_core_utilizador_data_registo_id
+    ON "core_utilizador"(data_registo, id_utilizador);
+CREATE INDEX IF NOT EXISTS idx_core_utilizador_role_data_registo_id
+    ON "core_utilizador"(role, data_registo, id_utilizador);
+
+-- Versões de dados das exportações em background (core/exportacao_jobs.py):
+-- cada statement que altera uma destas tabelas incrementa um contador, na
+-- transação de quem altera (triggers trg_versao_*, triggers.sql), e uma
+-- exportação em cache só é reutilizada enquanto as versões das suas tabelas
+-- não mudarem. Por ser transacional, o incremento só fica visível com o
+-- commit dos dados: uma exportação pedida com a alteração ainda por
+-- confirmar é gerada e guardada com a versão anterior. Cada tabela tem
+-- 16 linhas (slot = pg_backend_pid() % 16) e a versão é a soma,
+-- para que writers concorrentes raramente esperem pelo lock da mesma linha.
+CREATE TABLE IF NOT EXISTS "VERSOES_DADOS" (
+    nome VARCHAR(50) NOT NULL,
+    slot SMALLINT NOT NULL,
+    versao BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (nome, slot)
+);
+
+-- Números de utente (gerar_n_utentes, funcoes.sql): atribuídos em bloco a
+-- partir de uma sequência em vez de números aleatórios testados um a um
+CREATE SEQUENCE IF NOT EXISTS n_utente_seq
+    MINVALUE 1000000000
+    MAXVALUE 9999999999
+    START WITH 1000000000;
@@ -2,29 +2,38 @@
 -- FUNÇÕES DO SISTEMA
 -- ============================================================================
 
--- Função para gerar número de utente único (10 dígitos)
-CREATE OR REPLACE FUNCTION gerar_n_utente() 
-RETURNS VARCHAR(10) AS $$
+-- Função para reservar p_quantidade números de utente únicos (10 dígitos)
+-- da sequência n_utente_seq. Os números já atribuídos pelo gerador aleatório
+-- antigo são saltados (a sequência nunca devolve o mesmo valor duas vezes)
+CREATE OR REPLACE FUNCTION gerar_n_utentes(p_quantidade INTEGER)
+RETURNS TABLE (n_utente VARCHAR(20))
+LANGUAGE plpgsql
+AS $$
 DECLARE
-    novo_numero VARCHAR(10);
-    tentativas INTEGER := 0;
-BEGIN
-    WHILE tentativas < 1000 LOOP
-        -- Gerar número aleatório de 10 dígitos
-        novo_numero := lpad(floor(random() * 10000000000)::bigint::text, 10, '0');
-        
-        -- Verificar se não existe
-        IF NOT EXISTS (SELECT 1 FROM "core_utilizador" WHERE n_utente = novo_numero) THEN
-            RETURN novo_numero;
-        END IF;
-        
-        tentativas := tentativas + 1;
+    v_em_falta INTEGER := p_quantidade;
+    v_obtidos INTEGER;
+BEGIN
+    WHILE v_em_falta > 0 LOOP
+        RETURN QUERY
+        SELECT c.numero::VARCHAR(20)
+        FROM (
+            SELECT nextval('n_utente_seq')::TEXT AS numero
+            FROM generate_series(1, v_em_falta)
+        ) c
+        WHERE NOT EXISTS (
+            SELECT 1 FROM "core_utilizador" u WHERE u.n_utente = c.numero
+        );
+        GET DIAGNOSTICS v_obtidos = ROW_COUNT;
+        v_em_falta := v_em_falta - v_obtidos;
     END LOOP;
-    
-    -- Fallback: timestamp + random
-    RETURN to_char(EXTRACT(EPOCH FROM now())::bigint, 'FM9999999999');
 END;
-$$ LANGUAGE plpgsql;
+$$;
+
+-- Função para gerar número de utente único (10 dígitos)
+CREATE OR REPLACE FUNCTION gerar_n_utente() 
+RETURNS VARCHAR(10) AS $$
+    SELECT n_utente FROM gerar_n_utentes(1);
+$$ LANGUAGE sql;
 
 -- Função para validar se horário está dentro do período de disponibilidade
 CREATE OR REPLACE FUNCTION validar_horario_disponibilidade(
@@ -206,8 +215,28 @@ BEGIN
 END;
 $$;
 
+-- Função para estimar o número de linhas de uma tabela a partir das
+-- estatísticas do planeador (reltuples); NULL se a tabela nunca foi analisada
+CREATE OR REPLACE FUNCTION estimar_linhas_tabela(p_tabela VARCHAR)
+RETURNS BIGINT
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT CASE WHEN c.reltuples >= 0 THEN c.reltuples::BIGINT END
+    FROM pg_class c
+    WHERE c.oid = to_regclass(quote_ident(p_tabela));
+$$;
+
 -- Função para listar utilizadores (admin) com filtro opcional por role
-CREATE OR REPLACE FUNCTION listar_utilizadores_admin(p_role VARCHAR DEFAULT NULL)
+-- (paginação keyset por (data_registo, id_utilizador) desc a partir do último
+-- utilizador da página anterior)
+DROP FUNCTION IF EXISTS listar_utilizadores_admin(VARCHAR);
+CREATE OR REPLACE FUNCTION listar_utilizadores_admin(
+    p_role VARCHAR DEFAULT NULL,
+    p_limite INTEGER DEFAULT 50,
+    p_apos_data_registo TIMESTAMPTZ DEFAULT NULL,
+    p_apos_id INTEGER DEFAULT NULL
+)
 RETURNS TABLE (
     id_utilizador INTEGER,
     nome VARCHAR(255),
@@ -219,6 +248,7 @@ RETURNS TABLE (
     role_display VARCHAR(50)
 )
 LANGUAGE plpgsql
+STABLE
 AS $$
 BEGIN
     RETURN QUERY
@@ -229,7 +259,7 @@ BEGIN
         u.telefone,
         u.role,
         u.ativo,
-        u.data_registo::timestamp,
+        u.data_registo,
         CASE u.role
             WHEN 'admin' THEN 'Administrador'
             WHEN 'medico' THEN 'Médico'
@@ -239,7 +269,49 @@ BEGIN
         END AS role_display
     FROM "core_utilizador" u
     WHERE (p_role IS NULL OR p_role = '' OR u.role = p_role)
-    ORDER BY u.data_registo DESC;
+      AND (
+          p_apos_id IS NULL
+          OR (u.data_registo, u.id_utilizador) < (p_apos_data_registo, p_apos_id)
+      )
+    ORDER BY u.data_registo DESC, u.id_utilizador DESC
+    LIMIT p_limite;
+END;
+$$;
+
+-- Função para contar utilizadores (admin): estimativa do planeador sem
+-- filtros (estimado), contagem exata até p_max com filtro (limitado = TRUE
+-- se há mais de p_max linhas)
+CREATE OR REPLACE FUNCTION contar_utilizadores_admin(
+    p_role VARCHAR DEFAULT NULL,
+    p_max INTEGER DEFAULT 10000
+)
+RETURNS TABLE (
+    total BIGINT,
+    estimado BOOLEAN,
+    limitado BOOLEAN
+)
+LANGUAGE plpgsql
+STABLE
+AS $$
+DECLARE
+    v_total BIGINT;
+BEGIN
+    IF p_role IS NULL OR p_role = '' THEN
+        SELECT estimar_linhas_tabela('core_utilizador') INTO v_total;
+        IF v_total IS NOT NULL THEN
+            RETURN QUERY SELECT v_total, TRUE, FALSE;
+            RETURN;
+        END IF;
+    END IF;
+
+    SELECT COUNT(*) INTO v_total
+    FROM (
+        SELECT 1
+        FROM "core_utilizador" u
+        WHERE (p_role IS NULL OR p_role = '' OR u.role = p_role)
+        LIMIT p_max + 1
+    ) x;
+    RETURN QUERY SELECT LEAST(v_total, p_max::BIGINT), FALSE, v_total > p_max;
 END;
 $$;
 
@@ -303,10 +375,16 @@ END;
 $$;
 
 -- Função para listar consultas (admin) com filtros
+-- (paginação keyset por (data_consulta, hora_consulta, id_consulta) desc a
+-- partir da última consulta da página anterior)
+DROP FUNCTION IF EXISTS listar_consultas_admin(VARCHAR, DATE, INTEGER);
 CREATE OR REPLACE FUNCTION listar_consultas_admin(
     p_estado VARCHAR DEFAULT NULL,
     p_data DATE DEFAULT NULL,
-    p_limite INTEGER DEFAULT 100
+    p_limite INTEGER DEFAULT 50,
+    p_apos_data DATE DEFAULT NULL,
+    p_apos_hora TIME DEFAULT NULL,
+    p_apos_id INTEGER DEFAULT NULL
 )
 RETURNS TABLE (
     id_consulta INTEGER,
@@ -317,6 +395,7 @@ RETURNS TABLE (
     medico_nome VARCHAR(255)
 )
 LANGUAGE plpgsql
+STABLE
 AS $$
 BEGIN
     RETURN QUERY
@@ -334,11 +413,52 @@ BEGIN
     JOIN "core_utilizador" u_m ON m.id_utilizador = u_m.id_utilizador
     WHERE (p_estado IS NULL OR p_estado = '' OR c.estado = p_estado)
       AND (p_data IS NULL OR c.data_consulta = p_data)
-    ORDER BY c.data_consulta DESC, c.hora_consulta DESC
+      AND (
+          p_apos_id IS NULL
+          OR (c.data_consulta, c.hora_consulta, c.id_consulta) < (p_apos_data, p_apos_hora, p_apos_id)
+      )
+    ORDER BY c.data_consulta DESC, c.hora_consulta DESC, c.id_consulta DESC
     LIMIT p_limite;
 END;
 $$;
 
+-- Função para contar consultas (admin), como contar_utilizadores_admin
+CREATE OR REPLACE FUNCTION contar_consultas_admin(
+    p_estado VARCHAR DEFAULT NULL,
+    p_data DATE DEFAULT NULL,
+    p_max INTEGER DEFAULT 10000
+)
+RETURNS TABLE (
+    total BIGINT,
+    estimado BOOLEAN,
+    limitado BOOLEAN
+)
+LANGUAGE plpgsql
+STABLE
+AS $$
+DECLARE
+    v_total BIGINT;
+BEGIN
+    IF (p_estado IS NULL OR p_estado = '') AND p_data IS NULL THEN
+        SELECT estimar_linhas_tabela('CONSULTAS') INTO v_total;
+        IF v_total IS NOT NULL THEN
+            RETURN QUERY SELECT v_total, TRUE, FALSE;
+            RETURN;
+        END IF;
+    END IF;
+
+    SELECT COUNT(*) INTO v_total
+    FROM (
+        SELECT 1
+        FROM "CONSULTAS" c
+        WHERE (p_estado IS NULL OR p_estado = '' OR c.estado = p_estado)
+          AND (p_data IS NULL OR c.data_consulta = p_data)
+        LIMIT p_max + 1
+    ) x;
+    RETURN QUERY SELECT LEAST(v_total, p_max::BIGINT), FALSE, v_total > p_max;
+END;
+$$;
+
 -- Função para obter consulta por ID (admin)
 CREATE OR REPLACE FUNCTION obter_consulta_admin_por_id(p_id_consulta INTEGER)
 RETURNS TABLE (
@@ -372,7 +492,175 @@ BEGIN
 END;
 $$;
 
+-- Motor de slots: grelha de slots de várias disponibilidades numa só query
+-- (lida da tabela materializada "SLOTS", mantida por triggers)
+CREATE OR REPLACE FUNCTION obter_slots_disponibilidades(p_ids INTEGER[])
+RETURNS TABLE (
+    id_disponibilidade INTEGER,
+    data DATE,
+    hora_inicio TIME,
+    hora_fim TIME,
+    disponivel BOOLEAN,
+    id_consulta INTEGER
+)
+LANGUAGE plpgsql
+STABLE
+AS $$
+BEGIN
+    RETURN QUERY
+    SELECT
+        s.id_disponibilidade,
+        s.data,
+        s.hora_inicio,
+        s.hora_fim,
+        NOT s.ocupado AS disponivel,
+        s.id_consulta
+    FROM "SLOTS" s
+    WHERE s.id_disponibilidade = ANY(p_ids)
+    ORDER BY s.data, s.id_disponibilidade, s.hora_inicio;
+END;
+$$;
+
+-- Função para recalcular o contador slots_ocupados de todas as disponibilidades
+-- (manutenção; em funcionamento normal é mantido pelo trigger)
+CREATE OR REPLACE FUNCTION recalcular_slots_ocupados()
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_total INTEGER;
+BEGIN
+    UPDATE "DISPONIBILIDADE" d
+    SET slots_ocupados = COALESCE(c.total, 0)
+    FROM "DISPONIBILIDADE" d2
+    LEFT JOIN (
+        SELECT id_disponibilidade, COUNT(*) AS total
+        FROM "CONSULTAS"
+        WHERE estado <> 'cancelada'
+        AND id_disponibilidade IS NOT NULL
+        GROUP BY id_disponibilidade
+    ) c ON c.id_disponibilidade = d2.id_disponibilidade
+    WHERE d.id_disponibilidade = d2.id_disponibilidade
+    AND d.slots_ocupados IS DISTINCT FROM COALESCE(c.total, 0);
+
+    GET DIAGNOSTICS v_total = ROW_COUNT;
+    RETURN v_total;
+END;
+$$;
+
+-- Função para obter os N primeiros slots livres de todos os médicos
+-- (filtros opcionais por especialidade/unidade/região, paginação keyset
+-- por (data, hora_inicio, id_slot) a partir do último slot da página anterior)
+CREATE OR REPLACE FUNCTION obter_primeiros_slots_livres(
+    p_id_especialidade INTEGER DEFAULT NULL,
+    p_id_unidade INTEGER DEFAULT NULL,
+    p_id_regiao INTEGER DEFAULT NULL,
+    p_limite INTEGER DEFAULT 20,
+    p_apos_data DATE DEFAULT NULL,
+    p_apos_hora TIME DEFAULT NULL,
+    p_apos_id_slot INTEGER DEFAULT NULL
+)
+RETURNS TABLE (
+    id_slot INTEGER,
+    id_disponibilidade INTEGER,
+    id_medico INTEGER,
+    medico_nome VARCHAR(255),
+    especialidade_nome VARCHAR(255),
+    id_unidade INTEGER,
+    nome_unidade VARCHAR(255),
+    data DATE,
+    hora_inicio TIME,
+    hora_fim TIME
+)
+LANGUAGE plpgsql
+STABLE
+AS $$
+BEGIN
+    RETURN QUERY
+    SELECT
+        s.id_slot,
+        s.id_disponibilidade,
+        s.id_medico,
+        u.nome AS medico_nome,
+        COALESCE(e.nome_especialidade, 'Sem especialidade') AS especialidade_nome,
+        s.id_unidade,
+        un.nome_unidade,
+        s.data,
+        s.hora_inicio,
+        s.hora_fim
+    FROM "SLOTS" s
+    JOIN "DISPONIBILIDADE" d ON d.id_disponibilidade = s.id_disponibilidade
+    JOIN "MEDICOS" m ON s.id_medico = m.id_medico
+    JOIN "core_utilizador" u ON m.id_utilizador = u.id_utilizador
+    JOIN "UNIDADE_DE_SAUDE" un ON s.id_unidade = un.id_unidade
+    LEFT JOIN "ESPECIALIDADES" e ON m.id_especialidade = e.id_especialidade
+    WHERE NOT s.ocupado
+      AND d.status_slot IN ('disponivel', 'available')
+      AND u.ativo = TRUE
+      AND (s.data, s.hora_inicio) > (CURRENT_DATE, LOCALTIME)
+      AND (p_id_especialidade IS NULL OR m.id_especialidade = p_id_especialidade)
+      AND (p_id_unidade IS NULL OR s.id_unidade = p_id_unidade)
+      AND (p_id_regiao IS NULL OR un.id_regiao = p_id_regiao)
+      AND (
+          p_apos_data IS NULL
+          OR (s.data, s.hora_inicio, s.id_slot) > (p_apos_data, p_apos_hora, p_apos_id_slot)
+      )
+    ORDER BY s.data, s.hora_inicio, s.id_slot
+    LIMIT p_limite;
+END;
+$$;
+
+-- Função para (re)gerar os slots materializados de uma disponibilidade
+-- (ou de todas, com NULL), marcando os já ocupados por consultas ativas
+CREATE OR REPLACE FUNCTION reconstruir_slots(p_id_disponibilidade INTEGER DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_total INTEGER;
+BEGIN
+    DELETE FROM "SLOTS" s
+    WHERE p_id_disponibilidade IS NULL
+       OR s.id_disponibilidade = p_id_disponibilidade;
+
+    INSERT INTO "SLOTS" (
+        id_disponibilidade, id_medico, id_unidade, data,
+        hora_inicio, hora_fim, ocupado, id_consulta
+    )
+    SELECT
+        d.id_disponibilidade,
+        d.id_medico,
+        d.id_unidade,
+        d.data,
+        gs.slot_inicio::time,
+        (gs.slot_inicio + make_interval(mins => d.duracao_slot))::time,
+        c.id_consulta IS NOT NULL,
+        c.id_consulta
+    FROM "DISPONIBILIDADE" d
+    JOIN LATERAL generate_series(
+        d.data + d.hora_inicio,
+        d.data + d.hora_fim - make_interval(mins => d.duracao_slot),
+        make_interval(mins => d.duracao_slot)
+    ) AS gs(slot_inicio) ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT c2.id_consulta
+        FROM "CONSULTAS" c2
+        WHERE c2.id_disponibilidade = d.id_disponibilidade
+          AND c2.hora_consulta = gs.slot_inicio::time
+          AND c2.estado <> 'cancelada'
+        ORDER BY c2.id_consulta
+        LIMIT 1
+    ) c ON TRUE
+    WHERE d.duracao_slot > 0
+      AND (p_id_disponibilidade IS NULL OR d.id_disponibilidade = p_id_disponibilidade);
+
+    GET DIAGNOSTICS v_total = ROW_COUNT;
+    RETURN v_total;
+END;
+$$;
+
 -- Função para listar disponibilidades (admin) com filtros
+-- Devolve apenas os slots livres (via obter_slots_disponibilidades)
 CREATE OR REPLACE FUNCTION listar_disponibilidades_admin(
     p_id_unidade INTEGER,
     p_data DATE,
@@ -390,32 +678,26 @@ AS $$
 BEGIN
     RETURN QUERY
     SELECT
-        d.id_disponibilidade,
-        gs.slot_inicio::time AS hora_inicio,
-        (gs.slot_inicio + (d.duracao_slot || ' minutes')::interval)::time AS hora_fim,
+        s.id_disponibilidade,
+        s.hora_inicio,
+        s.hora_fim,
         u.nome AS medico_nome,
         COALESCE(e.nome_especialidade, 'Sem especialidade') AS especialidade_nome
-    FROM "DISPONIBILIDADE" d
+    FROM obter_slots_disponibilidades(ARRAY(
+        SELECT d.id_disponibilidade
+        FROM "DISPONIBILIDADE" d
+        JOIN "MEDICOS" m ON d.id_medico = m.id_medico
+        WHERE d.id_unidade = p_id_unidade
+          AND d.data = p_data
+          AND d.status_slot IN ('disponivel', 'available')
+          AND (p_id_especialidade IS NULL OR m.id_especialidade = p_id_especialidade)
+    )) s
+    JOIN "DISPONIBILIDADE" d ON d.id_disponibilidade = s.id_disponibilidade
     JOIN "MEDICOS" m ON d.id_medico = m.id_medico
     JOIN "core_utilizador" u ON m.id_utilizador = u.id_utilizador
     LEFT JOIN "ESPECIALIDADES" e ON m.id_especialidade = e.id_especialidade
-    JOIN LATERAL generate_series(
-        d.hora_inicio,
-        d.hora_fim - (d.duracao_slot || ' minutes')::interval,
-        (d.duracao_slot || ' minutes')::interval
-    ) AS gs(slot_inicio) ON TRUE
-    WHERE d.id_unidade = p_id_unidade
-      AND d.data = p_data
-      AND d.status_slot IN ('disponivel', 'available')
-      AND (p_id_especialidade IS NULL OR m.id_especialidade = p_id_especialidade)
-      AND NOT EXISTS (
-          SELECT 1
-          FROM "CONSULTAS" c
-          WHERE c.id_disponibilidade = d.id_disponibilidade
-            AND c.hora_consulta = gs.slot_inicio::time
-            AND c.estado NOT IN ('cancelada')
-      )
-    ORDER BY gs.slot_inicio;
+    WHERE s.disponivel
+    ORDER BY s.hora_inicio;
 END;
 $$;
 
@@ -471,9 +753,12 @@ END;
 $$;
 
 -- Função para listar faturas (admin) com filtro opcional por estado
+-- (paginação keyset por id_fatura desc a partir da última fatura da página anterior)
+DROP FUNCTION IF EXISTS listar_faturas_admin(VARCHAR, INTEGER);
 CREATE OR REPLACE FUNCTION listar_faturas_admin(
     p_estado VARCHAR DEFAULT NULL,
-    p_limite INTEGER DEFAULT 100
+    p_limite INTEGER DEFAULT 50,
+    p_apos_id INTEGER DEFAULT NULL
 )
 RETURNS TABLE (
     id_fatura INTEGER,
@@ -485,6 +770,7 @@ RETURNS TABLE (
     data_pagamento DATE
 )
 LANGUAGE plpgsql
+STABLE
 AS $$
 BEGIN
     RETURN QUERY
@@ -498,11 +784,47 @@ BEGIN
         f.data_pagamento
     FROM vw_faturas_completas f
     WHERE (p_estado IS NULL OR p_estado = '' OR f.estado_fatura = p_estado)
+      AND (p_apos_id IS NULL OR f.id_fatura < p_apos_id)
     ORDER BY f.id_fatura DESC
     LIMIT p_limite;
 END;
 $$;
 
+-- Função para contar faturas (admin), como contar_utilizadores_admin
+CREATE OR REPLACE FUNCTION contar_faturas_admin(
+    p_estado VARCHAR DEFAULT NULL,
+    p_max INTEGER DEFAULT 10000
+)
+RETURNS TABLE (
+    total BIGINT,
+    estimado BOOLEAN,
+    limitado BOOLEAN
+)
+LANGUAGE plpgsql
+STABLE
+AS $$
+DECLARE
+    v_total BIGINT;
+BEGIN
+    IF p_estado IS NULL OR p_estado = '' THEN
+        SELECT estimar_linhas_tabela('FATURAS') INTO v_total;
+        IF v_total IS NOT NULL THEN
+            RETURN QUERY SELECT v_total, TRUE, FALSE;
+            RETURN;
+        END IF;
+    END IF;
+
+    SELECT COUNT(*) INTO v_total
+    FROM (
+        SELECT 1
+        FROM "FATURAS" f
+        WHERE (p_estado IS NULL OR p_estado = '' OR f.estado = p_estado)
+        LIMIT p_max + 1
+    ) x;
+    RETURN QUERY SELECT LEAST(v_total, p_max::BIGINT), FALSE, v_total > p_max;
+END;
+$$;
+
 -- Função para obter fatura por ID (admin)
 CREATE OR REPLACE FUNCTION obter_fatura_admin_por_id(p_id_fatura INTEGER)
 RETURNS TABLE (
@@ -684,6 +1006,10 @@ BEGIN
 END;
 $$;
 
+-- As funções de listagem/detalhe dos relatórios são LANGUAGE sql STABLE para
+-- o planeador as expandir na query (inlining): num cursor do lado do servidor
+-- (exportações em streaming, core/exportacao.py) as linhas chegam à medida que
+-- são lidas, em vez de o resultado ser todo materializado pela função
 CREATE OR REPLACE FUNCTION relatorio_faturas_listar(
     p_data_inicio DATE DEFAULT NULL,
     p_data_fim DATE DEFAULT NULL,
@@ -702,10 +1028,9 @@ RETURNS TABLE (
     data_consulta DATE,
     hora_consulta TIME
 )
-LANGUAGE plpgsql
+LANGUAGE sql
+STABLE
 AS $$
-BEGIN
-    RETURN QUERY
     SELECT
         v.id_fatura,
         v.data_pagamento,
@@ -723,7 +1048,6 @@ BEGIN
       AND (p_data_fim IS NULL OR v.data_pagamento <= p_data_fim)
       AND (p_estado IS NULL OR v.estado_fatura = p_estado)
     ORDER BY v.id_fatura DESC;
-END;
 $$;
 
 CREATE OR REPLACE FUNCTION relatorio_faturas_stats(
@@ -798,10 +1122,9 @@ RETURNS TABLE (
     medico_nome VARCHAR(255),
     especialidade_nome VARCHAR(255)
 )
-LANGUAGE plpgsql
+LANGUAGE sql
+STABLE
 AS $$
-BEGIN
-    RETURN QUERY
     SELECT
         v.id_fatura,
         v.data_pagamento,
@@ -823,7 +1146,6 @@ BEGIN
       AND (p_estado IS NULL OR v.estado_fatura = p_estado)
     ORDER BY v.id_fatura DESC
     LIMIT p_limite;
-END;
 $$;
 
 CREATE OR REPLACE FUNCTION relatorio_consultas_listar(
@@ -845,10 +1167,9 @@ RETURNS TABLE (
     id_fatura INTEGER,
     criado_em TIMESTAMP
 )
-LANGUAGE plpgsql
+LANGUAGE sql
+STABLE
 AS $$
-BEGIN
-    RETURN QUERY
     SELECT
         c.id_consulta,
         c.data_consulta,
@@ -867,7 +1188,6 @@ BEGIN
       AND (p_estado IS NULL OR c.estado = p_estado)
       AND (p_medico_id IS NULL OR c.id_medico = p_medico_id)
     ORDER BY c.data_consulta DESC, c.hora_consulta DESC;
-END;
 $$;
 
 CREATE OR REPLACE FUNCTION relatorio_consultas_total(
@@ -915,10 +1235,9 @@ RETURNS TABLE (
     fatura_valor NUMERIC,
     fatura_estado VARCHAR(50)
 )
-LANGUAGE plpgsql
+LANGUAGE sql
+STABLE
 AS $$
-BEGIN
-    RETURN QUERY
     SELECT
         c.id_consulta,
         c.data_consulta,
@@ -940,7 +1259,6 @@ BEGIN
       AND (p_medico_id IS NULL OR c.id_medico = p_medico_id)
     ORDER BY c.data_consulta DESC, c.hora_consulta DESC
     LIMIT p_limite;
-END;
 $$;
 
 -- Função para listar especialidades
@@ -2360,7 +2678,9 @@ BEGIN
 END;
 $$;
 
--- Função para obter estatísticas do dashboard admin
+-- Função para obter estatísticas do dashboard admin numa única query: totais
+-- globais de "CONTADORES" e uma passagem com FILTER sobre as consultas
+-- agendadas/confirmadas e sobre as faturas pendentes/pagas no mês
 CREATE OR REPLACE FUNCTION obter_dashboard_admin_stats(p_inicio_mes DATE)
 RETURNS TABLE (
         total_pacientes BIGINT,
@@ -2378,35 +2698,54 @@ AS $$
 DECLARE
         v_hoje DATE := CURRENT_DATE;
 BEGIN
-        SELECT COUNT(*) INTO total_pacientes FROM "PACIENTES";
-        SELECT COUNT(*) INTO total_medicos FROM "MEDICOS";
-        SELECT COUNT(*) INTO total_enfermeiros FROM "ENFERMEIRO";
-        SELECT COUNT(*) INTO total_unidades FROM "UNIDADE_DE_SAUDE";
-
-        SELECT COUNT(*) INTO consultas_hoje_confirmadas
-        FROM "CONSULTAS"
-        WHERE data_consulta = v_hoje
-            AND estado = 'confirmada';
-
-        SELECT COUNT(*) INTO consultas_mes_confirmadas
-        FROM "CONSULTAS"
-        WHERE data_consulta >= p_inicio_mes
-            AND estado = 'confirmada';
-
-        SELECT COUNT(*) INTO consultas_pendentes
-        FROM "CONSULTAS"
-        WHERE estado = 'agendada';
-
-        SELECT COUNT(*) INTO faturas_pendentes
-        FROM "FATURAS"
-        WHERE estado = 'pendente';
-
-        SELECT COALESCE(SUM(valor), 0) INTO receita_mes
-        FROM "FATURAS"
-        WHERE estado = 'paga'
-            AND data_pagamento >= p_inicio_mes;
-
-        RETURN NEXT;
+        RETURN QUERY
+        WITH contadores AS (
+            SELECT
+                COALESCE(MAX(ct.valor) FILTER (WHERE ct.nome = 'pacientes'), 0)::BIGINT AS pacientes,
+                COALESCE(MAX(ct.valor) FILTER (WHERE ct.nome = 'medicos'), 0)::BIGINT AS medicos,
+                COALESCE(MAX(ct.valor) FILTER (WHERE ct.nome = 'enfermeiros'), 0)::BIGINT AS enfermeiros,
+                COALESCE(MAX(ct.valor) FILTER (WHERE ct.nome = 'unidades'), 0)::BIGINT AS unidades
+            FROM "CONTADORES" ct
+        ),
+        consultas AS (
+            -- Só consultas em aberto: usa o índice (estado, data + hora)
+            SELECT
+                COUNT(*) FILTER (WHERE c.estado = 'confirmada' AND c.data_consulta = v_hoje) AS hoje,
+                COUNT(*) FILTER (WHERE c.estado = 'confirmada' AND c.data_consulta >= p_inicio_mes) AS mes,
+                COUNT(*) FILTER (WHERE c.estado = 'agendada') AS pendentes
+            FROM "CONSULTAS" c
+            WHERE c.estado IN ('agendada', 'confirmada')
+        ),
+        faturas AS (
+            -- Pendentes + pagas no mês: dois ranges do índice (estado, data_pagamento)
+            SELECT
+                COUNT(*) FILTER (WHERE f.estado = 'pendente') AS pendentes,
+                COALESCE(SUM(f.valor) FILTER (WHERE f.estado = 'paga'), 0) AS receita
+            FROM "FATURAS" f
+            WHERE f.estado = 'pendente'
+               OR (f.estado = 'paga' AND f.data_pagamento >= p_inicio_mes)
+        )
+        SELECT ct.pacientes, ct.medicos, ct.enfermeiros, ct.unidades,
+               c.hoje, c.mes, c.pendentes,
+               f.pendentes, f.receita
+        FROM contadores ct, consultas c, faturas f;
+END;
+$$;
+
+-- Função para recalcular a tabela "CONTADORES" a partir das tabelas
+-- (depois de um TRUNCATE ou se os contadores divergirem)
+CREATE OR REPLACE FUNCTION recalcular_contadores()
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+        INSERT INTO "CONTADORES" AS ct (nome, valor)
+        VALUES
+            ('pacientes', (SELECT COUNT(*) FROM "PACIENTES")),
+            ('medicos', (SELECT COUNT(*) FROM "MEDICOS")),
+            ('enfermeiros', (SELECT COUNT(*) FROM "ENFERMEIRO")),
+            ('unidades', (SELECT COUNT(*) FROM "UNIDADE_DE_SAUDE"))
+        ON CONFLICT (nome) DO UPDATE SET valor = EXCLUDED.valor;
 END;
 $$;
 
@@ -2644,6 +2983,55 @@ BEGIN
 END;
 $$;
 
+-- Função para obter o perfil completo do utilizador (utilizador + ids do role)
+-- Usada pela cache de perfis (core/user_cache.py): uma só query por utilizador
+CREATE OR REPLACE FUNCTION obter_perfil_utilizador(p_id_utilizador INTEGER)
+RETURNS TABLE (
+    id_utilizador INTEGER,
+    nome VARCHAR(255),
+    email VARCHAR(255),
+    password VARCHAR(128),
+    telefone VARCHAR(20),
+    n_utente VARCHAR(20),
+    role VARCHAR(20),
+    data_registo TIMESTAMPTZ,
+    ativo BOOLEAN,
+    email_verified BOOLEAN,
+    last_login TIMESTAMPTZ,
+    is_superuser BOOLEAN,
+    id_paciente INTEGER,
+    id_medico INTEGER,
+    id_enfermeiro INTEGER
+) 
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    SELECT 
+        u.id_utilizador,
+        u.nome,
+        u.email,
+        u.password,
+        u.telefone,
+        u.n_utente,
+        u.role,
+        u.data_registo,
+        u.ativo,
+        u.email_verified,
+        u.last_login,
+        COALESCE(u.is_superuser, FALSE) as is_superuser,
+        p.id_paciente,
+        m.id_medico,
+        e.id_enfermeiro
+    FROM "core_utilizador" u
+    LEFT JOIN "PACIENTES" p ON p.id_utilizador = u.id_utilizador
+    LEFT JOIN "MEDICOS" m ON m.id_utilizador = u.id_utilizador
+    LEFT JOIN "ENFERMEIRO" e ON e.id_utilizador = u.id_utilizador
+    WHERE u.id_utilizador = p_id_utilizador
+    LIMIT 1;
+END;
+$$;
+
 -- Função para obter consultas com filtros de data
 CREATE OR REPLACE FUNCTION obter_consultas_com_filtros(
     p_id_paciente INTEGER DEFAULT NULL,
@@ -2728,8 +3116,51 @@ BEGIN
         p_data_prescricao
     )
     RETURNING id_receita INTO p_id_receita;
-    
-    COMMIT;
+END;
+$$;
+
+-- Procedure para inserir várias receitas de uma consulta numa só chamada
+-- (uma linha por posição dos arrays; linhas sem medicamento são ignoradas).
+-- Se p_novo_estado for indicado, atualiza também o estado da consulta, na
+-- mesma transação.
+CREATE OR REPLACE PROCEDURE inserir_receitas_lote(
+    p_id_consulta INTEGER,
+    p_medicamentos TEXT[],
+    p_dosagens TEXT[],
+    p_instrucoes TEXT[],
+    p_data_prescricao DATE,
+    p_novo_estado VARCHAR(50) DEFAULT NULL,
+    INOUT p_total_receitas INTEGER DEFAULT NULL
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF p_novo_estado IS NOT NULL THEN
+        UPDATE "CONSULTAS"
+        SET estado = p_novo_estado,
+            modificado_em = NOW()
+        WHERE id_consulta = p_id_consulta;
+    END IF;
+
+    INSERT INTO "RECEITAS" (
+        id_consulta,
+        medicamento,
+        dosagem,
+        instrucoes,
+        data_prescricao
+    )
+    SELECT
+        p_id_consulta,
+        LEFT(BTRIM(r.medicamento), 255),
+        LEFT(COALESCE(NULLIF(BTRIM(r.dosagem), ''), 'Conforme prescrição'), 255),
+        LEFT(r.instrucoes, 255),
+        p_data_prescricao
+    FROM unnest(p_medicamentos, p_dosagens, p_instrucoes)
+         WITH ORDINALITY AS r(medicamento, dosagem, instrucoes, ordem)
+    WHERE NULLIF(BTRIM(r.medicamento), '') IS NOT NULL
+    ORDER BY r.ordem;
+
+    GET DIAGNOSTICS p_total_receitas = ROW_COUNT;
 END;
 $$;
 
@@ -2745,7 +3176,243 @@ BEGIN
     SET estado = p_novo_estado,
         modificado_em = NOW()
     WHERE id_consulta = p_id_consulta;
-    
-    COMMIT;
 END;
-$$;
\ No newline at end of file
+$$;
+
+-- ============================================================================
+-- CONTEXTO DO UTILIZADOR (ROW LEVEL SECURITY)
+-- O id do utilizador da aplicação fica no parâmetro 'app.current_user_id'.
+-- O middleware SetPostgreSQLUserContextMiddleware define-o com
+-- set_config(..., true) (válido só até ao fim da transação).
+-- ============================================================================
+
+-- Função para definir o utilizador atual (nível de sessão)
+CREATE OR REPLACE FUNCTION set_current_user(p_id_utilizador INTEGER)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM set_config('app.current_user_id', p_id_utilizador::TEXT, false);
+END;
+$$;
+
+-- Função para obter o utilizador atual (NULL se não estiver definido)
+CREATE OR REPLACE FUNCTION obter_current_user_id()
+RETURNS INTEGER
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT NULLIF(current_setting('app.current_user_id', true), '')::INTEGER;
+$$;
+
+-- ============================================================================
+-- OUTBOX DE NOTAS CLÍNICAS (PostgreSQL -> MongoDB)
+-- ============================================================================
+
+-- Função para registar uma nota clínica no outbox (chamar na mesma transação
+-- que altera a consulta)
+CREATE OR REPLACE FUNCTION enfileirar_nota_outbox(
+    p_id_consulta INTEGER,
+    p_payload JSONB
+)
+RETURNS BIGINT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_id_evento BIGINT;
+BEGIN
+    INSERT INTO "OUTBOX_NOTAS" (id_consulta, payload)
+    VALUES (p_id_consulta, p_payload)
+    RETURNING id_evento INTO v_id_evento;
+
+    RETURN v_id_evento;
+END;
+$$;
+
+-- Função para reservar um lote de eventos pendentes (FOR UPDATE SKIP LOCKED:
+-- vários workers podem correr em paralelo sem processar o mesmo evento).
+-- A reserva é gravada (proxima_tentativa adiada p_reserva_segundos) e vale
+-- depois do commit: quem chama confirma a transação antes de escrever no
+-- MongoDB, sem segurar bloqueios durante a escrita. Se o worker morrer a meio,
+-- os eventos voltam a ficar pendentes quando a reserva expira.
+DROP FUNCTION IF EXISTS reservar_eventos_outbox_notas(INTEGER, INTEGER);
+CREATE OR REPLACE FUNCTION reservar_eventos_outbox_notas(
+    p_limite INTEGER DEFAULT 100,
+    p_max_tentativas INTEGER DEFAULT 10,
+    p_reserva_segundos INTEGER DEFAULT 300
+)
+RETURNS TABLE(
+    id_evento BIGINT,
+    id_consulta INTEGER,
+    payload JSONB,
+    criado_em TIMESTAMPTZ,
+    tentativas INTEGER
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    UPDATE "OUTBOX_NOTAS" o
+    SET proxima_tentativa = NOW() + p_reserva_segundos * INTERVAL '1 second'
+    FROM (
+        SELECT p.id_evento
+        FROM "OUTBOX_NOTAS" p
+        WHERE p.processado_em IS NULL
+        AND p.proxima_tentativa <= NOW()
+        AND p.tentativas < p_max_tentativas
+        ORDER BY p.proxima_tentativa, p.id_evento
+        LIMIT p_limite
+        FOR UPDATE SKIP LOCKED
+    ) r
+    WHERE o.id_evento = r.id_evento
+    RETURNING o.id_evento, o.id_consulta, o.payload, o.criado_em, o.tentativas;
+END;
+$$;
+
+-- Procedure para concluir um lote: marca os processados e reagenda os
+-- falhados com backoff exponencial (limitado a 1 hora)
+CREATE OR REPLACE PROCEDURE concluir_eventos_outbox_notas(
+    p_processados BIGINT[],
+    p_falhados BIGINT[],
+    p_erro TEXT DEFAULT NULL,
+    p_backoff_segundos INTEGER DEFAULT 5
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE "OUTBOX_NOTAS"
+    SET processado_em = NOW(),
+        ultimo_erro = NULL
+    WHERE id_evento = ANY(p_processados);
+
+    UPDATE "OUTBOX_NOTAS"
+    SET tentativas = tentativas + 1,
+        ultimo_erro = p_erro,
+        proxima_tentativa = NOW() + LEAST(
+            p_backoff_segundos * POWER(2, tentativas),
+            3600
+        ) * INTERVAL '1 second'
+    WHERE id_evento = ANY(p_falhados);
+END;
+$$;
+
+-- ============================================================================
+-- LEMBRETES DE CONSULTAS
+-- ============================================================================
+
+-- Função para reservar os lembretes de um tipo ('24h', '2h') para as
+-- consultas confirmadas na janela [p_inicio, p_fim] (data + hora locais) e
+-- devolver os dados de todas numa só query.
+-- A reserva é um INSERT ... ON CONFLICT DO NOTHING no registo "LEMBRETES":
+-- cada consulta só é devolvida uma vez por tipo, mesmo com janelas
+-- sobrepostas ou vários workers em paralelo. Reservas não confirmadas com
+-- marcar_lembretes_enviados há mais de p_expirar voltam a ser devolvidas
+-- (FOR UPDATE SKIP LOCKED) se a consulta ainda estiver na janela.
+CREATE OR REPLACE FUNCTION reservar_lembretes(
+    p_tipo_lembrete VARCHAR(10),
+    p_inicio TIMESTAMP,
+    p_fim TIMESTAMP,
+    p_expirar INTERVAL DEFAULT INTERVAL '15 minutes'
+)
+RETURNS TABLE (
+    id_lembrete INTEGER,
+    id_consulta INTEGER,
+    data_consulta DATE,
+    hora_consulta TIME,
+    motivo VARCHAR(255),
+    paciente_nome VARCHAR(255),
+    paciente_email VARCHAR(255),
+    medico_nome VARCHAR(255),
+    especialidade_nome VARCHAR(255),
+    nome_unidade VARCHAR(255)
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    WITH novos AS (
+        INSERT INTO "LEMBRETES" (id_consulta, tipo_lembrete)
+        SELECT c.id_consulta, p_tipo_lembrete
+        FROM "CONSULTAS" c
+        WHERE c.estado = 'confirmada'
+        AND (c.data_consulta + c.hora_consulta) BETWEEN p_inicio AND p_fim
+        ON CONFLICT ON CONSTRAINT uq_lembretes_consulta_tipo DO NOTHING
+        RETURNING "LEMBRETES".id_lembrete, "LEMBRETES".id_consulta
+    ),
+    expirados AS (
+        UPDATE "LEMBRETES" l
+        SET reservado_em = NOW(),
+            tentativas = l.tentativas + 1
+        WHERE l.id_lembrete IN (
+            SELECT l2.id_lembrete
+            FROM "LEMBRETES" l2
+            JOIN "CONSULTAS" c2 ON c2.id_consulta = l2.id_consulta
+            WHERE l2.enviado_em IS NULL
+            AND l2.tipo_lembrete = p_tipo_lembrete
+            AND l2.reservado_em < NOW() - p_expirar
+            AND l2.tentativas < 5
+            -- Só repete lembretes de consultas ainda dentro da janela
+            AND (c2.data_consulta + c2.hora_consulta) BETWEEN p_inicio AND p_fim
+            FOR UPDATE OF l2 SKIP LOCKED
+        )
+        RETURNING l.id_lembrete, l.id_consulta
+    ),
+    reservados AS (
+        SELECT * FROM novos
+        UNION ALL
+        SELECT * FROM expirados
+    )
+    SELECT
+        r.id_lembrete,
+        c.id_consulta,
+        c.data_consulta,
+        c.hora_consulta,
+        c.motivo::VARCHAR(255),
+        pac_u.nome::VARCHAR(255),
+        pac_u.email::VARCHAR(255),
+        med_u.nome::VARCHAR(255),
+        e.nome_especialidade::VARCHAR(255),
+        u.nome_unidade::VARCHAR(255)
+    FROM reservados r
+    JOIN "CONSULTAS" c ON c.id_consulta = r.id_consulta
+    JOIN "PACIENTES" p ON c.id_paciente = p.id_paciente
+    JOIN "core_utilizador" pac_u ON p.id_utilizador = pac_u.id_utilizador
+    JOIN "MEDICOS" m ON c.id_medico = m.id_medico
+    JOIN "core_utilizador" med_u ON m.id_utilizador = med_u.id_utilizador
+    LEFT JOIN "ESPECIALIDADES" e ON m.id_especialidade = e.id_especialidade
+    LEFT JOIN "DISPONIBILIDADE" d ON c.id_disponibilidade = d.id_disponibilidade
+    LEFT JOIN "UNIDADE_DE_SAUDE" u ON d.id_unidade = u.id_unidade
+    WHERE c.estado = 'confirmada'
+    ORDER BY (c.data_consulta + c.hora_consulta), c.id_consulta;
+END;
+$$;
+
+-- Procedure para confirmar o envio dos lembretes reservados
+CREATE OR REPLACE PROCEDURE marcar_lembretes_enviados(p_ids INTEGER[])
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE "LEMBRETES"
+    SET enviado_em = NOW()
+    WHERE id_lembrete = ANY(p_ids)
+    AND enviado_em IS NULL;
+END;
+$$;
+
+-- Função para obter as versões de dados das exportações em cache
+-- ("VERSOES_DADOS", incrementadas pelos triggers trg_versao_*; só as
+-- alterações já confirmadas contam)
+CREATE OR REPLACE FUNCTION obter_versoes_dados()
+RETURNS TABLE (
+    nome VARCHAR(50),
+    versao BIGINT
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT t.nome::VARCHAR(50), COALESCE(SUM(v.versao), 0)::BIGINT
+    FROM unnest(ARRAY['consultas', 'faturas', 'utilizadores', 'medicos',
+                      'regioes', 'unidades', 'especialidades']) AS t(nome)
+    LEFT JOIN "VERSOES_DADOS" v ON v.nome = t.nome
+    GROUP BY t.nome;
+$$;
@@ -99,6 +99,10 @@ BEGIN
 END;
 $$;
 
+-- As funções de listagem/detalhe dos relatórios são LANGUAGE sql STABLE para
+-- o planeador as expandir na query (inlining): num cursor do lado do servidor
+-- (exportações em streaming, core/exportacao.py) as linhas chegam à medida que
+-- são lidas, em vez de o resultado ser todo materializado pela função
 CREATE OR REPLACE FUNCTION relatorio_faturas_listar(
     p_data_inicio DATE DEFAULT NULL,
     p_data_fim DATE DEFAULT NULL,
@@ -117,10 +121,9 @@ RETURNS TABLE (
     data_consulta DATE,
     hora_consulta TIME
 )
-LANGUAGE plpgsql
+LANGUAGE sql
+STABLE
 AS $$
-BEGIN
-    RETURN QUERY
     SELECT
         v.id_fatura,
         v.data_pagamento,
@@ -138,7 +141,6 @@ BEGIN
       AND (p_data_fim IS NULL OR v.data_pagamento <= p_data_fim)
       AND (p_estado IS NULL OR v.estado_fatura = p_estado)
     ORDER BY v.id_fatura DESC;
-END;
 $$;
 
 CREATE OR REPLACE FUNCTION relatorio_faturas_stats(
@@ -213,10 +215,9 @@ RETURNS TABLE (
     medico_nome VARCHAR(255),
     especialidade_nome VARCHAR(255)
 )
-LANGUAGE plpgsql
+LANGUAGE sql
+STABLE
 AS $$
-BEGIN
-    RETURN QUERY
     SELECT
         v.id_fatura,
         v.data_pagamento,
@@ -238,7 +239,6 @@ BEGIN
       AND (p_estado IS NULL OR v.estado_fatura = p_estado)
     ORDER BY v.id_fatura DESC
     LIMIT p_limite;
-END;
 $$;
 
 CREATE OR REPLACE FUNCTION relatorio_consultas_listar(
@@ -260,10 +260,9 @@ RETURNS TABLE (
     id_fatura INTEGER,
     criado_em TIMESTAMP
 )
-LANGUAGE plpgsql
+LANGUAGE sql
+STABLE
 AS $$
-BEGIN
-    RETURN QUERY
     SELECT
         c.id_consulta,
         c.data_consulta,
@@ -282,7 +281,6 @@ BEGIN
       AND (p_estado IS NULL OR c.estado = p_estado)
       AND (p_medico_id IS NULL OR c.id_medico = p_medico_id)
     ORDER BY c.data_consulta DESC, c.hora_consulta DESC;
-END;
 $$;
 
 CREATE OR REPLACE FUNCTION relatorio_consultas_total(
@@ -330,10 +328,9 @@ RETURNS TABLE (
     fatura_valor NUMERIC,
     fatura_estado VARCHAR(50)
 )
-LANGUAGE plpgsql
+LANGUAGE sql
+STABLE
 AS $$
-BEGIN
-    RETURN QUERY
     SELECT
         c.id_consulta,
         c.data_consulta,
@@ -355,5 +352,4 @@ BEGIN
       AND (p_medico_id IS NULL OR c.id_medico = p_medico_id)
     ORDER BY c.data_consulta DESC, c.hora_consulta DESC
     LIMIT p_limite;
-END;
 $$;
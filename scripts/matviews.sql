@@ -2,6 +2,19 @@
 -- MATERIALIZED VIEWS DO SISTEMA 
 -- ============================================================================
 
+-- Metadados de atualização das materialized views (atualizar_matview).
+-- dados_ate: primeiro dia do mês em que foi feito o último refresh com
+-- sucesso; os meses anteriores estão completos na view, os restantes são
+-- calculados em tempo real pelas funções de relatório.
+CREATE TABLE IF NOT EXISTS "MATVIEW_REFRESH" (
+    nome VARCHAR(100) PRIMARY KEY,
+    atualizado_em TIMESTAMPTZ NULL,
+    dados_ate DATE NULL,
+    ultima_tentativa TIMESTAMPTZ NOT NULL,
+    duracao_ms NUMERIC(12,1) NULL,
+    erro TEXT NULL
+);
+
 -- Materialized View para estatísticas mensais (atualizada diariamente)
 CREATE MATERIALIZED VIEW mv_estatisticas_mensais AS
 SELECT 
@@ -33,7 +46,7 @@ FROM "CONSULTAS" c
 LEFT JOIN "FATURAS" f ON c.id_consulta = f.id_consulta
 LEFT JOIN "MEDICOS" m ON c.id_medico = m.id_medico
 LEFT JOIN "ESPECIALIDADES" e ON m.id_especialidade = e.id_especialidade
-WHERE c.data_consulta >= CURRENT_DATE - INTERVAL '12 months'
+WHERE c.data_consulta >= DATE_TRUNC('month', CURRENT_DATE) - INTERVAL '12 months'
 GROUP BY DATE_TRUNC('month', c.data_consulta), 
          EXTRACT(YEAR FROM c.data_consulta), 
          EXTRACT(MONTH FROM c.data_consulta)
@@ -89,11 +102,289 @@ ORDER BY consultas_realizadas DESC NULLS LAST, media_avaliacao DESC;
 CREATE UNIQUE INDEX idx_mv_ranking_medicos_id ON mv_ranking_medicos(id_medico);
 CREATE INDEX idx_mv_ranking_medicos_consultas ON mv_ranking_medicos(consultas_realizadas);
 
--- Função para atualizar materialized views
+-- Materialized View de consultas por mês, estado e médico (só meses fechados)
+CREATE MATERIALIZED VIEW mv_consultas_mensais AS
+SELECT
+    DATE_TRUNC('month', c.data_consulta)::DATE as mes,
+    c.estado,
+    m.id_medico,
+    u_m.nome as medico_nome,
+    COALESCE(e.nome_especialidade, 'Sem especialidade') as especialidade_nome,
+    COUNT(*)::BIGINT as total
+FROM "CONSULTAS" c
+JOIN "PACIENTES" p ON c.id_paciente = p.id_paciente
+JOIN "MEDICOS" m ON c.id_medico = m.id_medico
+JOIN "core_utilizador" u_m ON m.id_utilizador = u_m.id_utilizador
+LEFT JOIN "ESPECIALIDADES" e ON m.id_especialidade = e.id_especialidade
+WHERE c.data_consulta < DATE_TRUNC('month', CURRENT_DATE)
+GROUP BY DATE_TRUNC('month', c.data_consulta), c.estado, m.id_medico, u_m.nome,
+         COALESCE(e.nome_especialidade, 'Sem especialidade');
+
+CREATE UNIQUE INDEX idx_mv_consultas_mensais ON mv_consultas_mensais(mes, estado, id_medico);
+
+-- Materialized View de receita (faturas pagas) por mês de pagamento (só meses fechados)
+CREATE MATERIALIZED VIEW mv_receitas_mensais AS
+SELECT
+    DATE_TRUNC('month', f.data_pagamento)::DATE as mes,
+    SUM(f.valor) as total,
+    COUNT(*)::BIGINT as count
+FROM "FATURAS" f
+WHERE f.estado = 'paga'
+  AND f.data_pagamento < DATE_TRUNC('month', CURRENT_DATE)
+GROUP BY DATE_TRUNC('month', f.data_pagamento);
+
+CREATE UNIQUE INDEX idx_mv_receitas_mensais_mes ON mv_receitas_mensais(mes);
+
+-- Função para atualizar uma materialized view e registar a duração em "MATVIEW_REFRESH".
+-- Um erro no refresh fica registado e não altera dados_ate (a view mantém os dados anteriores).
+CREATE OR REPLACE FUNCTION atualizar_matview(p_nome VARCHAR)
+RETURNS TABLE (
+    matview VARCHAR(100),
+    refresh_ms NUMERIC,
+    sucesso BOOLEAN,
+    mensagem_erro TEXT
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_inicio TIMESTAMPTZ := clock_timestamp();
+    v_duracao NUMERIC;
+    v_erro TEXT;
+BEGIN
+    IF p_nome NOT IN ('mv_estatisticas_mensais', 'mv_ranking_medicos',
+                      'mv_consultas_mensais', 'mv_receitas_mensais') THEN
+        RAISE EXCEPTION 'Materialized view desconhecida: %', p_nome;
+    END IF;
+
+    BEGIN
+        EXECUTE format('REFRESH MATERIALIZED VIEW CONCURRENTLY %I', p_nome);
+    EXCEPTION WHEN OTHERS THEN
+        v_erro := SQLERRM;
+    END;
+
+    v_duracao := ROUND((EXTRACT(EPOCH FROM clock_timestamp() - v_inicio) * 1000)::NUMERIC, 1);
+
+    INSERT INTO "MATVIEW_REFRESH" AS r (nome, atualizado_em, dados_ate, ultima_tentativa, duracao_ms, erro)
+    VALUES (
+        p_nome,
+        CASE WHEN v_erro IS NULL THEN v_inicio END,
+        CASE WHEN v_erro IS NULL THEN DATE_TRUNC('month', CURRENT_DATE)::DATE END,
+        v_inicio,
+        v_duracao,
+        v_erro
+    )
+    ON CONFLICT (nome) DO UPDATE SET
+        atualizado_em = COALESCE(EXCLUDED.atualizado_em, r.atualizado_em),
+        dados_ate = COALESCE(EXCLUDED.dados_ate, r.dados_ate),
+        ultima_tentativa = EXCLUDED.ultima_tentativa,
+        duracao_ms = EXCLUDED.duracao_ms,
+        erro = EXCLUDED.erro;
+
+    RETURN QUERY SELECT p_nome::VARCHAR(100), v_duracao, v_erro IS NULL, v_erro;
+END;
+$$;
+
+-- Função para atualizar todas as materialized views
+DROP FUNCTION IF EXISTS atualizar_matviews();
 CREATE OR REPLACE FUNCTION atualizar_matviews()
-RETURNS VOID AS $$
+RETURNS TABLE (
+    matview VARCHAR(100),
+    refresh_ms NUMERIC,
+    sucesso BOOLEAN,
+    mensagem_erro TEXT
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_nome VARCHAR;
+BEGIN
+    FOREACH v_nome IN ARRAY ARRAY['mv_estatisticas_mensais', 'mv_ranking_medicos',
+                                  'mv_consultas_mensais', 'mv_receitas_mensais'] LOOP
+        RETURN QUERY SELECT * FROM atualizar_matview(v_nome);
+    END LOOP;
+END;
+$$;
+
+-- Função para dividir um período em meses fechados (lidos da materialized view)
+-- e o resto (calculado em tempo real). Devolve [mv_inicio, mv_fim[; quando
+-- nenhum mês completo do período está na view, mv_inicio = mv_fim.
+CREATE OR REPLACE FUNCTION intervalo_meses_fechados(
+    p_matview VARCHAR,
+    p_data_inicio DATE DEFAULT NULL,
+    p_data_fim DATE DEFAULT NULL
+)
+RETURNS TABLE (
+    mv_inicio DATE,
+    mv_fim DATE
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_inicio DATE := COALESCE(p_data_inicio, DATE '1900-01-01');
+    v_fim DATE := COALESCE(p_data_fim, DATE '9999-12-30');
+    v_dados_ate DATE;
+BEGIN
+    SELECT r.dados_ate INTO v_dados_ate
+    FROM "MATVIEW_REFRESH" r
+    WHERE r.nome = p_matview;
+
+    -- Primeiro mês que começa dentro do período
+    mv_inicio := CASE
+        WHEN v_inicio = DATE_TRUNC('month', v_inicio)::DATE THEN v_inicio
+        ELSE (DATE_TRUNC('month', v_inicio) + INTERVAL '1 month')::DATE
+    END;
+    -- Fim (exclusivo) do último mês que acaba dentro do período, limitado ao que a view tem
+    mv_fim := LEAST(DATE_TRUNC('month', v_fim + 1)::DATE, v_dados_ate);
+
+    IF mv_fim IS NULL OR mv_fim <= mv_inicio THEN
+        mv_inicio := v_inicio;
+        mv_fim := v_inicio;
+    END IF;
+    RETURN NEXT;
+END;
+$$;
+
+-- Função para o relatório de consultas: contagens por estado e médico no
+-- período, com os meses fechados lidos de mv_consultas_mensais
+CREATE OR REPLACE FUNCTION relatorio_consultas_agregado(
+    p_data_inicio DATE DEFAULT NULL,
+    p_data_fim DATE DEFAULT NULL,
+    p_estado VARCHAR DEFAULT NULL
+)
+RETURNS TABLE (
+    estado VARCHAR(50),
+    id_medico INTEGER,
+    medico_nome VARCHAR(255),
+    especialidade_nome VARCHAR(255),
+    total BIGINT
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_inicio DATE := COALESCE(p_data_inicio, DATE '1900-01-01');
+    v_fim DATE := COALESCE(p_data_fim, DATE '9999-12-30');
+    v_mv_inicio DATE;
+    v_mv_fim DATE;
+BEGIN
+    SELECT i.mv_inicio, i.mv_fim INTO v_mv_inicio, v_mv_fim
+    FROM intervalo_meses_fechados('mv_consultas_mensais', v_inicio, v_fim) i;
+
+    RETURN QUERY
+    SELECT x.estado, x.id_medico, x.medico_nome, x.especialidade_nome, SUM(x.total)::BIGINT
+    FROM (
+        SELECT mv.estado, mv.id_medico, mv.medico_nome, mv.especialidade_nome, mv.total
+        FROM mv_consultas_mensais mv
+        WHERE mv.mes >= v_mv_inicio
+          AND mv.mes < v_mv_fim
+          AND (p_estado IS NULL OR mv.estado = p_estado)
+
+        UNION ALL
+
+        SELECT c.estado, c.id_medico, c.medico_nome,
+               COALESCE(c.nome_especialidade, 'Sem especialidade')::VARCHAR(255),
+               COUNT(*)::BIGINT
+        FROM vw_consultas_completas c
+        WHERE ((c.data_consulta >= v_inicio AND c.data_consulta < v_mv_inicio)
+            OR (c.data_consulta >= v_mv_fim AND c.data_consulta <= v_fim))
+          AND (p_estado IS NULL OR c.estado = p_estado)
+        GROUP BY c.estado, c.id_medico, c.medico_nome, COALESCE(c.nome_especialidade, 'Sem especialidade')
+    ) x
+    GROUP BY x.estado, x.id_medico, x.medico_nome, x.especialidade_nome;
+END;
+$$;
+
+-- Função para a receita (faturas pagas) no período, com os meses fechados
+-- lidos de mv_receitas_mensais
+CREATE OR REPLACE FUNCTION relatorio_receitas_agregado(
+    p_data_inicio DATE DEFAULT NULL,
+    p_data_fim DATE DEFAULT NULL
+)
+RETURNS TABLE (
+    total NUMERIC,
+    count BIGINT
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_inicio DATE := COALESCE(p_data_inicio, DATE '1900-01-01');
+    v_fim DATE := COALESCE(p_data_fim, DATE '9999-12-30');
+    v_mv_inicio DATE;
+    v_mv_fim DATE;
+BEGIN
+    SELECT i.mv_inicio, i.mv_fim INTO v_mv_inicio, v_mv_fim
+    FROM intervalo_meses_fechados('mv_receitas_mensais', v_inicio, v_fim) i;
+
+    RETURN QUERY
+    SELECT COALESCE(SUM(x.total), 0), COALESCE(SUM(x.count), 0)::BIGINT
+    FROM (
+        SELECT mv.total, mv.count
+        FROM mv_receitas_mensais mv
+        WHERE mv.mes >= v_mv_inicio
+          AND mv.mes < v_mv_fim
+
+        UNION ALL
+
+        SELECT f.valor, 1::BIGINT
+        FROM "FATURAS" f
+        WHERE f.estado = 'paga'
+          AND ((f.data_pagamento >= v_inicio AND f.data_pagamento < v_mv_inicio)
+            OR (f.data_pagamento >= v_mv_fim AND f.data_pagamento <= v_fim))
+    ) x;
+END;
+$$;
+
+-- Função para a evolução mensal do dashboard: meses fechados de
+-- mv_estatisticas_mensais e os meses seguintes (mês atual) em tempo real
+CREATE OR REPLACE FUNCTION obter_estatisticas_mensais(p_meses INTEGER DEFAULT 12)
+RETURNS TABLE (
+    mes DATE,
+    total_consultas BIGINT,
+    consultas_realizadas BIGINT,
+    consultas_canceladas BIGINT,
+    total_faturas BIGINT,
+    valor_total_pago NUMERIC,
+    medicos_ativos BIGINT,
+    pacientes_atendidos BIGINT
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_mes_atual DATE := DATE_TRUNC('month', CURRENT_DATE)::DATE;
+    v_inicio DATE := (DATE_TRUNC('month', CURRENT_DATE) - (p_meses - 1) * INTERVAL '1 month')::DATE;
+    v_dados_ate DATE;
 BEGIN
-    REFRESH MATERIALIZED VIEW CONCURRENTLY mv_estatisticas_mensais;
-    REFRESH MATERIALIZED VIEW CONCURRENTLY mv_ranking_medicos;
+    SELECT r.dados_ate INTO v_dados_ate
+    FROM "MATVIEW_REFRESH" r
+    WHERE r.nome = 'mv_estatisticas_mensais';
+    v_dados_ate := GREATEST(LEAST(COALESCE(v_dados_ate, v_inicio), v_mes_atual), v_inicio);
+
+    RETURN QUERY
+    SELECT mv.mes::DATE, mv.total_consultas, mv.consultas_realizadas, mv.consultas_canceladas,
+           mv.total_faturas, mv.valor_total_pago, mv.medicos_ativos, mv.pacientes_atendidos
+    FROM mv_estatisticas_mensais mv
+    WHERE mv.mes >= v_inicio
+      AND mv.mes < v_dados_ate
+
+    UNION ALL
+
+    SELECT
+        DATE_TRUNC('month', c.data_consulta)::DATE,
+        COUNT(DISTINCT c.id_consulta),
+        COUNT(DISTINCT CASE WHEN c.estado = 'realizada' THEN c.id_consulta END),
+        COUNT(DISTINCT CASE WHEN c.estado = 'cancelada' THEN c.id_consulta END),
+        COUNT(DISTINCT f.id_fatura),
+        SUM(CASE WHEN f.estado = 'paga' THEN f.valor ELSE 0 END),
+        COUNT(DISTINCT c.id_medico),
+        COUNT(DISTINCT c.id_paciente)
+    FROM "CONSULTAS" c
+    LEFT JOIN "FATURAS" f ON c.id_consulta = f.id_consulta
+    WHERE c.data_consulta >= v_dados_ate
+      AND c.data_consulta < v_mes_atual + INTERVAL '1 month'
+    GROUP BY DATE_TRUNC('month', c.data_consulta)
+
+    ORDER BY 1;
 END;
-$$ LANGUAGE plpgsql;
\ No newline at end of file
+$$;
+
+-- Primeiro refresh: regista dados_ate em "MATVIEW_REFRESH"
+SELECT * FROM atualizar_matviews();
@@ -10,12 +10,6 @@ LANGUAGE plpgsql
 AS $$
 DECLARE
     v_id_disponibilidade INTEGER;
-    v_hora_fim TIME;
-    v_duracao_slot INTEGER;
-    v_consultas_count INTEGER;
-    v_total_slots INTEGER;
-    v_slot_time TIME;
-    v_contador INTEGER := 0;
 BEGIN
     -- 1. Verificar se paciente existe e está ativo
     IF NOT EXISTS (
@@ -37,34 +31,31 @@ BEGIN
         RAISE EXCEPTION 'Médico não encontrado ou inativo';
     END IF;
     
-    -- 3. Verificar se já existe consulta no mesmo horário
-    IF EXISTS (
-        SELECT 1 FROM "CONSULTAS" 
-        WHERE id_medico = p_id_medico
-        AND data_consulta = p_data_consulta
-        AND hora_consulta = p_hora_consulta
-        AND estado NOT IN ('cancelada')
-    ) THEN
-        RAISE EXCEPTION 'Já existe uma consulta agendada neste horário';
-    END IF;
-    
-    -- 4. Encontrar disponibilidade correspondente
-    SELECT d.id_disponibilidade, d.hora_fim, d.duracao_slot
-    INTO v_id_disponibilidade, v_hora_fim, v_duracao_slot
-    FROM "DISPONIBILIDADE" d
-    WHERE d.id_medico = p_id_medico
-    AND d.data = p_data_consulta
-    AND d.hora_inicio <= p_hora_consulta
-    AND d.hora_fim > p_hora_consulta
-    AND d.status_slot IN ('disponivel', 'available')
-    FOR UPDATE SKIP LOCKED
-    LIMIT 1;
+    -- 3. Reservar o slot com um único UPDATE condicional.
+    -- Só reserva se o slot estiver livre; marcações concorrentes para o
+    -- mesmo slot falham aqui (ou no índice único de "CONSULTAS")
+    UPDATE "SLOTS" s
+    SET ocupado = TRUE
+    WHERE s.id_slot = (
+        SELECT s2.id_slot
+        FROM "SLOTS" s2
+        JOIN "DISPONIBILIDADE" d ON d.id_disponibilidade = s2.id_disponibilidade
+        WHERE s2.id_medico = p_id_medico
+        AND s2.data = p_data_consulta
+        AND s2.hora_inicio = p_hora_consulta
+        AND NOT s2.ocupado
+        AND d.status_slot IN ('disponivel', 'available')
+        LIMIT 1
+        FOR UPDATE OF s2 SKIP LOCKED
+    )
+    AND NOT s.ocupado
+    RETURNING s.id_disponibilidade INTO v_id_disponibilidade;
     
     IF v_id_disponibilidade IS NULL THEN
-        RAISE EXCEPTION 'Não há disponibilidade para este horário';
+        RAISE EXCEPTION 'Este horário não está disponível ou já foi marcado';
     END IF;
     
-    -- 5. Criar consulta
+    -- 4. Criar consulta (o trigger associa-a ao slot reservado)
     INSERT INTO "CONSULTAS" (
         id_paciente, id_medico, id_disponibilidade,
         data_consulta, hora_consulta, estado,
@@ -77,27 +68,16 @@ BEGIN
         TRUE, CURRENT_TIMESTAMP
     );
     
-    -- 6. Verificar se disponibilidade está completa
-    -- Calcular total de slots possíveis
-    v_total_slots := EXTRACT(EPOCH FROM (v_hora_fim - (
-        SELECT hora_inicio FROM "DISPONIBILIDADE" 
+    -- 5. Marcar como booked se todos os slots estiverem ocupados
+    IF NOT EXISTS (
+        SELECT 1 FROM "SLOTS"
         WHERE id_disponibilidade = v_id_disponibilidade
-    ))) / 60 / v_duracao_slot;
-    
-    -- Contar consultas agendadas nesta disponibilidade
-    SELECT COUNT(*) INTO v_consultas_count
-    FROM "CONSULTAS"
-    WHERE id_disponibilidade = v_id_disponibilidade
-    AND estado NOT IN ('cancelada');
-    
-    -- Marcar como booked se todos slots estiverem ocupados
-    IF v_consultas_count >= v_total_slots THEN
+        AND NOT ocupado
+    ) THEN
         UPDATE "DISPONIBILIDADE"
         SET status_slot = 'booked'
         WHERE id_disponibilidade = v_id_disponibilidade;
     END IF;
-    
-    COMMIT;
 END;
 $$;
 
@@ -148,8 +128,6 @@ BEGIN
             modificado_em = CURRENT_TIMESTAMP
         WHERE id_consulta = p_id_consulta;
     END IF;
-    
-    COMMIT;
 END;
 $$;
 
@@ -217,8 +195,6 @@ BEGIN
         p_id_consulta, v_valor_fatura, p_metodo_pagamento,
         'pendente', NULL
     );
-    
-    COMMIT;
 END;
 $$;
 
@@ -310,8 +286,6 @@ BEGIN
     UPDATE "FATURAS"
     SET estado = 'cancelada'
     WHERE id_consulta = p_id_consulta AND estado = 'pendente';
-    
-    COMMIT;
 END;
 $$;
 
@@ -351,8 +325,6 @@ BEGIN
         p_instrucoes,
         CURRENT_DATE
     );
-    
-    COMMIT;
 END;
 $$;
 
@@ -381,8 +353,6 @@ BEGIN
             modificado_em = NOW()
         WHERE id_utilizador = p_id_utilizador;
     END IF;
-    
-    COMMIT;
 END;
 $$;
 
@@ -404,8 +374,6 @@ BEGIN
         alergias = p_alergias,
         observacoes = p_observacoes
     WHERE id_paciente = p_id_paciente;
-    
-    COMMIT;
 END;
 $$;
 
@@ -422,8 +390,6 @@ BEGIN
     IF NOT FOUND THEN
         RAISE EXCEPTION 'Token inválido ou expirado';
     END IF;
-    
-    COMMIT;
 END;
 $$;
 
@@ -453,29 +419,33 @@ BEGIN
         RAISE EXCEPTION 'Esta consulta não pode ser reagendada';
     END IF;
     
-    -- Obter dados da nova disponibilidade
-    SELECT data, hora_inicio, id_medico 
-    INTO v_novo_data, v_novo_hora, v_novo_id_medico
-    FROM "DISPONIBILIDADE" 
-    WHERE id_disponibilidade = p_nova_disponibilidade_id
-    AND status_slot = 'available'
-    FOR UPDATE;
+    -- Reservar o primeiro slot livre da nova disponibilidade com um único
+    -- UPDATE condicional (o slot antigo é libertado pelo trigger)
+    UPDATE "SLOTS" s
+    SET ocupado = TRUE
+    WHERE s.id_slot = (
+        SELECT s2.id_slot
+        FROM "SLOTS" s2
+        JOIN "DISPONIBILIDADE" d ON d.id_disponibilidade = s2.id_disponibilidade
+        WHERE s2.id_disponibilidade = p_nova_disponibilidade_id
+        AND NOT s2.ocupado
+        AND d.status_slot IN ('disponivel', 'available')
+        ORDER BY s2.hora_inicio
+        LIMIT 1
+        FOR UPDATE OF s2 SKIP LOCKED
+    )
+    AND NOT s.ocupado
+    RETURNING s.data, s.hora_inicio, s.id_medico
+    INTO v_novo_data, v_novo_hora, v_novo_id_medico;
     
     IF v_novo_data IS NULL THEN
         RAISE EXCEPTION 'Disponibilidade não encontrada ou já ocupada';
     END IF;
     
-    -- Libertar disponibilidade antiga
-    IF v_id_disponibilidade_antiga IS NOT NULL THEN
-        UPDATE "DISPONIBILIDADE" 
-        SET status_slot = 'available'
-        WHERE id_disponibilidade = v_id_disponibilidade_antiga;
-    END IF;
-    
     -- Atualizar consulta
     UPDATE "CONSULTAS" 
     SET id_disponibilidade = p_nova_disponibilidade_id,
-        id_medico = v_novo_medico_id,
+        id_medico = v_novo_id_medico,
         data_consulta = v_novo_data,
         hora_consulta = v_novo_hora,
         estado = 'agendada',
@@ -485,12 +455,24 @@ BEGIN
         modificado_em = NOW()
     WHERE id_consulta = p_id_consulta;
     
-    -- Marcar nova disponibilidade como ocupada
-    UPDATE "DISPONIBILIDADE" 
-    SET status_slot = 'booked'
-    WHERE id_disponibilidade = p_nova_disponibilidade_id;
+    -- Reabrir a disponibilidade antiga se estava completa
+    IF v_id_disponibilidade_antiga IS NOT NULL THEN
+        UPDATE "DISPONIBILIDADE" 
+        SET status_slot = 'available'
+        WHERE id_disponibilidade = v_id_disponibilidade_antiga
+        AND status_slot = 'booked';
+    END IF;
     
-    COMMIT;
+    -- Marcar nova disponibilidade como booked se ficou sem slots livres
+    IF NOT EXISTS (
+        SELECT 1 FROM "SLOTS"
+        WHERE id_disponibilidade = p_nova_disponibilidade_id
+        AND NOT ocupado
+    ) THEN
+        UPDATE "DISPONIBILIDADE" 
+        SET status_slot = 'booked'
+        WHERE id_disponibilidade = p_nova_disponibilidade_id;
+    END IF;
 END;
 $$;
 
@@ -513,17 +495,7 @@ DECLARE
     v_n_utente VARCHAR(20);
 BEGIN
     -- Gerar número de utente único
-    SELECT LPAD(FLOOR(RANDOM() * 1000000000)::TEXT, 10, '0') INTO v_n_utente
-    FROM generate_series(1, 100)
-    WHERE NOT EXISTS (
-        SELECT 1 FROM "core_utilizador" WHERE n_utente = v_n_utente
-    )
-    LIMIT 1;
-    
-    IF v_n_utente IS NULL THEN
-        -- Se falhou, usar sequencial
-        v_n_utente := 'U' || LPAD(NEXTVAL('utilizador_seq')::TEXT, 9, '0');
-    END IF;
+    v_n_utente := gerar_n_utente();
     
     -- Inserir utilizador
     INSERT INTO "core_utilizador" (
@@ -554,8 +526,6 @@ BEGIN
         p_alergias,
         p_observacoes
     );
-    
-    COMMIT;
 END;
 $$;
 
@@ -571,8 +541,6 @@ BEGIN
         hora_checkin = NOW(),
         modificado_em = NOW()
     WHERE id_consulta = p_id_consulta;
-    
-    COMMIT;
 END;
 $$;
 
@@ -766,8 +734,6 @@ BEGIN
     
     mensagem := 'Consulta agendada com sucesso para ' || v_paciente_nome || '. Aguarda aceitação do paciente.';
     sucesso := TRUE;
-    
-    COMMIT;
 END;
 $$;
 
@@ -856,8 +822,6 @@ BEGIN
     mensagem := 'Disponibilidade criada e consulta agendada para ' || v_paciente_nome || 
                 ' na unidade ' || v_unidade_nome || '. Aguarda aceitação do paciente.';
     sucesso := TRUE;
-    
-    COMMIT;
 END;
 $$;
 
@@ -923,7 +887,6 @@ BEGIN
     END IF;
     
     sucesso := TRUE;
-    COMMIT;
 END;
 $$;
 
@@ -985,8 +948,6 @@ BEGIN
     
     mensagem := 'Período de ' || v_dias_criados || ' dia(s) marcado como indisponível!';
     sucesso := TRUE;
-    
-    COMMIT;
 END;
 $$;
 
@@ -1027,8 +988,6 @@ BEGIN
         mensagem := 'Erro ao excluir disponibilidade.';
         sucesso := FALSE;
     END IF;
-    
-    COMMIT;
 END;
 $$;
 
@@ -1094,7 +1053,5 @@ BEGIN
     
     mensagem := 'Consulta recusada com sucesso.';
     sucesso := TRUE;
-    
-    COMMIT;
 END;
 $$;
\ No newline at end of file
@@ -12,7 +12,6 @@ AS $$
 BEGIN
 	INSERT INTO "REGIAO" (nome, tipo_regiao)
 	VALUES (p_nome, p_tipo_regiao);
-	COMMIT;
 END;
 $$;
 
@@ -135,7 +134,6 @@ BEGIN
 
 	mensagem := 'Consulta agendada com sucesso. Aguarda confirmação do médico e do paciente.';
 	sucesso := TRUE;
-	COMMIT;
 END;
 $$;
 
@@ -156,7 +154,6 @@ BEGIN
 	IF NOT FOUND THEN
 		RAISE EXCEPTION 'Região não encontrada';
 	END IF;
-	COMMIT;
 END;
 $$;
 
@@ -210,7 +207,6 @@ BEGIN
 	IF NOT FOUND THEN
 		RAISE EXCEPTION 'Região não encontrada';
 	END IF;
-	COMMIT;
 END;
 $$;
 
@@ -224,7 +220,6 @@ AS $$
 BEGIN
 	INSERT INTO "ESPECIALIDADES" (nome_especialidade, descricao)
 	VALUES (p_nome, p_descricao);
-	COMMIT;
 END;
 $$;
 
@@ -245,7 +240,6 @@ BEGIN
 	IF NOT FOUND THEN
 		RAISE EXCEPTION 'Especialidade não encontrada';
 	END IF;
-	COMMIT;
 END;
 $$;
 
@@ -267,7 +261,6 @@ BEGIN
 	IF NOT FOUND THEN
 		RAISE EXCEPTION 'Especialidade não encontrada';
 	END IF;
-	COMMIT;
 END;
 $$;
 
@@ -283,7 +276,6 @@ AS $$
 BEGIN
 	INSERT INTO "UNIDADE_DE_SAUDE" (nome_unidade, morada_unidade, tipo_unidade, id_regiao)
 	VALUES (p_nome, p_morada, p_tipo, p_id_regiao);
-	COMMIT;
 END;
 $$;
 
@@ -308,7 +300,6 @@ BEGIN
 	IF NOT FOUND THEN
 		RAISE EXCEPTION 'Unidade não encontrada';
 	END IF;
-	COMMIT;
 END;
 $$;
 
@@ -352,7 +343,6 @@ BEGIN
 	IF NOT FOUND THEN
 		RAISE EXCEPTION 'Unidade não encontrada';
 	END IF;
-	COMMIT;
 END;
 $$;
 
@@ -416,8 +406,6 @@ BEGIN
 		INSERT INTO "PACIENTES" (id_utilizador, data_nasc, genero, morada, alergias, observacoes)
 		VALUES (v_id_utilizador, p_data_nasc, p_genero, COALESCE(p_morada, ''), '', '');
 	END IF;
-
-	COMMIT;
 END;
 $$;
 
@@ -460,8 +448,6 @@ BEGIN
 	IF NOT FOUND THEN
 		RAISE EXCEPTION 'Utilizador não encontrado';
 	END IF;
-
-	COMMIT;
 END;
 $$;
 
@@ -479,8 +465,6 @@ BEGIN
 	IF NOT FOUND THEN
 		RAISE EXCEPTION 'Utilizador não encontrado';
 	END IF;
-
-	COMMIT;
 END;
 $$;
 
@@ -499,8 +483,6 @@ BEGIN
 
 	INSERT INTO "FATURAS" (id_consulta, valor, metodo_pagamento, estado, data_pagamento)
 	VALUES (p_id_consulta, p_valor, p_metodo_pagamento, 'pendente', NULL);
-
-	COMMIT;
 END;
 $$;
 
@@ -527,7 +509,131 @@ BEGIN
 	IF NOT FOUND THEN
 		RAISE EXCEPTION 'Fatura não encontrada';
 	END IF;
+END;
+$$;
+
+-- ============================================================================
+-- IMPORTAÇÃO EM MASSA (core/importacao.py)
+-- ============================================================================
+-- As linhas validadas do ficheiro são carregadas com COPY numa tabela
+-- temporária importacao_* (ON COMMIT DROP, criada pela aplicação na mesma
+-- transação) e juntadas à tabela final com um único INSERT ... SELECT.
+-- Cada função devolve as linhas do ficheiro que não foram inseridas.
+
+-- Importar regiões (nome já existente -> linha rejeitada)
+CREATE OR REPLACE FUNCTION admin_importar_regioes()
+RETURNS TABLE (linha INTEGER)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+	RETURN QUERY
+	WITH inseridas AS (
+		INSERT INTO "REGIAO" (nome, tipo_regiao)
+		SELECT s.nome, s.tipo_regiao
+		FROM importacao_regioes s
+		ORDER BY s.linha
+		ON CONFLICT (nome) DO NOTHING
+		RETURNING "REGIAO".nome
+	)
+	SELECT s.linha
+	FROM importacao_regioes s
+	WHERE NOT EXISTS (SELECT 1 FROM inseridas i WHERE i.nome = s.nome)
+	ORDER BY s.linha;
+END;
+$$;
 
-	COMMIT;
+-- Importar especialidades (nome já existente -> linha rejeitada)
+CREATE OR REPLACE FUNCTION admin_importar_especialidades()
+RETURNS TABLE (linha INTEGER)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+	RETURN QUERY
+	WITH inseridas AS (
+		INSERT INTO "ESPECIALIDADES" (nome_especialidade, descricao)
+		SELECT s.nome_especialidade, s.descricao
+		FROM importacao_especialidades s
+		ORDER BY s.linha
+		ON CONFLICT (nome_especialidade) DO NOTHING
+		RETURNING "ESPECIALIDADES".nome_especialidade
+	)
+	SELECT s.linha
+	FROM importacao_especialidades s
+	WHERE NOT EXISTS (SELECT 1 FROM inseridas i WHERE i.nome_especialidade = s.nome_especialidade)
+	ORDER BY s.linha;
+END;
+$$;
+
+-- Importar unidades de saúde. Não há chave natural (nomes repetidos são
+-- permitidos), por isso não há conflitos: só são rejeitadas as linhas cuja
+-- região deixou de existir depois de o ficheiro ter sido validado
+CREATE OR REPLACE FUNCTION admin_importar_unidades()
+RETURNS TABLE (linha INTEGER)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+	-- O INSERT da CTE é sempre executado, mesmo sem ser referenciado
+	RETURN QUERY
+	WITH inseridas AS (
+		INSERT INTO "UNIDADE_DE_SAUDE" (nome_unidade, morada_unidade, tipo_unidade, id_regiao)
+		SELECT s.nome_unidade, s.morada_unidade, s.tipo_unidade, s.id_regiao
+		FROM importacao_unidades s
+		JOIN "REGIAO" r ON r.id_regiao = s.id_regiao
+		ORDER BY s.linha
+	)
+	SELECT s.linha
+	FROM importacao_unidades s
+	WHERE NOT EXISTS (SELECT 1 FROM "REGIAO" r WHERE r.id_regiao = s.id_regiao)
+	ORDER BY s.linha;
+END;
+$$;
+
+-- Importar pacientes (onboarding em massa). As senhas chegam já em hash;
+-- os números de utente são reservados num só bloco (gerar_n_utentes) para as
+-- linhas cujo email ainda não existe (email já existente -> linha rejeitada)
+CREATE OR REPLACE FUNCTION admin_importar_pacientes()
+RETURNS TABLE (linha INTEGER)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+	v_novos INTEGER;
+BEGIN
+	SELECT COUNT(*) INTO v_novos
+	FROM importacao_pacientes s
+	WHERE NOT EXISTS (SELECT 1 FROM "core_utilizador" u WHERE u.email = s.email);
+
+	RETURN QUERY
+	WITH novos AS (
+		SELECT s.*, ROW_NUMBER() OVER (ORDER BY s.linha) AS ordem
+		FROM importacao_pacientes s
+		WHERE NOT EXISTS (SELECT 1 FROM "core_utilizador" u WHERE u.email = s.email)
+	),
+	numeros AS (
+		SELECT g.n_utente, ROW_NUMBER() OVER () AS ordem
+		FROM gerar_n_utentes(v_novos) g
+	),
+	utilizadores AS (
+		INSERT INTO "core_utilizador" (
+			nome, email, telefone, n_utente, password, role,
+			data_registo, ativo, is_superuser, email_verified
+		)
+		SELECT n.nome, n.email, NULLIF(n.telefone, ''), num.n_utente, n.password, 'paciente',
+			NOW(), TRUE, FALSE, FALSE
+		FROM novos n
+		JOIN numeros num ON num.ordem = n.ordem
+		ORDER BY n.ordem
+		ON CONFLICT (email) DO NOTHING
+		RETURNING "core_utilizador".id_utilizador, "core_utilizador".email
+	),
+	pacientes AS (
+		INSERT INTO "PACIENTES" (id_utilizador, data_nasc, genero, morada, alergias, observacoes)
+		SELECT u.id_utilizador, s.data_nasc, s.genero, s.morada, s.alergias, s.observacoes
+		FROM utilizadores u
+		JOIN importacao_pacientes s ON s.email = u.email
+	)
+	SELECT s.linha
+	FROM importacao_pacientes s
+	WHERE NOT EXISTS (SELECT 1 FROM utilizadores u WHERE u.email = s.email)
+	ORDER BY s.linha;
 END;
 $$;
@@ -128,4 +128,279 @@ INSERT INTO "CONSULTAS" (
 ) RETURNING id_consulta;
 
 DELETE FROM "CONSULTAS" WHERE id_consulta = 26;
-DELETE FROM "DISPONIBILIDADE" WHERE id_disponibilidade = 15;
\ No newline at end of file
+DELETE FROM "DISPONIBILIDADE" WHERE id_disponibilidade = 15;
+
+-- ============================================================================
+-- SLOTS MATERIALIZADOS ("SLOTS")
+-- ============================================================================
+
+-- Trigger para gerar os slots quando a disponibilidade é criada ou o seu
+-- horário muda (a remoção é tratada pelo ON DELETE CASCADE)
+CREATE OR REPLACE FUNCTION sincronizar_slots_disponibilidade()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM reconstruir_slots(NEW.id_disponibilidade);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_slots_disponibilidade_insert
+    AFTER INSERT ON "DISPONIBILIDADE"
+    FOR EACH ROW
+    EXECUTE FUNCTION sincronizar_slots_disponibilidade();
+
+CREATE TRIGGER trg_slots_disponibilidade_update
+    AFTER UPDATE OF id_medico, id_unidade, data, hora_inicio, hora_fim, duracao_slot
+    ON "DISPONIBILIDADE"
+    FOR EACH ROW
+    EXECUTE FUNCTION sincronizar_slots_disponibilidade();
+
+-- Trigger para ocupar/libertar o slot de cada consulta.
+-- Se o slot já pertence a outra consulta ativa a operação falha
+-- (unique_violation): não há marcações duplas.
+CREATE OR REPLACE FUNCTION sincronizar_slot_consulta()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_mudou BOOLEAN;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        v_mudou := TRUE;
+    ELSIF TG_OP = 'DELETE' THEN
+        v_mudou := TRUE;
+    ELSE
+        v_mudou := NEW.id_disponibilidade IS DISTINCT FROM OLD.id_disponibilidade
+            OR NEW.hora_consulta IS DISTINCT FROM OLD.hora_consulta
+            OR (NEW.estado = 'cancelada') IS DISTINCT FROM (OLD.estado = 'cancelada');
+    END IF;
+
+    IF NOT v_mudou THEN
+        RETURN NEW;
+    END IF;
+
+    -- Libertar o slot anterior
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE "SLOTS"
+        SET ocupado = FALSE,
+            id_consulta = NULL
+        WHERE id_consulta = OLD.id_consulta;
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+
+    -- Ocupar o slot atual (pode já ter sido reservado por marcar_consulta)
+    IF NEW.estado <> 'cancelada' AND NEW.id_disponibilidade IS NOT NULL THEN
+        UPDATE "SLOTS"
+        SET ocupado = TRUE,
+            id_consulta = NEW.id_consulta
+        WHERE id_disponibilidade = NEW.id_disponibilidade
+          AND hora_inicio = NEW.hora_consulta
+          AND (id_consulta IS NULL OR id_consulta = NEW.id_consulta);
+
+        IF NOT FOUND AND EXISTS (
+            SELECT 1 FROM "SLOTS"
+            WHERE id_disponibilidade = NEW.id_disponibilidade
+              AND hora_inicio = NEW.hora_consulta
+        ) THEN
+            RAISE EXCEPTION 'Já existe uma consulta agendada neste horário'
+                USING ERRCODE = 'unique_violation';
+        END IF;
+    END IF;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_slot_consulta
+    AFTER INSERT OR UPDATE OR DELETE ON "CONSULTAS"
+    FOR EACH ROW
+    EXECUTE FUNCTION sincronizar_slot_consulta();
+
+-- Preencher os slots das disponibilidades já existentes
+SELECT reconstruir_slots();
+
+
+-- ============================================================================
+-- CONTADOR DE SLOTS OCUPADOS ("DISPONIBILIDADE".slots_ocupados)
+-- ============================================================================
+
+-- Trigger para manter incrementalmente o número de consultas ativas
+-- (estado <> 'cancelada') de cada disponibilidade
+CREATE OR REPLACE FUNCTION atualizar_slots_ocupados()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_antiga INTEGER;
+    v_nova INTEGER;
+BEGIN
+    -- Disponibilidade que a consulta ocupava / passa a ocupar
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.estado <> 'cancelada' THEN
+        v_antiga := OLD.id_disponibilidade;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.estado <> 'cancelada' THEN
+        v_nova := NEW.id_disponibilidade;
+    END IF;
+
+    IF v_antiga IS DISTINCT FROM v_nova THEN
+        IF v_antiga IS NOT NULL THEN
+            UPDATE "DISPONIBILIDADE"
+            SET slots_ocupados = slots_ocupados - 1
+            WHERE id_disponibilidade = v_antiga;
+        END IF;
+        IF v_nova IS NOT NULL THEN
+            UPDATE "DISPONIBILIDADE"
+            SET slots_ocupados = slots_ocupados + 1
+            WHERE id_disponibilidade = v_nova;
+        END IF;
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_slots_ocupados
+    AFTER INSERT OR UPDATE OF estado, id_disponibilidade OR DELETE ON "CONSULTAS"
+    FOR EACH ROW
+    EXECUTE FUNCTION atualizar_slots_ocupados();
+
+-- Preencher o contador das disponibilidades já existentes
+SELECT recalcular_slots_ocupados();
+
+
+
+-- ============================================================================
+-- CONTADORES DO DASHBOARD ADMIN ("CONTADORES")
+-- ============================================================================
+
+-- Trigger de statement: soma/subtrai ao contador TG_ARGV[0] o número de
+-- linhas inseridas/apagadas (um único UPDATE por statement, mesmo em
+-- inserções em massa)
+CREATE OR REPLACE FUNCTION atualizar_contador()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_linhas BIGINT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT COUNT(*) INTO v_linhas FROM linhas_novas;
+    ELSE
+        SELECT -COUNT(*) INTO v_linhas FROM linhas_antigas;
+    END IF;
+
+    IF v_linhas <> 0 THEN
+        INSERT INTO "CONTADORES" AS ct (nome, valor)
+        VALUES (TG_ARGV[0], v_linhas)
+        ON CONFLICT (nome) DO UPDATE SET valor = ct.valor + EXCLUDED.valor;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_contador_pacientes_insert
+    AFTER INSERT ON "PACIENTES"
+    REFERENCING NEW TABLE AS linhas_novas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION atualizar_contador('pacientes');
+
+CREATE TRIGGER trg_contador_pacientes_delete
+    AFTER DELETE ON "PACIENTES"
+    REFERENCING OLD TABLE AS linhas_antigas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION atualizar_contador('pacientes');
+
+CREATE TRIGGER trg_contador_medicos_insert
+    AFTER INSERT ON "MEDICOS"
+    REFERENCING NEW TABLE AS linhas_novas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION atualizar_contador('medicos');
+
+CREATE TRIGGER trg_contador_medicos_delete
+    AFTER DELETE ON "MEDICOS"
+    REFERENCING OLD TABLE AS linhas_antigas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION atualizar_contador('medicos');
+
+CREATE TRIGGER trg_contador_enfermeiros_insert
+    AFTER INSERT ON "ENFERMEIRO"
+    REFERENCING NEW TABLE AS linhas_novas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION atualizar_contador('enfermeiros');
+
+CREATE TRIGGER trg_contador_enfermeiros_delete
+    AFTER DELETE ON "ENFERMEIRO"
+    REFERENCING OLD TABLE AS linhas_antigas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION atualizar_contador('enfermeiros');
+
+CREATE TRIGGER trg_contador_unidades_insert
+    AFTER INSERT ON "UNIDADE_DE_SAUDE"
+    REFERENCING NEW TABLE AS linhas_novas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION atualizar_contador('unidades');
+
+CREATE TRIGGER trg_contador_unidades_delete
+    AFTER DELETE ON "UNIDADE_DE_SAUDE"
+    REFERENCING OLD TABLE AS linhas_antigas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION atualizar_contador('unidades');
+
+-- Preencher os contadores com as linhas já existentes
+SELECT recalcular_contadores();
+
+
+
+-- ============================================================================
+-- VERSÕES DE DADOS DAS EXPORTAÇÕES ("VERSOES_DADOS")
+-- ============================================================================
+
+-- Trigger de statement: incrementa a versão TG_ARGV[0] (uma vez por
+-- statement, seja qual for o número de linhas) na transação de quem altera,
+-- numa das 16 linhas da tabela escolhida pelo backend
+CREATE OR REPLACE FUNCTION incrementar_versao_dados()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO "VERSOES_DADOS" AS v (nome, slot, versao)
+    VALUES (TG_ARGV[0], pg_backend_pid() % 16, 1)
+    ON CONFLICT (nome, slot) DO UPDATE SET versao = v.versao + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_versao_consultas
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "CONSULTAS"
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION incrementar_versao_dados('consultas');
+
+CREATE TRIGGER trg_versao_faturas
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "FATURAS"
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION incrementar_versao_dados('faturas');
+
+-- Só as colunas que aparecem nos relatórios (um login, que só altera
+-- last_login, não invalida as exportações)
+CREATE TRIGGER trg_versao_utilizadores
+    AFTER INSERT OR UPDATE OF nome, n_utente OR DELETE OR TRUNCATE ON "core_utilizador"
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION incrementar_versao_dados('utilizadores');
+
+CREATE TRIGGER trg_versao_medicos
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "MEDICOS"
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION incrementar_versao_dados('medicos');
+
+CREATE TRIGGER trg_versao_regioes
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "REGIAO"
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION incrementar_versao_dados('regioes');
+
+CREATE TRIGGER trg_versao_unidades
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "UNIDADE_DE_SAUDE"
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION incrementar_versao_dados('unidades');
+
+CREATE TRIGGER trg_versao_especialidades
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "ESPECIALIDADES"
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION incrementar_versao_dados('especialidades');
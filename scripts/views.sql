@@ -158,18 +158,12 @@ SELECT
     r.nome as regiao_nome,
     r.tipo_regiao,
     
-    -- Slots ocupados
-    (SELECT COUNT(*) 
-     FROM "CONSULTAS" c 
-     WHERE c.id_disponibilidade = d.id_disponibilidade 
-     AND c.estado NOT IN ('cancelada')) as slots_ocupados,
+    -- Slots ocupados (contador mantido por trigger; BIGINT como o antigo COUNT)
+    d.slots_ocupados::BIGINT as slots_ocupados,
     
     -- Slots disponíveis
     ((EXTRACT(EPOCH FROM (d.hora_fim - d.hora_inicio)) / 60) / d.duracao_slot) 
-    - (SELECT COUNT(*) 
-       FROM "CONSULTAS" c 
-       WHERE c.id_disponibilidade = d.id_disponibilidade 
-       AND c.estado NOT IN ('cancelada')) as slots_disponiveis
+    - d.slots_ocupados as slots_disponiveis
 
 FROM "DISPONIBILIDADE" d
 JOIN "MEDICOS" m ON d.id_medico = m.id_medico
@@ -275,17 +269,11 @@ SELECT
     d.status_slot,
     un.nome_unidade,
     un.morada_unidade,
-    -- Slots ocupados
-    (SELECT COUNT(*) 
-     FROM "CONSULTAS" c 
-     WHERE c.id_disponibilidade = d.id_disponibilidade 
-     AND c.estado NOT IN ('cancelada')) as slots_ocupados,
+    -- Slots ocupados (contador mantido por trigger; BIGINT como o antigo COUNT)
+    d.slots_ocupados::BIGINT as slots_ocupados,
     -- Slots disponíveis
     ((EXTRACT(EPOCH FROM (d.hora_fim - d.hora_inicio)) / 60) / d.duracao_slot) 
-    - (SELECT COUNT(*) 
-       FROM "CONSULTAS" c 
-       WHERE c.id_disponibilidade = d.id_disponibilidade 
-       AND c.estado NOT IN ('cancelada')) as slots_disponiveis
+    - d.slots_ocupados as slots_disponiveis
 FROM "DISPONIBILIDADE" d
 JOIN "UNIDADE_DE_SAUDE" un ON d.id_unidade = un.id_unidade;
 